@@ -0,0 +1,18 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from school.services.user_context import lazy_user_context
+
+
+class SchoolContextJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that also attaches the authenticated user's role,
+    school and profiles as `request.school_context`, in place of the
+    session user's context set by SchoolContextMiddleware.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            # Set on the HttpRequest; the DRF Request proxies attribute reads to it.
+            request._request.school_context = lazy_user_context(result[0])
+        return result
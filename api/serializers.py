@@ -2,7 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from school.models import (
     School, Grade, Streams, Role, Subject, StaffProfile, Parent, Student,
-    Enrollment, Term, TimeSlot, Timetable, Lesson, Attendance, DisciplineRecord, SubjectEnrollment,
+    Enrollment, Term, TimeSlot, Timetable, Lesson, LessonPattern, Attendance, DisciplineRecord, SubjectEnrollment,
     Assignment, Submission, Payment, SmartID, ScanLog, GradeAttendance, ContactMessage, Notification,
     Announcement, FeeInvoice, FeeStructure, FeeType, ExamSession, ExamResult, Complaint,
     ClassTeacherAssignment, AcademicYear, Timetable,
@@ -10,27 +10,10 @@ from school.models import (
 from datetime import date
 from django.utils import timezone
 from datetime import timedelta
-def get_user_role(user):
-    if user.is_teacher:
-        return 'teacher'
-    elif user.is_parent:
-        return 'parent'
-    elif user.is_student:
-        return 'student'
-    elif user.is_admin:
-        return 'admin'
-    elif user.school_staff:
-        return 'staff'
-    return 'user'
-
-def get_user_school(user, role):
-    if role == 'teacher':
-        return getattr(user, 'staffprofile', None).school
-    elif role == 'parent':
-        return getattr(user, 'parent', None).school
-    elif role == 'student':
-        return getattr(user, 'student', None).school
-    return None
+from school.services.attendance import record_attendance
+from school.services.lesson_patterns import lesson_enrollments, materialise, occurrences
+from school.services.user_context import school_for_role, user_context
+from school.services.weekly_timetable import week_grid, week_schedule
 # Status mapping for input (full name -> code)
 STATUS_MAP = {
     'present': 'P',
@@ -59,31 +42,14 @@ SEVERITY_CHOICES = [
 User = get_user_model()
 
 def get_user_role(user):
-    if hasattr(user, 'is_teacher') and user.is_teacher:
-        return 'teacher'
-    elif hasattr(user, 'is_parent') and user.is_parent:
-        return 'parent'
-    elif hasattr(user, 'is_student') and user.is_student:
-        return 'student'
-    elif hasattr(user, 'is_admin') and user.is_admin:
-        return 'admin'
-    elif hasattr(user, 'school_staff') and user.school_staff:
-        return 'staff'
-    return 'user'
+    return user_context(user).role
+
 
 def get_user_school(user, user_role=None):
-    if user_role is None:
-        user_role = get_user_role(user)
-    if user_role == 'teacher':
-        return getattr(user, 'staffprofile', None).school if hasattr(user, 'staffprofile') else None
-    elif user_role == 'parent':
-        return getattr(user, 'parent', None).school if hasattr(user, 'parent') else None
-    elif user_role == 'student':
-        return getattr(user, 'student', None).school if hasattr(user, 'student') else None
-    elif user_role == 'admin':
-        # Admins might have access to multiple schools; for simplicity, assume they have a school or return None
-        return None  # Or implement multi-school logic if needed
-    return None
+    ctx = user_context(user)
+    if user_role is None or user_role == ctx.role:
+        return ctx.school
+    return school_for_role(user, user_role)
 
 # User Serializers (unchanged)
 class ParentSerializer(serializers.ModelSerializer):
@@ -240,51 +206,19 @@ class TeacherTimetableSerializer(serializers.Serializer):
         return obj.user.get_full_name()
     
     def get_schedule(self, obj):
-        # Query active lessons for this teacher
         active_term = Term.objects.filter(school=obj.school, is_active=True).first()
         if not active_term:
             return {}  # No active term
-        
-        lessons = Lesson.objects.filter(
-            teacher=obj,
-            timetable__term=active_term,
-            timetable__school=obj.school
-        ).select_related('subject', 'time_slot', 'stream', 'timetable__term').order_by('day_of_week', 'time_slot__start_time')
-        
-        schedule = {}
-        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        day_map = {'monday': 'Monday', 'tuesday': 'Tuesday', 'wednesday': 'Wednesday', 'thursday': 'Thursday', 'friday': 'Friday'}
-        for day_name in days:
-            day_key = day_name.lower()
-            day_lessons = lessons.filter(day_of_week=day_key)
-            day_slots = []
-            for lesson in day_lessons:
-                time_str = f"{lesson.time_slot.start_time.strftime('%H-%M')}-{lesson.time_slot.end_time.strftime('%H-%M')}" if lesson.time_slot else ''
-                slot_data = {
-                    'timeSlot': time_str,
-                    'subject': lesson.subject.name if lesson.subject else '',
-                    'subjectCode': lesson.subject.code if lesson.subject else '',
-                    'class': lesson.stream.name if lesson.stream else ''
-                }
-                day_slots.append(slot_data)
-            
-            # Fill empty slots from school time_slots
-            school_time_slots = TimeSlot.objects.filter(school=obj.school).order_by('start_time')
-            for ts in school_time_slots:
-                time_str = f"{ts.start_time.strftime('%H-%M')}-{ts.end_time.strftime('%H-%M')}"
-                if not any(slot['timeSlot'] == time_str for slot in day_slots):
-                    day_slots.append({
-                        'timeSlot': time_str,
-                        'subject': '',
-                        'subjectCode': '',
-                        'class': ''
-                    })
-            schedule[day_name] = sorted(day_slots, key=lambda x: x['timeSlot'])
-        return schedule
+        grid = week_grid(obj.school, active_term, teacher=obj)
+        return week_schedule(grid, lambda label, name, code, stream: {
+            'timeSlot': label, 'subject': name, 'subjectCode': code, 'class': stream,
+        })
 
 
 class TeacherLessonSerializer(serializers.Serializer):
-    lessonId = serializers.IntegerField(source='id')
+    """A weekly lesson: a LessonPattern (patternId) or a pattern-less Lesson (lessonId)."""
+    lessonId = serializers.SerializerMethodField()
+    patternId = serializers.SerializerMethodField()
     subjectName = serializers.CharField(source='subject.name')
     subjectCode = serializers.CharField(source='subject.code')
     className = serializers.SerializerMethodField()
@@ -293,6 +227,12 @@ class TeacherLessonSerializer(serializers.Serializer):
     endTime = serializers.SerializerMethodField()
     timeSlot = serializers.SerializerMethodField()
 
+    def get_lessonId(self, obj):
+        return obj.id if isinstance(obj, Lesson) else None
+
+    def get_patternId(self, obj):
+        return obj.id if isinstance(obj, LessonPattern) else None
+
     def get_className(self, obj):
         if obj.stream:
             grade = obj.stream.grade.name if obj.stream.grade else ''
@@ -327,50 +267,15 @@ class StudentTimetableSerializer(serializers.Serializer):
         return obj.grade_level.name
     
     def get_schedule(self, obj):
-        # Query lessons for student's stream
         if not obj.stream:
             return {}  # No stream assigned
-        
         active_term = Term.objects.filter(school=obj.school, is_active=True).first()
         if not active_term:
             return {}
-        
-        lessons = Lesson.objects.filter(
-            stream=obj.stream,
-            timetable__term=active_term,
-            timetable__school=obj.school
-        ).select_related('subject', 'time_slot', 'timetable__term').order_by('day_of_week', 'time_slot__start_time')
-        
-        schedule = {}
-        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        day_map = {'monday': 'Monday', 'tuesday': 'Tuesday', 'wednesday': 'Wednesday', 'thursday': 'Thursday', 'friday': 'Friday'}
-        for day_name in days:
-            day_key = day_name.lower()
-            day_lessons = lessons.filter(day_of_week=day_key)
-            day_slots = []
-            for lesson in day_lessons:
-                time_str = f"{lesson.time_slot.start_time.strftime('%H-%M')}-{lesson.time_slot.end_time.strftime('%H-%M')}" if lesson.time_slot else ''
-                slot_data = {
-                    'timeSlot': time_str,
-                    'subject': lesson.subject.code if lesson.subject else '',  # As per sample
-                    'subjectCode': lesson.subject.code if lesson.subject else '',
-                    'subjectName': lesson.subject.name if lesson.subject else ''
-                }
-                day_slots.append(slot_data)
-            
-            # Fill empties
-            school_time_slots = TimeSlot.objects.filter(school=obj.school).order_by('start_time')
-            for ts in school_time_slots:
-                time_str = f"{ts.start_time.strftime('%H-%M')}-{ts.end_time.strftime('%H-%M')}"
-                if not any(slot['timeSlot'] == time_str for slot in day_slots):
-                    day_slots.append({
-                        'timeSlot': time_str,
-                        'subject': '',
-                        'subjectCode': '',
-                        'subjectName': ''
-                    })
-            schedule[day_name] = sorted(day_slots, key=lambda x: x['timeSlot'])
-        return schedule
+        grid = week_grid(obj.school, active_term, stream=obj.stream)
+        return week_schedule(grid, lambda label, name, code, stream: {
+            'timeSlot': label, 'subject': code, 'subjectCode': code, 'subjectName': name,
+        })
 
 class AttendanceStatusField(serializers.ChoiceField):
     def __init__(self, **kwargs):
@@ -427,7 +332,10 @@ class AttendanceItemSerializer(serializers.Serializer):
     remarks = serializers.CharField(max_length=255, required=False, default='')  # Optional remarks
 
 class AttendanceCreateSerializer(serializers.ModelSerializer):
-    lesson_id = serializers.IntegerField(write_only=True)  # Input lesson ID to determine subject/date
+    lesson_id = serializers.IntegerField(write_only=True, required=False)  # Input lesson ID to determine subject/date
+    # Or a weekly pattern occurrence that has no dated lesson yet
+    pattern_id = serializers.IntegerField(write_only=True, required=False)
+    lesson_date = serializers.DateField(write_only=True, required=False)
     attendances = serializers.ListField(
         child=AttendanceItemSerializer(),
         write_only=True
@@ -435,12 +343,25 @@ class AttendanceCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Attendance
-        fields = ['lesson_id', 'attendances']  # No direct fields; bulk via attendances
+        fields = ['lesson_id', 'pattern_id', 'lesson_date', 'attendances']  # No direct fields; bulk via attendances
+
+    def validate(self, attrs):
+        if not attrs.get('lesson_id') and not (attrs.get('pattern_id') and attrs.get('lesson_date')):
+            raise serializers.ValidationError("Provide lesson_id, or pattern_id with lesson_date.")
+        return attrs
 
     def create(self, validated_data):
-        lesson_id = validated_data.pop('lesson_id')
+        lesson_id = validated_data.pop('lesson_id', None)
+        pattern_id = validated_data.pop('pattern_id', None)
+        lesson_date = validated_data.pop('lesson_date', None)
         attendances_data = validated_data.pop('attendances')
-        lesson = Lesson.objects.get(id=lesson_id)
+        if lesson_id:
+            lesson = Lesson.objects.get(id=lesson_id)
+        else:
+            try:
+                lesson = materialise(LessonPattern.objects.get(id=pattern_id), lesson_date)
+            except ValueError as exc:
+                raise serializers.ValidationError(str(exc))
         
         request = self.context.get('request')
         user_school = get_user_school(request.user) if request else None
@@ -449,27 +370,28 @@ class AttendanceCreateSerializer(serializers.ModelSerializer):
         
         # Auto-set marked_by if teacher
         marked_by = None
-        if request and get_user_role(request.user) == 'teacher':
+        if request and request.user.is_teacher:
             marked_by = request.user.staffprofile
         
-        created_attendances = []
-        for item_data in attendances_data:
-            student_id = item_data.pop('student_id')
-            student = Student.objects.get(id=student_id)
-            # Find enrollment for this student-lesson
-            enrollment = Enrollment.objects.get(
-                student=student,
-                lesson=lesson,
-            )
-            # Create attendance
-            attendance = Attendance.objects.create(
-                enrollment=enrollment,
-                date=lesson.lesson_date,  # Use lesson date
-                status=item_data['status'],
-                remarks=item_data.get('remarks', ''),
-                marked_by=marked_by
-            )
-            created_attendances.append(attendance)
+        # One query for every student's enrollment, one batched upsert.
+        enrollments = {
+            e.student_id: e
+            for e in lesson_enrollments(lesson).select_related('student__user')
+        }
+        missing = [item['student_id'] for item in attendances_data if item['student_id'] not in enrollments]
+        if missing:
+            raise serializers.ValidationError(f"Students not enrolled in this lesson: {missing}")
+
+        created_attendances = record_attendance(
+            [
+                (enrollments[item['student_id']], item['status'], item.get('remarks', ''))
+                for item in attendances_data
+            ],
+            lesson.lesson_date,  # Use lesson date
+            lesson=lesson,
+            marked_by=marked_by,
+            actor=request.user if request else None,
+        )
         
         return created_attendances  # Return list for bulk response
 
@@ -545,7 +467,7 @@ class GradeAttendanceCreateSerializer(serializers.Serializer):
             student = Student.objects.get(id=student_id)
             if student.stream != stream:
                 raise serializers.ValidationError(f"Student {student_id} not in stream {stream.name}")
-            # Create GradeAttendance (recorded_at auto_now_add=True)
+            # Create GradeAttendance (recorded_at defaults to now)
             attendance = GradeAttendance.objects.create(
                 student=student,
                 stream=stream,
@@ -559,7 +481,7 @@ class GradeAttendanceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = GradeAttendance
-        fields = ['id', 'studentName', 'status', 'recorded_at']
+        fields = ['id', 'studentName', 'status', 'recorded_at', 'updated_at']
 
     def get_studentName(self, obj):
         return obj.student.user.get_full_name()
@@ -584,7 +506,7 @@ class DisciplineCreateSerializer(serializers.ModelSerializer):
         if school and student.school != school:
             raise serializers.ValidationError("Student not in your school")
         # Auto-set teacher if current user is teacher
-        if request and get_user_role(request.user) == 'teacher' and not teacher_id:
+        if request and request.user.is_teacher and not teacher_id:
             validated_data['teacher'] = request.user.staffprofile
         if teacher_id:
             validated_data['teacher'] = StaffProfile.objects.get(id=teacher_id)
@@ -653,36 +575,11 @@ class AssignmentCreateSerializer(serializers.ModelSerializer):
         model = Assignment
         fields = ['subject_id', 'title', 'description', 'dueDate', 'assignment_type', 'max_score']
     
-    @staticmethod
-    def get_user_role(user):
-        if user.is_teacher:
-            return 'teacher'
-        elif user.is_parent:
-            return 'parent'
-        elif user.is_student:
-            return 'student'
-        elif user.is_admin:
-            return 'admin'
-        elif user.school_staff:
-            return 'staff'
-        return 'user'
-    
-    @staticmethod
-    def get_user_school(user):
-        role = AssignmentCreateSerializer.get_user_role(user)
-        if role == 'teacher':
-            return getattr(user, 'staffprofile', None).school if hasattr(user, 'staffprofile') else None
-        elif role == 'parent':
-            return getattr(user, 'parent', None).school if hasattr(user, 'parent') else None
-        elif role == 'student':
-            return getattr(user, 'student', None).school if hasattr(user, 'student') else None
-        return None
-    
     def create(self, validated_data):
         subject_id = validated_data.pop('subject_id')
         subject = Subject.objects.get(id=subject_id)
         request = self.context.get('request')
-        school = self.get_user_school(request.user) if request else None
+        school = get_user_school(request.user) if request else None
         
         if school and subject.school != school:
             raise serializers.ValidationError("Subject not in your school")
@@ -866,7 +763,10 @@ class TeacherStatsSerializer(serializers.ModelSerializer):
 
     def get_lessons(self, obj):
         today = date.today()
-        return Lesson.objects.filter(teacher=obj, lesson_date=today).count()
+        return len(occurrences(
+            LessonPattern.objects.filter(teacher=obj), today, today,
+            lessons=Lesson.objects.filter(teacher=obj),
+        ))
 
     def get_assignments(self, obj):
         return Assignment.objects.filter(
@@ -880,8 +780,19 @@ class TeacherStatsSerializer(serializers.ModelSerializer):
     def get_announcements(self, obj):
         # Assuming Announcement has 'posted_by' as ForeignKey to StaffProfile or User; adjust as needed
         return Notification.objects.filter(recipient=obj.user).count()  # Or filter(posted_by=obj.user) if to User
+def _recent_rate(counts):
+    total, present = counts['total'], counts['present']
+    return {
+        'total': total,
+        'present': present,
+        'absent': total - present,
+        'percentage': round((present / total * 100) if total > 0 else 0, 2),
+    }
+
+
 class ParentChildrenSerializer(serializers.Serializer):
-    childId = serializers.CharField(source='student_id')
+    """One child entry of school.services.parent_summary (last 30 days)."""
+    childId = serializers.CharField(source='student.student_id')
     childName = serializers.SerializerMethodField()
     className = serializers.SerializerMethodField()
     classAttendanceStats = serializers.SerializerMethodField()
@@ -889,71 +800,28 @@ class ParentChildrenSerializer(serializers.Serializer):
     disciplineStats = serializers.SerializerMethodField()
 
     def get_childName(self, obj):
-        return obj.user.get_full_name()
+        return obj['student'].user.get_full_name()
 
     def get_className(self, obj):
-        if obj.stream:
-            return f"{obj.grade_level.name} {obj.stream.name}"
-        return obj.grade_level.name
+        student = obj['student']
+        if student.stream:
+            return f"{student.grade_level.name} {student.stream.name}"
+        return student.grade_level.name
 
     def get_classAttendanceStats(self, obj):
-        # Class attendance from GradeAttendance for current grade, last 30 days
-        recent_date = timezone.now().date() - timedelta(days=30)
-        attendances = obj.recent_stream_attendances  # Prefetched; filter in code if needed
-        filtered_attendances = [a for a in attendances if a.recorded_at.date() >= recent_date and a.stream == obj.stream]
-        
-        total = len(filtered_attendances)
-        present = len([a for a in filtered_attendances if a.status == 'P'])
-        absent = total - present
-        percentage = (present / total * 100) if total > 0 else 0
-        
-        return {
-            'total': total,
-            'present': present,
-            'absent': absent,
-            'percentage': round(percentage, 2)
-        }
+        # Gate (GradeAttendance) scans in the child's current stream
+        return _recent_rate(obj['recent_gate_attendance'])
 
     def get_lessonAttendanceStats(self, obj):
-        recent_date = timezone.now().date() - timedelta(days=30)
-
-        # no grade_level on enrollment → just use all current enrollments
-        enrollments = getattr(obj, 'current_enrollments', [])
-        enrollment_ids = [e.id for e in enrollments]
-
-        attendances = Attendance.objects.filter(
-            enrollment__id__in=enrollment_ids,
-            date__gte=recent_date
-        )
-
-        total = attendances.count()
-        present = attendances.filter(status='present').count()
-        absent = total - present
-        percentage = (present / total * 100) if total > 0 else 0
-
-        return {
-            'total': total,
-            'present': present,
-            'absent': absent,
-            'percentage': round(percentage, 2)
-        }
+        return _recent_rate(obj['recent_attendance'])
 
     def get_disciplineStats(self, obj):
-        # Discipline stats from DisciplineRecord, last 30 days
-        recent_date = timezone.now().date() - timedelta(days=30)
-        records = obj.recent_discipline_records  # Prefetched; filter in code
-        filtered_records = [r for r in records if r.date >= recent_date]
-        
-        total = len(filtered_records)
-        # Assuming SEVERITY_CHOICES has 'minor', 'major'; adjust as needed
-        minor = len([r for r in filtered_records if r.severity == 'minor'])
-        major = len([r for r in filtered_records if r.severity == 'major'])
-        
+        recent = obj['recent_discipline']
         return {
-            'total': total,
-            'minor': minor,
-            'major': major,
-            'recent_incidents': total  # Or list summaries if needed
+            'total': recent['total'],
+            'minor': recent['minor'],
+            'major': recent['major'],
+            'recent_incidents': recent['total'],
         }
 
 
@@ -961,46 +829,8 @@ class ParentChildrenSerializer(serializers.Serializer):
 
 # ── Helpers & School-Scoped Mixin ────────────────────────────────────────────
 
-def _get_user_role_extended(user):
-    if user.is_teacher:
-        return 'teacher'
-    elif user.is_parent:
-        return 'parent'
-    elif user.is_student:
-        return 'student'
-    elif user.is_principal:
-        return 'principal'
-    elif user.is_deputy_principal:
-        return 'deputy'
-    elif user.is_policy_maker:
-        return 'policy_maker'
-    elif user.is_admin:
-        return 'admin'
-    elif user.school_staff:
-        return 'staff'
-    return 'user'
-
-
 def _get_school_for_user(user):
-    role = _get_user_role_extended(user)
-    if role in ('teacher', 'principal', 'deputy', 'policy_maker', 'staff'):
-        sp = getattr(user, 'staffprofile', None)
-        return sp.school if sp else None
-    if role == 'admin':
-        sp = getattr(user, 'staffprofile', None)
-        if sp:
-            return sp.school
-        try:
-            return user.school_admin_profile
-        except Exception:
-            return None
-    if role == 'parent':
-        p = getattr(user, 'parent', None)
-        return p.school if p else None
-    if role == 'student':
-        s = getattr(user, 'student', None)
-        return s.school if s else None
-    return None
+    return user_context(user).school
 
 
 class SchoolScopedMixin:
@@ -1250,7 +1080,7 @@ class LessonSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Lesson
-        fields = ['id', 'subject', 'subject_name', 'stream', 'stream_name',
+        fields = ['id', 'pattern', 'subject', 'subject_name', 'stream', 'stream_name',
                   'teacher', 'teacher_name', 'day_of_week', 'time_slot',
                   'time_slot_display', 'room', 'lesson_date', 'is_canceled']
 
@@ -1523,7 +1353,6 @@ class ComplaintCreateSerializer(serializers.ModelSerializer):
                 pass
 
     def create(self, validated_data):
-        from api.views import get_user_role, get_user_school
         request = self.context['request']
         role = get_user_role(request.user)
         target = validated_data.pop('target', 'school_admin')
@@ -94,7 +94,7 @@ from .views import (
     TimetableDetailView, TimeSlotDetailView,
     ClassTeacherListView, ClassTeacherRosterView, ClassTeacherRollCallView,
     ClassTeacherAttendanceSummaryView, ClassTeacherSubjectSummaryView,
-    AttendanceSummaryView, TeacherAttendanceSummaryView, SmartAttendanceView,
+    AttendanceSummaryView, TeacherAttendanceSummaryView, SmartAttendanceView, ScanBatchView,
 
     # ── Sprint 2: Finance, Exams, Attendance ─────────────────────────────
     FeeTypesView, FeeTypeDetailView,
@@ -263,6 +263,7 @@ urlpatterns = [
     path('attendance/summary/', AttendanceSummaryView.as_view(), name='attendance_summary'),
     path('teacher/attendance/summary/', TeacherAttendanceSummaryView.as_view(), name='teacher_attendance_summary'),
     path('teacher/attendance/<int:lesson_id>/smart/', SmartAttendanceView.as_view(), name='smart_attendance'),
+    path('scans/bulk/', ScanBatchView.as_view(), name='scan_batch'),
 
     # ═══════════════════════════════════════════════════════════════════════
     # SPRINT 2 — Finance, Exams, Attendance Completeness
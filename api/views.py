@@ -13,6 +13,7 @@ from django.db.models.functions import TruncHour
 from django.db.models import Count
 from datetime import date
 from django.utils import timezone
+from .pagination import CursorListMixin, select_fields
 from .serializers import (
     RegisterSerializer, LoginSerializer, TimeSlotSerializer,
     TeacherTimetableSerializer, StudentTimetableSerializer, AnnouncementSerializer,
@@ -39,66 +40,45 @@ from .serializers import (
     AdminDashboardSerializer, TeacherDashboardSerializer, StudentDashboardSerializer, ParentDashboardSerializer,
 )
 from school.models import (
-    StaffProfile, Student, Parent, SubjectEnrollment, TimeSlot, Lesson, School, Grade, Enrollment, Streams,
+    StaffProfile, Student, Parent, SubjectEnrollment, TimeSlot, Lesson, LessonPattern, School, Grade, Enrollment, Streams,
     Attendance, DisciplineRecord, Assignment, ContactMessage, Submission, Term, Subject, Notification,
     GradeAttendance, Announcement, FeeInvoice, FeeStructure, FeeType, ExamSession, ExamResult, Complaint,
-    ClassTeacherAssignment, AcademicYear, Timetable,
+    ClassTeacherAssignment, AcademicYear, Timetable, AttendanceDevice,
 )
+from school.services.attendance_rollup import rollups_for, status_counts, summarize
+from school.services.exam_ranking import rank_students
+from school.services.finance_reports import collection_report
+from school.services.parent_summary import parent_summary
+from school.services.student_stats import stats_for_students, student_stats
+from school.services.user_context import school_for_role, user_context
+from school.services.attendance import record_attendance
+from school.services.lesson_patterns import lesson_enrollments, occurrence_counts, occurrences
+from school.services.zkteco import ScanRecord, SmartIDCache, ingest
 from rest_framework.decorators import action
 from django.db.models import Count, Case, When, IntegerField, Sum
 from django.db.models import Avg, Q, F, ExpressionWrapper, DecimalField
 from django.utils import timezone
 from datetime import timedelta
+import hmac
+from django.utils.dateparse import parse_datetime
 User = get_user_model()
 
+_SCAN_CARDS = SmartIDCache()  # shared by ScanBatchView requests in this process
+
 ADMIN_ROLES = {'admin', 'principal', 'deputy'}
 STAFF_ROLES = {'admin', 'principal', 'deputy', 'policy_maker', 'staff', 'teacher'}
 ALL_ROLES = {'admin', 'principal', 'deputy', 'policy_maker', 'staff', 'teacher', 'parent', 'student'}
 
 
 def get_user_role(user):
-    # Admin roles take priority so a principal who is also a teacher
-    # is correctly identified as principal, not teacher.
-    if user.is_principal:
-        return 'principal'
-    elif user.is_deputy_principal:
-        return 'deputy'
-    elif user.is_policy_maker:
-        return 'policy_maker'
-    elif user.is_admin:
-        return 'admin'
-    elif user.is_teacher:
-        return 'teacher'
-    elif user.is_parent:
-        return 'parent'
-    elif user.is_student:
-        return 'student'
-    elif user.school_staff:
-        return 'staff'
-    return 'user'
+    return user_context(user).role
 
 
 def get_user_school(user, role=None):
-    if role is None:
-        role = get_user_role(user)
-    if role in ('teacher', 'principal', 'deputy', 'policy_maker', 'staff'):
-        sp = getattr(user, 'staffprofile', None)
-        return sp.school if sp else None
-    if role == 'admin':
-        sp = getattr(user, 'staffprofile', None)
-        if sp:
-            return sp.school
-        try:
-            return user.school_admin_profile
-        except Exception:
-            return None
-    if role == 'parent':
-        p = getattr(user, 'parent', None)
-        return p.school if p else None
-    if role == 'student':
-        s = getattr(user, 'student', None)
-        return s.school if s else None
-    return None
+    ctx = user_context(user)
+    if role is None or role == ctx.role:
+        return ctx.school
+    return school_for_role(user, role)
 
 # Auth Views - Updated with AllowAny
 @api_view(['POST'])
@@ -185,7 +165,7 @@ class TeacherTimetableView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request, teacher_id):
-        teacher = get_object_or_404(StaffProfile, staff_id=teacher_id)
+        teacher = get_object_or_404(StaffProfile.objects.select_related('user', 'school'), staff_id=teacher_id)
         user_role = get_user_role(request.user)
         if user_role != 'teacher' or request.user != teacher.user:
             # Allow admins or same school staff
@@ -212,29 +192,33 @@ class TeacherLessonsView(APIView):
         if not active_term:
             return Response([])
 
-        # Fetch lessons
+        # The weekly lessons: timetable patterns plus pattern-less dated lessons
+        ordering = ('stream__grade__name', 'day_of_week', 'time_slot__start_time')
+        patterns = LessonPattern.objects.filter(
+            teacher=teacher,
+            timetable__term=active_term,
+            school=teacher.school,
+            is_active=True,
+        ).select_related('subject', 'time_slot', 'stream__grade').order_by(*ordering)
         lessons = Lesson.objects.filter(
             teacher=teacher,
             timetable__term=active_term,
-            timetable__school=teacher.school
-        ).select_related(
-            'subject', 'time_slot', 'stream', 'stream__grade', 'timetable__term'
-        ).order_by(
-            'stream__grade__name',
-            'day_of_week',
-            'time_slot__start_time'
-        )
+            timetable__school=teacher.school,
+            pattern__isnull=True,
+        ).select_related('subject', 'time_slot', 'stream__grade').order_by(*ordering)
 
-        serializer = TeacherLessonSerializer(lessons, many=True)
+        serializer = TeacherLessonSerializer([*patterns, *lessons], many=True)
         return Response(serializer.data)
 
 
-class StudentsListView(APIView):
+class StudentsListView(CursorListMixin, APIView):
     """
     GET: List all students in the user's school (for admins/teachers)
-    Includes enrolled subjects per student.
+    Includes enrolled subjects per student, by admission number.
     """
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('student_id',)
+    since_field = 'updated_at'
 
     def get(self, request):
         user_role = get_user_role(request.user)
@@ -268,19 +252,17 @@ class StudentsListView(APIView):
                     is_active=True
                 ).select_related('subject')
             )
-        ).order_by(
-            'user__last_name',
-            'user__first_name'
         )
 
-        serializer = StudentListSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.list_response(request, queryset, StudentListSerializer)
 
 class StudentTimetableView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request, student_id):
-        student = get_object_or_404(Student, student_id=student_id)
+        student = get_object_or_404(
+            Student.objects.select_related('user', 'school', 'grade_level', 'stream'), student_id=student_id,
+        )
         user_role = get_user_role(request.user)
         authorized = False
         if user_role == 'student' and request.user == student.user:
@@ -299,8 +281,9 @@ class StudentTimetableView(APIView):
         return Response(serializer.data)
 
 # Placeholder Views for Missing Data (implement once models added)
-class AttendanceRecordsView(APIView):
+class AttendanceRecordsView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    since_field = 'updated_at'
     
     def get(self, request):
         user_role = get_user_role(request.user)
@@ -313,10 +296,11 @@ class AttendanceRecordsView(APIView):
             return Response({'error': 'No school access'}, status=status.HTTP_403_FORBIDDEN)
         queryset = Attendance.objects.filter(
             enrollment__school=school
-        ).select_related('enrollment__student', 'marked_by')
-        
-        serializer = AttendanceModelSerializer(queryset, many=True)
-        return Response(serializer.data)
+        ).select_related(
+            'enrollment__student__user', 'enrollment__student__grade_level', 'enrollment__student__stream',
+        )
+
+        return self.list_response(request, queryset, AttendanceModelSerializer)
     
     def post(self, request):
         """
@@ -366,8 +350,11 @@ class AttendanceDetailView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class StreamAttendanceRecordsView(APIView):
+class StreamAttendanceRecordsView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    # Write time, not recorded_at: replayed scan backlogs are inserted with old scan times.
+    cursor_ordering = ('-updated_at',)
+    since_field = 'updated_at'
 
     def get(self, request, pk):
         """
@@ -383,7 +370,7 @@ class StreamAttendanceRecordsView(APIView):
             return Response({'error': 'No school access or unauthorized stream'}, status=status.HTTP_403_FORBIDDEN)
         
         # Base queryset
-        queryset = GradeAttendance.objects.filter(stream=stream).select_related('student__user').order_by('-recorded_at')
+        queryset = GradeAttendance.objects.filter(stream=stream).select_related('student__user')
         
         # Role-specific filtering
         if user_role == 'student':
@@ -399,9 +386,8 @@ class StreamAttendanceRecordsView(APIView):
             else:
                 return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
         # For teacher/admin: all records in stream
-        
-        serializer = GradeAttendanceSerializer(queryset, many=True)
-        return Response(serializer.data)  # Empty list [] if no records
+
+        return self.list_response(request, queryset, GradeAttendanceSerializer)
 
     def post(self, request, pk):
         """
@@ -445,15 +431,16 @@ class StreamAttendanceRecordsView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class DisciplineRecordsView(APIView):
+class DisciplineRecordsView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = [JSONParser]
     renderer_classes = [JSONRenderer]
+    since_field = 'updated_at'
 
     def get(self, request):
         """
         GET: List discipline records (filtered by role/school).
-        Returns empty list if no records match filters.
+        Returns an empty page if no records match filters.
         """
         user_role = get_user_role(request.user)
         if user_role not in ALL_ROLES:
@@ -474,9 +461,7 @@ class DisciplineRecordsView(APIView):
         elif user_role == 'teacher':
             queryset = queryset.filter(teacher=request.user.staffprofile)
 
-        # Always use ModelSerializer for real data (or empty)
-        serializer = DisciplineRecordSerializer(queryset, many=True)
-        return Response(serializer.data)  # Empty list [] if no records
+        return self.list_response(request, queryset, DisciplineRecordSerializer)
 
     def post(self, request):
         """
@@ -544,7 +529,7 @@ class DisciplineDetailView(APIView):  # For /discipline/<pk>/
         discipline.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-class AssignmentsView(APIView):
+class AssignmentsView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
@@ -577,9 +562,7 @@ class AssignmentsView(APIView):
             subjects = staff.subjects.all()
             queryset = queryset.filter(subject__in=subjects)
         
-        # Real data
-        serializer = AssignmentSerializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        return self.list_response(request, queryset, AssignmentSerializer, context={'request': request})
     
     def post(self, request):
         # POST: Create assignment
@@ -684,14 +667,16 @@ class StudentStatsView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request, student_id):
-        student = get_object_or_404(Student, student_id=student_id)
+        student = get_object_or_404(
+            Student.objects.select_related('user', 'grade_level', 'stream'), student_id=student_id,
+        )
         user_role = get_user_role(request.user)
         authorized = False
         if user_role == 'student' and request.user == student.user:
             authorized = True
         elif user_role == 'parent':
             parent = get_object_or_404(Parent, user=request.user)
-            if student in parent.children.all():
+            if parent.children.filter(pk=student.pk).exists():
                 authorized = True
         elif user_role in ['admin', 'teacher']:
             if hasattr(request.user, 'school') and request.user.school == student.school:
@@ -699,169 +684,10 @@ class StudentStatsView(APIView):
         if not authorized:
             return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
         
-        # Get current/active term for filtering
-        current_term = Term.objects.filter(school=student.school, is_active=True).first()
-        if not current_term:
-            current_term = Term.objects.filter(school=student.school).order_by('-start_date').first()  # Latest term
-        
-        term_start = current_term.start_date if current_term else (timezone.now().date() - timedelta(days=90))  # Fallback 90 days
-        term_end = current_term.end_date if current_term else timezone.now().date()
-        
-        # 1. Attendance Stats (unchanged)
-        attendances = Attendance.objects.filter(
-            enrollment__student=student,
-            date__range=[term_start, term_end]
-        )
-        total_days = attendances.aggregate(total=Count('date'))['total'] or 0
-        present_days = attendances.filter(status='P').count()
-        absent_days = attendances.filter(status__in=['UA', 'EA']).count()
-        attendance_rate = round((present_days / total_days * 100) if total_days > 0 else 0, 1)
-        recent_absences = attendances.filter(status__in=['UA', 'EA'], date__gte=timezone.now().date() - timedelta(days=30)).count()
-        last_absence = attendances.filter(status__in=['UA', 'EA']).order_by('-date').first()
-        last_absence_date = last_absence.date.isoformat() if last_absence else None
-        
-        attendance_stats = {
-            'totalDays': total_days,
-            'presentDays': present_days,
-            'absentDays': absent_days,
-            'attendanceRate': attendance_rate,
-            'recentAbsences': recent_absences,
-            'lastAbsenceDate': last_absence_date
-        }
-        
-        # 2. Assignments Stats
-        from school.models import SubjectEnrollment
-        subject_ids = SubjectEnrollment.objects.filter(
-            student=student, is_active=True
-        ).values_list('subject_id', flat=True)
-        enrollments = Enrollment.objects.filter(
-            student=student, status='active',
-            lesson__subject_id__in=subject_ids
-        ).select_related('lesson__subject')
-        assignments = Assignment.objects.filter(
-            subject_id__in=subject_ids,
-            due_date__gte=term_start
-        )
-        total_assignments = assignments.count()
-        submissions = Submission.objects.filter(
-            enrollment__student=student,
-            assignment__due_date__gte=term_start
-        )
-        completed = submissions.exclude(score__isnull=True).count()
-        pending = submissions.filter(score__isnull=True).count()
-        overdue = assignments.filter(
-            due_date__lt=timezone.now(),
-            submissions__isnull=True
-        ).distinct().count()
-        completion_rate = round((completed / total_assignments * 100) if total_assignments > 0 else 0, 1)
-        average_score = submissions.aggregate(avg=Avg('score'))['avg'] or 0
-        
-        assignments_stats = {
-            'total': total_assignments,
-            'completed': completed,
-            'pending': pending,
-            'overdue': overdue,
-            'completionRate': completion_rate,
-            'averageScore': round(average_score, 1)
-        }
-        
-        # 3. Discipline Stats (unchanged)
-        disciplines = DisciplineRecord.objects.filter(
-            student=student,
-            date__range=[term_start, term_end]
-        )
-        total_records = disciplines.count()
-        low_severity = disciplines.filter(severity='minor').count()
-        medium_severity = disciplines.filter(severity='moderate').count()
-        high_severity = disciplines.filter(severity='major').count()
-        last_incident = disciplines.order_by('-date').first()
-        last_incident_date = last_incident.date.isoformat() if last_incident else None
-        
-        discipline_stats = {
-            'totalRecords': total_records,
-            'lowSeverity': low_severity,
-            'mediumSeverity': medium_severity,
-            'highSeverity': high_severity,
-            'lastIncidentDate': last_incident_date
-        }
-        
-        # 4. Grades Stats - FIXED: Use only current grade enrollments
-        subject_grades = []
-        total_grades = 0
-        num_graded_subjects = 0
-        for enrollment in enrollments:
-            subj = enrollment.lesson.subject if enrollment.lesson_id else None
-            if not subj:
-                continue
-            subject_subs = submissions.filter(enrollment__lesson__subject=subj)
-            avg_grade = subject_subs.aggregate(avg=Avg('score'))['avg'] or 0
-            has_grades = subject_subs.filter(score__isnull=False).exists()
-            grade_status = 'graded' if has_grades else 'pending'
-            grade_letter = self._compute_grade_letter(avg_grade) if has_grades else 'Pending'
-            teacher = subj.teachers_subjects.first()
-            subject_entry = {
-                'subject': subj.name,
-                'grade': round(avg_grade, 1),
-                'gradeLetter': grade_letter,
-                'teacher': teacher.user.get_full_name() if teacher else 'TBD',
-                'status': grade_status
-            }
-            subject_grades.append(subject_entry)
-            if has_grades:
-                total_grades += avg_grade
-                num_graded_subjects += 1
-        
-        average = round(total_grades / num_graded_subjects if num_graded_subjects > 0 else 0, 1)
-        gpa = round(average / 25, 1)  # Placeholder GPA
-        
-        grades_stats = {
-            'average': average,
-            'gpa': gpa,
-            'subjects': subject_grades
-        }
-        
-        # 5. Performance (unchanged; uses current stream/grade)
-        stream_students = student.stream.student_stream.all() if student.stream else student.grade_level.students.all()
-        rank_in_class = list(stream_students).index(student) + 1 if stream_students.exists() else 1
-        total_in_class = stream_students.count()
-        percentile = round((total_in_class - rank_in_class + 1) / total_in_class * 100) if total_in_class > 0 else 0
-        trend = 'improving' if attendance_rate > 80 else 'needs improvement'
-        
-        performance_stats = {
-            'trend': trend,
-            'rankInClass': rank_in_class,
-            'totalStudentsInClass': total_in_class,
-            'percentile': percentile
-        }
-        
-        # Compile stats_data
-        stats_data = {
-            'studentId': student.student_id,
-            'studentName': student.user.get_full_name(),
-            'className': f"{student.grade_level.name} {student.stream.name}" if student.stream else student.grade_level.name,
-            'attendance': attendance_stats,
-            'assignments': assignments_stats,
-            'discipline': discipline_stats,
-            'grades': grades_stats,
-            'performance': performance_stats
-        }
-        
-        serializer = StudentStatsSerializer(data=stats_data)
+        serializer = StudentStatsSerializer(data=student_stats(student))
         if serializer.is_valid():
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
-    def _compute_grade_letter(self, score):
-        if score >= 90:
-            return 'A'
-        elif score >= 80:
-            return 'B+'
-        elif score >= 70:
-            return 'B'
-        elif score >= 60:
-            return 'C'
-        else:
-            return 'F'
 
 class ParentStatsView(APIView):
     permission_classes = [IsAuthenticated]
@@ -870,56 +696,12 @@ class ParentStatsView(APIView):
         if not request.user.is_parent:
             return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
         parent = get_object_or_404(Parent, user=request.user)
-        
-        # Placeholder children data from sample (full)
+        children = Student.objects.filter(parents=parent).select_related(
+            'user', 'grade_level', 'stream', 'school',
+        ).order_by('pk')
         children_data = []
-        for child in parent.children.all()[:2]:  # Limit to sample size
-            child_stats_data = {
-                'studentId': child.student_id,
-                'studentName': child.user.get_full_name(),
-                'className': f"{child.grade_level.name} {child.stream.name}" if child.stream else child.grade_level.name,
-                'attendance': {
-                    'totalDays': 90,
-                    'presentDays': 85,
-                    'absentDays': 5,
-                    'attendanceRate': 94.4,
-                    'recentAbsences': 2
-                },
-                'assignments': {
-                    'total': 12,
-                    'completed': 10,
-                    'pending': 2,
-                    'overdue': 0,
-                    'completionRate': 83.3
-                },
-                'discipline': {
-                    'totalRecords': 2,
-                    'lowSeverity': 2,
-                    'mediumSeverity': 0,
-                    'highSeverity': 0
-                },
-                'grades': {
-                    'average': 85.5,
-                    'subjects': [
-                        {
-                            'subject': 'Mathematics',
-                            'grade': 88,
-                            'gradeLetter': 'A'
-                        },
-                        {
-                            'subject': 'English',
-                            'grade': 82,
-                            'gradeLetter': 'B+'
-                        },
-                        {
-                            'subject': 'Science',
-                            'grade': 90,
-                            'gradeLetter': 'A'
-                        }
-                    ]
-                }
-            }
-            child_serializer = StudentStatsSerializer(data=child_stats_data)
+        for child_stats in stats_for_students(children).values():
+            child_serializer = StudentStatsSerializer(data=child_stats)
             child_serializer.is_valid()
             children_data.append(child_serializer.data)
         
@@ -958,25 +740,7 @@ class ParentChildrenView(APIView):
             return Response({'error': 'Unauthorized'}, status=403)
 
         parent = get_object_or_404(Parent, user=request.user)
-
-        children = parent.children.all().prefetch_related(
-            Prefetch(
-                'grade_attendance',   # <-- correct related name
-                queryset=GradeAttendance.objects.select_related('stream', 'student'),
-                to_attr='recent_stream_attendances'   # <-- what serializer expects
-            ),
-            Prefetch(
-                'discipline_records',  # <-- correct related name
-                queryset=DisciplineRecord.objects.all(),
-                to_attr='recent_discipline_records'  # <-- expected by serializer
-            ),
-            Prefetch(
-                'enrollments',
-                queryset=Enrollment.objects.select_related('lesson__subject', 'school', 'student'),
-                to_attr='current_enrollments'
-            )
-        )
-
+        children = parent_summary(parent)['children']
         serializer = ParentChildrenSerializer(children, many=True)
         return Response(serializer.data)
 
@@ -1269,8 +1033,9 @@ class SubjectDetailView(APIView):
 
 # ── Staff ─────────────────────────────────────────────────────────────────────
 
-class StaffListView(APIView):
+class StaffListView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('pk',)
 
     def get(self, request):
         role = get_user_role(request.user)
@@ -1283,7 +1048,7 @@ class StaffListView(APIView):
         position = request.query_params.get('position')
         if position:
             qs = qs.filter(position=position)
-        return Response(StaffSerializer(qs, many=True).data)
+        return self.list_response(request, qs, StaffSerializer)
 
 
 class StaffDetailView(APIView):
@@ -1392,8 +1157,9 @@ class StudentStatusView(APIView):
 
 # ── Parents (admin manage) ────────────────────────────────────────────────────
 
-class ParentsListView(APIView):
+class ParentsListView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('pk',)
 
     def get(self, request):
         role = get_user_role(request.user)
@@ -1403,7 +1169,7 @@ class ParentsListView(APIView):
         if not school:
             return Response({'error': 'No school.'}, status=status.HTTP_403_FORBIDDEN)
         qs = Parent.objects.filter(school=school).select_related('user').prefetch_related('children')
-        return Response(ParentListSerializer(qs, many=True).data)
+        return self.list_response(request, qs, ParentListSerializer)
 
 
 class ParentDetailView(APIView):
@@ -1446,8 +1212,14 @@ class ParentDetailView(APIView):
 # ── Lessons (teacher/admin manage) ───────────────────────────────────────────
 
 class LessonsManageView(APIView):
-    """GET list of lessons; POST create a lesson (teacher/admin)."""
+    """
+    GET the dated lessons between ?start= and ?end= (ISO dates, default the
+    current week, at most MAX_LESSON_DAYS); POST create a lesson (teacher/admin).
+    Dates of the weekly timetable that were never materialised have a null
+    id and carry their pattern. Supports ?fields= like the list endpoints.
+    """
     permission_classes = [IsAuthenticated]
+    MAX_LESSON_DAYS = 31
 
     def get(self, request):
         role = get_user_role(request.user)
@@ -1456,17 +1228,40 @@ class LessonsManageView(APIView):
         school = get_user_school(request.user)
         if not school:
             return Response({'error': 'No school.'}, status=status.HTTP_403_FORBIDDEN)
+
+        today = timezone.localdate()
+        start_str, end_str = request.query_params.get('start'), request.query_params.get('end')
+        try:
+            start = date.fromisoformat(start_str) if start_str else today - timedelta(days=today.weekday())
+            end = date.fromisoformat(end_str) if end_str else start + timedelta(days=6)
+        except ValueError:
+            return Response({'error': 'start and end must be ISO dates.'}, status=status.HTTP_400_BAD_REQUEST)
+        if end < start or (end - start).days >= self.MAX_LESSON_DAYS:
+            return Response({'error': f'end must be within {self.MAX_LESSON_DAYS} days after start.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
         active_term = Term.objects.filter(school=school, is_active=True).first()
+        patterns = LessonPattern.objects.filter(school=school)
         qs = Lesson.objects.filter(timetable__school=school)
         if active_term:
+            patterns = patterns.filter(timetable__term=active_term)
             qs = qs.filter(timetable__term=active_term)
         if role == 'teacher':
+            patterns = patterns.filter(teacher=request.user.staffprofile)
             qs = qs.filter(teacher=request.user.staffprofile)
         stream_id = request.query_params.get('stream_id')
         if stream_id:
+            patterns = patterns.filter(stream_id=stream_id)
             qs = qs.filter(stream_id=stream_id)
-        qs = qs.select_related('subject', 'stream__grade', 'teacher__user', 'time_slot')
-        return Response(LessonSerializer(qs, many=True).data)
+
+        serializer = LessonSerializer(occurrences(patterns, start, end, lessons=qs), many=True)
+        fields = request.query_params.get('fields')
+        if fields:
+            unknown = select_fields(serializer.child, fields)
+            if unknown:
+                return Response({'error': f"Unknown fields: {', '.join(unknown)}."},
+                                status=status.HTTP_400_BAD_REQUEST)
+        return Response({'start': start, 'end': end, 'results': serializer.data})
 
     def post(self, request):
         role = get_user_role(request.user)
@@ -1517,9 +1312,10 @@ class LessonManageDetailView(APIView):
 
 # ── Submissions ───────────────────────────────────────────────────────────────
 
-class SubmissionsView(APIView):
+class SubmissionsView(CursorListMixin, APIView):
     """GET submissions (role-filtered); POST submit assignment (student)."""
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-submitted_at',)
 
     def get(self, request):
         role = get_user_role(request.user)
@@ -1540,7 +1336,7 @@ class SubmissionsView(APIView):
         assignment_id = request.query_params.get('assignment_id')
         if assignment_id:
             qs = qs.filter(assignment_id=assignment_id)
-        return Response(SubmissionSerializer(qs, many=True).data)
+        return self.list_response(request, qs, SubmissionSerializer)
 
     def post(self, request):
         role = get_user_role(request.user)
@@ -1588,8 +1384,9 @@ class SubmissionDetailView(APIView):
 
 # ── Exams ─────────────────────────────────────────────────────────────────────
 
-class ExamSessionsView(APIView):
+class ExamSessionsView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-created_at',)
 
     def get(self, request):
         role = get_user_role(request.user)
@@ -1599,7 +1396,7 @@ class ExamSessionsView(APIView):
         qs = ExamSession.objects.filter(school=school).select_related('grade', 'term')
         if role in ('student', 'parent'):
             qs = qs.filter(is_published=True)
-        return Response(ExamSessionSerializer(qs, many=True).data)
+        return self.list_response(request, qs, ExamSessionSerializer)
 
     def post(self, request):
         role = get_user_role(request.user)
@@ -1660,9 +1457,11 @@ class ExamPublishView(APIView):
         return Response({'id': session.pk, 'is_published': session.is_published})
 
 
-class ExamResultsView(APIView):
+class ExamResultsView(CursorListMixin, APIView):
     """GET results for an exam session; POST/bulk-create results (admin/teacher)."""
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('pk',)
+    since_field = 'updated_at'
 
     def get(self, request, pk):
         role = get_user_role(request.user)
@@ -1685,7 +1484,7 @@ class ExamResultsView(APIView):
         subject_id = request.query_params.get('subject_id')
         if subject_id:
             qs = qs.filter(subject_id=subject_id)
-        return Response(ExamResultSerializer(qs, many=True).data)
+        return self.list_response(request, qs, ExamResultSerializer)
 
     def post(self, request, pk):
         role = get_user_role(request.user)
@@ -1710,9 +1509,10 @@ class ExamResultsView(APIView):
         return Response(ExamResultSerializer(created, many=True).data, status=status.HTTP_201_CREATED)
 
 
-class MyExamResultsView(APIView):
+class MyExamResultsView(CursorListMixin, APIView):
     """GET own exam results (student) or children's results (parent)."""
     permission_classes = [IsAuthenticated]
+    since_field = 'updated_at'
 
     def get(self, request):
         role = get_user_role(request.user)
@@ -1723,7 +1523,7 @@ class MyExamResultsView(APIView):
                 session__is_published=True,
                 school=school
             ).select_related('session__grade', 'subject')
-            return Response(ExamResultSerializer(qs, many=True).data)
+            return self.list_response(request, qs, ExamResultSerializer)
         elif role == 'parent':
             parent = getattr(request.user, 'parent', None)
             if not parent:
@@ -1733,14 +1533,16 @@ class MyExamResultsView(APIView):
                 session__is_published=True,
                 school=school
             ).select_related('session__grade', 'subject', 'student__user')
-            return Response(ExamResultSerializer(qs, many=True).data)
+            return self.list_response(request, qs, ExamResultSerializer)
         return Response({'error': 'Only students or parents.'}, status=status.HTTP_403_FORBIDDEN)
 
 
 # ── Finance ───────────────────────────────────────────────────────────────────
 
-class FeeInvoicesView(APIView):
+class FeeInvoicesView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-created_at',)
+    since_field = 'updated_at'
 
     def get(self, request):
         role = get_user_role(request.user)
@@ -1759,7 +1561,7 @@ class FeeInvoicesView(APIView):
         status_filter = request.query_params.get('status')
         if status_filter:
             qs = qs.filter(status=status_filter)
-        return Response(FeeInvoiceSerializer(qs, many=True).data)
+        return self.list_response(request, qs, FeeInvoiceSerializer)
 
     def post(self, request):
         role = get_user_role(request.user)
@@ -1851,29 +1653,33 @@ class FeeStructuresView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class StudentFeesView(APIView):
+class StudentFeesView(CursorListMixin, APIView):
     """GET fee statement for a student (self) or parent (for children)."""
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-created_at',)
+    since_field = 'updated_at'
 
     def get(self, request):
         role = get_user_role(request.user)
         school = get_user_school(request.user)
         if role == 'student':
             qs = FeeInvoice.objects.filter(student=request.user.student, school=school)
-            return Response(FeeInvoiceSerializer(qs, many=True).data)
+            return self.list_response(request, qs, FeeInvoiceSerializer)
         elif role == 'parent':
             parent = getattr(request.user, 'parent', None)
             if not parent:
                 return Response({'error': 'No parent profile.'}, status=status.HTTP_403_FORBIDDEN)
             qs = FeeInvoice.objects.filter(student__parents=parent, school=school)
-            return Response(FeeInvoiceSerializer(qs, many=True).data)
+            return self.list_response(request, qs, FeeInvoiceSerializer)
         return Response({'error': 'Only students or parents.'}, status=status.HTTP_403_FORBIDDEN)
 
 
 # ── Complaints ────────────────────────────────────────────────────────────────
 
-class ComplaintsView(APIView):
+class ComplaintsView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-created_at',)
+    since_field = 'updated_at'
 
     def get(self, request):
         role = get_user_role(request.user)
@@ -1906,7 +1712,7 @@ class ComplaintsView(APIView):
 
         if status_filter:
             qs = qs.filter(status=status_filter)
-        return Response(ComplaintSerializer(qs, many=True).data)
+        return self.list_response(request, qs, ComplaintSerializer)
 
     def post(self, request):
         role = get_user_role(request.user)
@@ -1959,9 +1765,10 @@ class ComplaintDetailView(APIView):
 
 # ── School Announcements ──────────────────────────────────────────────────────
 
-class SchoolAnnouncementsView(APIView):
+class SchoolAnnouncementsView(CursorListMixin, APIView):
     """GET school announcements (all school members); POST create (admin/teacher)."""
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-created_at',)
 
     def get(self, request):
         role = get_user_role(request.user)
@@ -1982,7 +1789,7 @@ class SchoolAnnouncementsView(APIView):
             qs = qs.filter(audience__in=allowed)
         # Exclude expired
         qs = qs.filter(Q(expires_at__isnull=True) | Q(expires_at__gte=tz.now()))
-        return Response(SchoolAnnouncementSerializer(qs, many=True).data)
+        return self.list_response(request, qs, SchoolAnnouncementSerializer)
 
     def post(self, request):
         role = get_user_role(request.user)
@@ -2073,7 +1880,7 @@ class GradePromoteView(APIView):
         if student_ids:
             qs = qs.filter(pk__in=student_ids)
         promoted = qs.count()
-        qs.update(grade_level=to_grade, stream=to_stream)
+        qs.update(grade_level=to_grade, stream=to_stream, updated_at=timezone.now())
         return Response({'promoted': promoted, 'to_grade': to_grade.name})
 
 
@@ -2137,6 +1944,7 @@ class DashboardView(APIView):
             student__school=school, recorded_at__date=today, status='P'
         ).count()
         total_students = Student.objects.filter(school=school, is_active=True).count()
+        lessons_today = summarize(rollups_for(school, date=today))
         data = {
             'school_name': school.name,
             'total_students': total_students,
@@ -2147,6 +1955,12 @@ class DashboardView(APIView):
                 'present': total_present,
                 'total': total_students,
                 'rate': round(total_present / total_students * 100, 1) if total_students else 0,
+                'lessons': {
+                    'present': lessons_today['present'],
+                    'total': lessons_today['total'],
+                    'rate': (round(lessons_today['present'] / lessons_today['total'] * 100, 1)
+                             if lessons_today['total'] else 0),
+                },
             },
             'pending_complaints': Complaint.objects.filter(school=school, status='open').count(),
             'recent_discipline': DisciplineRecord.objects.filter(school=school).count(),
@@ -2162,7 +1976,10 @@ class DashboardView(APIView):
         today = tz.now().date()
         data = {
             'teacher_name': user.get_full_name(),
-            'lessons_today': Lesson.objects.filter(teacher=teacher, lesson_date=today).count(),
+            'lessons_today': len(occurrences(
+                LessonPattern.objects.filter(teacher=teacher), today, today,
+                lessons=Lesson.objects.filter(teacher=teacher),
+            )),
             'total_subjects': teacher.subjects.count(),
             'pending_assignments': Assignment.objects.filter(
                 school=school, subject__in=teacher.subjects.all()
@@ -2243,7 +2060,10 @@ class PolicyDashboardView(APIView):
                 'last_7_days': GradeAttendance.objects.filter(
                     student__school=school,
                     recorded_at__gte=timezone.now() - timedelta(days=7)
-                ).values('status').annotate(count=Count('id'))
+                ).values('status').annotate(count=Count('id')),
+                'lessons_last_7_days': status_counts(summarize(rollups_for(
+                    school, date__gte=timezone.localdate() - timedelta(days=7)
+                ))),
             },
             'discipline_summary': {
                 'total': DisciplineRecord.objects.filter(school=school).count(),
@@ -2554,7 +2374,7 @@ class ParentStudentLinkView(APIView):
 
 # ── Enrollments ───────────────────────────────────────────────────────────────
 
-class EnrollmentsView(APIView):
+class EnrollmentsView(CursorListMixin, APIView):
     """GET/POST lesson enrollments (admin/teacher)."""
     permission_classes = [IsAuthenticated]
 
@@ -2572,7 +2392,7 @@ class EnrollmentsView(APIView):
         student_id = request.query_params.get('student_id')
         if student_id:
             qs = qs.filter(student_id=student_id)
-        return Response(EnrollmentSerializer(qs, many=True).data)
+        return self.list_response(request, qs, EnrollmentSerializer)
 
     def post(self, request):
         role = get_user_role(request.user)
@@ -2872,9 +2692,12 @@ class ClassTeacherSubjectSummaryView(APIView):
             stream = assignment.stream
 
         subjects = Subject.objects.filter(school=school, grade=stream.grade, is_active=True)
+        lesson_counts = occurrence_counts(
+            LessonPattern.objects.filter(stream=stream, school=school), 'subject_id',
+            lessons=Lesson.objects.filter(stream=stream, timetable__school=school),
+        )
         summary = []
         for subject in subjects:
-            lessons = Lesson.objects.filter(stream=stream, subject=subject, timetable__school=school)
             assignments = Assignment.objects.filter(school=school, subject=subject)
             submissions = Submission.objects.filter(
                 assignment__in=assignments,
@@ -2884,7 +2707,7 @@ class ClassTeacherSubjectSummaryView(APIView):
             summary.append({
                 'subject_id': subject.id,
                 'subject_name': subject.name,
-                'total_lessons': lessons.count(),
+                'total_lessons': lesson_counts[subject.id],
                 'total_assignments': assignments.count(),
                 'total_submissions': submissions.count(),
                 'average_score': round(avg_score, 1) if avg_score else None,
@@ -2948,16 +2771,30 @@ class TeacherAttendanceSummaryView(APIView):
                 return Response({'error': 'No staff profile.'}, status=status.HTTP_403_FORBIDDEN)
 
         active_term = Term.objects.filter(school=school, is_active=True).first()
-        lessons = Lesson.objects.filter(teacher=teacher, timetable__school=school)
+        lessons = []
         if active_term:
-            lessons = lessons.filter(timetable__term=active_term)
+            lessons = occurrences(
+                LessonPattern.objects.filter(teacher=teacher, school=school, timetable__term=active_term),
+                active_term.start_date, active_term.end_date,
+                lessons=Lesson.objects.filter(teacher=teacher, timetable__school=school,
+                                              timetable__term=active_term),
+            )
+        counts = {
+            row['enrollment__lesson_id']: row
+            for row in Attendance.objects.filter(
+                enrollment__lesson_id__in=[lesson.id for lesson in lessons if lesson.id],
+            ).values('enrollment__lesson_id').annotate(
+                total=Count('id'), present=Count('id', filter=Q(status='P')),
+            )
+        }
 
         lesson_summaries = []
-        for lesson in lessons.select_related('subject', 'stream__grade'):
-            total = Attendance.objects.filter(enrollment__lesson=lesson).count()
-            present = Attendance.objects.filter(enrollment__lesson=lesson, status='P').count()
+        for lesson in lessons:
+            row = counts.get(lesson.id, {})
+            total, present = row.get('total', 0), row.get('present', 0)
             lesson_summaries.append({
                 'lesson_id': lesson.id,
+                'pattern_id': lesson.pattern_id,
                 'subject': lesson.subject.name,
                 'stream': f"{lesson.stream.grade.name} {lesson.stream.name}" if lesson.stream else '',
                 'day': lesson.day_of_week,
@@ -2991,23 +2828,33 @@ class SmartAttendanceView(APIView):
             return Response({'error': 'card_numbers list is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
         from school.models import SmartID
+        cards = {
+            sid.card_number: sid.student
+            for sid in SmartID.objects.filter(
+                card_number__in=card_numbers, school=school, student__isnull=False,
+            ).select_related('student__user')
+        }
+        enrollments = {
+            e.student_id: e for e in lesson_enrollments(lesson).filter(
+                student_id__in=[st.id for st in cards.values()],
+            )
+        }
         marked_present = []
         not_found = []
+        marks = []
         for card_num in card_numbers:
-            smart_id = SmartID.objects.filter(card_number=card_num, school=school).first()
-            if not smart_id or not smart_id.student:
+            student = cards.get(card_num)
+            if student is None:
                 not_found.append(card_num)
                 continue
-            student = smart_id.student
-            enrollment = Enrollment.objects.filter(student=student, lesson=lesson).first()
+            enrollment = enrollments.get(student.id)
             if enrollment:
-                teacher = getattr(request.user, 'staffprofile', None)
-                Attendance.objects.update_or_create(
-                    enrollment=enrollment,
-                    date=lesson.lesson_date or timezone.now().date(),
-                    defaults={'status': 'P', 'marked_by': teacher}
-                )
+                marks.append((enrollment, 'P', None))
                 marked_present.append(student.user.get_full_name())
+        record_attendance(
+            marks, lesson.lesson_date or timezone.now().date(), lesson=lesson,
+            marked_by=getattr(request.user, 'staffprofile', None), actor=request.user,
+        )
 
         return Response({
             'lesson_id': lesson_id,
@@ -3017,6 +2864,45 @@ class SmartAttendanceView(APIView):
         })
 
 
+class ScanBatchView(APIView):
+    """
+    POST: bulk-ingest biometric scans uploaded from a school's local spool
+    (school.services.scan_spool). Authenticated by the device's api_key in
+    the X-Device-Key header. Resending a batch is harmless.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    MAX_RECORDS = 5000
+
+    def post(self, request):
+        device = AttendanceDevice.objects.filter(
+            device_id=request.data.get('device_id') or '', is_active=True,
+        ).select_related('school').first()
+        key = request.headers.get('X-Device-Key', '')
+        if device is None or not device.api_key or not hmac.compare_digest(device.api_key, key):
+            return Response({'error': 'Unknown device or bad key.'}, status=status.HTTP_403_FORBIDDEN)
+
+        raw = request.data.get('records')
+        if not isinstance(raw, list) or len(raw) > self.MAX_RECORDS:
+            return Response(
+                {'error': f'records must be a list of at most {self.MAX_RECORDS} items.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        records = []
+        for i, item in enumerate(raw):
+            try:
+                user_id, scanned_at = str(item['user_id']), parse_datetime(str(item['timestamp']))
+            except (KeyError, TypeError, ValueError):
+                user_id, scanned_at = '', None
+            if scanned_at is None or not user_id:
+                return Response({'error': f'records[{i}] needs user_id and an ISO timestamp.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            records.append(ScanRecord(user_id, scanned_at))
+
+        created = ingest(device, records, _SCAN_CARDS, replay=True)
+        return Response({'received': len(records), 'stored': len(created)})
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # SPRINT 2 — Finance, Exams, Attendance Completeness
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -3235,43 +3121,32 @@ class FeeCollectionReportView(APIView):
         if not school:
             return Response({'error': 'No school.'}, status=status.HTTP_403_FORBIDDEN)
 
+        term = None
         term_id = request.query_params.get('term_id')
-        qs = FeeInvoice.objects.filter(school=school)
         if term_id:
-            qs = qs.filter(term_id=term_id)
+            term = Term.objects.filter(pk=term_id, school=school).first()
+            if term is None:
+                return Response({'error': 'Term not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        agg = qs.aggregate(
-            total_invoiced=Sum('amount_required'),
-            total_collected=Sum('amount_paid'),
-        )
-        total_invoiced = float(agg['total_invoiced'] or 0)
-        total_collected = float(agg['total_collected'] or 0)
-        balance = total_invoiced - total_collected
-        collection_rate = round(total_collected / total_invoiced * 100, 1) if total_invoiced else 0
-
-        by_status = list(qs.values('status').annotate(
-            count=Count('id'), amount=Sum('amount_required')
-        ))
-
-        by_grade = []
-        grades = Grade.objects.filter(school=school)
-        for grade in grades:
-            g_qs = qs.filter(student__grade_level=grade)
-            g_agg = g_qs.aggregate(invoiced=Sum('amount_required'), collected=Sum('amount_paid'))
-            by_grade.append({
-                'grade': grade.name,
-                'total_students': g_qs.values('student').distinct().count(),
-                'total_invoiced': float(g_agg['invoiced'] or 0),
-                'total_collected': float(g_agg['collected'] or 0),
-            })
+        report = collection_report(school, term, active_only=False)
+        total_invoiced = float(report['all']['expected'])
+        total_collected = float(report['all']['collected'])
 
         return Response({
             'total_invoiced': total_invoiced,
             'total_collected': total_collected,
-            'balance': balance,
-            'collection_rate': collection_rate,
-            'by_status': by_status,
-            'by_grade': by_grade,
+            'balance': total_invoiced - total_collected,
+            'collection_rate': report['all']['rate'],
+            'by_status': report['by_status'],
+            'by_grade': [
+                {
+                    'grade': g['grade'].name,
+                    'total_students': g['students'],
+                    'total_invoiced': float(g['expected']),
+                    'total_collected': float(g['collected']),
+                }
+                for g in report['grades']
+            ],
         })
 
 
@@ -3317,32 +3192,20 @@ class StudentFeeStatementView(APIView):
 
 # ── Exam Rankings ─────────────────────────────────────────────────────────────
 
-def _compute_exam_ranking(session, students):
+def _compute_exam_ranking(session, students, stream=None):
     """Return sorted list with position, totals, for students in session."""
-    from school.models import ExamResult as ER
-    rows = []
-    for student in students:
-        results = ER.objects.filter(session=session, student=student)
-        total = sum(r.total for r in results if r.total is not None)
-        pct = round(total / (session.total_marks * results.count()) * 100, 1) if results.count() and session.total_marks else None
-        rows.append({
-            'student': student,
-            'total_score': round(total, 2) if results.count() else None,
-            'percentage': pct,
-        })
-    rows.sort(key=lambda x: (x['total_score'] is None, -(x['total_score'] or 0)))
-    ranked = []
-    for i, row in enumerate(rows):
-        ranked.append({
-            'position': i + 1,
+    return [
+        {
+            'position': row['position'] if row['total'] is not None else None,
             'student_id': row['student'].student_id,
             'student_name': row['student'].user.get_full_name(),
             'stream_name': row['student'].stream.name if row['student'].stream else None,
-            'total_score': row['total_score'],
+            'total_score': row['total'],
             'percentage': row['percentage'],
-            'grade_band': None,
-        })
-    return ranked
+            'grade_band': row['grade_band'] if row['total'] is not None else None,
+        }
+        for row in rank_students(session, students, stream=stream)
+    ]
 
 
 class ExamGradeRankingView(APIView):
@@ -3381,7 +3244,7 @@ class ExamStreamRankingView(APIView):
         students = Student.objects.filter(
             school=school, stream=stream, is_active=True
         ).select_related('user', 'stream')
-        ranking = _compute_exam_ranking(session, students)
+        ranking = _compute_exam_ranking(session, students, stream=stream)
         return Response({
             'session': session.name,
             'stream': f"{stream.grade.name} {stream.name}",
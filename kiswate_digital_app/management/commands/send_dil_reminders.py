@@ -1,71 +1,36 @@
 """
 send_dil_reminders — dispatch pending DIL NotificationLog entries.
 
-Processes NotificationLog records with status='pending', fires them via
-the EUJIM SMS gateway and/or Django email depending on notification_type,
-then updates each record's status to 'sent' or 'failed'.
+Processes NotificationLog records with status='pending' and sends them by
+SMS and/or email depending on notification_type. SMS go out concurrently
+through the pooled EUJIM gateway client (school.services.sms). Email reuses
+one SMTP connection. Records are leased in batches of SEND_BATCH_SIZE
+before anything is sent (school.services.jobs.lease_rows), so overlapping
+runs never send the same reminder twice. Each batch's status ('sent' or
+'failed') is saved as soon as it is done, and its lease is released.
 
 Run every minute via cron:
     * * * * * /path/to/venv/bin/python manage.py send_dil_reminders >> /var/log/kiswate/dil_reminders.log 2>&1
 """
-import time
-import requests
-from django.core.management.base import BaseCommand
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
 from django.utils import timezone
-from kiswate_digital_app.models import NotificationLog
-
-
-SMS_URL = getattr(settings, 'SMS_API_URL', 'https://quicksms.advantasms.com/api/services/sendsms/')
 
+from kiswate_digital_app.models import NotificationLog
+from school.services.jobs import lease_rows, worker_name
+from school.services.sms import send_batch
 
-def _phone_ke(phone: str) -> str:
-    p = str(phone).strip().replace(' ', '').replace('-', '')
-    if p.startswith('0'):
-        return '254' + p[1:]
-    if p.startswith('+254'):
-        return p[1:]
-    if not p.startswith('254'):
-        return '254' + p
-    return p
+SEND_BATCH_SIZE = 200
+SEND_LEASE_SECONDS = 60 * 15  # well beyond one batch, even with slow SMTP
 
 
-def _send_sms(phone: str, message: str) -> tuple:
-    """Returns (success: bool, error: str)."""
-    api_key = getattr(settings, 'SMS_API_KEY', '')
-    partner = getattr(settings, 'SMS_PARTNERID', '')
-    shortcode = getattr(settings, 'SMS_SHORTCODE', '')
-    if not all([api_key, partner, shortcode]):
-        return False, 'SMS credentials not configured'
-    payload = {
-        'apikey': api_key,
-        'partnerID': partner,
-        'shortcode': shortcode,
-        'message': message,
-        'mobile': _phone_ke(phone),
-    }
-    for attempt in range(3):
-        try:
-            r = requests.post(SMS_URL, json=payload, timeout=15)
-            if r.status_code == 200:
-                data = r.json()
-                resp = data.get('responses', [{}])[0]
-                if resp.get('response-code') == 200:
-                    return True, ''
-        except requests.exceptions.RequestException as e:
-            err = str(e)
-        if attempt < 2:
-            time.sleep(3)
-    return False, err if 'err' in dir() else 'SMS send failed after retries'
-
-
-def _send_email(to: str, subject: str, body: str) -> tuple:
+def _send_email(connection, to: str, subject: str, body: str) -> tuple:
     """Returns (success: bool, error: str)."""
     if not to:
         return False, 'No email address'
     try:
-        send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [to], fail_silently=False)
+        send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [to], fail_silently=False, connection=connection)
         return True, ''
     except Exception as e:
         return False, str(e)
@@ -76,49 +41,78 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument(
-            '--limit', type=int, default=100,
-            help='Max notifications to process per run (default 100).'
+            '--limit', type=int, default=2000,
+            help='Max notifications to process per run (default 2000).'
         )
 
     def handle(self, *args, **options):
         limit = options['limit']
-        pending = NotificationLog.objects.filter(
-            status='pending'
-        ).select_related('recipient').order_by('created_at')[:limit]
+        pending = NotificationLog.objects.filter(status='pending').order_by('created_at')
+        owner = worker_name()
+        processed = sent = failed = 0
 
-        if not pending.exists():
+        connection = get_connection()
+        try:
+            try:
+                connection.open()
+            except Exception:
+                pass  # each send retries the connection and records its own error
+            while processed < limit:
+                batch = list(
+                    lease_rows(pending, owner, min(SEND_BATCH_SIZE, limit - processed), lease=SEND_LEASE_SECONDS)
+                    .select_related('recipient__user').order_by('created_at')
+                )
+                if not batch:
+                    break
+                self._deliver(batch, connection)
+                processed += len(batch)
+                sent += sum(1 for log in batch if log.status == 'sent')
+                failed += sum(1 for log in batch if log.status == 'failed')
+        finally:
+            connection.close()
+
+        if not processed:
             self.stdout.write('No pending DIL notifications.')
             return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'DIL reminders done — sent: {sent}, failed: {failed}'
+            )
+        )
 
-        sent = failed = 0
-
-        for log in pending:
+    def _deliver(self, batch, connection):
+        """Send one leased batch, then save its statuses and release it."""
+        outbox = [
+            (log.pk, log.recipient.phone, log.message)
+            for log in batch
+            if log.message and log.notification_type in ('sms', 'both') and getattr(log.recipient, 'phone', '')
+        ]
+        sms_results = send_batch(outbox)
+
+        for log in batch:
+            log.locked_by, log.locked_until = '', None
             profile = log.recipient
-            phone = getattr(profile, 'phone', '') or ''
             email = profile.user.email if profile.user_id else ''
             n_type = log.notification_type  # 'sms', 'email', 'both'
             subject = log.subject or 'Kiswate DIL Notification'
-            message = log.message or ''
 
-            if not message:
+            if not log.message:
                 log.status = 'failed'
                 log.error_message = 'Empty message body'
-                log.save(update_fields=['status', 'error_message'])
-                failed += 1
                 continue
 
             ok = False
             errors = []
 
-            if n_type in ('sms', 'both') and phone:
-                success, err = _send_sms(phone, message)
+            if log.pk in sms_results:
+                success, err = sms_results[log.pk]
                 if success:
                     ok = True
                 else:
                     errors.append(f'SMS: {err}')
 
             if n_type in ('email', 'both') and email:
-                success, err = _send_email(email, subject, message)
+                success, err = _send_email(connection, email, subject, log.message)
                 if success:
                     ok = True
                 else:
@@ -128,16 +122,10 @@ class Command(BaseCommand):
                 log.status = 'sent'
                 log.sent_at = timezone.now()
                 log.error_message = ''
-                sent += 1
             else:
                 log.status = 'failed'
                 log.error_message = '; '.join(errors) or 'No contact method available'
-                failed += 1
 
-            log.save(update_fields=['status', 'sent_at', 'error_message'])
-
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'DIL reminders done — sent: {sent}, failed: {failed}'
-            )
+        NotificationLog.objects.bulk_update(
+            batch, ['status', 'sent_at', 'error_message', 'locked_by', 'locked_until'], batch_size=500,
         )
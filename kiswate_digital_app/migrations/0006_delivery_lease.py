@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kiswate_digital_app', '0005_teacher_nullable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='locked_by',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -372,6 +372,9 @@ class NotificationLog(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     related_class = models.ForeignKey(VirtualClass, on_delete=models.SET_NULL, null=True, blank=True)
     related_assessment = models.ForeignKey(Assessment, on_delete=models.SET_NULL, null=True, blank=True)
+    # Lease held by the send_dil_reminders run delivering this row (see school.services.jobs.lease_rows).
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
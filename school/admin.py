@@ -15,6 +15,7 @@ admin.site.register(School)
 admin.site.register(Role)
 admin.site.register(Timetable)
 admin.site.register(Lesson)
+admin.site.register(LessonPattern)
 admin.site.register(Grade)
 admin.site.register(StaffProfile)
 admin.site.register(Student)
@@ -56,4 +57,18 @@ admin.site.register(AttendanceAlert)
 admin.site.register(Pathway)
 admin.site.register(Upload)
 admin.site.register(SubjectEnrollment)
-admin.site.register(AuditLog)
\ No newline at end of file
+admin.site.register(AuditLog)
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'school', 'status', 'priority', 'attempts', 'run_after', 'locked_by', 'created_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('created_at', 'finished_at')
+
+
+@admin.register(AttendanceDevice)
+class AttendanceDeviceAdmin(admin.ModelAdmin):
+    list_display = ('device_id', 'school', 'kind', 'host', 'location', 'is_active', 'last_synced_at', 'last_seen_at')
+    list_filter = ('kind', 'is_active')
+    search_fields = ('device_id', 'host', 'location')
+    readonly_fields = ('last_synced_at', 'last_record_count', 'last_seen_at', 'last_error')
@@ -1328,8 +1328,14 @@ class FeePaymentUploadForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-select'}),
     )
     file = forms.FileField(
-        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.xlsx,.xls'}),
-        help_text='Excel: columns student_id, amount, payment_method (cash/mpesa/cheque/bank), notes',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.xlsx,.xls,.csv'}),
+        help_text='Excel/CSV, or a bank / M-Pesa statement export: student_id (or account), amount, '
+                  'reference, payment_date, payment_method, notes',
+    )
+    payment_method = forms.ChoiceField(
+        choices=FeeInvoice.PAYMENT_METHOD_CHOICES, initial='cash', required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        help_text='Used for rows without a payment_method column.',
     )
 
     def __init__(self, school, *args, **kwargs):
@@ -1,7 +1,8 @@
 # your_app/management/commands/check_lessons.py
 from django.core.management.base import BaseCommand
 from datetime import timedelta
-from school.models import Lesson, Subject,Grade, Term,StaffProfile
+from school.models import Lesson, LessonPattern, Subject,Grade, Term,StaffProfile
+from school.services.lesson_patterns import occurrences
 from collections import defaultdict
 import datetime
 class Command(BaseCommand):
@@ -32,14 +33,13 @@ class Command(BaseCommand):
                 self.stdout.write(f"  👨‍🏫 Teacher: {teacher.user.get_full_name()}")
 
                 # Filter lessons for this subject & teacher in this term by lesson_date
-                lessons = Lesson.objects.filter(
-                    subject=subject,
-                    teacher=teacher,
-                    lesson_date__gte=term.start_date,
-                    lesson_date__lte=term.end_date
-                ).order_by('lesson_date')
+                lessons = occurrences(
+                    LessonPattern.objects.filter(subject=subject, teacher=teacher),
+                    term.start_date, term.end_date,
+                    lessons=Lesson.objects.filter(subject=subject, teacher=teacher),
+                )
 
-                if not lessons.exists():
+                if not lessons:
                     self.stdout.write("    ❌ No lessons created for this teacher.\n")
                     continue
 
@@ -0,0 +1,58 @@
+"""
+generate_report_slips — render every report slip of an exam session in one go.
+
+Covers the whole grade, or one stream with --stream, as a single merged PDF
+or a ZIP of one PDF per student; either is rendered in chunks across a
+process pool. The run is
+recorded as a ReportSlipJob, so it also shows up for web download.
+
+    python manage.py generate_report_slips --session 12
+    python manage.py generate_report_slips --session 12 --stream 4 --format zip --workers 4
+    python manage.py generate_report_slips --session 12 --output /tmp/g7_slips.pdf
+"""
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+
+from school.models import ExamSession, ReportSlipJob, Streams
+from school.services.report_slips import run_report_slip_job
+
+
+class Command(BaseCommand):
+    help = 'Render all report slips of an exam session as a merged PDF or ZIP.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', type=int, required=True, help='ExamSession id.')
+        parser.add_argument('--stream', type=int, help='Limit to one stream id (default: whole grade).')
+        parser.add_argument('--format', choices=[c for c, _ in ReportSlipJob.FORMAT_CHOICES],
+                            default=ReportSlipJob.FORMAT_PDF)
+        parser.add_argument('--workers', type=int, help='Render processes (default settings.REPORT_SLIP_WORKERS or 2).')
+        parser.add_argument('--output', help='Also copy the result to this path.')
+
+    def handle(self, *args, **options):
+        try:
+            session = ExamSession.objects.select_related('school', 'grade').get(pk=options['session'])
+        except ExamSession.DoesNotExist:
+            raise CommandError(f"Exam session {options['session']} not found.")
+
+        stream = None
+        if options['stream']:
+            stream = Streams.objects.filter(
+                pk=options['stream'], school=session.school, grade=session.grade,
+            ).first()
+            if stream is None:
+                raise CommandError(f"Stream {options['stream']} is not part of {session.grade}.")
+
+        job = ReportSlipJob.objects.create(
+            session=session, school=session.school, stream=stream, output_format=options['format'],
+        )
+        job = run_report_slip_job(job.pk, workers=options['workers'])
+        if job.status != ReportSlipJob.STATUS_DONE:
+            raise CommandError(f"Failed: {job.error}")
+
+        if options['output']:
+            shutil.copyfile(job.file_path, options['output'])
+        elapsed = (job.finished_at - job.created_at).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f"{job.total} slips → {options['output'] or job.file_path} in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,106 @@
+"""
+generate_timetables — solve a whole school's term timetable in one pass.
+
+All selected streams are planned together in memory (teacher clashes are
+resolved across the school), then written with a single bulk insert.
+Use --dry-run to print the weekly plan and conflicts without writing.
+
+    python manage.py generate_timetables --school THS001
+    python manage.py generate_timetables --school THS001 --grade G7 --overwrite
+    python manage.py generate_timetables --school THS001 --dry-run
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from school.models import School, Streams, Term, Timetable
+from school.services.timetable_generator import WEEKDAYS, generate_for_school
+
+
+class Command(BaseCommand):
+    help = "Generate timetables for every stream of a school's active term."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school', required=True, help='School code.')
+        parser.add_argument('--term', type=int, help='Term id (default: the active term).')
+        parser.add_argument('--grade', help='Limit to one grade code.')
+        parser.add_argument('--stream', type=int, help='Limit to one stream id.')
+        parser.add_argument(
+            '--overwrite', action='store_true',
+            help='Delete and regenerate existing lessons of the selected timetables.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report the plan and conflicts without writing anything.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            school = School.objects.get(code=options['school'])
+        except School.DoesNotExist:
+            raise CommandError(f"School '{options['school']}' not found.")
+
+        terms = Term.objects.filter(school=school)
+        term = terms.filter(id=options['term']).first() if options['term'] else terms.filter(is_active=True).first()
+        if not term:
+            raise CommandError('No matching term (pass --term or activate one).')
+
+        streams = Streams.objects.filter(school=school, is_active=True).select_related('grade')
+        if options['grade']:
+            streams = streams.filter(grade__code=options['grade'])
+        if options['stream']:
+            streams = streams.filter(id=options['stream'])
+
+        dry_run = options['dry_run']
+        timetables = []
+        for st in streams:
+            lookup = dict(school=school, grade=st.grade, stream=st, term=term, year=term.start_date.year)
+            tt = Timetable.objects.filter(**lookup).first()
+            if tt is None:
+                tt = Timetable(start_date=term.start_date, end_date=term.end_date, **lookup)
+                if not dry_run:
+                    tt.save()
+            timetables.append(tt)
+
+        if not timetables:
+            raise CommandError('No streams selected.')
+
+        try:
+            plan, result = generate_for_school(
+                school, term, timetables, overwrite=options['overwrite'], dry_run=dry_run,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if dry_run:
+            self._print_plan(plan)
+
+        for c in plan.conflicts:
+            self.stdout.write(self.style.WARNING(
+                f"  [{c['type']}] {c.get('subject', '')} {c.get('stream', '')}"
+                + (f" missing={c['missing']}" if 'missing' in c else '')
+            ))
+
+        summary = (
+            f"{len(plan.timetables)} streams, {len(plan.placements)} weekly sessions, "
+            f"{len(plan.conflicts)} conflicts, {plan.backtracks} backtracks, {plan.elapsed:.2f}s"
+        )
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Dry run: {summary}. Nothing written."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{summary}. Created {len(result['patterns'])} weekly lessons, "
+                f"{result['enrollments_created']} enrollments."
+            ))
+
+    def _print_plan(self, plan):
+        slots = plan.time_slots
+        for tt in plan.timetables:
+            grid = plan.grid(tt.stream_id)
+            self.stdout.write(f"\n[{tt.grade.name} {tt.stream.name}]")
+            header = 'slot'.ljust(12) + ''.join(d[:3].title().ljust(14) for d in WEEKDAYS)
+            self.stdout.write(header)
+            for i, ts in enumerate(slots):
+                row = ts.start_time.strftime('%H:%M').ljust(12)
+                for day in range(len(WEEKDAYS)):
+                    p = grid.get((day, i))
+                    row += (plan.subject_names[p.subject_id][:12] if p else '-').ljust(14)
+                self.stdout.write(row)
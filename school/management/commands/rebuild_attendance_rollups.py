@@ -0,0 +1,53 @@
+"""
+rebuild_attendance_rollups — recompute the AttendanceDailyRollup table that
+the attendance dashboards read from.
+
+Rollups are refreshed automatically when attendance is marked; run this
+after a deploy that adds the table, after raw SQL fixes to Attendance, or
+nightly as a safety net:
+
+    python manage.py rebuild_attendance_rollups
+    python manage.py rebuild_attendance_rollups --school THS001 --from 2026-01-01 --to 2026-03-31
+    30 1 * * * /path/to/venv/bin/python manage.py rebuild_attendance_rollups --days 7 >> /var/log/kiswate/rollups.log 2>&1
+"""
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from school.models import School
+from school.services.attendance_rollup import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily attendance rollups from raw attendance.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school', help='School code (default: all schools).')
+        parser.add_argument('--from', dest='start', help='First date YYYY-MM-DD.')
+        parser.add_argument('--to', dest='end', help='Last date YYYY-MM-DD.')
+        parser.add_argument('--days', type=int, help='Only the last N days (overrides --from).')
+
+    def _parse(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+
+    def handle(self, *args, **options):
+        start, end = self._parse(options['start']), self._parse(options['end'])
+        if options['days']:
+            start = timezone.localdate() - timedelta(days=options['days'])
+
+        schools = School.objects.all()
+        if options['school']:
+            schools = schools.filter(code=options['school'])
+            if not schools.exists():
+                raise CommandError(f"School '{options['school']}' not found.")
+
+        total = 0
+        for school in schools:
+            written = rebuild(school, start, end)
+            total += written
+            self.stdout.write(f"  {school.name}: {written} rollup rows")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} rollup rows."))
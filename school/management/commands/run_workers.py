@@ -0,0 +1,99 @@
+"""
+run_workers — run the background job pool (Excel imports, exam uploads,
+report-slip batches; see school.services.jobs).
+
+Starts --workers processes that claim BackgroundJob rows and restarts any
+that die. On SIGTERM/SIGINT the workers finish their current job and the
+command exits. Jobs from a worker that was killed outright are re-claimed
+once their lease lapses.
+
+Run under systemd (see deployment/kiswate-workers.service):
+    python manage.py run_workers --workers 4
+    python manage.py run_workers --kind report_slips --workers 1
+    python manage.py run_workers --drain        # run what is queued now, then exit
+"""
+import multiprocessing
+import os
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from school.services.job_worker import worker_process
+from school.services.jobs import JOB_HANDLERS, POLL_SECONDS, work
+
+
+def worker(ctx, index, kinds, poll):
+    """An unstarted worker process for `ctx`."""
+    # Not daemonic: report_slips jobs open their own render pool, and daemonic
+    # processes may not have children. worker_process exits when this supervisor
+    # goes away, and handle() joins the workers on shutdown.
+    return ctx.Process(
+        target=worker_process, args=(index, kinds, poll), name=f'kiswate-worker-{index}', daemon=False,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Run background job worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'BACKGROUND_JOB_WORKERS', 2),
+            help='Worker processes (default settings.BACKGROUND_JOB_WORKERS or 2).'
+        )
+        parser.add_argument(
+            '--kind', action='append', choices=sorted(JOB_HANDLERS),
+            help='Only run jobs of this kind (repeatable; default all).'
+        )
+        parser.add_argument('--poll', type=float, default=POLL_SECONDS, help='Idle poll interval in seconds.')
+        parser.add_argument('--drain', action='store_true', help='Run queued jobs in this process, then exit.')
+
+    def handle(self, *args, **options):
+        kinds = options['kind']
+        if options['drain']:
+            work(kinds=kinds, drain=True)
+            self.stdout.write(self.style.SUCCESS('Queue drained.'))
+            return
+
+        count = options['workers']
+        if count < 1:
+            raise CommandError('--workers must be at least 1.')
+
+        # spawn, not fork: children set Django up themselves and never share parent DB sockets.
+        ctx = multiprocessing.get_context('spawn')
+        connections.close_all()
+
+        def start(index):
+            proc = worker(ctx, index, kinds, options['poll'])
+            proc.start()
+            return proc
+
+        stopping = []
+
+        def shutdown(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+        procs = [start(i) for i in range(count)]
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} worker(s) running ({', '.join(kinds) if kinds else 'all job kinds'})."
+        ))
+
+        while not stopping:
+            time.sleep(1)
+            for i, proc in enumerate(procs):
+                if not proc.is_alive() and not stopping:
+                    self.stderr.write(self.style.ERROR(f'Worker {i} exited ({proc.exitcode}); restarting.'))
+                    procs[i] = start(i)
+
+        self.stdout.write(f'Signal {stopping[0]}: stopping after current jobs…')
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped.'))
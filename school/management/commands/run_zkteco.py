@@ -0,0 +1,129 @@
+"""
+run_zkteco — ingest scans from every active ZKTeco device (see
+school.services.zkteco).
+
+Devices are AttendanceDevice rows (manage them in the admin). Each active
+device gets a thread holding a persistent connection; the device table is
+re-read every --reload seconds so added or deactivated devices are picked up
+without a restart. On SIGTERM/SIGINT the threads finish their current sync
+and the command exits.
+
+With --spool the poller writes every record to a local SQLite spool first
+and an uploader thread ships it to --upload (the server's /api/scans/bulk/),
+so scans survive a dropped link. The device list is then cached in the spool
+and used whenever the database cannot be reached.
+
+Run under systemd (see deployment/zkteco.service):
+    python manage.py run_zkteco
+    python manage.py run_zkteco --device grade1 --once   # one sync, then exit
+    python manage.py run_zkteco --spool /var/lib/kiswate/scans.db \
+        --upload https://kiswate.example/api/scans/bulk/
+"""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from school.models import AttendanceDevice
+from school.services.scan_spool import DEVICE_FIELDS, ScanSpool, Uploader
+from school.services.zkteco import POLL_SECONDS, DeviceSync, SmartIDCache
+
+
+class Command(BaseCommand):
+    help = 'Sync attendance logs from ZKTeco biometric devices.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', action='append', help='Only sync this device_id (repeatable).')
+        parser.add_argument('--poll', type=float, default=POLL_SECONDS, help='Seconds between syncs of a device.')
+        parser.add_argument('--reload', type=float, default=60, help='Seconds between re-reads of the device table.')
+        parser.add_argument('--once', action='store_true', help='Sync each device once, then exit.')
+        parser.add_argument('--spool', help='Local spool file; records are written here first.')
+        parser.add_argument('--upload', help='Bulk scan API URL the spool is uploaded to (with --spool).')
+
+    def _devices(self, only, spool=None):
+        qs = AttendanceDevice.objects.filter(is_active=True).select_related('school')
+        if only:
+            qs = qs.filter(device_id__in=only)
+        try:
+            devices = list(qs)
+        except DatabaseError:
+            if spool is None:
+                raise
+            self.stderr.write('Database unreachable; using the device list cached in the spool.')
+            devices = [
+                AttendanceDevice(device_id=device_id, **config)
+                for device_id, config in spool.devices().items()
+                if set(DEVICE_FIELDS) <= config.keys() and (not only or device_id in only)
+            ]
+        else:
+            if spool is not None:
+                spool.save_devices(devices)
+        return devices
+
+    def handle(self, *args, **options):
+        if bool(options['spool']) != bool(options['upload']):
+            raise CommandError('--spool and --upload go together.')
+        spool = ScanSpool(options['spool']) if options['spool'] else None
+        cache = None if spool else SmartIDCache()
+        devices = self._devices(options['device'], spool)
+        if not devices and (options['once'] or options['device']):
+            raise CommandError('No matching active devices.')
+
+        if options['once']:
+            for device in devices:
+                sync = DeviceSync(device, cache, spool=spool)
+                try:
+                    result = sync.sync()
+                except Exception as exc:
+                    self.stderr.write(self.style.ERROR(f'{device.device_id}: {exc}'))
+                    continue
+                finally:
+                    sync.close()
+                if spool:
+                    self.stdout.write(f'{device.device_id}: {result} record(s) spooled.')
+                else:
+                    self.stdout.write(f'{device.device_id}: {len(result)} new scan(s).')
+            if spool:
+                try:
+                    self.stdout.write(f'{Uploader(spool, options["upload"]).upload()} record(s) uploaded.')
+                except Exception as exc:
+                    self.stderr.write(self.style.ERROR(f'Upload failed, records kept in the spool: {exc}'))
+            return
+
+        stopping = threading.Event()
+
+        def shutdown(signum, frame):
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        threads = {}
+        if spool:
+            threads['uploader'] = threading.Thread(
+                target=Uploader(spool, options['upload']).run, args=(stopping.is_set,),
+                name='zk-uploader', daemon=True,
+            )
+            threads['uploader'].start()
+        while not stopping.is_set():
+            for device in devices:
+                thread = threads.get(device.device_id)
+                if thread is None or not thread.is_alive():
+                    thread = threading.Thread(
+                        target=DeviceSync(device, cache, spool=spool).run, args=(stopping.is_set, options['poll']),
+                        name=f'zk-{device.device_id}', daemon=True,
+                    )
+                    thread.start()
+                    threads[device.device_id] = thread
+                    self.stdout.write(f'Syncing {device} every {options["poll"]}s.')
+            stopping.wait(options['reload'])
+            try:
+                devices = self._devices(options['device'], spool)
+            except DatabaseError as exc:
+                self.stderr.write(self.style.ERROR(f'Could not reload devices: {exc}'))
+
+        self.stdout.write('Stopping after current syncs…')
+        for thread in threads.values():
+            thread.join()
+        self.stdout.write(self.style.SUCCESS('ZKTeco sync stopped.'))
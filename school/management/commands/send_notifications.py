@@ -1,72 +1,59 @@
 """
 send_notifications — dispatch pending school SMS notifications.
 
-Processes queued Notification records that have an sms_status of 'pending'
-and fires them via the EUJIM SMS gateway.  Email notifications are sent
-via Django's send_mail.
+Processes Notification records from the last 24 hours whose SMS or email
+has not been attempted yet (sms_sent / email_sent is NULL). Bulk-notify
+campaign rows are skipped; their own background jobs deliver them. SMS go out
+concurrently through the pooled, rate-limited EUJIM gateway client
+(school.services.sms). Email reuses one SMTP connection for the whole batch.
+Rows are leased in batches of SEND_BATCH_SIZE before anything is sent
+(school.services.jobs.lease_rows), so a run that overlaps the next cron
+tick never texts the same parent twice. Each batch's outcomes are written
+back to sms_sent / sms_error / email_sent / email_error as soon as it is
+done, and the lease is released. A delivered message is never picked up
+again. Rows of a run that crashed become available once their lease lapses.
 
 Run every minute via cron:
     * * * * * /path/to/venv/bin/python manage.py send_notifications >> /var/log/kiswate/sms.log 2>&1
 """
-import time
-import requests
-from django.core.management.base import BaseCommand
+from datetime import timedelta
+
 from django.conf import settings
-from django.core.mail import send_mail
-from school.models import Notification, Parent, StaffProfile
-
-
-SMS_URL = getattr(settings, 'SMS_API_URL', 'https://quicksms.advantasms.com/api/services/sendsms/')
-
-
-def _phone_ke(phone: str) -> str:
-    """Normalise phone to 254XXXXXXXXX format."""
-    p = str(phone).strip().replace(' ', '').replace('-', '')
-    if p.startswith('0'):
-        return '254' + p[1:]
-    if p.startswith('+254'):
-        return p[1:]
-    if not p.startswith('254'):
-        return '254' + p
-    return p
-
-
-def _sms(phone: str, message: str) -> bool:
-    api_key = getattr(settings, 'SMS_API_KEY', '')
-    partner = getattr(settings, 'SMS_PARTNERID', '')
-    shortcode = getattr(settings, 'SMS_SHORTCODE', '')
-    if not all([api_key, partner, shortcode]):
-        return False
-    payload = {
-        'apikey': api_key,
-        'partnerID': partner,
-        'shortcode': shortcode,
-        'message': message,
-        'mobile': _phone_ke(phone),
-    }
-    for attempt in range(3):
-        try:
-            r = requests.post(SMS_URL, json=payload, timeout=15)
-            if r.status_code == 200:
-                data = r.json()
-                resp = data.get('responses', [{}])[0]
-                if resp.get('response-code') == 200:
-                    return True
-        except requests.exceptions.RequestException:
-            pass
-        if attempt < 2:
-            time.sleep(3)
-    return False
-
-
-def _email(to: str, subject: str, body: str) -> bool:
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from school.models import Notification
+from school.services.jobs import lease_rows, worker_name
+from school.services.sms import send_batch
+
+DELIVERY_FIELDS = ['sms_sent', 'sms_error', 'email_sent', 'email_error', 'locked_by', 'locked_until']
+SEND_BATCH_SIZE = 200
+SEND_LEASE_SECONDS = 60 * 15  # well beyond one batch, even with slow SMTP
+
+
+def _phone(user):
+    phone = getattr(user, 'phone_number', '') or ''
+    if not phone:
+        staff = getattr(user, 'staffprofile', None)
+        if staff:
+            phone = getattr(staff, 'phone', '') or ''
+        parent = getattr(user, 'parent', None)
+        if parent:
+            phone = getattr(parent, 'phone', '') or phone
+    return phone
+
+
+def _email(connection, to, subject, body):
+    """Returns (success: bool, error: str)."""
     if not to:
-        return False
+        return False, 'No email address'
     try:
-        send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [to], fail_silently=False)
-        return True
-    except Exception:
-        return False
+        send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [to], fail_silently=False, connection=connection)
+        return True, ''
+    except Exception as e:
+        return False, str(e)[:500]
 
 
 class Command(BaseCommand):
@@ -74,71 +61,76 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument(
-            '--limit', type=int, default=50,
-            help='Max notifications to process per run (default 50).'
+            '--limit', type=int, default=2000,
+            help='Max notifications to process per run (default 2000).'
         )
 
     def handle(self, *args, **options):
-        limit = options['limit']
-        # Fetch notifications that haven't been delivered via SMS yet.
-        # We use a convention: Notification.is_read=False means undelivered.
-        # Only process notifications that also have an sms_pending flag or
-        # that were created by the system (title not null) in the last 24h.
-        from django.utils import timezone
-        from datetime import timedelta
         since = timezone.now() - timedelta(hours=24)
+        pending = (
+            Notification.objects.filter(sent_at__gte=since, campaign__isnull=True)
+            .filter(Q(sms_sent__isnull=True) | Q(email_sent__isnull=True))
+            .exclude(message='')
+            .order_by('sent_at')
+        )
+        owner = worker_name()
+        processed = sent_sms = sent_email = failed = 0
 
-        pending = Notification.objects.filter(
-            is_read=False,
-            sent_at__gte=since,
-        ).select_related('recipient').order_by('sent_at')[:limit]
-
-        if not pending.exists():
+        connection = get_connection()
+        try:
+            try:
+                connection.open()
+            except Exception:
+                pass  # each send retries the connection and records its own error
+            while processed < options['limit']:
+                batch = list(
+                    lease_rows(
+                        pending, owner, min(SEND_BATCH_SIZE, options['limit'] - processed),
+                        lease=SEND_LEASE_SECONDS,
+                    )
+                    .select_related('recipient', 'recipient__parent', 'recipient__staffprofile')
+                    .order_by('sent_at')
+                )
+                if not batch:
+                    break
+                sms_results = self._deliver(batch, connection)
+                processed += len(batch)
+                sent_sms += sum(1 for ok, _ in sms_results.values() if ok)
+                sent_email += sum(1 for n in batch if n.email_sent)
+                failed += sum(1 for n in batch if not n.sms_sent and not n.email_sent)
+        finally:
+            connection.close()
+
+        if not processed:
             self.stdout.write('No pending notifications.')
             return
-
-        sent_sms = 0
-        sent_email = 0
-        failed = 0
-
-        for notif in pending:
-            user = notif.recipient
-            subject_line = notif.title or 'Kiswate Notification'
-            body = notif.message or ''
-            if not body:
-                continue
-
-            # Resolve phone number
-            phone = getattr(user, 'phone_number', '') or ''
-            email = getattr(user, 'email', '') or ''
-
-            # Try phone via profile relations
-            if not phone:
-                staff = getattr(user, 'staffprofile', None)
-                if staff:
-                    phone = getattr(staff, 'phone', '') or ''
-                parent = getattr(user, 'parent', None)
-                if parent:
-                    phone = getattr(parent, 'phone', '') or phone
-
-            ok_sms = False
-            ok_email = False
-
-            if phone:
-                ok_sms = _sms(phone, f"{subject_line}: {body}")
-                if ok_sms:
-                    sent_sms += 1
-
-            if email:
-                ok_email = _email(email, subject_line, body)
-                if ok_email:
-                    sent_email += 1
-
-            if not ok_sms and not ok_email:
-                failed += 1
-
         self.stdout.write(
             self.style.SUCCESS(
                 f'Done — SMS sent: {sent_sms}, Email sent: {sent_email}, Failed: {failed}'
             )
         )
+
+    def _deliver(self, batch, connection):
+        """Send one leased batch, save its outcomes and release it; returns the SMS results."""
+        outbox = []
+        for notif in batch:
+            if notif.sms_sent is not None:
+                continue
+            phone = _phone(notif.recipient)
+            if phone:
+                outbox.append((notif.pk, phone, f"{notif.title or 'Kiswate Notification'}: {notif.message}"))
+            else:
+                notif.sms_sent, notif.sms_error = False, 'No phone number'
+        sms_results = send_batch(outbox)
+
+        for notif in batch:
+            if notif.pk in sms_results:
+                notif.sms_sent, notif.sms_error = sms_results[notif.pk]
+            if notif.email_sent is None:
+                notif.email_sent, notif.email_error = _email(
+                    connection, notif.recipient.email, notif.title or 'Kiswate Notification', notif.message,
+                )
+            notif.locked_by, notif.locked_until = '', None
+
+        Notification.objects.bulk_update(batch, DELIVERY_FIELDS, batch_size=500)
+        return sms_results
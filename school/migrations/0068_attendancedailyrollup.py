@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0067_complaint_multi_complainant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_count', models.PositiveIntegerField(default=0)),
+                ('present_count', models.PositiveIntegerField(default=0)),
+                ('excused_tardy_count', models.PositiveIntegerField(default=0)),
+                ('unexcused_tardy_count', models.PositiveIntegerField(default=0)),
+                ('excused_absence_count', models.PositiveIntegerField(default=0)),
+                ('unexcused_absence_count', models.PositiveIntegerField(default=0)),
+                ('behavior_count', models.PositiveIntegerField(default=0)),
+                ('suspension_count', models.PositiveIntegerField(default=0)),
+                ('expulsion_count', models.PositiveIntegerField(default=0)),
+                ('academic_year', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='school.academicyear')),
+                ('grade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='school.grade')),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='school.school')),
+                ('stream', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='school.streams')),
+                ('subject', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='school.subject')),
+                ('teacher', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='school.staffprofile')),
+                ('term', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='school.term')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['school', 'date'], name='school_atte_school__937925_idx'), models.Index(fields=['date'], name='school_atte_date_b074dd_idx'), models.Index(fields=['term'], name='school_atte_term_id_1e1d68_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0070_backgroundjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('audience', models.CharField(max_length=30)),
+                ('channel_inapp', models.BooleanField(default=True)),
+                ('channel_email', models.BooleanField(default=False)),
+                ('channel_sms', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('sending', 'Sending'), ('done', 'Done')], default='sending', max_length=10)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('batches', models.PositiveIntegerField(default=0)),
+                ('batches_done', models.PositiveIntegerField(default=0)),
+                ('email_sent', models.PositiveIntegerField(default=0)),
+                ('email_failed', models.PositiveIntegerField(default=0)),
+                ('sms_sent', models.PositiveIntegerField(default=0)),
+                ('sms_failed', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notification_campaigns', to=settings.AUTH_USER_MODEL)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_campaigns', to='school.school')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='campaign',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='school.notificationcampaign'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0071_notificationcampaign'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LessonPattern',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day_of_week', models.CharField(choices=[('monday', 'Monday'), ('tuesday', 'Tuesday'), ('wednesday', 'Wednesday'), ('thursday', 'Thursday'), ('friday', 'Friday'), ('saturday', 'Saturday'), ('sunday', 'Sunday')], max_length=10)),
+                ('room', models.CharField(blank=True, max_length=50)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_patterns', to='school.school')),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_patterns', to='school.streams')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_patterns', to='school.subject')),
+                ('teacher', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lesson_patterns', to='school.staffprofile')),
+                ('term', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lesson_patterns', to='school.term')),
+                ('time_slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_patterns', to='school.timeslot')),
+                ('timetable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patterns', to='school.timetable')),
+            ],
+            options={
+                'ordering': ['day_of_week', 'time_slot__start_time'],
+            },
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='pattern',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='p_enrollments', to='school.lessonpattern'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='pattern',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='school.lessonpattern'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['pattern'], name='school_enro_pattern_4362c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['pattern', 'lesson_date'], name='school_less_pattern_c0bbaf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lessonpattern',
+            index=models.Index(fields=['teacher', 'day_of_week'], name='school_less_teacher_fa85e5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lessonpattern',
+            index=models.Index(fields=['stream', 'day_of_week'], name='school_less_stream__342c77_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='lessonpattern',
+            unique_together={('timetable', 'subject', 'day_of_week', 'time_slot', 'stream')},
+        ),
+    ]
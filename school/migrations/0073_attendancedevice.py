@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0072_lessonpattern'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scanlog',
+            name='scanned_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='AttendanceDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=100, unique=True)),
+                ('host', models.CharField(max_length=255)),
+                ('port', models.PositiveIntegerField(default=4370)),
+                ('location', models.CharField(blank=True, max_length=255)),
+                ('kind', models.CharField(choices=[('gate', 'Gate (notify parents)'), ('grade', 'Grade / classroom (mark attendance)')], default='gate', max_length=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_record_count', models.PositiveIntegerField(default=0)),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_devices', to='school.school')),
+            ],
+            options={
+                'ordering': ['school', 'device_id'],
+            },
+        ),
+    ]
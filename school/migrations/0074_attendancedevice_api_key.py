@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0073_attendancedevice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancedevice',
+            name='api_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
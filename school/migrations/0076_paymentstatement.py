@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:18
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0075_invoicegenerationjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentStatement',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('default_method', models.CharField(choices=[('mpesa', 'M-Pesa STK Push'), ('cash', 'Cash'), ('cheque', 'Cheque'), ('bank', 'Bank Transfer')], default='cash', max_length=10)),
+                ('rows', models.JSONField(blank=True, default=list)),
+                ('status', models.CharField(choices=[('draft', 'Awaiting confirmation'), ('posted', 'Posted'), ('discarded', 'Discarded')], default='draft', max_length=20)),
+                ('summary', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('posted_at', models.DateTimeField(blank=True, null=True)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_statements', to='school.school')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_statements', to='school.term')),
+                ('uploaded_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
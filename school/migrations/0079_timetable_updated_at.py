@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0078_delivery_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='lessonpattern',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:15
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def date_scanned_rows(apps, schema_editor):
+    """Scanned rows were stamped with their upload time; use the scan time."""
+    GradeAttendance = apps.get_model('school', 'GradeAttendance')
+    ScanLog = apps.get_model('school', 'ScanLog')
+    GradeAttendance.objects.filter(scan_log__isnull=False).update(
+        recorded_at=Subquery(ScanLog.objects.filter(pk=OuterRef('scan_log_id')).values('scanned_at')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0079_timetable_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='gradeattendance',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(date_scanned_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_delivery_records(apps, schema_editor):
+    """
+    Campaign email/SMS outcomes lived on Notification rows, written (already
+    read) even when the in-app channel was off. Copy them to CampaignDelivery
+    and drop the rows that were never meant for the inbox.
+    """
+    Notification = apps.get_model('school', 'Notification')
+    CampaignDelivery = apps.get_model('school', 'CampaignDelivery')
+    rows = Notification.objects.filter(
+        campaign__isnull=False,
+    ).filter(
+        models.Q(campaign__channel_email=True) | models.Q(campaign__channel_sms=True),
+    ).values_list('campaign_id', 'recipient_id', 'sms_sent', 'email_sent', 'sms_error', 'email_error')
+    CampaignDelivery.objects.bulk_create(
+        [
+            CampaignDelivery(
+                campaign_id=campaign_id, recipient_id=recipient_id, sms_sent=sms_sent,
+                email_sent=email_sent, sms_error=sms_error, email_error=email_error,
+            )
+            for campaign_id, recipient_id, sms_sent, email_sent, sms_error, email_error in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+    Notification.objects.filter(campaign__isnull=False, campaign__channel_inapp=False).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0080_gradeattendance_scan_time'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationcampaign',
+            name='batches_failed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CampaignDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('sms_sent', models.BooleanField(blank=True, null=True)),
+                ('email_sent', models.BooleanField(blank=True, null=True)),
+                ('sms_error', models.CharField(blank=True, max_length=500)),
+                ('email_error', models.CharField(blank=True, max_length=500)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='school.notificationcampaign')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='campaign_deliveries', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(move_delivery_records, migrations.RunPython.noop),
+    ]
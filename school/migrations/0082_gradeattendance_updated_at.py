@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:30
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def stamp_existing_rows(apps, schema_editor):
+    """Existing rows were last written when they were recorded."""
+    apps.get_model('school', 'GradeAttendance').objects.update(updated_at=F('recorded_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0081_campaigndelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gradeattendance',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(stamp_existing_rows, migrations.RunPython.noop),
+    ]
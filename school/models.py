@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
 from decimal import Decimal
+import secrets
 import uuid
 from django.utils import timezone
 from userauths.models import User
@@ -414,6 +415,7 @@ class Student(models.Model):
     is_active = models.BooleanField(default=True)
     suspended = models.BooleanField(default=False)  # New: For marking suspensions
     expelled = models.BooleanField(default=False)  # New: For marking expulsions
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.student_id})"
@@ -474,6 +476,12 @@ class Enrollment(models.Model):
         on_delete=models.CASCADE,
         related_name="l_enrollments",        blank=True, null=True
     )    
+    # Pattern-level roster row (lesson is empty); dated rows are created from it on demand.
+    pattern = models.ForeignKey(
+        'LessonPattern',
+        on_delete=models.CASCADE,
+        related_name='p_enrollments', blank=True, null=True
+    )
     enrolled_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=ENROLLMENT_STATUS_CHOICES, default='active')
     school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='enrollments')
@@ -482,10 +490,15 @@ class Enrollment(models.Model):
         indexes = [
             models.Index(fields=['lesson']),
             models.Index(fields=['student']),
+            models.Index(fields=['pattern']),
         ]
 
     def __str__(self):
-        return f"{self.student} → {self.lesson.subject if self.lesson else 'No Lesson'}"
+        if self.lesson:
+            return f"{self.student} → {self.lesson.subject}"
+        if self.pattern:
+            return f"{self.student} → {self.pattern.subject}"
+        return f"{self.student} → No Lesson"
 
 
 class AcademicYear(models.Model):
@@ -559,6 +572,43 @@ WEEKDAY_CHOICES = [
     ('sunday', 'Sunday'),
 ]
 
+class LessonPattern(models.Model):
+    """
+    A weekly recurring lesson (weekday + time slot + subject + teacher + stream)
+    for a term. This is the stored timetable; dated Lesson rows are only
+    materialised from it on first attendance mark or for one-off changes, see
+    school.services.lesson_patterns.
+    """
+    school = models.ForeignKey('School', on_delete=models.CASCADE, related_name='lesson_patterns')
+    timetable = models.ForeignKey(Timetable, on_delete=models.CASCADE, related_name='patterns')
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name='lesson_patterns', blank=True, null=True)
+    stream = models.ForeignKey('Streams', on_delete=models.CASCADE, related_name='lesson_patterns')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='lesson_patterns')
+    teacher = models.ForeignKey('StaffProfile', on_delete=models.SET_NULL, related_name='lesson_patterns', blank=True, null=True)
+    day_of_week = models.CharField(max_length=10, choices=WEEKDAY_CHOICES)
+    time_slot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE, related_name='lesson_patterns')
+    room = models.CharField(max_length=50, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['day_of_week', 'time_slot__start_time']
+        unique_together = ['timetable', 'subject', 'day_of_week', 'time_slot', 'stream']
+        indexes = [
+            models.Index(fields=['teacher', 'day_of_week']),
+            models.Index(fields=['stream', 'day_of_week']),
+        ]
+
+    @property
+    def weekday(self):
+        """date.weekday() index of day_of_week (Monday = 0)."""
+        return [code for code, _ in WEEKDAY_CHOICES].index(self.day_of_week)
+
+    def __str__(self):
+        return f"{self.subject} - {self.stream} - {self.day_of_week} {self.time_slot.start_time}-{self.time_slot.end_time}"
+
+
 class Lesson(models.Model):
     timetable = models.ForeignKey(Timetable, on_delete=models.CASCADE, related_name='lessons', blank=True, null=True)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='lessons', blank=True, null=True)
@@ -570,6 +620,8 @@ class Lesson(models.Model):
     is_canceled = models.BooleanField(default=False)
     lesson_date = models.DateField(blank=True, null=True)  # For one-off changes
     notes = models.TextField(blank=True)
+    pattern = models.ForeignKey(LessonPattern, on_delete=models.CASCADE, related_name='occurrences', blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['day_of_week','lesson_date', 'time_slot__start_time']
@@ -577,6 +629,7 @@ class Lesson(models.Model):
         indexes = [
             models.Index(fields=['teacher', 'lesson_date']),
             models.Index(fields=['timetable', 'day_of_week']),
+            models.Index(fields=['pattern', 'lesson_date']),
         ]
 
     def __str__(self):
@@ -670,6 +723,7 @@ class Attendance(models.Model):
         related_name='marked_attendance'
     )
     marked_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def clean(self):
         # Only certain roles can mark '18'/'20'
@@ -688,6 +742,42 @@ class Attendance(models.Model):
         return f"{self.enrollment.student} - {self.enrollment.lesson.subject} on {self.date}"
 
 
+class AttendanceDailyRollup(models.Model):
+    """
+    Per-day attendance counters for dashboards, one row per
+    (school, date, term, grade, stream, subject, teacher). Derived from
+    Attendance by school.services.attendance_rollup; never edit by hand.
+    """
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='attendance_rollups')
+    date = models.DateField()
+    academic_year = models.ForeignKey(AcademicYear, on_delete=models.CASCADE, blank=True, null=True)
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, blank=True, null=True)
+    grade = models.ForeignKey(Grade, on_delete=models.CASCADE, blank=True, null=True)
+    stream = models.ForeignKey(Streams, on_delete=models.CASCADE, blank=True, null=True)
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, blank=True, null=True)
+    teacher = models.ForeignKey(StaffProfile, on_delete=models.CASCADE, blank=True, null=True)
+
+    total_count = models.PositiveIntegerField(default=0)
+    present_count = models.PositiveIntegerField(default=0)              # P
+    excused_tardy_count = models.PositiveIntegerField(default=0)        # ET
+    unexcused_tardy_count = models.PositiveIntegerField(default=0)      # UT
+    excused_absence_count = models.PositiveIntegerField(default=0)      # EA
+    unexcused_absence_count = models.PositiveIntegerField(default=0)    # UA
+    behavior_count = models.PositiveIntegerField(default=0)             # IB
+    suspension_count = models.PositiveIntegerField(default=0)           # 18
+    expulsion_count = models.PositiveIntegerField(default=0)            # 20
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['school', 'date']),
+            models.Index(fields=['date']),
+            models.Index(fields=['term']),
+        ]
+
+    def __str__(self):
+        return f"{self.school} {self.date}: {self.present_count}/{self.total_count}"
+
+
 
 # DisciplineRecord
 class DisciplineRecord(models.Model):
@@ -703,6 +793,7 @@ class DisciplineRecord(models.Model):
     reported_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='discipline_reports')
     frequency_count = models.PositiveIntegerField(default=1)  # New: Track repeats for patterns
     resolved = models.BooleanField(default=False)  # New: For follow-up
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         indexes = [models.Index(fields=['student', 'date', 'severity']),models.Index(fields=['teacher', 'date']),
@@ -744,6 +835,11 @@ class Notification(models.Model):
     email_sent = models.BooleanField(null=True, blank=True)
     sms_error = models.CharField(max_length=500, blank=True)
     email_error = models.CharField(max_length=500, blank=True)
+    # Set for bulk sends; their email/SMS is delivered by the campaign's jobs, not send_notifications.
+    campaign = models.ForeignKey('NotificationCampaign', on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications')
+    # Lease held by the send_notifications run delivering this row (see school.services.jobs.lease_rows).
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-sent_at']
@@ -754,6 +850,67 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.title} to {self.recipient.get_full_name()}"
 
+
+class NotificationCampaign(models.Model):
+    """
+    One bulk notification. With the in-app channel on each recipient gets a
+    Notification row; email/SMS go out in batched background jobs
+    (school.services.campaigns) that record each recipient's outcome on a
+    CampaignDelivery row.
+    """
+    STATUS_SENDING = 'sending'
+    STATUS_DONE    = 'done'
+    STATUS_CHOICES = [
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_DONE,    'Done'),
+    ]
+
+    school        = models.ForeignKey(School, on_delete=models.CASCADE, related_name='notification_campaigns')
+    created_by    = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='notification_campaigns')
+    title         = models.CharField(max_length=255)
+    message       = models.TextField()
+    audience      = models.CharField(max_length=30)
+    channel_inapp = models.BooleanField(default=True)
+    channel_email = models.BooleanField(default=False)
+    channel_sms   = models.BooleanField(default=False)
+    status        = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_SENDING)
+    total         = models.PositiveIntegerField(default=0)
+    batches       = models.PositiveIntegerField(default=0)
+    batches_done  = models.PositiveIntegerField(default=0)  # finished, whether delivered or failed
+    batches_failed = models.PositiveIntegerField(default=0)
+    email_sent    = models.PositiveIntegerField(default=0)
+    email_failed  = models.PositiveIntegerField(default=0)
+    sms_sent      = models.PositiveIntegerField(default=0)
+    sms_failed    = models.PositiveIntegerField(default=0)
+    created_at    = models.DateTimeField(auto_now_add=True)
+    finished_at   = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.title} → {self.audience} ({self.total})"
+
+    @property
+    def progress_pct(self):
+        if self.batches:
+            return min(100, int(self.batches_done / self.batches * 100))
+        return 100 if self.status == self.STATUS_DONE else 0
+
+
+class CampaignDelivery(models.Model):
+    """Email/SMS target of a NotificationCampaign and its outcome (None = not attempted)."""
+    campaign    = models.ForeignKey(NotificationCampaign, on_delete=models.CASCADE, related_name='deliveries')
+    recipient   = models.ForeignKey(User, on_delete=models.CASCADE, related_name='campaign_deliveries')
+    phone       = models.CharField(max_length=20, blank=True)
+    sms_sent    = models.BooleanField(null=True, blank=True)
+    email_sent  = models.BooleanField(null=True, blank=True)
+    sms_error   = models.CharField(max_length=500, blank=True)
+    email_error = models.CharField(max_length=500, blank=True)
+
+    def __str__(self):
+        return f"{self.campaign_id} → {self.recipient_id}"
+
 # Smart ID model 
 class SmartID(models.Model):
     profile = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -773,7 +930,7 @@ class SmartID(models.Model):
 class ScanLog(models.Model):
     smart_id = models.ForeignKey(SmartID, on_delete=models.CASCADE, related_name='scan_logs')
     scan_id =  models.CharField(max_length=100, unique=True, db_index=True)
-    scanned_at = models.DateTimeField(auto_now_add=True)
+    scanned_at = models.DateTimeField(default=timezone.now, db_index=True)  # Device time for biometric scans
     location = models.CharField(max_length=255, blank=True)  # e.g., "Main Gate", "Library"
     device_id = models.CharField(max_length=100, blank=True)  # ID of the scanning device
     action = models.CharField(max_length=50, blank=True)  # e.g., "Entry", "Exit"
@@ -781,12 +938,48 @@ class ScanLog(models.Model):
     def __str__(self):
         return f"ScanLog: {self.smart_id} at {self.scanned_at}"
 
+class AttendanceDevice(models.Model):
+    """A ZKTeco biometric terminal polled by `manage.py run_zkteco`."""
+    KIND_GATE = 'gate'
+    KIND_GRADE = 'grade'
+    KIND_CHOICES = [
+        (KIND_GATE, 'Gate (notify parents)'),
+        (KIND_GRADE, 'Grade / classroom (mark attendance)'),
+    ]
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='attendance_devices')
+    device_id = models.CharField(max_length=100, unique=True)  # Written to ScanLog.device_id
+    host = models.CharField(max_length=255)  # IP address or hostname
+    port = models.PositiveIntegerField(default=4370)
+    location = models.CharField(max_length=255, blank=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=KIND_GATE)
+    is_active = models.BooleanField(default=True)
+    api_key = models.CharField(max_length=64, blank=True)  # Sent by edge uploaders to /api/scans/bulk/
+    # Sync state: newest record ingested (high-water mark) and the device's record count at that point.
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_record_count = models.PositiveIntegerField(default=0)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['school', 'device_id']
+
+    def __str__(self):
+        return f"{self.device_id} ({self.location or self.host})"
+
+    def save(self, *args, **kwargs):
+        if not self.api_key:
+            self.api_key = secrets.token_hex(32)
+        super().save(*args, **kwargs)
+
+
 class GradeAttendance(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='grade_attendance')
     stream = models.ForeignKey(Streams, on_delete=models.CASCADE,blank=True, null=True)
     status = models.CharField(max_length=5, choices=ATTENDANCE_STATUS_CHOICES, default='P')
-    recorded_at = models.DateTimeField(auto_now_add=True)
+    recorded_at = models.DateTimeField(default=timezone.now)  # the scan time for scanned rows
     scan_log = models.ForeignKey(ScanLog, null=True, blank=True, on_delete=models.SET_NULL)
+    # When the row was last written; replayed scans arrive with an old recorded_at.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.student.user.get_full_name()} - {self.status}"    
@@ -1553,16 +1746,23 @@ class FeeInvoice(models.Model):
     def balance(self):
         return self.amount_required - self.amount_paid
 
-    def save(self, *args, **kwargs):
-        if not self.receipt_number:
-            import uuid
-            self.receipt_number = f"RCP-{str(uuid.uuid4()).upper()[:8]}"
+    @staticmethod
+    def new_receipt_number():
+        return f"RCP-{str(uuid.uuid4()).upper()[:8]}"
+
+    def refresh_status(self):
+        """Derive status from the amounts; save() and bulk writers both call this."""
         if self.amount_paid >= self.amount_required:
             self.status = 'paid'
         elif self.amount_paid > 0:
             self.status = 'partial'
         else:
             self.status = 'pending'
+
+    def save(self, *args, **kwargs):
+        if not self.receipt_number:
+            self.receipt_number = self.new_receipt_number()
+        self.refresh_status()
         super().save(*args, **kwargs)
 
 
@@ -1759,3 +1959,165 @@ class ExamUploadJob(models.Model):
         if self.total_rows:
             return min(100, int(self.processed / self.total_rows * 100))
         return 0
+
+
+class ReportSlipJob(models.Model):
+    """Batch render of every report slip of an exam session for a grade or one stream."""
+    STATUS_PENDING    = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE       = 'done'
+    STATUS_FAILED     = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING,    'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE,       'Done'),
+        (STATUS_FAILED,     'Failed'),
+    ]
+    FORMAT_PDF = 'pdf'
+    FORMAT_ZIP = 'zip'
+    FORMAT_CHOICES = [
+        (FORMAT_PDF, 'Single merged PDF'),
+        (FORMAT_ZIP, 'ZIP of one PDF per student'),
+    ]
+
+    id           = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    session      = models.ForeignKey('ExamSession', on_delete=models.CASCADE, related_name='slip_jobs')
+    school       = models.ForeignKey('School', on_delete=models.CASCADE, related_name='report_slip_jobs')
+    stream       = models.ForeignKey('Streams', on_delete=models.SET_NULL, null=True, blank=True, related_name='report_slip_jobs')
+    output_format = models.CharField(max_length=5, choices=FORMAT_CHOICES, default=FORMAT_PDF)
+    requested_by = models.ForeignKey('userauths.User', on_delete=models.SET_NULL, null=True)
+    file_path    = models.CharField(max_length=500, blank=True)
+    status       = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    total        = models.PositiveIntegerField(default=0)
+    processed    = models.PositiveIntegerField(default=0)
+    error        = models.TextField(blank=True)
+    created_at   = models.DateTimeField(auto_now_add=True)
+    finished_at  = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def progress_pct(self):
+        if self.total:
+            return min(100, int(self.processed / self.total * 100))
+        return 0
+
+
+class InvoiceGenerationJob(models.Model):
+    """Bulk generation of a term's fee invoices from the selected fee structures."""
+    STATUS_PENDING    = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE       = 'done'
+    STATUS_FAILED     = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING,    'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE,       'Done'),
+        (STATUS_FAILED,     'Failed'),
+    ]
+
+    id             = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    school         = models.ForeignKey('School', on_delete=models.CASCADE, related_name='invoice_jobs')
+    term           = models.ForeignKey('Term', on_delete=models.CASCADE, related_name='invoice_jobs')
+    fee_structures = models.ManyToManyField('FeeStructure', related_name='invoice_jobs')
+    due_date       = models.DateField(null=True, blank=True)
+    overwrite      = models.BooleanField(default=False)
+    requested_by   = models.ForeignKey('userauths.User', on_delete=models.SET_NULL, null=True)
+    status         = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    total          = models.PositiveIntegerField(default=0)
+    processed      = models.PositiveIntegerField(default=0)
+    created        = models.PositiveIntegerField(default=0)
+    updated        = models.PositiveIntegerField(default=0)
+    skipped        = models.PositiveIntegerField(default=0)
+    error          = models.TextField(blank=True)
+    created_at     = models.DateTimeField(auto_now_add=True)
+    finished_at    = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def progress_pct(self):
+        if self.total:
+            return min(100, int(self.processed / self.total * 100))
+        return 0
+
+
+class PaymentStatement(models.Model):
+    """
+    An uploaded bank or M-Pesa statement. Its rows are kept here between the
+    preview and the bursar's confirmation, when the payments are posted.
+    """
+    STATUS_DRAFT     = 'draft'
+    STATUS_POSTED    = 'posted'
+    STATUS_DISCARDED = 'discarded'
+    STATUS_CHOICES = [
+        (STATUS_DRAFT,     'Awaiting confirmation'),
+        (STATUS_POSTED,    'Posted'),
+        (STATUS_DISCARDED, 'Discarded'),
+    ]
+
+    id             = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    school         = models.ForeignKey('School', on_delete=models.CASCADE, related_name='payment_statements')
+    term           = models.ForeignKey('Term', on_delete=models.CASCADE, related_name='payment_statements')
+    uploaded_by    = models.ForeignKey('userauths.User', on_delete=models.SET_NULL, null=True)
+    filename       = models.CharField(max_length=255, blank=True)
+    default_method = models.CharField(max_length=10, choices=FeeInvoice.PAYMENT_METHOD_CHOICES, default='cash')
+    rows           = models.JSONField(default=list, blank=True)
+    status         = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_DRAFT)
+    summary        = models.JSONField(default=dict, blank=True)
+    created_at     = models.DateTimeField(auto_now_add=True)
+    posted_at      = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename or 'Statement'} ({self.get_status_display()})"
+
+
+class BackgroundJob(models.Model):
+    """
+    Durable work queue shared by every slow task (Excel imports, exam uploads,
+    report-slip batches). Rows are claimed by `manage.py run_workers` under a
+    time-limited lease; see school.services.jobs. Progress and results stay on
+    the task's own record (Upload, ExamUploadJob, ReportSlipJob).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE    = 'done'
+    STATUS_FAILED  = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE,    'Done'),
+        (STATUS_FAILED,  'Failed'),
+    ]
+    PRIORITY_LOW    = -10
+    PRIORITY_NORMAL = 0
+    PRIORITY_HIGH   = 10
+
+    kind         = models.CharField(max_length=50, db_index=True)
+    payload      = models.JSONField(default=dict, blank=True)
+    school       = models.ForeignKey('School', on_delete=models.CASCADE, null=True, blank=True, related_name='background_jobs')
+    status       = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    priority     = models.SmallIntegerField(default=PRIORITY_NORMAL)
+    attempts     = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after    = models.DateTimeField(default=timezone.now)
+    locked_by    = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error   = models.TextField(blank=True)
+    created_at   = models.DateTimeField(auto_now_add=True)
+    finished_at  = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_after']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
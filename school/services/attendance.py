@@ -0,0 +1,102 @@
+"""
+Batched attendance writes.
+
+A roll-call submit is one call: the existing rows for (enrollments, date) are
+loaded in one query, split into creates and updates, written with
+bulk_create / bulk_update, and recorded as a single audit entry instead of
+one update_or_create (plus one audit insert) per student.
+
+    marks = [(enrollment, 'P', None), (enrollment, 'UA', 'sick')]
+    saved = record_attendance(marks, lesson.lesson_date, lesson=lesson,
+                              marked_by=teacher, term=term, actor=request.user)
+
+bulk_create and bulk_update bypass the Attendance post_save signals, so the
+day's dashboard rollup is queued here via mark_dirty().
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import Attendance
+from . import audit
+from .attendance_rollup import mark_dirty
+
+ATTENDANCE_BATCH_SIZE = 500
+
+
+@transaction.atomic
+def record_attendance(marks, date, lesson=None, marked_by=None, term=None,
+                      academic_year=None, actor=None):
+    """
+    Upsert one Attendance per enrollment for `date` and return the saved rows.
+
+    `marks` is an iterable of (enrollment, status, remarks); a remarks, term
+    or academic_year of None leaves an existing row's value alone. The
+    enrollment objects are attached to the returned rows, so callers can read
+    `att.enrollment.student` without extra queries when they loaded students
+    with select_related.
+    """
+    marks = {enrollment.id: (enrollment, status, remarks) for enrollment, status, remarks in marks}
+    if not marks:
+        return []
+
+    existing = {}
+    for att in Attendance.objects.filter(enrollment_id__in=list(marks), date=date).order_by('id'):
+        existing.setdefault(att.enrollment_id, att)
+
+    to_create, to_update, changes = [], [], {}
+    update_fields = {'status', 'marked_by', 'term', 'academic_year', 'updated_at'}
+    now = timezone.now()
+    for enrollment_id, (enrollment, status, remarks) in marks.items():
+        att = existing.get(enrollment_id)
+        if att is None:
+            att = Attendance(
+                enrollment=enrollment, date=date, status=status, remarks=remarks,
+                marked_by=marked_by, term=term, academic_year=academic_year,
+            )
+            to_create.append(att)
+            continue
+        att.enrollment = enrollment
+        if att.status != status:
+            changes[att.pk] = [att.status, status]
+        att.status = status
+        att.marked_by = marked_by
+        att.updated_at = now
+        if term is not None:
+            att.term = term
+        if academic_year is not None:
+            att.academic_year = academic_year
+        if remarks is not None:
+            att.remarks = remarks
+            update_fields.add('remarks')
+        to_update.append(att)
+
+    Attendance.objects.bulk_create(to_create, batch_size=ATTENDANCE_BATCH_SIZE)
+    if to_create and to_create[0].pk is None and not connection.features.can_return_rows_from_bulk_insert:
+        # Backends such as MySQL do not hand primary keys back from bulk_create.
+        pks = dict(
+            Attendance.objects.filter(
+                enrollment_id__in=[a.enrollment_id for a in to_create], date=date,
+            ).values_list('enrollment_id', 'id')
+        )
+        for att in to_create:
+            att.pk = pks.get(att.enrollment_id)
+    Attendance.objects.bulk_update(to_update, sorted(update_fields), batch_size=ATTENDANCE_BATCH_SIZE)
+
+    school_ids = {enrollment.school_id for enrollment, _, _ in marks.values()}
+    for school_id in school_ids:
+        mark_dirty(school_id, date)
+
+    audit.log(
+        'Lesson' if lesson is not None else 'Attendance',
+        lesson.pk if lesson is not None else 0,
+        'update' if to_update else 'create',
+        f"Attendance for {date}: {len(to_create)} created, "
+        f"{len(to_update)} updated ({len(changes)} status changes)",
+        school_id=school_ids.pop() if len(school_ids) == 1 else None,
+        actor_id=actor.pk if actor is not None else None,
+        changes={
+            'created': {str(a.pk): a.status for a in to_create},
+            'updated': {str(pk): change for pk, change in changes.items()},
+        },
+    )
+    return to_create + to_update
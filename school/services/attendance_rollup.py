@@ -0,0 +1,183 @@
+"""
+Daily attendance rollups.
+
+Dashboards read AttendanceDailyRollup (one row per school/day/term/grade/
+stream/subject/teacher) instead of counting raw Attendance rows through
+enrollment → lesson → stream → grade joins on every page load.
+
+Rows are kept current at day granularity: saving or deleting an Attendance
+marks its (school, date) dirty, and the dirty days are recomputed once when
+the surrounding transaction commits. Paths that bypass model signals
+(bulk_create, queryset.update) call refresh_days() themselves; the
+rebuild_attendance_rollups command recomputes any range from scratch.
+
+    totals = summarize(rollups_for(school, date__range=(start, end)))
+    per_grade = summarize(rollups_for(school), 'grade__name')
+"""
+import threading
+import weakref
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from ..models import Attendance, AttendanceDailyRollup
+
+ROLLUP_BATCH_SIZE = 1000
+
+# Attendance status code → counter name. The model column is `<name>_count`;
+# summarize() returns the bare names.
+STATUS_FIELDS = {
+    'P': 'present',
+    'ET': 'excused_tardy',
+    'UT': 'unexcused_tardy',
+    'EA': 'excused_absence',
+    'UA': 'unexcused_absence',
+    'IB': 'behavior',
+    '18': 'suspension',
+    '20': 'expulsion',
+}
+COUNTER_FIELDS = ('total',) + tuple(STATUS_FIELDS.values())
+
+_DIMENSIONS = dict(
+    school_id=F('enrollment__school_id'),
+    grade_id=F('enrollment__lesson__stream__grade_id'),
+    stream_id=F('enrollment__lesson__stream_id'),
+    subject_id=F('enrollment__lesson__subject_id'),
+    teacher_id=F('enrollment__lesson__teacher_id'),
+)
+
+
+def _aggregate(attendance_qs):
+    counters = {'total_count': Count('id')}
+    counters.update({
+        f'{name}_count': Count('id', filter=Q(status=code)) for code, name in STATUS_FIELDS.items()
+    })
+    return (
+        attendance_qs.order_by()
+        .values('date', 'term_id', 'academic_year_id', **_DIMENSIONS)
+        .annotate(**counters)
+    )
+
+
+@transaction.atomic
+def _replace(rollup_qs, attendance_qs):
+    rollup_qs.delete()
+    batch, written = [], 0
+    for row in _aggregate(attendance_qs).iterator(chunk_size=ROLLUP_BATCH_SIZE):
+        if row['school_id'] is None:
+            continue
+        batch.append(AttendanceDailyRollup(**row))
+        if len(batch) >= ROLLUP_BATCH_SIZE:
+            AttendanceDailyRollup.objects.bulk_create(batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        AttendanceDailyRollup.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def rebuild(school=None, start=None, end=None):
+    """Recompute rollups for `school` (or every school) between `start` and `end` inclusive."""
+    rollups = AttendanceDailyRollup.objects.all()
+    attendance = Attendance.objects.all()
+    if school is not None:
+        rollups = rollups.filter(school=school)
+        attendance = attendance.filter(enrollment__school=school)
+    if start:
+        rollups = rollups.filter(date__gte=start)
+        attendance = attendance.filter(date__gte=start)
+    if end:
+        rollups = rollups.filter(date__lte=end)
+        attendance = attendance.filter(date__lte=end)
+    return _replace(rollups, attendance)
+
+
+def refresh_days(keys):
+    """Recompute the rollups of each (school_id, date) in `keys`."""
+    dates_by_school = defaultdict(set)
+    for school_id, day in keys:
+        if school_id and day:
+            dates_by_school[school_id].add(day)
+    for school_id, dates in dates_by_school.items():
+        _replace(
+            AttendanceDailyRollup.objects.filter(school_id=school_id, date__in=dates),
+            Attendance.objects.filter(enrollment__school_id=school_id, date__in=dates),
+        )
+
+
+# ── Incremental maintenance ──────────────────────────────────────────────────
+
+_pending = threading.local()
+
+
+class _RollupFlush:
+    """on_commit callback carrying the (school_id, date) keys of one transaction."""
+
+    def __init__(self):
+        self.keys = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        refresh_days(self.keys)
+
+
+def mark_dirty(school_id, day):
+    """Queue (school_id, day) for recomputation when the current transaction commits."""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        refresh_days({(school_id, day)})
+        return
+    # Reuse the pending flush of this savepoint level, never an enclosing
+    # block's. Only Django's on_commit queue holds it, so a rollback frees it.
+    flushes = getattr(_pending, 'flushes', None)
+    if flushes is None:
+        flushes = _pending.flushes = weakref.WeakValueDictionary()
+    level = tuple(connection.savepoint_ids)
+    flush = flushes.get(level)
+    if flush is None or flush.done:
+        flush = flushes[level] = _RollupFlush()
+        transaction.on_commit(flush, robust=True)
+    flush.keys.add((school_id, day))
+
+
+# ── Reading ──────────────────────────────────────────────────────────────────
+
+def rollups_for(school=None, **filters):
+    """Rollup rows of `school` (a School, a School queryset, or None for all)."""
+    qs = AttendanceDailyRollup.objects.all()
+    if school is not None:
+        if hasattr(school, 'model'):
+            qs = qs.filter(school__in=school)
+        else:
+            qs = qs.filter(school=school)
+    return qs.filter(**filters)
+
+
+def summarize(rollups, *group_by):
+    """
+    Sum the counters of `rollups`. Without `group_by` returns one dict; with
+    it returns a values() queryset with one row per group. Each row also has
+    `absent` (EA + UA) and `tardy` (ET + UT).
+    """
+    sums = {name: Sum(f'{name}_count') for name in COUNTER_FIELDS}
+    if group_by:
+        return (
+            rollups.values(*group_by)
+            .annotate(**sums)
+            .annotate(
+                absent=F('excused_absence') + F('unexcused_absence'),
+                tardy=F('excused_tardy') + F('unexcused_tardy'),
+            )
+        )
+    totals = {k: v or 0 for k, v in rollups.aggregate(**sums).items()}
+    totals['absent'] = totals['excused_absence'] + totals['unexcused_absence']
+    totals['tardy'] = totals['excused_tardy'] + totals['unexcused_tardy']
+    return totals
+
+
+def status_counts(totals):
+    """{status_code: count} from a summarize() row."""
+    return {code: totals[name] or 0 for code, name in STATUS_FIELDS.items()}
@@ -0,0 +1,131 @@
+"""
+Write-behind audit log.
+
+Audit entries are buffered per transaction and written with one bulk_create
+when it commits, instead of one INSERT per audited save inside the caller's
+transaction:
+
+    audit.log('Payment', payment.pk, 'create', "M-Pesa 500", school_id=payment.school_id)
+
+Entries logged outside a transaction are written straight away. Inside one,
+each savepoint level gets its own buffer: an on_commit callback registered
+once at that level and found again through a thread-local weak mapping keyed
+on the connection's savepoint ids. Django discards the callbacks of whatever
+it rolls back, which frees the buffer with them, so rolled-back changes
+(including a rolled-back savepoint) leave no audit trail behind.
+
+Callers pass foreign-key ids they already hold. Attendance only knows its
+enrollment, so an entry can carry `enrollment_id` instead of `school_id`; the
+schools (and students) of every such entry are then resolved with a single
+query at flush time rather than one lazy load per saved row.
+"""
+import logging
+import threading
+import weakref
+
+from django.db import transaction
+
+from ..models import AuditLog, Enrollment
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BATCH_SIZE = 500
+
+
+_pending = threading.local()
+
+
+class _AuditFlush:
+    """on_commit callback carrying the audit entries of one transaction or savepoint."""
+
+    def __init__(self):
+        self.entries = []
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        write(self.entries)
+
+
+def _flushes():
+    """This thread's pending flushes by savepoint ids; only Django's on_commit queue keeps them alive."""
+    flushes = getattr(_pending, 'flushes', None)
+    if flushes is None:
+        flushes = _pending.flushes = weakref.WeakValueDictionary()
+    return flushes
+
+
+def _resolve_enrollments(entries):
+    pending = {e['enrollment_id'] for e in entries if e.get('enrollment_id')}
+    if not pending:
+        return
+    found = {
+        pk: (school_id, student_id)
+        for pk, school_id, student_id in Enrollment.objects.filter(pk__in=pending)
+        .values_list('pk', 'school_id', 'student_id')
+    }
+    for entry in entries:
+        enrollment_id = entry.get('enrollment_id')
+        if not enrollment_id:
+            continue
+        school_id, student_id = found.get(enrollment_id, (None, '?'))
+        if entry['school_id'] is None:
+            entry['school_id'] = school_id
+        entry['description'] = entry['description'].replace('{student}', str(student_id))
+
+
+def write(entries):
+    """Insert buffered `entries` in bulk. Audit failures never reach the caller."""
+    if not entries:
+        return
+    try:
+        _resolve_enrollments(entries)
+        AuditLog.objects.bulk_create(
+            [
+                AuditLog(
+                    school_id=e['school_id'],
+                    model_name=e['model_name'],
+                    object_id=e['object_id'],
+                    action=e['action'],
+                    actor_id=e['actor_id'],
+                    description=e['description'],
+                    changes=e['changes'],
+                )
+                for e in entries
+            ],
+            batch_size=AUDIT_BATCH_SIZE,
+        )
+    except Exception:
+        logger.exception("Failed to write %d audit entries", len(entries))
+
+
+def log(model_name, object_id, action, description='', school_id=None, actor_id=None,
+        changes=None, enrollment_id=None):
+    """
+    Queue one AuditLog entry for the current transaction.
+
+    With `enrollment_id`, a missing `school_id` is taken from the enrollment
+    and any `{student}` in `description` is replaced by its student id.
+    """
+    entry = dict(
+        model_name=model_name,
+        object_id=object_id or 0,
+        action=action,
+        description=description,
+        school_id=school_id,
+        actor_id=actor_id,
+        changes=changes or {},
+        enrollment_id=enrollment_id,
+    )
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        write([entry])
+        return
+    # One flush per savepoint level, so an enclosing block's flush never takes
+    # this block's entries and rolling back a savepoint drops exactly its own.
+    level, flushes = tuple(connection.savepoint_ids), _flushes()
+    flush = flushes.get(level)
+    if flush is None or flush.done:
+        flush = flushes[level] = _AuditFlush()
+        transaction.on_commit(flush, robust=True)
+    flush.entries.append(entry)
@@ -0,0 +1,155 @@
+"""
+Bulk notification campaigns.
+
+start_campaign() bulk-creates one Notification per recipient when the
+in-app channel is on. When email or SMS is selected it also writes one
+CampaignDelivery per recipient and splits them into batches of
+CAMPAIGN_BATCH_SIZE, each a 'campaign_delivery' background job
+(school.services.jobs).
+
+deliver_batch() sends a batch's SMS concurrently through the pooled
+gateway and its email over one SMTP connection. It records each outcome on
+the CampaignDelivery row as soon as it has it and adds the totals to the
+campaign's counters. Rows that already carry an outcome are skipped, so a
+retried job never re-sends. A batch whose job fails for good is counted by
+batch_failed(), so the campaign still finishes.
+"""
+from django.conf import settings
+from django.core.mail import get_connection, send_mail
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import CampaignDelivery, Notification, NotificationCampaign
+from .jobs import enqueue
+from .sms import send_batch
+
+CAMPAIGN_BATCH_SIZE = 200
+SMS_MAX_CHARS = 320
+EMAIL_SAVE_EVERY = 25
+
+
+def start_campaign(school, user, title, message, audience, recipients, inapp=True, email=False, sms=False):
+    """
+    Create a NotificationCampaign for `recipients` ((user, phone) pairs) and
+    queue its delivery; returns the campaign.
+    """
+    with transaction.atomic():
+        campaign = NotificationCampaign.objects.create(
+            school=school, created_by=user, title=title, message=message, audience=audience,
+            channel_inapp=inapp, channel_email=email, channel_sms=sms, total=len(recipients),
+        )
+        if inapp:
+            Notification.objects.bulk_create(
+                [
+                    Notification(recipient=recipient, title=title, message=message, school=school, campaign=campaign)
+                    for recipient, _ in recipients
+                ],
+                batch_size=1000,
+            )
+
+        batches = []
+        if email or sms:
+            CampaignDelivery.objects.bulk_create(
+                [
+                    CampaignDelivery(campaign=campaign, recipient=recipient, phone=phone or '')
+                    for recipient, phone in recipients
+                ],
+                batch_size=1000,
+            )
+            pks = list(campaign.deliveries.order_by('pk').values_list('pk', flat=True))
+            batches = [pks[i:i + CAMPAIGN_BATCH_SIZE] for i in range(0, len(pks), CAMPAIGN_BATCH_SIZE)]
+
+        if not batches:
+            campaign.status = NotificationCampaign.STATUS_DONE
+            campaign.finished_at = timezone.now()
+            campaign.save(update_fields=['status', 'finished_at'])
+            return campaign
+
+        campaign.batches = len(batches)
+        campaign.save(update_fields=['batches'])
+        for batch in batches:
+            enqueue('campaign_delivery', school=school, campaign_id=campaign.pk, deliveries=batch)
+    return campaign
+
+
+def _email(connection, to, subject, body):
+    try:
+        send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [to], fail_silently=False, connection=connection)
+        return True, ''
+    except Exception as e:
+        return False, str(e)[:500]
+
+
+def _add_counts(campaign_id, **counts):
+    NotificationCampaign.objects.filter(pk=campaign_id).update(
+        **{field: F(field) + n for field, n in counts.items()},
+    )
+
+
+def _finish_batch(campaign_id, failed=False):
+    """Count a finished batch on the campaign; close it after the last one."""
+    _add_counts(campaign_id, batches_done=1, batches_failed=int(failed))
+    NotificationCampaign.objects.filter(
+        pk=campaign_id, status=NotificationCampaign.STATUS_SENDING, batches_done__gte=F('batches'),
+    ).update(status=NotificationCampaign.STATUS_DONE, finished_at=timezone.now())
+
+
+def _save_outcomes(campaign_id, rows, channel):
+    """Persist `rows`' `channel` outcomes and add them to the campaign's counters."""
+    if not rows:
+        return
+    sent = sum(1 for d in rows if getattr(d, f'{channel}_sent'))
+    with transaction.atomic():
+        CampaignDelivery.objects.bulk_update(rows, [f'{channel}_sent', f'{channel}_error'], batch_size=500)
+        _add_counts(campaign_id, **{f'{channel}_sent': sent, f'{channel}_failed': len(rows) - sent})
+
+
+def deliver_batch(campaign_id, deliveries):
+    """
+    Background job: deliver one batch of a campaign. `deliveries` are
+    CampaignDelivery ids. Outcomes are saved as they come in (all SMS at
+    once, email every EMAIL_SAVE_EVERY sends), so a job that dies part way
+    re-sends nothing that already went out when it is retried.
+    """
+    campaign = NotificationCampaign.objects.get(pk=campaign_id)
+    targets = list(
+        CampaignDelivery.objects.filter(pk__in=deliveries, campaign=campaign).select_related('recipient')
+    )
+
+    if campaign.channel_sms:
+        text = f"{campaign.title}\n{campaign.message}"[:SMS_MAX_CHARS]
+        outbox = [(d.pk, d.phone, text) for d in targets if d.sms_sent is None and d.phone]
+        results = send_batch(outbox) if outbox else {}
+        texted = []
+        for d in targets:
+            if d.pk in results:
+                d.sms_sent, d.sms_error = results[d.pk]
+                texted.append(d)
+        _save_outcomes(campaign.pk, texted, 'sms')
+
+    if campaign.channel_email:
+        to_email = [d for d in targets if d.email_sent is None and d.recipient.email]
+        if to_email:
+            connection = get_connection()
+            try:
+                try:
+                    connection.open()
+                except Exception:
+                    pass  # each send retries the connection and records its own error
+                for i in range(0, len(to_email), EMAIL_SAVE_EVERY):
+                    chunk = to_email[i:i + EMAIL_SAVE_EVERY]
+                    for d in chunk:
+                        d.email_sent, d.email_error = _email(
+                            connection, d.recipient.email, campaign.title, campaign.message,
+                        )
+                    _save_outcomes(campaign.pk, chunk, 'email')
+            finally:
+                connection.close()
+
+    _finish_batch(campaign.pk)
+
+
+def batch_failed(campaign_id, deliveries):
+    """Failure hook: a batch that used up its attempts still counts as finished, so the campaign closes."""
+    _finish_batch(campaign_id, failed=True)
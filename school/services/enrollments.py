@@ -0,0 +1,130 @@
+"""
+Set-based lesson enrollment.
+
+Callers describe which students belong in which lessons; this module builds
+the student × lesson pairs in memory, drops the pairs already stored (one
+query, or one per chunk of lesson ids) and writes the rest with chunked
+bulk_create instead of one get_or_create per pair.
+
+    pairs = stream_enrollment_pairs(lessons, students_by_stream(school, stream_ids))
+    bulk_enroll(school, pairs)
+"""
+from collections import defaultdict
+
+from django.db.models import QuerySet
+
+from ..models import Enrollment, Student, SubjectEnrollment
+
+ENROLLMENT_CHUNK_SIZE = 1000
+# Stay well under SQLite's bound-parameter limit for IN (...) lookups.
+ID_CHUNK_SIZE = 900
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def students_by_stream(school, stream_ids):
+    """{stream_id: [student_id, ...]} for active students, in one query."""
+    out = defaultdict(list)
+    for stream_id, student_id in Student.objects.filter(
+        school=school, is_active=True, stream_id__in=stream_ids,
+    ).values_list('stream_id', 'id'):
+        out[stream_id].append(student_id)
+    return out
+
+
+def stream_enrollment_pairs(lessons, by_stream):
+    """Every student of a lesson's stream is enrolled in that lesson."""
+    return {
+        (student_id, lesson.id)
+        for lesson in lessons
+        for student_id in by_stream.get(lesson.stream_id, ())
+    }
+
+
+def subject_enrollment_pairs(lessons, students):
+    """
+    Enroll each student in the lessons of the subjects they take, within their
+    own stream. `students` is an iterable of (student_id, stream_id).
+    """
+    students = list(students)
+    subjects = defaultdict(set)
+    for student_id, subject_id in SubjectEnrollment.objects.filter(
+        student_id__in=[sid for sid, _ in students], is_active=True,
+    ).values_list('student_id', 'subject_id'):
+        subjects[student_id].add(subject_id)
+
+    lessons_by_key = defaultdict(list)
+    for lesson in lessons:
+        lessons_by_key[(lesson.stream_id, lesson.subject_id)].append(lesson.id)
+
+    pairs = set()
+    for student_id, stream_id in students:
+        for subject_id in subjects.get(student_id, ()):
+            for lesson_id in lessons_by_key.get((stream_id, subject_id), ()):
+                pairs.add((student_id, lesson_id))
+    return pairs
+
+
+def _existing_pairs(field, targets):
+    """(student_id, <field>_id) pairs already stored for a queryset or iterable of ids."""
+    column = f'{field}_id'
+    if isinstance(targets, QuerySet):
+        return set(
+            Enrollment.objects.filter(**{f'{field}__in': targets.values('pk')})
+            .values_list('student_id', column)
+        )
+    existing = set()
+    for chunk in _chunks(targets, ID_CHUNK_SIZE):
+        existing.update(
+            Enrollment.objects.filter(**{f'{column}__in': chunk}).values_list('student_id', column)
+        )
+    return existing
+
+
+def _bulk_enroll(school, field, pairs, targets, chunk_size):
+    pairs = set(pairs)
+    if not pairs:
+        return 0
+    if targets is None:
+        targets = {target_id for _, target_id in pairs}
+    missing = sorted(pairs - _existing_pairs(field, targets))
+
+    column = f'{field}_id'
+    for chunk in _chunks(missing, chunk_size):
+        Enrollment.objects.bulk_create(
+            [
+                Enrollment(student_id=student_id, school=school, status='active', **{column: target_id})
+                for student_id, target_id in chunk
+            ],
+            ignore_conflicts=True,
+        )
+    return len(missing)
+
+
+def existing_enrollment_pairs(lessons):
+    """
+    (student_id, lesson_id) pairs already stored for `lessons`, which may be a
+    Lesson queryset (filtered with a subquery) or an iterable of lesson ids.
+    """
+    return _existing_pairs('lesson', lessons)
+
+
+def bulk_enroll(school, pairs, lessons=None, chunk_size=ENROLLMENT_CHUNK_SIZE):
+    """
+    Create the missing Enrollment rows for `pairs` and return how many were written.
+
+    `lessons` scopes the existence check; it defaults to the lesson ids in `pairs`.
+    """
+    return _bulk_enroll(school, 'lesson', pairs, lessons, chunk_size)
+
+
+def bulk_enroll_patterns(school, pairs, patterns=None, chunk_size=ENROLLMENT_CHUNK_SIZE):
+    """
+    Create the missing pattern-level Enrollment rows for (student_id, pattern_id)
+    `pairs` and return how many were written. `patterns` scopes the existence check.
+    """
+    return _bulk_enroll(school, 'pattern', pairs, patterns, chunk_size)
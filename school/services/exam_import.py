@@ -0,0 +1,171 @@
+"""
+Bulk exam-score import for ExamUploadJob.
+
+The sheet is loaded once with pandas. Student ids are resolved with a
+single dict built from one query. Score columns are coerced and checked
+against the session's *_out_of maxima column-wise. Rows are then upserted
+in chunks with bulk_create(update_conflicts=True). Job progress is written
+once per chunk rather than once per row.
+
+Expected columns (case-insensitive):
+    student_id | adm_no | admission_number | admission — the student's admission number
+    cat, assignment, assessment, exam (optionally suffixed _score)
+"""
+import os
+
+import pandas as pd
+from django.db import connection
+from django.utils import timezone
+
+from ..models import ExamResult, ExamUploadJob, Student
+
+IMPORT_CHUNK_SIZE = 500
+# Sheets up to this many rows are imported inside the upload request.
+INLINE_IMPORT_ROWS = 200
+
+ID_COLUMNS = ('student_id', 'adm_no', 'admission_number', 'admission')
+# ExamResult field → (accepted column names, ExamSession max-mark attribute, label)
+SCORE_COLUMNS = {
+    'cat_score': (('cat', 'cat_score'), 'cat_out_of', 'CAT'),
+    'assignment_score': (('assignment', 'assignment_score'), 'assignment_out_of', 'Assignment'),
+    'assessment_score': (('assessment', 'assessment_score'), 'assessment_out_of', 'Assessment'),
+    'exam_score': (('exam', 'exam_score'), 'exam_out_of', 'Exam'),
+}
+MAX_REPORTED_ERRORS = 10
+
+
+def read_score_sheet(path):
+    """DataFrame of the uploaded sheet with trimmed, lower-cased headers."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.xlsx', '.xls'):
+        df = pd.read_excel(path, dtype=str)
+    elif ext == '.csv':
+        df = pd.read_csv(path, dtype=str)
+    else:
+        raise ValueError(f'Unsupported file type: {ext}')
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    return df
+
+
+def _first_column(df, names):
+    return next((name for name in names if name in df.columns), None)
+
+
+def prepare_scores(df, session, students):
+    """
+    Vectorised validation. `students` maps student_id → (pk, stream_id).
+
+    Returns (valid, total, skipped, errors): `valid` is a DataFrame with
+    columns student_pk, stream_id and the four score fields (NaN for blanks),
+    one row per student (the last occurrence wins); `total` counts rows with
+    a student id; `skipped` counts unknown students, out-of-range rows and
+    duplicates.
+    """
+    id_col = _first_column(df, ID_COLUMNS)
+    if id_col is None:
+        raise ValueError('Column "student_id" not found in file.')
+
+    ids = df[id_col].fillna('').astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+    present = ids.ne('') & ids.str.lower().ne('nan')
+    df, ids = df[present], ids[present]
+    total = len(df)
+
+    out = pd.DataFrame(index=df.index)
+    matched = ids.map(students)
+    known = matched.notna()
+    out['student_pk'] = matched.map(lambda v: v[0] if isinstance(v, tuple) else None)
+    out['stream_id'] = matched.map(lambda v: v[1] if isinstance(v, tuple) else None)
+
+    errors = []
+    invalid = pd.Series(False, index=df.index)
+    for field, (names, max_attr, label) in SCORE_COLUMNS.items():
+        col = _first_column(df, names)
+        scores = pd.to_numeric(df[col], errors='coerce') if col else pd.Series(float('nan'), index=df.index)
+        limit = getattr(session, max_attr)
+        bad = known & (scores.lt(0) | scores.gt(limit))
+        for sid, value in zip(ids[bad].head(MAX_REPORTED_ERRORS), scores[bad].head(MAX_REPORTED_ERRORS)):
+            errors.append(f"{sid}: {label} score {value:g} is outside 0–{limit:g}.")
+        invalid |= bad
+        out[field] = scores
+
+    valid = out[known & ~invalid].drop_duplicates(subset='student_pk', keep='last')
+    skipped = total - int((known & ~invalid).sum())
+    return valid, total, skipped, errors
+
+
+def upsert_results(job, valid, staff=None, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None):
+    """Write `valid` (from prepare_scores) as ExamResult upserts; returns rows written."""
+    update_fields = list(SCORE_COLUMNS) + ['stream', 'school', 'updated_at']
+    if staff is not None:
+        update_fields.append('entered_by')
+    conflict_kwargs = {'update_conflicts': True, 'update_fields': update_fields}
+    # MySQL upserts on any unique key and rejects an explicit conflict target.
+    if connection.features.supports_update_conflicts_with_target:
+        conflict_kwargs['unique_fields'] = ['session', 'student', 'subject']
+
+    records = valid.astype(object).where(valid.notna(), None).to_dict('records')
+    written = 0
+    for start in range(0, len(records), chunk_size):
+        chunk = records[start:start + chunk_size]
+        ExamResult.objects.bulk_create(
+            [
+                ExamResult(
+                    session_id=job.session_id, subject_id=job.subject_id, school_id=job.school_id,
+                    student_id=int(r['student_pk']),
+                    stream_id=job.stream_id or (int(r['stream_id']) if r['stream_id'] is not None else None),
+                    entered_by=staff,
+                    **{field: (float(r[field]) if r[field] is not None else None) for field in SCORE_COLUMNS},
+                )
+                for r in chunk
+            ],
+            **conflict_kwargs,
+        )
+        written += len(chunk)
+        if on_chunk:
+            on_chunk(written)
+    return written
+
+
+def run_import(job, df=None):
+    """Process an ExamUploadJob end to end, recording progress and outcome on the job."""
+    try:
+        job.status = ExamUploadJob.STATUS_PROCESSING
+        job.save(update_fields=['status'])
+        if df is None:
+            if not os.path.exists(job.file_path):
+                raise FileNotFoundError(f'File not found: {job.file_path}')
+            df = read_score_sheet(job.file_path)
+
+        students = {
+            sid: (pk, stream_id)
+            for pk, sid, stream_id in Student.objects.filter(
+                school_id=job.school_id, is_active=True,
+            ).values_list('id', 'student_id', 'stream_id')
+        }
+        valid, total, skipped, errors = prepare_scores(df, job.session, students)
+        job.total_rows, job.skipped = total, skipped
+        job.save(update_fields=['total_rows', 'skipped'])
+
+        try:
+            staff = job.uploaded_by.staffprofile if job.uploaded_by else None
+        except Exception:
+            staff = None
+
+        def on_chunk(written):
+            job.saved = written
+            job.processed = skipped + written
+            job.save(update_fields=['processed', 'saved'])
+
+        upsert_results(job, valid, staff=staff, on_chunk=on_chunk)
+
+        job.processed = total
+        job.error = '\n'.join(errors)
+        job.status = ExamUploadJob.STATUS_DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=['processed', 'error', 'status', 'finished_at'])
+    except Exception as exc:
+        job.status = ExamUploadJob.STATUS_FAILED
+        job.error = str(exc)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
@@ -0,0 +1,148 @@
+"""
+Exam ranking engine.
+
+Per-student totals for an ExamSession come from one aggregate query over
+ExamResult grouped by (student, stream) and are cached, keyed on the
+session's latest ExamResult.updated_at and row count, so any score edit,
+import or delete produces a new key. Every ranking view — stream, grade,
+API, report slips and ranking PDFs — ranks from the same cached totals.
+
+Positions use standard competition ranking: equal totals share a position
+and the next distinct total skips ahead (1, 2, 2, 4). Students without any
+scored subject are listed last with position '–'.
+
+    ranking = rank_students(session, students, stream=stream)
+    pos = student_positions(session, student)
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Coalesce
+
+from ..models import ExamResult, Student, cbc_grade_band
+
+RANKING_CACHE_TIMEOUT = 60 * 60 * 6
+NO_POSITION = '–'
+
+_SCORE_FIELDS = ('cat_score', 'assignment_score', 'assessment_score', 'exam_score')
+
+
+def _cache_key(session):
+    stamp = ExamResult.objects.filter(session=session).aggregate(
+        latest=Max('updated_at'), rows=Count('id'),
+    )
+    latest = stamp['latest'].isoformat() if stamp['latest'] else '-'
+    return f"exam-ranking:{session.pk}:{latest}:{stamp['rows']}"
+
+
+def _compute_totals(session):
+    """{'by_student': {sid: [total, n]}, 'by_stream': {(sid, stream_id): [total, n]}}."""
+    scored = Q()
+    for field in _SCORE_FIELDS:
+        scored |= Q(**{f'{field}__isnull': False})
+    result_total = sum((Coalesce(field, 0.0) for field in _SCORE_FIELDS[1:]), Coalesce(_SCORE_FIELDS[0], 0.0))
+
+    by_student = defaultdict(lambda: [0.0, 0])
+    by_stream = {}
+    rows = (
+        ExamResult.objects.filter(session=session)
+        .filter(scored)
+        .order_by()
+        .values('student_id', 'stream_id')
+        .annotate(total=Sum(result_total), subjects=Count('id'))
+    )
+    for row in rows:
+        total, n = float(row['total'] or 0), row['subjects']
+        by_stream[(row['student_id'], row['stream_id'])] = [total, n]
+        acc = by_student[row['student_id']]
+        acc[0] += total
+        acc[1] += n
+    return {'by_student': dict(by_student), 'by_stream': by_stream}
+
+
+def session_totals(session):
+    """Cached per-student totals for `session` (see _compute_totals)."""
+    key = _cache_key(session)
+    totals = cache.get(key)
+    if totals is None:
+        totals = _compute_totals(session)
+        cache.set(key, totals, RANKING_CACHE_TIMEOUT)
+    return totals
+
+
+def _totals_for(totals, stream):
+    if stream is None:
+        return totals['by_student']
+    stream_id = getattr(stream, 'pk', stream)
+    return {sid: agg for (sid, st), agg in totals['by_stream'].items() if st == stream_id}
+
+
+def competition_positions(scores):
+    """{key: position} for {key: score}, highest first, ties sharing a position."""
+    positions, previous, position = {}, None, 0
+    for index, (key, score) in enumerate(sorted(scores.items(), key=lambda kv: -kv[1]), start=1):
+        if score != previous:
+            position, previous = index, score
+        positions[key] = position
+    return positions
+
+
+def rank_students(session, students, stream=None, totals=None):
+    """
+    Rank `students` for `session`, optionally counting only results recorded
+    against `stream`. Returns dicts sorted by position with keys student,
+    total, subjects_count, percentage, grade_band and position.
+    """
+    agg = _totals_for(totals or session_totals(session), stream)
+    students = list(students)
+    scores = {s.pk: round(agg[s.pk][0], 2) for s in students if s.pk in agg}
+    positions = competition_positions(scores)
+    max_marks = session.total_marks
+
+    ranking = []
+    for student in students:
+        total = scores.get(student.pk)
+        count = agg[student.pk][1] if total is not None else 0
+        pct = round(total / (max_marks * count) * 100, 1) if total is not None and count and max_marks else None
+        ranking.append({
+            'student': student,
+            'total': total,
+            'subjects_count': count,
+            'percentage': pct,
+            'grade_band': cbc_grade_band(pct) if pct is not None else NO_POSITION,
+            'position': positions.get(student.pk, NO_POSITION),
+        })
+    ranking.sort(key=lambda r: (r['total'] is None, -(r['total'] or 0)))
+    return ranking
+
+
+def positions_among(totals, student_ids, stream_id=None):
+    """({student_id: position}, ranked count) among `student_ids`, optionally per stream."""
+    agg = _totals_for(totals, stream_id)
+    scores = {sid: round(agg[sid][0], 2) for sid in student_ids if sid in agg}
+    return competition_positions(scores), len(scores)
+
+
+def student_positions(session, student, totals=None):
+    """
+    Stream and grade position of one student among the active students of
+    their stream and of the session's grade, without building full rankings.
+    """
+    totals = totals or session_totals(session)
+    grade_ids, stream_ids = [], []
+    for sid, stream_id in Student.objects.filter(
+        school_id=student.school_id, grade_level_id=session.grade_id, is_active=True,
+    ).values_list('id', 'stream_id'):
+        grade_ids.append(sid)
+        if student.stream_id and stream_id == student.stream_id:
+            stream_ids.append(sid)
+
+    stream_positions, stream_total = positions_among(totals, stream_ids, student.stream_id)
+    grade_positions, grade_total = positions_among(totals, grade_ids)
+    return {
+        'stream_pos': stream_positions.get(student.pk, NO_POSITION),
+        'stream_total': stream_total,
+        'grade_pos': grade_positions.get(student.pk, NO_POSITION),
+        'grade_total': grade_total,
+    }
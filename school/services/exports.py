@@ -0,0 +1,75 @@
+"""
+Constant-memory export helpers.
+
+CSV: rows are written through a pseudo-buffer and streamed to the client as
+they are produced (StreamingHttpResponse), so the queryset is never held in
+memory.
+
+PDF: reportlab consumes a LazyStory — a list facade that pulls the next
+flowable from a generator only when the previous one has been laid out —
+and rows are packed into small per-page Table flowables instead of one
+giant Table that reportlab would have to split over and over.
+"""
+import csv
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from reportlab.platypus import Table
+
+EXPORT_CHUNK_SIZE = 2000
+PDF_ROWS_PER_TABLE = 40
+
+
+class Echo:
+    """File-like object whose write() returns the value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def streaming_csv_response(filename, header, rows):
+    """StreamingHttpResponse that writes `header` then every row of the iterable `rows`."""
+    writer = csv.writer(Echo())
+
+    def generate():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class LazyStory(list):
+    """List facade over a flowable generator for SimpleDocTemplate.build()."""
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._source = iter(flowables)
+
+    def _fill(self):
+        if not list.__len__(self):
+            nxt = next(self._source, None)
+            if nxt is not None:
+                self.append(nxt)
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+
+def paged_tables(header, rows, col_widths, style, rows_per_table=PDF_ROWS_PER_TABLE):
+    """Yield one Table flowable (with header) per `rows_per_table` rows."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, rows_per_table))
+        if not chunk:
+            return
+        table = Table([header] + chunk, colWidths=col_widths, repeatRows=1)
+        table.setStyle(style)
+        yield table
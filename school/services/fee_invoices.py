@@ -0,0 +1,145 @@
+"""
+Set-based fee invoice generation for a term.
+
+`generate_invoices` replaces the structures × students loop (an exists(),
+maybe a delete() and a create() per student) with a handful of queries:
+
+1. the active students of every selected grade are read once and matched to
+   each fee structure (grade, plus stream when the structure has one);
+2. the term's existing invoices for those descriptions are fetched in one
+   query and keyed by (student, description);
+3. new invoices get their receipt number and status in memory and go out in
+   chunked bulk_create calls; with `overwrite` the existing invoice is
+   updated in place with bulk_update, so payments already recorded on it
+   are kept.
+
+    generate_invoices(school, term, structures, due_date=None, overwrite=False)
+
+The finance view runs it as an InvoiceGenerationJob (job kind 'fee_invoices')
+and polls the job's progress.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import FeeInvoice, InvoiceGenerationJob, Student
+
+INVOICE_CHUNK_SIZE = 500
+UPDATE_FIELDS = ['academic_year', 'amount_required', 'due_date', 'status', 'updated_at']
+
+
+def assign_receipt_numbers(invoices):
+    """Give every invoice a receipt number not used by another invoice."""
+    pending = list(invoices)
+    while pending:
+        numbers = {}
+        for invoice in pending:
+            number = FeeInvoice.new_receipt_number()
+            while number in numbers:
+                number = FeeInvoice.new_receipt_number()
+            numbers[number] = invoice
+        taken = set(FeeInvoice.objects.filter(receipt_number__in=list(numbers)).values_list('receipt_number', flat=True))
+        for number, invoice in numbers.items():
+            invoice.receipt_number = number
+        pending = [numbers[number] for number in taken]
+
+
+def generate_invoices(school, term, fee_structures, due_date=None, overwrite=False, created_by=None,
+                      on_progress=None, chunk_size=INVOICE_CHUNK_SIZE):
+    """
+    Invoice every active student matched by `fee_structures` for `term`.
+    Returns {'total', 'created', 'updated', 'skipped'}; `on_progress(done,
+    total)` is called once the plan is built and after each written chunk.
+    """
+    fee_structures = list(fee_structures)
+    by_grade = {}
+    for pk, grade_id, stream_id in (
+        Student.objects.filter(
+            school=school, is_active=True, grade_level_id__in={fs.grade_id for fs in fee_structures},
+        ).order_by('pk').values_list('pk', 'grade_level_id', 'stream_id')
+    ):
+        by_grade.setdefault(grade_id, []).append((pk, stream_id))
+
+    existing = {}
+    duplicates = []
+    for invoice in FeeInvoice.objects.filter(
+        school=school, term=term, description__in={fs.description for fs in fee_structures},
+    ).order_by('created_at', 'pk'):
+        key = (invoice.student_id, invoice.description)
+        if key in existing:
+            duplicates.append(invoice.pk)
+        else:
+            existing[key] = invoice
+
+    total = skipped = 0
+    to_create, to_update = {}, {}
+    for fs in fee_structures:
+        for student_id, stream_id in by_grade.get(fs.grade_id, ()):
+            if fs.stream_id and stream_id != fs.stream_id:
+                continue
+            total += 1
+            key = (student_id, fs.description)
+            invoice = to_create.get(key) or existing.get(key)
+            if invoice is not None and not overwrite:
+                skipped += 1
+                continue
+            if invoice is None:
+                invoice = to_create[key] = FeeInvoice(
+                    school=school, student_id=student_id, term=term,
+                    description=fs.description, created_by=created_by,
+                )
+            elif invoice.pk:
+                to_update[key] = invoice
+            invoice.academic_year_id = fs.academic_year_id
+            invoice.amount_required = fs.amount
+            invoice.due_date = due_date
+            invoice.refresh_status()
+
+    assign_receipt_numbers(to_create.values())
+    now = timezone.now()
+    for invoice in to_update.values():
+        invoice.updated_at = now
+
+    done = skipped
+    if on_progress:
+        on_progress(done, total)
+    new, changed = list(to_create.values()), list(to_update.values())
+    if overwrite and duplicates:
+        # Re-generating leaves one invoice per student and description.
+        FeeInvoice.objects.filter(pk__in=duplicates).delete()
+    for start in range(0, max(len(new), len(changed)), chunk_size):
+        with transaction.atomic():
+            FeeInvoice.objects.bulk_create(new[start:start + chunk_size])
+            FeeInvoice.objects.bulk_update(changed[start:start + chunk_size], UPDATE_FIELDS)
+        done += len(new[start:start + chunk_size]) + len(changed[start:start + chunk_size])
+        if on_progress:
+            on_progress(done, total)
+    return {'total': total, 'created': len(new), 'updated': len(changed), 'skipped': skipped}
+
+
+def run_invoice_job(job_id):
+    """Job handler: run an InvoiceGenerationJob, recording progress on the job row."""
+    job = InvoiceGenerationJob.objects.select_related('school', 'term', 'requested_by').get(pk=job_id)
+    try:
+        job.status = InvoiceGenerationJob.STATUS_PROCESSING
+        job.save(update_fields=['status'])
+
+        def on_progress(done, total):
+            job.processed, job.total = done, total
+            job.save(update_fields=['processed', 'total'])
+
+        counts = generate_invoices(
+            job.school, job.term, job.fee_structures.filter(is_active=True),
+            due_date=job.due_date, overwrite=job.overwrite, created_by=job.requested_by,
+            on_progress=on_progress,
+        )
+        job.total, job.processed = counts['total'], counts['total']
+        job.created, job.updated, job.skipped = counts['created'], counts['updated'], counts['skipped']
+        job.status = InvoiceGenerationJob.STATUS_DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=['total', 'processed', 'created', 'updated', 'skipped', 'status', 'finished_at'])
+    except Exception as exc:
+        job.status = InvoiceGenerationJob.STATUS_FAILED
+        job.error = str(exc)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
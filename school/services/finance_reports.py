@@ -0,0 +1,113 @@
+"""
+Fee collection report.
+
+Expected and collected amounts come from one aggregate query over FeeInvoice
+grouped by the student's (grade, stream), with a distinct student count per
+group; stream rows, grade subtotals and the school total are rolled up in
+Python. The grouped figures are cached per school and term, keyed on the
+invoices' latest updated_at and row count, so any invoice save, bulk write
+or delete produces a new key. The web report, its CSV export and the API
+all build from the same snapshot.
+
+    report = collection_report(school, term)
+    report['grades'][0]['streams'][0]['collected']
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+
+from ..models import FeeInvoice, Grade, Streams
+
+COLLECTION_CACHE_TIMEOUT = 60 * 10
+
+_ZERO = Decimal('0')
+
+
+def collection_rate(collected, expected):
+    return round(float(collected / expected * 100), 1) if expected else 0
+
+
+def _invoices(school, term):
+    qs = FeeInvoice.objects.filter(school=school)
+    return qs.filter(term=term) if term is not None else qs
+
+
+def _cache_key(school, term):
+    stamp = _invoices(school, term).aggregate(latest=Max('updated_at'), rows=Count('id'))
+    latest = stamp['latest'].isoformat() if stamp['latest'] else '-'
+    return f"fee-collection:{school.pk}:{term.pk if term else 'all'}:{latest}:{stamp['rows']}"
+
+
+def _compute(school, term):
+    """{'cells': {(grade_id, stream_id): (expected, collected, students)}, 'by_status': [...]}."""
+    qs = _invoices(school, term).order_by()
+    cells = {
+        (row['student__grade_level_id'], row['student__stream_id']): (
+            row['expected'] or _ZERO, row['collected'] or _ZERO, row['students'],
+        )
+        for row in qs.values('student__grade_level_id', 'student__stream_id').annotate(
+            expected=Sum('amount_required'), collected=Sum('amount_paid'),
+            students=Count('student', distinct=True),
+        )
+    }
+    by_status = list(
+        qs.values('status').annotate(count=Count('id'), amount=Sum('amount_required')).order_by('status')
+    )
+    return {'cells': cells, 'by_status': by_status}
+
+
+def collection_snapshot(school, term=None):
+    """Grouped invoice totals for `school` (one term, or all terms), cached."""
+    key = _cache_key(school, term)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = _compute(school, term)
+        cache.set(key, snapshot, COLLECTION_CACHE_TIMEOUT)
+    return snapshot
+
+
+def _totals(expected, collected, students):
+    return {
+        'expected': expected, 'collected': collected, 'balance': expected - collected,
+        'rate': collection_rate(collected, expected), 'students': students,
+    }
+
+
+def collection_report(school, term=None, active_only=True):
+    """
+    Collection figures for every grade of `school` (only active ones with
+    `active_only`) and each of its streams. A stream row covers invoices of
+    students currently in that stream, a grade row those of students in
+    that grade. Totals at the top level sum the listed grades; 'all' covers
+    every invoice, including students without a grade.
+    """
+    snapshot = collection_snapshot(school, term)
+    by_grade = defaultdict(lambda: [_ZERO, _ZERO, 0])
+    by_stream = defaultdict(lambda: [_ZERO, _ZERO, 0])
+    everything = [_ZERO, _ZERO, 0]
+    for (grade_id, stream_id), figures in snapshot['cells'].items():
+        for acc in (by_grade[grade_id], by_stream[stream_id], everything):
+            for i, value in enumerate(figures):
+                acc[i] += value
+
+    grades = Grade.objects.filter(school=school).order_by('name')
+    if active_only:
+        grades = grades.filter(is_active=True)
+    streams = defaultdict(list)
+    for stream in Streams.objects.filter(school=school).order_by('name'):
+        streams[stream.grade_id].append(stream)
+
+    report = []
+    for grade in grades:
+        row = dict(_totals(*by_grade[grade.pk]), grade=grade)
+        row['streams'] = [dict(_totals(*by_stream[stream.pk]), stream=stream) for stream in streams[grade.pk]]
+        report.append(row)
+
+    expected = sum((g['expected'] for g in report), _ZERO)
+    collected = sum((g['collected'] for g in report), _ZERO)
+    return dict(
+        _totals(expected, collected, sum(g['students'] for g in report)),
+        grades=report, all=_totals(*everything), by_status=snapshot['by_status'],
+    )
@@ -0,0 +1,28 @@
+"""
+Process entry point for `manage.py run_workers`.
+
+Kept free of model imports: a spawned worker unpickles its target before
+Django is set up, so the ORM may only be touched after django.setup().
+"""
+import signal
+
+
+def worker_process(index, kinds, poll):
+    """Set Django up in the fresh process, then run jobs until SIGTERM or the supervisor goes away."""
+    import os
+    import django
+    from django.db import connection
+
+    # A signal only raises a flag, so the job in hand always runs to completion.
+    # Ctrl-C reaches the whole process group; the supervisor decides when to stop.
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    supervisor = os.getppid()
+    django.setup()
+
+    from .jobs import work
+    try:
+        work(index, lambda: stopping or os.getppid() != supervisor, kinds, poll)
+    finally:
+        connection.close()
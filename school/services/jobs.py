@@ -0,0 +1,247 @@
+"""
+Database-backed background job queue.
+
+Request handlers enqueue work instead of starting daemon threads:
+
+    enqueue('exam_upload', school=school, job_id=str(job.pk))
+
+`manage.py run_workers` runs a fixed pool of worker processes that claim
+BackgroundJob rows one at a time. Where the backend supports it the claim is
+`SELECT ... FOR UPDATE SKIP LOCKED`, so workers never queue behind each
+other's row locks. Every claim then goes through a conditional UPDATE, so
+the claim is safe on SQLite too. A claimed job holds a lease
+(`locked_until`) that a heartbeat renews while it runs. If a worker dies,
+the lease lapses and another worker picks the job up again. Failures are
+retried with exponential backoff until `max_attempts`. A lapsed lease counts
+as an attempt too: a job that keeps killing its worker (out of memory, a
+crash in a C extension) is marked failed with "Lease expired" once its
+attempts are used up, instead of being handed to the next worker forever.
+
+Handlers are registered by kind in JOB_HANDLERS as dotted paths and are
+called with the job's payload as keyword arguments. A kind may also name a
+hook in JOB_FAILURE_HANDLERS, called the same way once a job has failed for
+good (attempts used up or lease lapsed on the last attempt).
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from ..models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {
+    'excel_upload': 'school.views._process_upload_in_background',
+    'exam_upload': 'school.views._run_exam_upload_job',
+    'report_slips': 'school.services.report_slips.run_report_slip_job',
+    'campaign_delivery': 'school.services.campaigns.deliver_batch',
+    'scan_sms': 'school.services.zkteco.notify_scans',
+    'fee_invoices': 'school.services.fee_invoices.run_invoice_job',
+}
+
+JOB_FAILURE_HANDLERS = {
+    'campaign_delivery': 'school.services.campaigns.batch_failed',
+}
+
+LEASE_SECONDS = 300
+RETRY_BASE_SECONDS = 30
+POLL_SECONDS = 2
+
+
+def enqueue(kind, school=None, priority=BackgroundJob.PRIORITY_NORMAL, max_attempts=3, **payload):
+    """
+    Queue `kind` to run with `payload` (JSON-serialisable kwargs).
+
+    With settings.BACKGROUND_JOBS_EAGER the job runs in-process once the
+    surrounding transaction commits, which is handy for development without
+    a worker pool.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = BackgroundJob.objects.create(
+        kind=kind, school=school, priority=priority, max_attempts=max_attempts, payload=payload,
+    )
+    if getattr(settings, 'BACKGROUND_JOBS_EAGER', False):
+        transaction.on_commit(lambda: _run_claimed(_claim_pk(job.pk, 'eager')))
+    return job
+
+
+def worker_name(index=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+def _claimable(now, kinds=None):
+    qs = BackgroundJob.objects.filter(
+        Q(status=BackgroundJob.STATUS_PENDING, run_after__lte=now)
+        | Q(status=BackgroundJob.STATUS_RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+    if kinds:
+        qs = qs.filter(kind__in=kinds)
+    return qs.order_by('-priority', 'run_after', 'pk')
+
+
+def _claim_pk(pk, worker, lease=LEASE_SECONDS):
+    """Take the lease on job `pk` if nobody else holds it; returns the job or None."""
+    now = timezone.now()
+    claimed = _claimable(now).filter(pk=pk).update(
+        status=BackgroundJob.STATUS_RUNNING, attempts=F('attempts') + 1,
+        locked_by=worker, locked_until=now + timedelta(seconds=lease),
+    )
+    return BackgroundJob.objects.get(pk=pk) if claimed else None
+
+
+def _on_failed(job):
+    """Run the failure hook of `job`'s kind, if it has one."""
+    hook = JOB_FAILURE_HANDLERS.get(job.kind)
+    if hook is None:
+        return
+    try:
+        import_string(hook)(**job.payload)
+    except Exception:
+        logger.exception('[JOB %s] failure hook for %s failed', job.pk, job.kind)
+
+
+def fail_lapsed(now=None):
+    """Mark jobs whose lease lapsed on their last attempt as failed; returns how many."""
+    now = now or timezone.now()
+    lapsed = BackgroundJob.objects.filter(
+        status=BackgroundJob.STATUS_RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts'),
+    )
+    failed = 0
+    for job in lapsed.only('pk', 'kind', 'payload'):
+        # One conditional UPDATE per job: of two workers sweeping at once, only one fails it and runs its hook.
+        if lapsed.filter(pk=job.pk).update(
+            status=BackgroundJob.STATUS_FAILED, last_error='Lease expired: the worker died while running the job.',
+            finished_at=now, locked_by='', locked_until=None,
+        ):
+            failed += 1
+            _on_failed(job)
+    return failed
+
+
+def claim(worker, kinds=None, lease=LEASE_SECONDS):
+    """Claim the next runnable job for `worker`, or None when the queue is idle."""
+    fail_lapsed()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    for _ in range(5):
+        if skip_locked:
+            with transaction.atomic():
+                pk = _claimable(timezone.now(), kinds).select_for_update(skip_locked=True).values_list(
+                    'pk', flat=True,
+                ).first()
+                job = _claim_pk(pk, worker, lease) if pk is not None else None
+        else:
+            # No row locks to skip (SQLite): the conditional UPDATE alone decides the race.
+            pk = _claimable(timezone.now(), kinds).values_list('pk', flat=True).first()
+            job = _claim_pk(pk, worker, lease) if pk is not None else None
+        if pk is None or job is not None:
+            return job
+        # Lost the race for that row to another worker; look again.
+    return None
+
+
+def lease_rows(queryset, owner, limit, lease=LEASE_SECONDS):
+    """
+    Lease up to `limit` rows of `queryset` to `owner` and return them as a
+    queryset. The model needs `locked_by` / `locked_until` fields; rows
+    leased to someone else are skipped until their lease lapses. The
+    conditional UPDATE decides races between concurrent runs, so two runs
+    never both get the same row.
+    """
+    now = timezone.now()
+    free = queryset.filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+    pks = list(free.values_list('pk', flat=True)[:limit])
+    if pks:
+        free.filter(pk__in=pks).update(locked_by=owner, locked_until=now + timedelta(seconds=lease))
+    return queryset.model.objects.filter(pk__in=pks, locked_by=owner)
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a running job's lease until stopped."""
+
+    def __init__(self, job, lease=LEASE_SECONDS):
+        super().__init__(daemon=True)
+        self.job, self.lease = job, lease
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.lease / 3):
+                BackgroundJob.objects.filter(pk=self.job.pk, locked_by=self.job.locked_by).update(
+                    locked_until=timezone.now() + timedelta(seconds=self.lease),
+                )
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def _run_claimed(job, heartbeat=False):
+    """Execute a claimed job and record its outcome; returns the job."""
+    if job is None:
+        return None
+    beat = _Heartbeat(job) if heartbeat else None
+    if beat:
+        beat.start()
+    try:
+        import_string(JOB_HANDLERS[job.kind])(**job.payload)
+    except Exception as exc:
+        logger.exception('[JOB %s] %s failed (attempt %s/%s)', job.pk, job.kind, job.attempts, job.max_attempts)
+        job.last_error = f'{type(exc).__name__}: {exc}'
+        if job.attempts < job.max_attempts:
+            job.status = BackgroundJob.STATUS_PENDING
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = BackgroundJob.STATUS_FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = BackgroundJob.STATUS_DONE
+        job.finished_at = timezone.now()
+    finally:
+        if beat:
+            beat.stop()
+
+    # Only the lease holder may settle the job; a lapsed lease means it was handed on.
+    owner, job.locked_by, job.locked_until = job.locked_by, '', None
+    settled = BackgroundJob.objects.filter(pk=job.pk, locked_by=owner).update(
+        status=job.status, run_after=job.run_after, last_error=job.last_error,
+        finished_at=job.finished_at, locked_by='', locked_until=None,
+    )
+    if settled and job.status == BackgroundJob.STATUS_FAILED:
+        _on_failed(job)
+    return job
+
+
+def run_next(worker, kinds=None):
+    """Claim and run one job; returns it, or None when nothing was runnable."""
+    return _run_claimed(claim(worker, kinds), heartbeat=True)
+
+
+def work(index=0, should_stop=None, kinds=None, poll=POLL_SECONDS, drain=False):
+    """
+    Worker loop: run jobs until `should_stop()` returns true, or, with
+    `drain`, until the queue is empty.
+    """
+    name = worker_name(index)
+    while not (should_stop and should_stop()):
+        if not drain:
+            close_old_connections()
+        try:
+            job = run_next(name, kinds)
+        except Exception:
+            logger.exception('[WORKER %s] claim failed', name)
+            job = None
+        if job is None:
+            if drain:
+                break
+            time.sleep(poll)
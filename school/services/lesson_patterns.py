@@ -0,0 +1,231 @@
+"""
+Recurring lessons.
+
+A timetable is stored as LessonPattern rows (one per weekly session) and the
+students of each pattern are enrolled once, against the pattern. Dated Lesson
+rows are only written when an occurrence is actually needed: when attendance
+is first marked for it or when a single date is changed (cancelled, moved
+room). Everything else reads occurrences generated in memory:
+
+    for lesson in occurrences(patterns, monday, friday, lessons=legacy_qs):
+        lesson.pk          # None until the date has been materialised
+        lesson.pattern_id  # set for every generated or materialised occurrence
+
+    lesson = materialise(pattern, date)       # get-or-create the dated row
+    enrollments = lesson_enrollments(lesson)  # dated rows from the pattern roster
+
+Counts never build the occurrences: occurrence_counts() adds up pattern dates
+and weekly_lesson_count() counts one row per weekly session.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+
+from ..models import Attendance, Enrollment, Lesson
+from .enrollments import bulk_enroll
+
+PATTERN_RELATED = ('subject', 'teacher__user', 'stream__grade', 'time_slot', 'timetable__grade')
+
+
+def pattern_window(pattern, start=None, end=None):
+    """The (first, last) dates `pattern` can occur on, clipped to its timetable and term."""
+    first, last = pattern.timetable.start_date, pattern.timetable.end_date
+    if pattern.term_id:
+        first, last = max(first, pattern.term.start_date), min(last, pattern.term.end_date)
+    if start:
+        first = max(first, start)
+    if end:
+        last = min(last, end)
+    return first, last
+
+
+def pattern_dates(pattern, start=None, end=None):
+    """Every date in the window that falls on the pattern's weekday."""
+    first, last = pattern_window(pattern, start, end)
+    if first > last:
+        return []
+    d = first + timedelta(days=(pattern.weekday - first.weekday()) % 7)
+    dates = []
+    while d <= last:
+        dates.append(d)
+        d += timedelta(days=7)
+    return dates
+
+
+def occurs_on(pattern, lesson_date):
+    return lesson_date in pattern_dates(pattern, lesson_date, lesson_date)
+
+
+def _occurrence(pattern, lesson_date):
+    """Unsaved Lesson standing in for one date of `pattern`."""
+    return Lesson(
+        pattern=pattern,
+        timetable=pattern.timetable,
+        subject=pattern.subject,
+        stream=pattern.stream,
+        teacher=pattern.teacher,
+        day_of_week=pattern.day_of_week,
+        time_slot=pattern.time_slot,
+        room=pattern.room,
+        lesson_date=lesson_date,
+    )
+
+
+def _sort_key(lesson):
+    return (
+        lesson.lesson_date,
+        lesson.time_slot.start_time if lesson.time_slot_id else None,
+    )
+
+
+def occurrences(patterns, start, end, lessons=None):
+    """
+    Lessons between `start` and `end` (inclusive), ordered by date and start time.
+
+    `patterns` is a LessonPattern queryset. Each pattern date yields its
+    materialised Lesson if one exists, otherwise an unsaved stand-in. `lessons`
+    is an optional queryset of dated Lesson rows in the same scope; the ones
+    without a pattern (one-offs and rows written before patterns existed) are
+    included as they are. Cancelled occurrences are kept, callers filter on
+    `is_canceled`.
+    """
+    patterns = list(patterns.filter(is_active=True).select_related('term', *PATTERN_RELATED))
+
+    stored = {}
+    if patterns:
+        for lesson in Lesson.objects.filter(
+            pattern_id__in=[p.id for p in patterns],
+            lesson_date__range=(start, end),
+        ).select_related(*PATTERN_RELATED):
+            stored[(lesson.pattern_id, lesson.lesson_date)] = lesson
+
+    out = []
+    for pattern in patterns:
+        for d in pattern_dates(pattern, start, end):
+            out.append(stored.get((pattern.id, d)) or _occurrence(pattern, d))
+
+    if lessons is not None:
+        out.extend(
+            lessons.filter(pattern__isnull=True, lesson_date__range=(start, end))
+            .select_related(*PATTERN_RELATED)
+        )
+    out.sort(key=_sort_key)
+    return out
+
+
+def occurrence_counts(patterns, by, start=None, end=None, lessons=None):
+    """
+    {value of `by`: number of lessons} over the same rows occurrences() would
+    yield, without building them. Without `start`/`end` each pattern counts
+    every date of its timetable and term. `by` is a field name shared by
+    LessonPattern and Lesson, e.g. 'subject_id'.
+    """
+    counts = Counter()
+    for pattern in patterns.filter(is_active=True).select_related('timetable', 'term'):
+        counts[getattr(pattern, by)] += len(pattern_dates(pattern, start, end))
+    if lessons is not None:
+        lessons = lessons.filter(pattern__isnull=True)
+        if start and end:
+            lessons = lessons.filter(lesson_date__range=(start, end))
+        for row in lessons.values(by).annotate(n=Count('pk')):
+            counts[row[by]] += row['n']
+    return counts
+
+
+def weekly_lesson_count(patterns, lessons=None):
+    """
+    Weekly sessions in scope: the active patterns, plus one per distinct
+    weekly slot of the pattern-less dated lessons in `lessons`.
+    """
+    total = patterns.filter(is_active=True).count()
+    if lessons is not None:
+        total += (
+            lessons.filter(pattern__isnull=True)
+            .values('timetable', 'stream', 'subject', 'day_of_week', 'time_slot')
+            .distinct().count()
+        )
+    return total
+
+
+def unmarked_occurrences(patterns, start, end, lessons=None):
+    """occurrences() that have no Attendance recorded against them."""
+    has_attendance = Exists(Attendance.objects.filter(enrollment__lesson=OuterRef('pk')))
+    scope = Q(pattern__in=patterns.values('pk'))
+    if lessons is not None:
+        scope |= Q(pk__in=lessons.filter(pattern__isnull=True).values('pk'))
+    marked = set(
+        Lesson.objects.filter(scope, lesson_date__range=(start, end))
+        .filter(has_attendance).values_list('pk', flat=True)
+    )
+    return [
+        lesson for lesson in occurrences(patterns, start, end, lessons=lessons)
+        if lesson.pk is None or lesson.pk not in marked
+    ]
+
+
+def materialise(pattern, lesson_date, **changes):
+    """
+    The dated Lesson for `pattern` on `lesson_date`, created on first use.
+
+    `changes` (e.g. is_canceled=True, room='Lab 2') are applied to the row, so
+    one-off edits go through here as well. A pre-pattern row for the same slot
+    and date is adopted rather than duplicated.
+    """
+    if not occurs_on(pattern, lesson_date):
+        raise ValueError(f"{pattern} does not run on {lesson_date}")
+
+    key = dict(
+        timetable_id=pattern.timetable_id,
+        subject_id=pattern.subject_id,
+        stream_id=pattern.stream_id,
+        day_of_week=pattern.day_of_week,
+        time_slot_id=pattern.time_slot_id,
+        lesson_date=lesson_date,
+    )
+    defaults = dict(pattern=pattern, teacher_id=pattern.teacher_id, room=pattern.room)
+    try:
+        with transaction.atomic():
+            lesson = Lesson.objects.get_or_create(**key, defaults=defaults)[0]
+    except IntegrityError:
+        # Another request materialised the same date first.
+        lesson = Lesson.objects.get(**key)
+
+    update_fields = []
+    if lesson.pattern_id is None:
+        lesson.pattern = pattern
+        update_fields.append('pattern')
+    for name, value in changes.items():
+        if getattr(lesson, name) != value:
+            setattr(lesson, name, value)
+            update_fields.append(name)
+    if update_fields:
+        lesson.save(update_fields=update_fields)
+    return lesson
+
+
+def pattern_roster(pattern_ids):
+    """{pattern_id: [student_id, ...]} of active pattern-level enrollments."""
+    out = defaultdict(list)
+    for pattern_id, student_id in Enrollment.objects.filter(
+        pattern_id__in=pattern_ids, lesson__isnull=True, status='active',
+    ).values_list('pattern_id', 'student_id'):
+        out[pattern_id].append(student_id)
+    return out
+
+
+def lesson_enrollments(lesson):
+    """
+    Active enrollments of a dated lesson. For a pattern occurrence the dated
+    rows are created from the pattern roster first, so attendance keeps
+    pointing at an Enrollment of the lesson that was taught.
+    """
+    if lesson.pattern_id:
+        roster = pattern_roster([lesson.pattern_id]).get(lesson.pattern_id, ())
+        bulk_enroll(
+            lesson.pattern.school,
+            {(student_id, lesson.id) for student_id in roster},
+            lessons=[lesson.id],
+        )
+    return Enrollment.objects.filter(lesson=lesson, status='active')
@@ -0,0 +1,177 @@
+"""
+Parent portal summary: every child of a parent from batched queries.
+
+The web dashboards and the parent-children API used to run the same block
+per child (attendance counts, a fee-balance aggregate, a discipline count,
+upcoming lessons, announcements and the active term). Here each metric is
+one query over all the children, grouped by student:
+
+- attendance, fee balances, discipline, class (gate) attendance and the
+  latest payments are GROUP BY student_id aggregates (payments through a
+  ROW_NUMBER window);
+- upcoming lessons are generated once for all the children's streams;
+- the active term is one query for all their schools and announcements
+  one query per (school, grade), so siblings share them.
+
+    summary = parent_summary(parent)
+    summary['children'][0]['att_rate'], summary['total_balance']
+
+The summary is cached per parent for PARENT_SUMMARY_CACHE_TIMEOUT seconds;
+parent traffic comes in evening bursts and the figures only need to be
+minutes fresh.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from ..models import (
+    Announcement, Attendance, DisciplineRecord, FeeInvoice, GradeAttendance, Lesson, LessonPattern, Payment,
+    Student, Term,
+)
+from .lesson_patterns import occurrences
+from .student_stats import grouped_by_student
+
+PARENT_SUMMARY_CACHE_TIMEOUT = 60 * 2
+RECENT_DAYS = 30
+UPCOMING_DAYS = 7
+UPCOMING_LIMIT = 8
+ANNOUNCEMENT_LIMIT = 4
+PAYMENT_LIMIT = 5
+
+
+def _status(student, balance):
+    if student.expelled:
+        return 'danger', 'Expelled'
+    if student.suspended:
+        return 'warning', 'Suspended'
+    if balance > 0:
+        return 'warning', 'Fee balance'
+    if student.is_active:
+        return 'success', 'Active'
+    return 'secondary', 'Inactive'
+
+
+def _upcoming(students, today):
+    stream_ids = {s.stream_id for s in students if s.stream_id}
+    by_stream = defaultdict(list)
+    if stream_ids:
+        for lesson in occurrences(
+            LessonPattern.objects.filter(stream_id__in=stream_ids),
+            today, today + timedelta(days=UPCOMING_DAYS),
+            lessons=Lesson.objects.filter(stream_id__in=stream_ids),
+        ):
+            if not lesson.is_canceled and len(by_stream[lesson.stream_id]) < UPCOMING_LIMIT:
+                by_stream[lesson.stream_id].append(lesson)
+    return by_stream
+
+
+def _announcements(students, now):
+    found = {}
+    for key in {(s.school_id, s.grade_level_id) for s in students}:
+        school_id, grade_id = key
+        found[key] = list(
+            Announcement.objects.filter(school_id=school_id, audience__in=['all', 'parents'])
+            .filter(Q(grade_id=grade_id) | Q(grade__isnull=True))
+            .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+            .order_by('-is_pinned', '-created_at')[:ANNOUNCEMENT_LIMIT]
+        )
+    return found
+
+
+def _payments(ids):
+    latest = defaultdict(list)
+    for payment in Payment.objects.filter(student_id__in=ids).annotate(
+        row=Window(RowNumber(), partition_by=F('student_id'), order_by=[F('paid_at').desc(), F('id').desc()]),
+    ).filter(row__lte=PAYMENT_LIMIT).order_by('student_id', 'row'):
+        latest[payment.student_id].append(payment)
+    return latest
+
+
+def build_summary(students, today=None):
+    """The summary dict for `students` (Student rows with user/grade/stream/school loaded)."""
+    students = list(students)
+    ids = [s.pk for s in students]
+    now = timezone.now()
+    today = today or timezone.localdate()
+    recent = today - timedelta(days=RECENT_DAYS)
+
+    present, absent = Q(status='P'), Q(status__in=['UA', 'EA'])
+    attendance = grouped_by_student(
+        Attendance.objects.filter(enrollment__student_id__in=ids), 'enrollment__student_id',
+        total=Count('id'), present=Count('id', filter=present), absent=Count('id', filter=absent),
+        recent_total=Count('id', filter=Q(date__gte=recent)),
+        recent_present=Count('id', filter=present & Q(date__gte=recent)),
+    )
+    balances = grouped_by_student(
+        FeeInvoice.objects.filter(student_id__in=ids).exclude(status='paid'), 'student_id',
+        balance=Sum(F('amount_required') - F('amount_paid')),
+    )
+    discipline = grouped_by_student(
+        DisciplineRecord.objects.filter(student_id__in=ids), 'student_id',
+        open=Count('id', filter=Q(resolved=False)),
+        recent=Count('id', filter=Q(date__gte=recent)),
+        recent_minor=Count('id', filter=Q(date__gte=recent, severity='minor')),
+        recent_major=Count('id', filter=Q(date__gte=recent, severity='major')),
+    )
+    gate = defaultdict(dict)
+    for row in GradeAttendance.objects.filter(
+        student_id__in=ids, recorded_at__date__gte=recent,
+    ).order_by().values('student_id', 'stream_id').annotate(total=Count('id'), present=Count('id', filter=present)):
+        gate[row['student_id']][row['stream_id']] = row
+    payments = _payments(ids)
+    upcoming = _upcoming(students, today)
+    announcements = _announcements(students, now)
+    terms = {}
+    for term in Term.objects.filter(school_id__in={s.school_id for s in students}, is_active=True).order_by('pk'):
+        terms.setdefault(term.school_id, term)
+
+    children, total_balance = [], Decimal('0.00')
+    for student in students:
+        att = attendance.get(student.pk, {})
+        total_att, present_att = att.get('total', 0), att.get('present', 0)
+        balance = balances.get(student.pk, {}).get('balance') or Decimal('0.00')
+        total_balance += balance
+        dis = discipline.get(student.pk, {})
+        status_color, status_label = _status(student, balance)
+        children.append({
+            'student': student,
+            'school': student.school,
+            'active_term': terms.get(student.school_id),
+            'att_rate': int((present_att / total_att * 100) if total_att else 0),
+            'present_att': present_att,
+            'absent_att': att.get('absent', 0),
+            'total_att': total_att,
+            'fee_balance': balance,
+            'discipline_count': dis.get('open', 0),
+            'recent_payments': payments.get(student.pk, []),
+            'upcoming_lessons': upcoming.get(student.stream_id, []),
+            'announcements': announcements[(student.school_id, student.grade_level_id)],
+            'status_color': status_color,
+            'status_label': status_label,
+            # last RECENT_DAYS days, for the parent-children API
+            'recent_attendance': {'total': att.get('recent_total', 0), 'present': att.get('recent_present', 0)},
+            'recent_gate_attendance': gate[student.pk].get(student.stream_id, {'total': 0, 'present': 0}),
+            'recent_discipline': {
+                'total': dis.get('recent', 0), 'minor': dis.get('recent_minor', 0), 'major': dis.get('recent_major', 0),
+            },
+        })
+    return {'children': children, 'total_balance': total_balance}
+
+
+def parent_summary(parent, today=None):
+    """build_summary() for every child of `parent`, cached per parent and day."""
+    today = today or timezone.localdate()
+    key = f"parent-summary:{parent.pk}:{today.isoformat()}"
+    summary = cache.get(key)
+    if summary is None:
+        children = Student.objects.filter(parents=parent).select_related(
+            'user', 'grade_level', 'stream', 'school',
+        ).order_by('pk')
+        summary = build_summary(children, today)
+        cache.set(key, summary, PARENT_SUMMARY_CACHE_TIMEOUT)
+    return summary
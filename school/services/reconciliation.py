@@ -0,0 +1,312 @@
+"""
+Fee payment reconciliation for bank and M-Pesa statement exports.
+
+A statement goes through three steps instead of a lookup, an invoice save and
+a Payment save per spreadsheet row:
+
+1. read     – `read_statement` loads a CSV or XLSX export with pandas, finds
+              the header row (exports often start with a few title lines)
+              and maps the bank / M-Pesa column names onto one row format;
+2. plan     – `plan_statement` matches every row to a student and to the
+              term's open invoices, using dicts built from one query each.
+              Students are found by admission number (the paybill account
+              or bank reference), or else by the payer's phone when it
+              belongs to the parent of exactly one student. Amounts are
+              allocated across open invoices oldest-first. A row whose
+              transaction reference is already on a Payment, or earlier in
+              the file, is a duplicate;
+3. post     – `post_statement` re-plans inside one transaction, holding a
+              row lock on the term's open invoices so a payment recorded
+              concurrently cannot be overwritten, and writes invoices,
+              credit invoices and Payments with bulk_update / bulk_create.
+
+    statement = PaymentStatement.objects.create(..., rows=read_statement(f, f.name))
+    preview = plan_statement(statement)          # shown to the bursar
+    summary = post_statement(statement, user)    # on confirmation
+
+Any amount left after the open invoices are cleared is recorded as a paid
+"Fee Payment (Uploaded)" invoice, as the old single-row upload did when a
+student had no open invoice.
+"""
+import re
+import uuid
+from decimal import Decimal
+
+import pandas as pd
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import FeeInvoice, Payment, PaymentStatement, Student
+from . import audit
+from .fee_invoices import assign_receipt_numbers
+
+POST_CHUNK_SIZE = 500
+HEADER_SCAN_ROWS = 15
+CREDIT_DESCRIPTION = 'Fee Payment (Uploaded)'
+METHODS = dict(FeeInvoice.PAYMENT_METHOD_CHOICES)
+
+# Normalised header name → row field. Headers are lower-cased with every
+# run of other characters turned into "_" ("A/C No." → "a_c_no").
+COLUMNS = {
+    'student_ref': ('student_id', 'admission_no', 'admission_number', 'admin_no', 'adm_no', 'a_c_no',
+                    'account', 'account_no', 'account_number', 'bill_ref_number', 'billrefnumber'),
+    'amount': ('amount', 'amount_paid', 'paid_in', 'credit', 'credit_amount', 'trans_amount', 'transamount'),
+    'reference': ('reference', 'receipt_no', 'transaction_id', 'trans_id', 'transid', 'mpesa_code',
+                  'bank_reference', 'transaction_reference', 'ref'),
+    'paid_at': ('payment_date', 'date', 'completion_time', 'trans_time', 'transtime', 'value_date',
+                'transaction_date'),
+    'payer': ('phone', 'msisdn', 'payer_phone', 'other_party_info', 'payer'),
+    'method': ('payment_method', 'method'),
+    'notes': ('notes', 'details', 'narrative', 'description'),
+}
+
+
+def _header(value):
+    return re.sub(r'[^a-z0-9]+', '_', str(value).strip().lower()).strip('_')
+
+
+def student_key(value):
+    """Admission numbers compare without case, spaces or punctuation."""
+    return re.sub(r'[^A-Z0-9]', '', str(value).upper())
+
+
+def phone_key(value):
+    """Last nine digits of the first phone-like number in `value`."""
+    match = re.search(r'\d{9,}', str(value).replace(' ', ''))
+    return match.group()[-9:] if match else ''
+
+
+def _columns(headers):
+    """{row field: column index} for the recognised `headers`."""
+    found = {}
+    names = [_header(h) for h in headers]
+    for field, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                found[field] = names.index(alias)
+                break
+    return found
+
+
+def read_statement(fileobj, filename=''):
+    """
+    Parse a CSV/XLSX statement into a list of row dicts (row, student_ref,
+    amount, reference, paid_at, payer, method, notes, error). Raises
+    ValueError when no usable header row is found.
+    """
+    if filename.lower().endswith('.csv'):
+        raw = pd.read_csv(fileobj, header=None, dtype=str, keep_default_na=False)
+    else:
+        raw = pd.read_excel(fileobj, header=None, dtype=str).fillna('')
+    for header_at in range(min(HEADER_SCAN_ROWS, len(raw))):
+        columns = _columns(raw.iloc[header_at])
+        if 'amount' in columns and ({'student_ref', 'payer'} & columns.keys()):
+            break
+    else:
+        raise ValueError(
+            'No header row with an amount column and a student_id / account column was found.'
+        )
+
+    body = raw.iloc[header_at + 1:]
+
+    def text(field):
+        if field not in columns:
+            return pd.Series('', index=body.index)
+        return body.iloc[:, columns[field]].astype(str).str.strip().replace({'nan': '', 'NaT': '', 'None': ''})
+
+    amounts = pd.to_numeric(text('amount').str.replace(r'[^0-9.\-]', '', regex=True), errors='coerce')
+    dates_raw = text('paid_at')
+    dates = pd.to_datetime(dates_raw.where(dates_raw != ''), errors='coerce', format='mixed', dayfirst=True)
+
+    rows = []
+    for index, student_ref, amount, reference, at, payer, method, notes in zip(
+        body.index, text('student_ref').str.replace(r'\.0$', '', regex=True), amounts,
+        text('reference'), dates, text('payer'), text('method').str.lower(), text('notes'),
+    ):
+        if not (student_ref or payer or reference) and pd.isna(amount):
+            continue  # blank line
+        error = ''
+        if pd.isna(amount) or amount <= 0:
+            error = 'Amount is missing or not a positive number'
+        rows.append({
+            'row': int(index) + 1,
+            'student_ref': student_ref,
+            'amount': '' if pd.isna(amount) else str(Decimal(str(amount)).quantize(Decimal('0.01'))),
+            'reference': reference[:100],
+            'paid_at': None if pd.isna(at) else at.isoformat(),
+            'payer': payer,
+            'method': method if method in METHODS else '',
+            'notes': notes,
+            'error': error,
+        })
+    return rows
+
+
+def _indexes(school, term, rows, lock=False):
+    students = {}
+    for pk, student_id, first, last in Student.objects.filter(school=school).values_list(
+        'pk', 'student_id', 'user__first_name', 'user__last_name',
+    ):
+        students.setdefault(student_key(student_id), (pk, student_id, f"{first} {last}".strip()))
+    by_pk = {entry[0]: entry for entry in students.values()}
+
+    children = {}
+    for student_pk, phone in Student.parents.through.objects.filter(
+        student__school=school,
+    ).values_list('student_id', 'parent__phone'):
+        if phone_key(phone):
+            children.setdefault(phone_key(phone), set()).add(student_pk)
+
+    invoices = FeeInvoice.objects.filter(
+        school=school, term=term, status__in=['pending', 'partial'],
+    ).order_by('created_at', 'pk')
+    if lock:
+        invoices = invoices.select_for_update()
+    open_invoices = {}
+    for invoice in invoices:
+        open_invoices.setdefault(invoice.student_id, []).append(invoice)
+
+    references = {row['reference'] for row in rows if row['reference']}
+    taken = set(Payment.objects.filter(transaction_id__in=references).values_list('transaction_id', flat=True))
+    return students, by_pk, children, open_invoices, taken
+
+
+def plan_statement(statement, lock=False):
+    """
+    Match and allocate every row of `statement` without writing anything.
+    Returns a dict with 'rows' (each row plus status, message, student and
+    allocations), the touched and credit invoices, and summary counts.
+    With `lock` (inside a transaction) the open invoices are read with
+    SELECT ... FOR UPDATE.
+    """
+    students, by_pk, children, open_invoices, taken = _indexes(
+        statement.school, statement.term, statement.rows, lock=lock,
+    )
+    seen = set()
+    planned, touched, credits = [], {}, []
+    counts = {'ok': 0, 'duplicate': 0, 'unmatched': 0, 'invalid': 0}
+    total = Decimal('0')
+
+    for row in statement.rows:
+        row = dict(row, allocations=[], credit=Decimal('0'), student=None)
+        if row['error']:
+            row['status'], row['message'] = 'invalid', row['error']
+        elif row['reference'] and (row['reference'] in taken or row['reference'] in seen):
+            row['status'], row['message'] = 'duplicate', f"Reference {row['reference']} is already recorded"
+        else:
+            student = students.get(student_key(row['student_ref'])) if row['student_ref'] else None
+            if student is None and row['payer']:
+                family = children.get(phone_key(row['payer']), ())
+                student = by_pk.get(next(iter(family))) if len(family) == 1 else None
+            if student is None:
+                row['status'] = 'unmatched'
+                row['message'] = f"No student matches '{row['student_ref'] or row['payer']}'"
+            else:
+                row['status'], row['message'], row['student'] = 'ok', '', student
+        counts[row['status']] += 1
+        if row['status'] != 'ok':
+            planned.append(row)
+            continue
+
+        if row['reference']:
+            seen.add(row['reference'])
+        amount = remaining = Decimal(row['amount'])
+        total += amount
+        method = row['method'] or statement.default_method
+        for invoice in open_invoices.get(row['student'][0], []):
+            if remaining <= 0:
+                break
+            share = min(invoice.balance, remaining)
+            if share <= 0:
+                continue
+            invoice.amount_paid += share
+            invoice.payment_method = method
+            if row['notes']:
+                invoice.notes = (invoice.notes + '\n' + row['notes']).strip()
+            invoice.refresh_status()
+            touched[invoice.pk] = invoice
+            row['allocations'].append((invoice, share))
+            remaining -= share
+        if remaining > 0:
+            row['credit'] = remaining
+            credits.append(FeeInvoice(
+                school=statement.school, student_id=row['student'][0], term=statement.term,
+                description=CREDIT_DESCRIPTION, amount_required=remaining, amount_paid=remaining,
+                payment_method=method, notes=row['notes'], created_by=statement.uploaded_by,
+            ))
+        planned.append(row)
+
+    for invoice in credits:
+        invoice.refresh_status()
+    return {
+        'rows': planned,
+        'invoices': list(touched.values()),
+        'credits': credits,
+        'counts': counts,
+        'total': total,
+    }
+
+
+def _paid_at(row):
+    at = parse_datetime(row['paid_at']) if row['paid_at'] else None
+    if at is not None and timezone.is_naive(at):
+        at = timezone.make_aware(at)
+    return at or timezone.now()
+
+
+def post_statement(statement, user=None, chunk_size=POST_CHUNK_SIZE):
+    """
+    Post the payments of a draft `statement` in one transaction and mark it
+    posted. Returns the summary stored on the statement. Rows are re-planned
+    here, so payments recorded since the preview are still honoured.
+    """
+    with transaction.atomic():
+        claimed = PaymentStatement.objects.filter(
+            pk=statement.pk, status=PaymentStatement.STATUS_DRAFT,
+        ).update(status=PaymentStatement.STATUS_POSTED, posted_at=timezone.now())
+        if not claimed:
+            raise ValueError('This statement has already been posted or discarded.')
+
+        plan = plan_statement(statement, lock=True)
+        now = timezone.now()
+        for invoice in plan['invoices']:
+            invoice.updated_at = now
+        FeeInvoice.objects.bulk_update(
+            plan['invoices'], ['amount_paid', 'status', 'payment_method', 'notes', 'updated_at'],
+            batch_size=chunk_size,
+        )
+        assign_receipt_numbers(plan['credits'])
+        FeeInvoice.objects.bulk_create(plan['credits'], batch_size=chunk_size)
+
+        description = f"Bulk upload – {statement.term.name}"
+        payments = [
+            Payment(
+                student_id=row['student'][0], school=statement.school,
+                amount=Decimal(row['amount']), payment_type='fees', status='paid',
+                transaction_id=row['reference'] or f"UPL-{uuid.uuid4().hex[:10].upper()}",
+                paid_at=_paid_at(row), description=description,
+            )
+            for row in plan['rows'] if row['status'] == 'ok'
+        ]
+        Payment.objects.bulk_create(payments, batch_size=chunk_size)
+        if payments and payments[0].pk is None and not connection.features.can_return_rows_from_bulk_insert:
+            pks = dict(Payment.objects.filter(
+                transaction_id__in=[p.transaction_id for p in payments],
+            ).values_list('transaction_id', 'pk'))
+            for payment in payments:
+                payment.pk = pks[payment.transaction_id]
+        for payment in payments:
+            audit.log(
+                'Payment', payment.pk, 'create',
+                f"{payment.get_payment_type_display()} {payment.amount} status={payment.status}",
+                school_id=payment.school_id, actor_id=user.pk if user else None,
+            )
+
+        statement.status, statement.posted_at = PaymentStatement.STATUS_POSTED, timezone.now()
+        statement.summary = dict(
+            plan['counts'], total=str(plan['total']),
+            invoices=len(plan['invoices']), credits=len(plan['credits']),
+        )
+        statement.save(update_fields=['summary'])
+    return statement.summary
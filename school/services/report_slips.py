@@ -0,0 +1,247 @@
+"""
+Report slips for single students and whole grades/streams.
+
+build_payloads() gathers everything a batch needs with a handful of
+queries — the students, all their results, and stream/grade positions from
+the cached session totals (school.services.exam_ranking) — and turns it
+into plain dicts that school.services.slip_pdf renders without the ORM.
+
+Both formats render slips in chunks across a process pool: a ZIP gets one
+PDF per student, a merged PDF one document per chunk, concatenated in order
+with pypdf. A single process (or a batch that fits one chunk) lays the
+merged PDF out as one reportlab document.
+
+    with open(path, 'wb') as fh:
+        render_batch(build_payloads(session, students), 'zip', fh)
+"""
+import io
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.utils import timezone
+from pypdf import PdfWriter
+
+from ..models import ExamResult, ReportSlipJob, Student, cbc_grade_band
+from .exam_ranking import NO_POSITION, positions_among, session_totals
+from .slip_pdf import render_files, render_merged, render_slip, write_zip
+
+SLIP_CHUNK_SIZE = 25
+PROGRESS_EVERY = 10
+SLIP_JOB_DIR = 'report_slips'
+DEFAULT_RENDER_WORKERS = 2
+
+
+def _school_header(school):
+    return {
+        'name': school.name, 'code': school.code, 'address': school.address,
+        'phone': school.contact_phone, 'email': school.contact_email,
+    }
+
+
+def _session_header(session):
+    return {
+        'name': session.name,
+        'grade': session.grade.name,
+        'term': session.term.name if session.term else '–',
+        'year': session.year,
+        'total_marks': session.total_marks,
+        'out_of': {
+            'cat': session.cat_out_of, 'assignment': session.assignment_out_of,
+            'assessment': session.assessment_out_of, 'exam': session.exam_out_of,
+        },
+    }
+
+
+def _result_row(result, total_marks):
+    total = result.total
+    pct = round(total / total_marks * 100, 1) if total is not None and total_marks else None
+    return {
+        'subject': result.subject.name,
+        'cat': result.cat_score, 'assignment': result.assignment_score,
+        'assessment': result.assessment_score, 'exam': result.exam_score,
+        'total': total, 'percentage': pct,
+        'band': cbc_grade_band(pct) if pct is not None else '–',
+    }
+
+
+def slip_payload(session, student, results, positions, school=None, session_header=None):
+    """Plain-dict description of one slip; `results` are the student's ExamResults by subject name."""
+    total_marks = session.total_marks
+    rows = [_result_row(r, total_marks) for r in results]
+    overall_total = sum(r['total'] for r in rows if r['total'] is not None)
+    overall_pct = round(overall_total / (total_marks * len(rows)) * 100, 1) if rows and total_marks else None
+    return {
+        'school': school or _school_header(student.school),
+        'session': session_header or _session_header(session),
+        'student': {
+            'name': student.user.get_full_name(),
+            'student_id': student.student_id,
+            'stream': student.stream.name if student.stream else '–',
+        },
+        'results': rows,
+        'overall': {
+            'total': overall_total,
+            'max': total_marks * len(rows),
+            'pct': overall_pct,
+            'band': cbc_grade_band(overall_pct) if overall_pct is not None else '–',
+        },
+        'stream_pos': positions['stream_pos'], 'stream_total': positions['stream_total'],
+        'grade_pos': positions['grade_pos'], 'grade_total': positions['grade_total'],
+        'printed_on': date.today().strftime('%d/%m/%Y'),
+        'filename': f"report_slip_{student.student_id}_{session.year}.pdf",
+    }
+
+
+def render_student_slip(session, student, results, positions):
+    """PDF bytes for one student's slip."""
+    return render_slip(slip_payload(session, student, results, positions))
+
+
+def build_payloads(session, students):
+    """Slip payloads for a Student queryset, in the queryset's order."""
+    students = list(students.select_related('user', 'stream', 'school'))
+    if not students:
+        return []
+    totals = session_totals(session)
+
+    grade_ids, stream_members = [], defaultdict(list)
+    for sid, stream_id in Student.objects.filter(
+        school_id=session.school_id, grade_level_id=session.grade_id, is_active=True,
+    ).values_list('id', 'stream_id'):
+        grade_ids.append(sid)
+        stream_members[stream_id].append(sid)
+    grade_positions, grade_total = positions_among(totals, grade_ids)
+    stream_positions = {
+        stream_id: positions_among(totals, members, stream_id)
+        for stream_id, members in stream_members.items() if stream_id
+    }
+
+    results = defaultdict(list)
+    for r in (
+        ExamResult.objects.filter(session=session, student_id__in=[s.pk for s in students])
+        .select_related('subject').order_by('student_id', 'subject__name')
+    ):
+        results[r.student_id].append(r)
+
+    school = _school_header(students[0].school)
+    header = _session_header(session)
+    payloads = []
+    for student in students:
+        by_stream, stream_total = stream_positions.get(student.stream_id, ({}, 0))
+        positions = {
+            'stream_pos': by_stream.get(student.pk, NO_POSITION), 'stream_total': stream_total,
+            'grade_pos': grade_positions.get(student.pk, NO_POSITION), 'grade_total': grade_total,
+        }
+        payloads.append(slip_payload(
+            session, student, results.get(student.pk, []), positions, school=school, session_header=header,
+        ))
+    return payloads
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _render_chunks(render, chunks, workers):
+    """Yield `render(chunk)` for each chunk in order, across `workers` processes when above one."""
+    if workers > 1:
+        # spawn, not fork: the caller is often a request thread holding DB connections.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+            yield from pool.map(render, chunks)
+    else:
+        for chunk in chunks:
+            yield render(chunk)
+
+
+def render_batch(payloads, output_format, fileobj, workers=None, on_progress=None):
+    """
+    Write every slip in `payloads` to `fileobj` as one merged PDF
+    (output_format 'pdf') or a ZIP of per-student PDFs ('zip').
+    `on_progress(done)` is called as slips complete. `workers` defaults to
+    settings.REPORT_SLIP_WORKERS: batches usually run inside one of several
+    queue workers, so the pool stays small rather than one per core.
+    """
+    progress = on_progress or (lambda done: None)
+    chunks = list(_chunks(payloads, SLIP_CHUNK_SIZE))
+    workers = min(workers or getattr(settings, 'REPORT_SLIP_WORKERS', DEFAULT_RENDER_WORKERS), len(chunks))
+
+    if output_format == ReportSlipJob.FORMAT_PDF:
+        if workers > 1:
+            writer, done = PdfWriter(), 0
+            for chunk, pdf in zip(chunks, _render_chunks(render_merged, chunks, workers)):
+                writer.append(io.BytesIO(pdf))
+                done += len(chunk)
+                progress(done)
+            writer.write(fileobj)
+            return
+
+        done = 0
+
+        def tick():
+            nonlocal done
+            done += 1
+            if done % PROGRESS_EVERY == 0:
+                progress(done)
+
+        fileobj.write(render_merged(payloads, on_slip=tick))
+        progress(len(payloads))
+        return
+
+    def rendered():
+        done = 0
+        for files in _render_chunks(render_files, chunks, workers):
+            done += len(files)
+            progress(done)
+            yield from files
+
+    write_zip(fileobj, rendered())
+
+
+def job_students(job):
+    """Active students covered by a ReportSlipJob, in class-list order."""
+    students = Student.objects.filter(school=job.school, grade_level=job.session.grade, is_active=True)
+    if job.stream_id:
+        students = students.filter(stream_id=job.stream_id)
+    return students.order_by('stream__name', 'user__last_name', 'user__first_name')
+
+
+def job_output_path(job):
+    folder = os.path.join(settings.MEDIA_ROOT, SLIP_JOB_DIR)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{job.pk}.{job.output_format}")
+
+
+def run_report_slip_job(job_id, workers=None):
+    """Render a ReportSlipJob, recording progress on the job row as slips complete."""
+    job = ReportSlipJob.objects.select_related('session__grade', 'session__term', 'school').get(pk=job_id)
+    try:
+        job.status = ReportSlipJob.STATUS_PROCESSING
+        job.save(update_fields=['status'])
+
+        payloads = build_payloads(job.session, job_students(job))
+        job.total = len(payloads)
+        job.save(update_fields=['total'])
+
+        def on_progress(done):
+            job.processed = done
+            job.save(update_fields=['processed'])
+
+        path = job_output_path(job)
+        with open(path, 'wb') as fh:
+            render_batch(payloads, job.output_format, fh, workers=workers, on_progress=on_progress)
+
+        job.file_path = path
+        job.status = ReportSlipJob.STATUS_DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=['file_path', 'status', 'finished_at'])
+    except Exception as exc:
+        job.status = ReportSlipJob.STATUS_FAILED
+        job.error = str(exc)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
@@ -0,0 +1,220 @@
+"""
+Local scan spool for schools on unreliable links.
+
+With `run_zkteco --spool PATH --upload URL` the device poller never writes to
+the Django database. New device records are appended to a local SQLite file
+first. An uploader thread ships them to POST /api/scans/bulk/ in per-device
+batches and marks them uploaded only once the server has acknowledged them.
+While the link is down, records simply accumulate in the spool. The server
+derives scan ids from device, user and timestamp, so a batch that is resent
+after a lost response is harmless.
+
+    spool = ScanSpool('/var/lib/kiswate/scans.db')
+    spool.append('gate1', records, record_count=conn.records)
+    Uploader(spool, 'https://school.example/api/scans/bulk/').upload()
+
+The spool also caches the device list (including each device's upload key)
+and the per-device high-water marks, so polling carries on across restarts
+while the database is unreachable.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_BATCH_SIZE = 500
+UPLOAD_TIMEOUT = (5, 30)
+MAX_BACKOFF_SECONDS = 300
+DEVICE_FIELDS = ('host', 'port', 'location', 'kind', 'api_key')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    scanned_at TEXT NOT NULL,
+    uploaded INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (device_id, user_id, scanned_at)
+);
+CREATE INDEX IF NOT EXISTS records_pending ON records (device_id, uploaded, seq);
+CREATE TABLE IF NOT EXISTS devices (
+    device_id TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    last_synced_at TEXT,
+    record_count INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _utc(at):
+    """Stored timestamps are UTC ISO strings, so they also sort as text."""
+    return at.astimezone(timezone.utc).isoformat()
+
+
+class ScanSpool:
+    """Append-only record spool in one SQLite file; safe to share between threads."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=FULL')  # a scan is only acknowledged once it is on disk
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # ── Devices ──────────────────────────────────────────────────────────────
+
+    def save_devices(self, devices):
+        """Cache the config of `devices` (AttendanceDevice rows), keeping their marks."""
+        with self.lock:
+            self.db.executemany(
+                'INSERT INTO devices (device_id, config) VALUES (?, ?) '
+                'ON CONFLICT (device_id) DO UPDATE SET config = excluded.config',
+                [
+                    (d.device_id, json.dumps({f: getattr(d, f) for f in DEVICE_FIELDS}))
+                    for d in devices
+                ],
+            )
+
+    def devices(self):
+        """{device_id: config} of every cached device."""
+        with self.lock:
+            rows = self.db.execute('SELECT device_id, config FROM devices').fetchall()
+        return {device_id: json.loads(config) for device_id, config in rows}
+
+    def state(self, device_id):
+        """(high-water mark, record count) of `device_id`."""
+        with self.lock:
+            row = self.db.execute(
+                'SELECT last_synced_at, record_count FROM devices WHERE device_id = ?', (device_id,),
+            ).fetchone()
+        if row is None:
+            return None, 0
+        return (datetime.fromisoformat(row[0]) if row[0] else None), row[1]
+
+    # ── Records ──────────────────────────────────────────────────────────────
+
+    def append(self, device_id, records, record_count=0):
+        """
+        Spool the `records` (aware `timestamp`, `user_id`) of `device_id` at or
+        after its mark and advance the mark. Returns how many were new.
+        """
+        mark, _ = self.state(device_id)
+        batch = sorted((r.timestamp, str(r.user_id)) for r in records)
+        if mark is not None:
+            batch = [(at, user_id) for at, user_id in batch if at >= mark]
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                before = self.db.total_changes
+                self.db.executemany(
+                    'INSERT OR IGNORE INTO records (device_id, user_id, scanned_at) VALUES (?, ?, ?)',
+                    [(device_id, user_id, _utc(at)) for at, user_id in batch],
+                )
+                added = self.db.total_changes - before
+                self.db.execute(
+                    'INSERT INTO devices (device_id, config, last_synced_at, record_count) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (device_id) DO UPDATE SET '
+                    'last_synced_at = coalesce(excluded.last_synced_at, devices.last_synced_at), '
+                    'record_count = excluded.record_count',
+                    (device_id, '{}', _utc(batch[-1][0]) if batch else None, record_count),
+                )
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+        return added
+
+    def pending(self, device_id, limit=UPLOAD_BATCH_SIZE):
+        """Oldest not-yet-uploaded records of `device_id` as (seq, user_id, scanned_at)."""
+        with self.lock:
+            return self.db.execute(
+                'SELECT seq, user_id, scanned_at FROM records '
+                'WHERE device_id = ? AND uploaded = 0 ORDER BY seq LIMIT ?',
+                (device_id, limit),
+            ).fetchall()
+
+    def pending_devices(self):
+        with self.lock:
+            return [row[0] for row in self.db.execute(
+                'SELECT DISTINCT device_id FROM records WHERE uploaded = 0',
+            )]
+
+    def mark_uploaded(self, seqs):
+        with self.lock:
+            self.db.executemany('UPDATE records SET uploaded = 1 WHERE seq = ?', [(seq,) for seq in seqs])
+
+    def purge(self, older_than=timedelta(days=7)):
+        """Drop uploaded records spooled more than `older_than` ago (by scan time)."""
+        cutoff = _utc(datetime.now(timezone.utc) - older_than)
+        with self.lock:
+            return self.db.execute(
+                'DELETE FROM records WHERE uploaded = 1 AND scanned_at < ?', (cutoff,),
+            ).rowcount
+
+
+class Uploader:
+    """Ships spooled records to the server's bulk scan endpoint."""
+
+    def __init__(self, spool, url, batch_size=UPLOAD_BATCH_SIZE, session=None):
+        self.spool, self.url, self.batch_size = spool, url, batch_size
+        self.session = session or requests.Session()
+
+    def _post(self, device_id, key, rows):
+        payload = {
+            'device_id': device_id,
+            'records': [{'user_id': user_id, 'timestamp': at} for _, user_id, at in rows],
+        }
+        r = self.session.post(self.url, json=payload, headers={'X-Device-Key': key}, timeout=UPLOAD_TIMEOUT)
+        r.raise_for_status()
+        return r.json()
+
+    def upload(self):
+        """
+        Upload every pending record. Returns how many were acknowledged; a
+        device whose upload fails keeps its records and is retried next round.
+        Raises the first failure after the other devices have been tried.
+        """
+        sent, error = 0, None
+        devices = self.spool.devices()
+        for device_id in self.spool.pending_devices():
+            key = devices.get(device_id, {}).get('api_key')
+            if not key:
+                logger.error("[SPOOL %s] no upload key cached; records kept", device_id)
+                continue
+            try:
+                while True:
+                    rows = self.spool.pending(device_id, self.batch_size)
+                    if not rows:
+                        break
+                    result = self._post(device_id, key, rows)
+                    self.spool.mark_uploaded([seq for seq, _, _ in rows])
+                    sent += len(rows)
+                    logger.info("[SPOOL %s] uploaded %d record(s), %s stored", device_id, len(rows), result.get('stored'))
+            except (requests.RequestException, ValueError) as exc:
+                logger.warning("[SPOOL %s] upload failed: %s", device_id, exc)
+                error = error or exc
+        if error is not None:
+            raise error
+        return sent
+
+    def run(self, should_stop, poll=5):
+        backoff = poll
+        while not should_stop():
+            try:
+                self.upload()
+                self.spool.purge()
+                backoff = poll
+            except Exception:
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+            deadline = time.monotonic() + backoff
+            while time.monotonic() < deadline and not should_stop():
+                time.sleep(1)
@@ -0,0 +1,213 @@
+"""
+Report-slip PDF rendering.
+
+Pure reportlab: every function here takes plain payload dicts (built by
+school.services.report_slips) and never touches the ORM, so slips can be
+rendered in worker processes. Paragraph/table styles are built once per
+process and shared by every slip rendered in it.
+"""
+import io
+import zipfile
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import (
+    Flowable, HRFlowable, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle,
+)
+
+from .exports import LazyStory
+
+GREEN = colors.HexColor('#0b7a2a')
+RED = colors.HexColor('#bb0a21')
+DARK = colors.HexColor('#111111')
+LIGHT_GREEN = colors.HexColor('#e8f5e9')
+
+CBC_KEY = (
+    'CBC Grade Key:  EE = Exceeding Expectations (75–100%)  |  ME = Meeting Expectations (50–74%)  |  '
+    'AE = Approaching Expectations (25–49%)  |  BE = Below Expectations (0–24%)'
+)
+
+_styles = None
+
+
+def slip_styles():
+    """Paragraph and table styles shared by every slip in this process."""
+    global _styles
+    if _styles is None:
+        _styles = {
+            'h1': ParagraphStyle('H1', fontSize=16, fontName='Helvetica-Bold', textColor=GREEN,
+                                 alignment=TA_CENTER, spaceAfter=2),
+            'h2': ParagraphStyle('H2', fontSize=11, fontName='Helvetica-Bold', textColor=DARK,
+                                 alignment=TA_CENTER, spaceAfter=2),
+            'sub': ParagraphStyle('Sub', fontSize=9, fontName='Helvetica', textColor=colors.grey,
+                                  alignment=TA_CENTER, spaceAfter=6),
+            'info': TableStyle([
+                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+            ]),
+            'scores': TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), GREEN),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 8),
+                ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, LIGHT_GREEN]),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('TOPPADDING', (0, 0), (-1, -1), 4),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+            ]),
+            'summary': TableStyle([
+                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+                ('FONTNAME', (4, 0), (4, -1), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('BACKGROUND', (0, 0), (-1, -1), LIGHT_GREEN),
+                ('BOX', (0, 0), (-1, -1), 1, GREEN),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+                ('TOPPADDING', (0, 0), (-1, -1), 5),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+            ]),
+            'key': TableStyle([
+                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Oblique'),
+                ('FONTSIZE', (0, 0), (-1, -1), 7),
+                ('TEXTCOLOR', (0, 0), (-1, -1), colors.grey),
+            ]),
+            'signature': TableStyle([
+                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
+            ]),
+        }
+    return _styles
+
+
+def _fmt(value, pattern='{:.1f}'):
+    return pattern.format(value) if value is not None else '–'
+
+
+def slip_flowables(slip):
+    """Flowables for one student's slip (see report_slips.slip_payload for the keys)."""
+    st = slip_styles()
+    school, session, student = slip['school'], slip['session'], slip['student']
+    elements = [
+        Paragraph(school['name'].upper(), st['h1']),
+        Paragraph(f"Code: {school['code']}  |  {school['address']}", st['sub']),
+        Paragraph(f"Tel: {school['phone']}  |  Email: {school['email']}", st['sub']),
+        HRFlowable(width='100%', thickness=2, color=GREEN, spaceAfter=6),
+        Paragraph(f"STUDENT REPORT SLIP – {session['name'].upper()}", st['h2']),
+        HRFlowable(width='100%', thickness=1, color=RED, spaceAfter=8),
+    ]
+
+    info_table = Table([
+        ['Name:', student['name'], 'Admission No:', student['student_id']],
+        ['Grade:', session['grade'], 'Stream:', student['stream']],
+        ['Term:', session['term'], 'Year:', str(session['year'])],
+    ], colWidths=[2.5*cm, 6*cm, 3*cm, 6*cm])
+    info_table.setStyle(st['info'])
+    elements += [info_table, Spacer(1, 8)]
+
+    out_of = session['out_of']
+    hdr = ['Subject', f"CAT\n/{out_of['cat']:.0f}", f"Asgn\n/{out_of['assignment']:.0f}",
+           f"Asmt\n/{out_of['assessment']:.0f}", f"Exam\n/{out_of['exam']:.0f}",
+           f"Total\n/{session['total_marks']:.0f}", '%', 'Grade']
+    table_data = [hdr]
+    for r in slip['results']:
+        table_data.append([
+            r['subject'], _fmt(r['cat']), _fmt(r['assignment']), _fmt(r['assessment']),
+            _fmt(r['exam']), _fmt(r['total']), _fmt(r['percentage'], '{:.1f}%'), r['band'],
+        ])
+    score_table = Table(table_data, colWidths=[4.5*cm, 1.6*cm, 1.6*cm, 1.6*cm, 1.6*cm, 2*cm, 1.8*cm, 1.8*cm],
+                        repeatRows=1)
+    score_table.setStyle(st['scores'])
+    elements += [score_table, Spacer(1, 10)]
+
+    overall = slip['overall']
+    sum_table = Table([
+        ['Overall Total:', f"{overall['total']:.1f} / {overall['max']:.0f}",
+         'Overall %:', f"{overall['pct']:.1f}%" if overall['pct'] else '–',
+         'Grade Band:', overall['band']],
+        ['Stream Position:', f"{slip['stream_pos']} / {slip['stream_total']}",
+         'Grade Position:', f"{slip['grade_pos']} / {slip['grade_total']}", '', ''],
+    ], colWidths=[3.5*cm, 4*cm, 3*cm, 3*cm, 2.5*cm, 2.5*cm])
+    sum_table.setStyle(st['summary'])
+    elements += [sum_table, Spacer(1, 16)]
+
+    key_table = Table([[CBC_KEY]], colWidths=[18.5*cm])
+    key_table.setStyle(st['key'])
+    elements += [key_table, Spacer(1, 20)]
+
+    sig_table = Table([[
+        'Class Teacher: ___________________________', 'Principal: ___________________________',
+        f"Date: {slip['printed_on']}",
+    ]], colWidths=[7*cm, 7*cm, 4.5*cm])
+    sig_table.setStyle(st['signature'])
+    elements.append(sig_table)
+    return elements
+
+
+class _SlipEnd(Flowable):
+    """Zero-size marker laid out after the last flowable of each slip."""
+
+    def wrap(self, available_width, available_height):
+        return 0, 0
+
+    def draw(self):
+        pass
+
+
+class _SlipDocTemplate(SimpleDocTemplate):
+    """Calls `on_slip()` each time a slip's end marker is laid out."""
+
+    def __init__(self, *args, on_slip=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_slip = on_slip
+
+    def afterFlowable(self, flowable):
+        if self._on_slip and isinstance(flowable, _SlipEnd):
+            self._on_slip()
+
+
+def _doc(buffer, on_slip=None):
+    return _SlipDocTemplate(buffer, pagesize=A4, leftMargin=1.5*cm, rightMargin=1.5*cm,
+                            topMargin=1.5*cm, bottomMargin=1.5*cm, on_slip=on_slip)
+
+
+def render_slip(slip):
+    """One slip as PDF bytes."""
+    buffer = io.BytesIO()
+    _doc(buffer).build(slip_flowables(slip))
+    return buffer.getvalue()
+
+
+def render_merged(slips, on_slip=None):
+    """All slips in one PDF, each starting on a new page; `on_slip` fires per finished slip."""
+    def story():
+        for i, slip in enumerate(slips):
+            if i:
+                yield PageBreak()
+            yield from slip_flowables(slip)
+            yield _SlipEnd()
+
+    buffer = io.BytesIO()
+    _doc(buffer, on_slip=on_slip).build(LazyStory(story()))
+    return buffer.getvalue()
+
+
+def render_files(slips):
+    """[(filename, pdf bytes)] for a chunk of slips; the worker-process entry point."""
+    return [(slip['filename'], render_slip(slip)) for slip in slips]
+
+
+def write_zip(fileobj, files):
+    """Write (filename, bytes) pairs into a ZIP archive on `fileobj`."""
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
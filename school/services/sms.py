@@ -0,0 +1,171 @@
+"""
+SMS delivery through the EUJIM/Advanta gateway.
+
+One pooled requests.Session per process is shared by every sender, so a
+batch reuses a handful of kept-alive TLS connections instead of opening
+one per message. send_batch() fans a batch out over a bounded thread pool
+behind a token-bucket rate limit. Transient failures (network errors,
+HTTP 429/5xx) are retried in whole rounds with exponential backoff. The
+coordinator sleeps between rounds, so no worker thread is parked on a
+retry. Gateway rejections (bad number, no credit) are final and come back
+with the gateway's description.
+
+    results = send_batch([(notif.pk, phone, text), ...])
+    ok, error = results[notif.pk]
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+DEFAULT_SMS_URL = 'https://quicksms.advantasms.com/api/services/sendsms/'
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+MAX_ATTEMPTS = 3
+BACKOFF_SECONDS = 1
+
+
+def phone_ke(phone):
+    """Normalise a Kenyan phone number to 254XXXXXXXXX."""
+    p = str(phone).strip().replace(' ', '').replace('-', '')
+    if p.startswith('0'):
+        return '254' + p[1:]
+    if p.startswith('+254'):
+        return p[1:]
+    if not p.startswith('254'):
+        return '254' + p
+    return p
+
+
+class RateLimiter:
+    """Token bucket shared by all threads: at most `rate` calls per second, bursts up to `rate`."""
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = self.rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SmsGateway:
+    """Pooled, rate-limited client for the SMS gateway; safe to share between threads."""
+
+    def __init__(self, url=None, concurrency=None, rate=None):
+        self.url = url or getattr(settings, 'SMS_API_URL', '') or DEFAULT_SMS_URL
+        self.concurrency = concurrency or getattr(settings, 'SMS_CONCURRENCY', 8)
+        self.limiter = RateLimiter(rate if rate is not None else getattr(settings, 'SMS_RATE_PER_SECOND', 10))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @property
+    def configured(self):
+        return all([
+            getattr(settings, 'SMS_API_KEY', ''),
+            getattr(settings, 'SMS_PARTNERID', ''),
+            getattr(settings, 'SMS_SHORTCODE', ''),
+        ])
+
+    def send_once(self, phone, message):
+        """
+        One delivery attempt. Returns (ok, error, retryable); `retryable` is
+        true only for failures worth trying again (network, 429, 5xx).
+        """
+        payload = {
+            'apikey': settings.SMS_API_KEY,
+            'partnerID': settings.SMS_PARTNERID,
+            'shortcode': settings.SMS_SHORTCODE,
+            'message': message,
+            'mobile': phone_ke(phone),
+        }
+        self.limiter.acquire()
+        try:
+            r = self.session.post(self.url, json=payload, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        except requests.exceptions.RequestException as exc:
+            return False, str(exc)[:500], True
+        if r.status_code == 429 or r.status_code >= 500:
+            return False, f'Gateway HTTP {r.status_code}', True
+        if r.status_code != 200:
+            return False, f'Gateway HTTP {r.status_code}', False
+        try:
+            resp = r.json().get('responses', [{}])[0]
+        except (ValueError, AttributeError, IndexError):
+            return False, 'Unreadable gateway response', True
+        if resp.get('response-code') == 200:
+            return True, '', False
+        return False, str(resp.get('response-description') or f"Gateway code {resp.get('response-code')}")[:500], False
+
+    def send(self, phone, message, attempts=None, backoff=None):
+        """Send one SMS with retries; returns (ok, error)."""
+        return self.send_batch([(None, phone, message)], attempts, backoff)[None]
+
+    def send_batch(self, messages, attempts=None, backoff=None):
+        """
+        Deliver `messages`, an iterable of (key, phone, text), concurrently.
+        Returns {key: (ok, error)}.
+        """
+        attempts = attempts or MAX_ATTEMPTS
+        backoff = BACKOFF_SECONDS if backoff is None else backoff
+        messages = list(messages)
+        if not self.configured:
+            return {key: (False, 'SMS credentials not configured') for key, _, _ in messages}
+
+        results = {}
+        pending = messages
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, max(len(messages), 1))) as pool:
+            for attempt in range(attempts):
+                if attempt:
+                    time.sleep(backoff * 2 ** (attempt - 1))
+                outcomes = pool.map(lambda m: self.send_once(m[1], m[2]), pending)
+                retry = []
+                for message, (ok, error, retryable) in zip(pending, outcomes):
+                    results[message[0]] = (ok, error)
+                    if retryable:
+                        retry.append(message)
+                pending = retry
+                if not pending:
+                    break
+        return results
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def gateway():
+    """The process-wide SmsGateway (and its connection pool)."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = SmsGateway()
+        return _gateway
+
+
+def send_sms(phone, message, attempts=None):
+    """Send one SMS through the shared gateway; returns (ok, error)."""
+    if not phone:
+        return False, 'No phone number'
+    return gateway().send(phone, message, attempts=attempts)
+
+
+def send_batch(messages, attempts=None):
+    """Send (key, phone, text) messages through the shared gateway; returns {key: (ok, error)}."""
+    return gateway().send_batch(messages, attempts=attempts)
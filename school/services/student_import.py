@@ -0,0 +1,291 @@
+"""
+Staged student import for the "students" category of universal_excel_upload.
+
+The sheet goes through four stages instead of a savepoint per row:
+
+1. normalise  – every column is cleaned column-wise (admission numbers,
+                names, dates, subject lists, pathway keys);
+2. resolve    – grades, streams, pathways and subjects are looked up in dicts
+                built from one query each;
+3. diff       – existing users, students and parents are fetched with a few
+                IN queries, and rows that would collide with another account
+                are rejected with a per-row error before anything is written;
+4. write      – users, students, subject enrollments, parents and parent
+                links go out in chunked bulk_create / bulk_update calls.
+
+New accounts get an unusable password rather than a hashed random one that
+nobody is ever told: hashing dominated the run, and the owner activates the
+account through the forgot-password OTP flow instead.
+
+    import_students(df, school, results)
+
+`results` is the upload's results dict ({"created", "errors", "warnings"}),
+filled with the same row numbers (sheet row = index + 2) as before.
+"""
+import pandas as pd
+from django.db import connection
+from django.utils import timezone
+
+from userauths.models import User
+
+from ..models import Grade, Parent, Pathway, Streams, Student, Subject, SubjectEnrollment
+
+IMPORT_CHUNK_SIZE = 500
+STUDENT_EMAIL = '{}@student.school.local'
+PARENT_EMAIL = '{}@parent.school.local'
+
+
+def _text(df, column):
+    """Column as stripped strings; missing columns and NaN become ''."""
+    if column not in df.columns:
+        return pd.Series('', index=df.index)
+    return df[column].fillna('').astype(str).str.strip().replace({'nan': '', 'NaT': ''})
+
+
+def pathway_key(name):
+    return name.strip().lower().replace('.', '').replace('&', 'and').replace(' ', '')
+
+
+def normalise(df):
+    """Stage 1: one cleaned DataFrame, one row per non-blank admission number."""
+    out = pd.DataFrame(index=df.index)
+    out['row'] = df.index + 2
+    out['admin_no'] = _text(df, 'admin_no').str.replace(r'\.0$', '', regex=True)
+    out['first_name'] = _text(df, 'first_name')
+    out['last_name'] = _text(df, 'last_name')
+    out['gender'] = _text(df, 'gender').str.upper()
+    out['grade'] = _text(df, 'grade')
+    out['stream'] = _text(df, 'stream')
+    out['pathway'] = _text(df, 'pathway').map(pathway_key)
+
+    dob_raw = _text(df, 'date_of_birth')
+    dob = pd.to_datetime(dob_raw.where(dob_raw != ''), errors='coerce', format='mixed')
+    out['date_of_birth'] = dob.dt.date.astype(object).where(dob.notna(), None)
+    out['bad_dob'] = dob.isna() & (dob_raw != '')
+
+    out['subjects'] = _text(df, 'subjects').map(
+        lambda raw: [c.strip().upper() for c in raw.split(',') if c.strip()]
+    )
+    out['parent_phone'] = _text(df, 'parent_phone').str.replace(r'\.0$', '', regex=True)
+    out['parent_email'] = _text(df, 'parent_email')
+    out['parent_first_name'] = _text(df, 'parent_first_name')
+    out['parent_last_name'] = _text(df, 'parent_last_name')
+    return out[out['admin_no'] != '']
+
+
+def _lookups(school):
+    """Stage 2 tables: grades and streams by lower-cased name, pathways and subjects by key."""
+    grades = {}
+    for grade in Grade.objects.filter(school=school).order_by('pk'):
+        grades.setdefault(grade.name.lower(), grade)
+    streams, any_stream = {}, {}
+    for stream in Streams.objects.filter(school=school).order_by('pk'):
+        streams.setdefault((stream.grade_id, stream.name.lower()), stream)
+        any_stream.setdefault(stream.name.lower(), stream)
+    pathways = {}
+    for pathway in Pathway.objects.filter(school=school).order_by('pk'):
+        pathways.setdefault((pathway.grade_id, pathway_key(pathway.name)), pathway)
+    subjects = {}
+    active = list(Subject.objects.filter(school=school, is_active=True).order_by('pk'))
+    for subject in active:
+        if subject.name:
+            subjects.setdefault(subject.name.upper(), subject)
+    for subject in active:  # a code match beats a name match
+        if subject.code:
+            subjects[subject.code.upper()] = subject
+    return grades, streams, any_stream, pathways, subjects
+
+
+def _bulk_create_users(users, chunk_size):
+    User.objects.bulk_create(users, batch_size=chunk_size)
+    if users and users[0].pk is None and not connection.features.can_return_rows_from_bulk_insert:
+        # Backends such as MySQL do not hand primary keys back from bulk_create.
+        pks = dict(User.objects.filter(email__in=[u.email for u in users]).values_list('email', 'pk'))
+        for user in users:
+            user.pk = pks[user.email]
+
+
+def _new_user(email, phone, first_name, last_name, **flags):
+    user = User(email=email, phone_number=phone, first_name=first_name, last_name=last_name, **flags)
+    user.set_unusable_password()  # activated through the forgot-password OTP flow
+    return user
+
+
+def import_students(df, school, results, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import the students sheet `df` into `school`; see the module docstring."""
+    rows = normalise(df)
+    grades, streams, any_stream, pathways, subjects = _lookups(school)
+    errors = {}
+
+    def fail(row, message):
+        errors.setdefault(row, message)
+
+    # ── Stage 2: resolve ────────────────────────────────────────────────────
+    plans = []
+    for r in rows.itertuples(index=False):
+        grade = grades.get(r.grade.lower())
+        if grade is None:
+            fail(r.row, f"Grade '{r.grade}' not found for this school")
+            continue
+        stream = streams.get((grade.id, r.stream.lower())) or any_stream.get(r.stream.lower())
+        if stream is None:
+            fail(r.row, f"Stream '{r.stream}' not found in {r.grade}")
+            continue
+        if r.bad_dob:
+            fail(r.row, "Invalid date_of_birth")
+            continue
+        subject_ids = []
+        for code in r.subjects:
+            subject = subjects.get(code)
+            if subject is None:
+                results["warnings"].append({
+                    "row": r.row,
+                    "message": (
+                        f"Subject '{code}' not found in school's activated subjects. "
+                        f"Go to Subjects → 'From Catalog' to activate it first."
+                    ),
+                })
+            else:
+                subject_ids.append(subject.id)
+        plans.append((r, grade, stream, pathways.get((grade.id, r.pathway)) if r.pathway else None, subject_ids))
+
+    # ── Stage 3: diff against existing accounts ─────────────────────────────
+    student_emails = {STUDENT_EMAIL.format(r.admin_no) for r, *_ in plans}
+    parent_phones = {r.parent_phone for r, *_ in plans if r.parent_phone}
+    parent_emails = {r.parent_email or PARENT_EMAIL.format(r.parent_phone) for r, *_ in plans if r.parent_phone}
+    users = {u.email: u for u in User.objects.filter(email__in=student_emails | parent_emails)}
+    phones_taken = dict(
+        User.objects.filter(phone_number__in={r.admin_no for r, *_ in plans} | parent_phones)
+        .values_list('phone_number', 'email')
+    )
+    students = {
+        s.student_id: s
+        for s in Student.objects.filter(student_id__in=[r.admin_no for r, *_ in plans]).select_related('user')
+    }
+    student_of_user = dict(
+        Student.objects.filter(user__email__in=student_emails).values_list('user__email', 'student_id')
+    )
+    parents = {p.phone: p for p in Parent.objects.filter(phone__in=parent_phones)}
+    parent_ids_taken = set(Parent.objects.filter(parent_id__in=parent_phones).values_list('parent_id', flat=True))
+    parent_of_user = dict(
+        Parent.objects.filter(user__email__in=parent_emails).values_list('user__email', 'phone')
+    )
+
+    new_users = {}
+
+    def phone_owner(email, phone):
+        """The other account already using `phone`, if any."""
+        if email in users or email in new_users:
+            return None
+        owner = phones_taken.get(phone)
+        return owner if owner is not None and owner != email else None
+
+    def claim_user(email, phone, first_name, last_name, **flags):
+        """The existing or to-be-created user for `email`."""
+        user = users.get(email) or new_users.get(email)
+        if user is None:
+            phones_taken[phone] = email
+            user = new_users[email] = _new_user(email, phone, first_name, last_name, **flags)
+        return user
+
+    accepted = []
+    for r, grade, stream, pathway, subject_ids in plans:
+        email = STUDENT_EMAIL.format(r.admin_no)
+        existing = students.get(r.admin_no)
+        if existing is not None and (existing.school_id != school.id or existing.user.email != email):
+            fail(r.row, f"Admission number '{r.admin_no}' already belongs to another student")
+            continue
+        if student_of_user.get(email, r.admin_no) != r.admin_no:
+            fail(r.row, f"User {email} is already linked to another student")
+            continue
+        if phone_owner(email, r.admin_no):
+            fail(r.row, f"Phone number '{r.admin_no}' already belongs to another account")
+            continue
+
+        # A parent already on file is reused as is; otherwise its account is created.
+        parent_email = None
+        if r.parent_phone and r.parent_phone not in parents:
+            parent_email = r.parent_email or PARENT_EMAIL.format(r.parent_phone)
+            linked = parent_of_user.get(parent_email)
+            if linked is not None:
+                fail(r.row, f"Parent account {parent_email} is already linked to phone '{linked}'")
+                continue
+            if r.parent_phone in parent_ids_taken:
+                fail(r.row, f"Parent id '{r.parent_phone}' is already in use")
+                continue
+            if phone_owner(parent_email, r.parent_phone):
+                fail(r.row, f"Parent phone '{r.parent_phone}' already belongs to another account")
+                continue
+
+        user = claim_user(email, r.admin_no, r.first_name, r.last_name, is_student=True)
+        parent_user = None
+        if parent_email is not None:
+            parent_user = claim_user(
+                parent_email, r.parent_phone, r.parent_first_name, r.parent_last_name, is_parent=True,
+            )
+        accepted.append((r, user, parent_user, grade, stream, pathway, subject_ids))
+
+    # ── Stage 4: write ──────────────────────────────────────────────────────
+    _bulk_create_users(list(new_users.values()), chunk_size)
+
+    today = timezone.now().date()
+    to_create, to_update = {}, {}
+    for r, user, _, grade, stream, pathway, _ in accepted:
+        student = students.get(r.admin_no) or to_create.get(r.admin_no) or Student(
+            user=user, student_id=r.admin_no, school=school,
+        )
+        student.date_of_birth = r.date_of_birth
+        student.gender = r.gender
+        student.enrollment_date = today
+        student.grade_level = grade
+        student.stream = stream
+        student.pathway = pathway
+        student.updated_at = timezone.now()
+        (to_update if student.pk else to_create)[r.admin_no] = student
+    Student.objects.bulk_create(list(to_create.values()), batch_size=chunk_size)
+    if to_create and not connection.features.can_return_rows_from_bulk_insert:
+        pks = dict(Student.objects.filter(student_id__in=list(to_create)).values_list('student_id', 'pk'))
+        for student in to_create.values():
+            student.pk = pks[student.student_id]
+    Student.objects.bulk_update(
+        list(to_update.values()),
+        ['date_of_birth', 'gender', 'enrollment_date', 'grade_level', 'stream', 'pathway', 'updated_at'],
+        batch_size=chunk_size,
+    )
+    by_admin_no = {**to_update, **to_create}
+
+    SubjectEnrollment.objects.bulk_create(
+        [
+            SubjectEnrollment(student=by_admin_no[r.admin_no], subject_id=subject_id)
+            for r, _, _, _, _, _, subject_ids in accepted
+            for subject_id in subject_ids
+        ],
+        batch_size=chunk_size, ignore_conflicts=True,
+    )
+
+    new_parents = {}
+    for r, _, parent_user, *_ in accepted:
+        if parent_user is not None and r.parent_phone not in new_parents:
+            new_parents[r.parent_phone] = Parent(
+                user=parent_user, parent_id=r.parent_phone, phone=r.parent_phone, school=school,
+            )
+    Parent.objects.bulk_create(list(new_parents.values()), batch_size=chunk_size)
+    if new_parents and not connection.features.can_return_rows_from_bulk_insert:
+        pks = dict(Parent.objects.filter(phone__in=list(new_parents)).values_list('phone', 'pk'))
+        for parent in new_parents.values():
+            parent.pk = pks[parent.phone]
+    parents.update(new_parents)
+
+    links = {
+        (by_admin_no[r.admin_no].pk, parents[r.parent_phone].pk)
+        for r, *_ in accepted if r.parent_phone
+    }
+    Student.parents.through.objects.bulk_create(
+        [Student.parents.through(student_id=s, parent_id=p) for s, p in links],
+        batch_size=chunk_size, ignore_conflicts=True,
+    )
+
+    results["created"] += len(accepted)
+    results["errors"].extend(
+        {"row": row, "error": message} for row, message in sorted(errors.items())
+    )
@@ -0,0 +1,319 @@
+"""
+Per-student statistics for the mobile app's student and parent stats
+endpoints.
+
+Each block is one conditional aggregate over its table, grouped by student,
+instead of a count() per figure and per child:
+
+- attendance  – row, present, absent and recent-absence counts plus the last
+                absence date over the term's Attendance rows;
+- assignments – assignments of the subjects each student takes (total, past
+                due) and their submissions (completed, pending, average
+                score, past-due ones handed in), giving the overdue count;
+- discipline  – record counts per severity and the last incident date;
+- grades      – submission averages grouped by (student, subject) in SQL,
+                one entry per subject the student takes, with the subject's
+                first teacher from one query over the teachers' subject links;
+- performance – stream position from the exam ranking engine for the
+                grade's latest published exam session.
+
+Every student is measured over their own school's active term (else its
+latest term, else the last 90 days).
+
+    stats = student_stats(student)          # dict in the API's camelCase shape
+    by_pk = stats_for_students(children)    # {student pk: the same dict}
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db.models import Avg, Count, Exists, F, Max, OuterRef, Q
+from django.utils import timezone
+
+from ..models import (
+    Attendance, DisciplineRecord, ExamSession, StaffProfile, Student, SubjectEnrollment, Submission, Term,
+)
+from .exam_ranking import session_totals, student_positions
+
+ABSENT = ('UA', 'EA')
+RECENT_ABSENCE_DAYS = 30
+
+
+def grade_letter(score):
+    if score >= 90:
+        return 'A'
+    elif score >= 80:
+        return 'B+'
+    elif score >= 70:
+        return 'B'
+    elif score >= 60:
+        return 'C'
+    return 'F'
+
+
+def stats_windows(school_ids, today):
+    """{school_id: (start, end)}: the active term, else the latest term, else the last 90 days."""
+    windows = {}
+    for school_id, start, end in Term.objects.filter(school_id__in=school_ids).order_by(
+        'school_id', '-is_active', '-start_date',
+    ).values_list('school_id', 'start_date', 'end_date'):
+        windows.setdefault(school_id, (start, end))
+    for school_id in school_ids:
+        windows.setdefault(school_id, (today - timedelta(days=90), today))
+    return windows
+
+
+def _within(windows, school_path, field, due=False):
+    """Rows whose `field` falls in their school's window (from its start only, for due dates)."""
+    q = Q()
+    for school_id, (start, end) in windows.items():
+        if due:
+            bounds = {f'{field}__gte': timezone.make_aware(datetime.combine(start, time.min))}
+        else:
+            bounds = {f'{field}__range': [start, end]}
+        q |= Q(**{school_path: school_id}, **bounds)
+    return q
+
+
+def grouped_by_student(qs, student_path, **aggregates):
+    """{student_id: {aggregate: value}} from one GROUP BY query."""
+    return {
+        row.pop('sid'): row
+        for row in qs.order_by().values(sid=F(student_path)).annotate(**aggregates)
+    }
+
+
+def _taken(student_path):
+    """The submission's subject is one the student takes."""
+    return Exists(SubjectEnrollment.objects.filter(
+        student=OuterRef(student_path), subject=OuterRef('assignment__subject'), is_active=True,
+    ))
+
+
+def attendance_stats(ids, windows, today):
+    absent = Q(status__in=ABSENT)
+    rows = grouped_by_student(
+        Attendance.objects.filter(enrollment__student_id__in=ids).filter(
+            _within(windows, 'enrollment__student__school_id', 'date'),
+        ),
+        'enrollment__student_id',
+        total=Count('id'),
+        present=Count('id', filter=Q(status='P')),
+        absent=Count('id', filter=absent),
+        recent=Count('id', filter=absent & Q(date__gte=today - timedelta(days=RECENT_ABSENCE_DAYS))),
+        last_absence=Max('date', filter=absent),
+    )
+    stats = {}
+    for pk in ids:
+        agg = rows.get(pk, {})
+        total, present = agg.get('total', 0), agg.get('present', 0)
+        stats[pk] = {
+            'totalDays': total,
+            'presentDays': present,
+            'absentDays': agg.get('absent', 0),
+            'attendanceRate': round((present / total * 100) if total else 0, 1),
+            'recentAbsences': agg.get('recent', 0),
+            'lastAbsenceDate': agg['last_absence'].isoformat() if agg.get('last_absence') else None,
+        }
+    return stats
+
+
+def assignment_stats(ids, windows, now):
+    assigned = grouped_by_student(
+        SubjectEnrollment.objects.filter(student_id__in=ids, is_active=True).filter(
+            _within(windows, 'student__school_id', 'subject__assignments__due_date', due=True),
+        ),
+        'student_id',
+        total=Count('subject__assignments', distinct=True),
+        past_due=Count('subject__assignments', distinct=True, filter=Q(subject__assignments__due_date__lt=now)),
+    )
+    submitted = grouped_by_student(
+        Submission.objects.filter(enrollment__student_id__in=ids).filter(
+            _within(windows, 'enrollment__student__school_id', 'assignment__due_date', due=True),
+        ),
+        'enrollment__student_id',
+        completed=Count('id', filter=Q(score__isnull=False)),
+        pending=Count('id', filter=Q(score__isnull=True)),
+        average=Avg('score'),
+        handed_in=Count(
+            'assignment', distinct=True,
+            filter=Q(assignment__due_date__lt=now) & Q(_taken('enrollment__student')),
+        ),
+    )
+    stats = {}
+    for pk in ids:
+        totals, subs = assigned.get(pk, {}), submitted.get(pk, {})
+        total, completed = totals.get('total', 0), subs.get('completed', 0)
+        stats[pk] = {
+            'total': total,
+            'completed': completed,
+            'pending': subs.get('pending', 0),
+            'overdue': max(totals.get('past_due', 0) - subs.get('handed_in', 0), 0),
+            'completionRate': round((completed / total * 100) if total else 0, 1),
+            'averageScore': round(subs.get('average') or 0, 1),
+        }
+    return stats
+
+
+def discipline_stats(ids, windows):
+    rows = grouped_by_student(
+        DisciplineRecord.objects.filter(student_id__in=ids).filter(_within(windows, 'student__school_id', 'date')),
+        'student_id',
+        total=Count('id'),
+        low=Count('id', filter=Q(severity='minor')),
+        medium=Count('id', filter=Q(severity='moderate')),
+        high=Count('id', filter=Q(severity='major')),
+        last=Max('date'),
+    )
+    stats = {}
+    for pk in ids:
+        agg = rows.get(pk, {})
+        stats[pk] = {
+            'totalRecords': agg.get('total', 0),
+            'lowSeverity': agg.get('low', 0),
+            'mediumSeverity': agg.get('medium', 0),
+            'highSeverity': agg.get('high', 0),
+            'lastIncidentDate': agg['last'].isoformat() if agg.get('last') else None,
+        }
+    return stats
+
+
+def grade_stats(ids, windows):
+    subjects = defaultdict(dict)
+    for student_id, subject_id, name in SubjectEnrollment.objects.filter(
+        student_id__in=ids, is_active=True,
+    ).order_by('subject__name', 'subject_id').values_list('student_id', 'subject_id', 'subject__name'):
+        subjects[student_id].setdefault(subject_id, name)
+
+    averages = {
+        (row['sid'], row['assignment__subject_id']): row
+        for row in Submission.objects.filter(enrollment__student_id__in=ids).filter(
+            _within(windows, 'enrollment__student__school_id', 'assignment__due_date', due=True),
+        ).order_by().values('assignment__subject_id', sid=F('enrollment__student_id')).annotate(
+            average=Avg('score'), graded=Count('id', filter=Q(score__isnull=False)),
+        )
+    }
+    teachers = {}
+    for subject_id, first, last in StaffProfile.subjects.through.objects.filter(
+        subject_id__in={subject_id for taken in subjects.values() for subject_id in taken},
+    ).order_by('staffprofile_id').values_list(
+        'subject_id', 'staffprofile__user__first_name', 'staffprofile__user__last_name',
+    ):
+        teachers.setdefault(subject_id, f"{first} {last}".strip())
+
+    stats = {}
+    for pk in ids:
+        entries, graded = [], []
+        for subject_id, name in subjects[pk].items():
+            row = averages.get((pk, subject_id), {})
+            average = row.get('average') or 0
+            has_grades = bool(row.get('graded'))
+            entries.append({
+                'subject': name,
+                'grade': round(average, 1),
+                'gradeLetter': grade_letter(average) if has_grades else 'Pending',
+                'teacher': teachers.get(subject_id, 'TBD'),
+                'status': 'graded' if has_grades else 'pending',
+            })
+            if has_grades:
+                graded.append(average)
+        average = round(sum(graded) / len(graded) if graded else 0, 1)
+        stats[pk] = {'average': average, 'gpa': round(average / 25, 1), 'subjects': entries}
+    return stats
+
+
+def _class_sizes(students):
+    """{student pk: active students in their stream (or grade, without a stream)}."""
+    active = Student.objects.filter(school_id__in={s.school_id for s in students}, is_active=True).order_by()
+    by_stream = dict(
+        active.filter(stream_id__in={s.stream_id for s in students if s.stream_id})
+        .values('stream_id').annotate(n=Count('id')).values_list('stream_id', 'n')
+    )
+    by_grade = {}
+    if any(not s.stream_id for s in students):
+        by_grade = dict(
+            active.filter(grade_level_id__in={s.grade_level_id for s in students if not s.stream_id})
+            .values('grade_level_id').annotate(n=Count('id')).values_list('grade_level_id', 'n')
+        )
+    return {
+        s.pk: by_stream.get(s.stream_id, 0) if s.stream_id else by_grade.get(s.grade_level_id, 0)
+        for s in students
+    }
+
+
+def performance_stats(students, attendance):
+    """
+    Position in the stream (or grade, without a stream) in the grade's
+    latest published exam session; rank 0 while the student is unranked.
+    """
+    sessions = {}
+    for session in ExamSession.objects.filter(
+        school_id__in={s.school_id for s in students},
+        grade_id__in={s.grade_level_id for s in students}, is_published=True,
+    ):
+        sessions.setdefault((session.school_id, session.grade_id), session)
+
+    totals, ranks = {}, {}
+    for student in students:
+        rank = total = 0
+        session = sessions.get((student.school_id, student.grade_level_id))
+        if session is not None:
+            if session.pk not in totals:
+                totals[session.pk] = session_totals(session)
+            positions = student_positions(session, student, totals=totals[session.pk])
+            scope = 'stream' if student.stream_id else 'grade'
+            total = positions[f'{scope}_total']
+            if isinstance(positions[f'{scope}_pos'], int):
+                rank = positions[f'{scope}_pos']
+        ranks[student.pk] = (rank, total)
+
+    unranked = [s for s in students if not ranks[s.pk][1]]
+    sizes = _class_sizes(unranked) if unranked else {}
+
+    stats = {}
+    for student in students:
+        rank, total = ranks[student.pk]
+        total = total or sizes.get(student.pk, 0)
+        stats[student.pk] = {
+            'trend': 'improving' if attendance[student.pk]['attendanceRate'] > 80 else 'needs improvement',
+            'rankInClass': rank,
+            'totalStudentsInClass': total,
+            'percentile': round((total - rank + 1) / total * 100) if rank and total else 0,
+        }
+    return stats
+
+
+def stats_for_students(students, today=None):
+    """{student pk: stats dict} for `students` (with user, grade_level and stream loaded)."""
+    students = list(students)
+    if not students:
+        return {}
+    ids = [s.pk for s in students]
+    now = timezone.now()
+    today = today or timezone.localdate()
+    windows = stats_windows({s.school_id for s in students}, today)
+
+    attendance = attendance_stats(ids, windows, today)
+    assignments = assignment_stats(ids, windows, now)
+    discipline = discipline_stats(ids, windows)
+    grades = grade_stats(ids, windows)
+    performance = performance_stats(students, attendance)
+    return {
+        student.pk: {
+            'studentId': student.student_id,
+            'studentName': student.user.get_full_name(),
+            'className': (
+                f"{student.grade_level.name} {student.stream.name}" if student.stream else student.grade_level.name
+            ),
+            'attendance': attendance[student.pk],
+            'assignments': assignments[student.pk],
+            'discipline': discipline[student.pk],
+            'grades': grades[student.pk],
+            'performance': performance[student.pk],
+        }
+        for student in students
+    }
+
+
+def student_stats(student, today=None):
+    """Every stats block for one `student`; see the module docstring."""
+    return stats_for_students([student], today)[student.pk]
@@ -0,0 +1,369 @@
+"""
+Whole-school timetable solver.
+
+Builds an in-memory occupancy model for a term (one bitset per teacher/day and
+per stream/day, bit ``i`` = time slot ``i``), places every required weekly
+session with bounded backtracking plus soft-constraint scoring, and only
+touches the database once the plan is complete.
+
+    plan = solve_term(school, term, timetables, overwrite=True)
+    plan.conflicts          # what could not be placed
+    apply_plan(plan)        # single bulk insert of the weekly lesson patterns
+"""
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import connection, transaction
+
+from ..models import Lesson, LessonPattern, Subject, StaffProfile
+from .enrollments import bulk_enroll_patterns, stream_enrollment_pairs, students_by_stream
+from .timetable_generator import (
+    WEEKDAYS, PRIORITY_SUBJECTS, MAX_SUBJECTS_PER_DAY, MAX_TEACHER_PER_DAY,
+    MAX_CONSECUTIVE, get_school_time_slots,
+)
+
+MAX_BACKTRACKS = 5000
+BACKTRACK_WINDOW = 25
+BULK_BATCH_SIZE = 500
+
+
+@dataclass
+class Demand:
+    """One weekly session of `subject_id` that still has to be placed for a stream."""
+    stream_id: int
+    subject_id: int
+    teacher_ids: list
+    priority: int
+    session_no: int
+
+
+@dataclass
+class Placement:
+    stream_id: int
+    subject_id: int
+    teacher_id: int
+    day: int
+    slot: int
+
+
+@dataclass
+class TimetablePlan:
+    school: object
+    term: object
+    timetables: list
+    time_slots: list
+    overwrite: bool
+    placements: list = field(default_factory=list)
+    conflicts: list = field(default_factory=list)
+    subject_names: dict = field(default_factory=dict)
+    backtracks: int = 0
+    elapsed: float = 0.0
+
+    def grid(self, stream_id):
+        """Return {(day, slot): Placement} for one stream."""
+        return {
+            (p.day, p.slot): p
+            for p in self.placements if p.stream_id == stream_id
+        }
+
+
+class OccupancyModel:
+    """Bitset occupancy for teachers and streams across the school week."""
+
+    def __init__(self, n_slots):
+        self.n_slots = n_slots
+        self.teacher = defaultdict(lambda: [0] * len(WEEKDAYS))
+        self.stream = defaultdict(lambda: [0] * len(WEEKDAYS))
+        # (stream_id, subject_id) -> per-day session counts
+        self.subject_day = defaultdict(lambda: [0] * len(WEEKDAYS))
+        # (stream_id, subject_id) -> teacher_ids already teaching it
+        self.continuity = defaultdict(set)
+
+    def occupy(self, stream_id, subject_id, teacher_id, day, slot):
+        bit = 1 << slot
+        if stream_id is not None:
+            self.stream[stream_id][day] |= bit
+            self.subject_day[(stream_id, subject_id)][day] += 1
+        if teacher_id is not None:
+            self.teacher[teacher_id][day] |= bit
+
+    def release(self, stream_id, subject_id, teacher_id, day, slot):
+        bit = ~(1 << slot)
+        self.stream[stream_id][day] &= bit
+        self.subject_day[(stream_id, subject_id)][day] -= 1
+        self.teacher[teacher_id][day] &= bit
+
+    def is_free(self, stream_id, subject_id, teacher_id, day, slot):
+        bit = 1 << slot
+        if self.stream[stream_id][day] & bit:
+            return False
+        if self.subject_day[(stream_id, subject_id)][day] >= MAX_SUBJECTS_PER_DAY:
+            return False
+        teacher_mask = self.teacher[teacher_id][day]
+        if teacher_mask & bit:
+            return False
+        if teacher_mask.bit_count() >= MAX_TEACHER_PER_DAY:
+            return False
+        return not _has_run(teacher_mask | bit, MAX_CONSECUTIVE + 1)
+
+
+def _has_run(mask, length):
+    """True when `mask` contains `length` consecutive set bits."""
+    run = mask
+    for shift in range(1, length):
+        run &= mask >> shift
+    return run != 0
+
+
+# ---------------- MODEL BUILDING ---------------- #
+def _load_existing(model, school, term, timetables, slot_index, overwrite):
+    """
+    Seed the model with the term's lesson patterns and any pattern-less dated
+    lessons (one-offs and timetables written before patterns existed).
+
+    Returns {stream_id: {subject_id: sessions already in the weekly pattern}}.
+    Lessons of timetables being overwritten are ignored; they are deleted on apply.
+    """
+    target_ids = {tt.id for tt in timetables}
+    existing_weekly = defaultdict(lambda: defaultdict(int))
+
+    columns = ('timetable_id', 'stream_id', 'subject_id', 'teacher_id', 'day_of_week', 'time_slot_id')
+    rows = set(LessonPattern.objects.filter(
+        school=school, term=term, is_active=True,
+    ).values_list(*columns))
+    rows.update(Lesson.objects.filter(
+        timetable__school=school,
+        pattern__isnull=True,
+        lesson_date__range=(term.start_date, term.end_date),
+        is_canceled=False,
+    ).values_list(*columns).order_by().distinct())
+
+    for tt_id, stream_id, subject_id, teacher_id, day_name, slot_id in rows:
+        if overwrite and tt_id in target_ids:
+            continue
+        if day_name not in WEEKDAYS or slot_id not in slot_index:
+            continue
+        day = WEEKDAYS.index(day_name)
+        slot = slot_index[slot_id]
+        # Other streams' lessons only constrain teachers, a target's own
+        # lessons also fill its grid and count toward its weekly targets.
+        if tt_id in target_ids:
+            if not (model.stream[stream_id][day] >> slot) & 1:
+                existing_weekly[stream_id][subject_id] += 1
+                model.continuity[(stream_id, subject_id)].add(teacher_id)
+            model.occupy(stream_id, subject_id, teacher_id, day, slot)
+        else:
+            model.occupy(None, subject_id, teacher_id, day, slot)
+    return existing_weekly
+
+
+def _build_demands(plan, existing_weekly):
+    grade_ids = {tt.grade_id for tt in plan.timetables}
+    subjects_by_grade = defaultdict(list)
+    sessions = {}
+    for subject_id, name, per_week in Subject.objects.filter(
+        grade__in=grade_ids, school=plan.school
+    ).values_list('id', 'name', 'sessions_per_week').distinct():
+        plan.subject_names[subject_id] = name
+        sessions[subject_id] = per_week
+    for grade_id, subject_id in Subject.grade.through.objects.filter(
+        grade_id__in=grade_ids, subject_id__in=plan.subject_names
+    ).values_list('grade_id', 'subject_id'):
+        subjects_by_grade[grade_id].append(subject_id)
+
+    teachers_by_subject = defaultdict(list)
+    for subject_id, staff_id in StaffProfile.subjects.through.objects.filter(
+        staffprofile__school=plan.school, subject_id__in=plan.subject_names
+    ).order_by('staffprofile_id').values_list('subject_id', 'staffprofile_id'):
+        teachers_by_subject[subject_id].append(staff_id)
+
+    priority_order = {n: i for i, n in enumerate(PRIORITY_SUBJECTS)}
+    demands = []
+    for tt in plan.timetables:
+        subject_ids = subjects_by_grade.get(tt.grade_id, [])
+        if not subject_ids:
+            plan.conflicts.append({"type": "NO_SUBJECTS", "stream": str(tt.stream)})
+            continue
+        for subject_id in subject_ids:
+            name = plan.subject_names[subject_id]
+            teachers = teachers_by_subject.get(subject_id, [])
+            if not teachers:
+                plan.conflicts.append({"type": "NO_TEACHER", "subject": name, "stream": str(tt.stream)})
+                continue
+            needed = sessions[subject_id] - existing_weekly[tt.stream_id].get(subject_id, 0)
+            for n in range(needed):
+                demands.append(Demand(
+                    stream_id=tt.stream_id, subject_id=subject_id,
+                    teacher_ids=teachers, priority=priority_order.get(name, 99), session_no=n,
+                ))
+
+    # Scarcest teachers first, priority subjects next, then round-robin across
+    # streams so no single stream exhausts a shared teacher.
+    demands.sort(key=lambda d: (len(d.teacher_ids), d.priority, d.session_no, d.stream_id))
+    return demands
+
+
+# ---------------- SEARCH ---------------- #
+def _candidates(model, demand, n_slots):
+    """Feasible (score, day, slot, teacher) tuples for `demand`, best first."""
+    key = (demand.stream_id, demand.subject_id)
+    per_day = model.subject_day[key]
+    continuity = model.continuity[key]
+    out = []
+    for day in range(len(WEEKDAYS)):
+        for slot in range(n_slots):
+            if (model.stream[demand.stream_id][day] >> slot) & 1:
+                continue
+            for tid in demand.teacher_ids:
+                if not model.is_free(demand.stream_id, demand.subject_id, tid, day, slot):
+                    continue
+                score = per_day[day] * 10                              # spread across the week
+                score += model.teacher[tid][day].bit_count() * 2       # balance teacher days
+                if demand.priority < 99:
+                    score += slot                                      # core subjects early
+                if continuity and tid not in continuity:
+                    score += 5                                         # keep one teacher per class
+                out.append((score, day, slot, tid))
+    out.sort()
+    return out
+
+
+def _search(model, demands, n_slots, max_backtracks):
+    """
+    Depth-first placement with chronological backtracking.
+
+    When a demand has no feasible slot, earlier placements are revisited, at
+    most BACKTRACK_WINDOW levels back and MAX_BACKTRACKS steps overall. If that
+    fails, the earlier placements are restored, the demand is recorded as
+    unplaced and the search never unwinds past it again.
+    """
+    stack = []          # [(candidates, position, placement or None)]
+    unplaced = []
+    backtracks = 0
+    floor = 0
+    failed = None       # (index, stack snapshot) of the demand that started an unwind
+    i = 0
+    while i < len(demands):
+        demand = demands[i]
+        if len(stack) == i:
+            candidates, pos = _candidates(model, demand, n_slots), 0
+        else:
+            candidates, pos, previous = stack.pop()
+            model.release(previous.stream_id, previous.subject_id, previous.teacher_id, previous.day, previous.slot)
+            pos += 1
+
+        if pos < len(candidates):
+            _, day, slot, tid = candidates[pos]
+            model.occupy(demand.stream_id, demand.subject_id, tid, day, slot)
+            stack.append((candidates, pos, Placement(
+                demand.stream_id, demand.subject_id, tid, day, slot,
+            )))
+            i += 1
+            if failed and i > failed[0]:
+                failed = None
+            continue
+
+        if failed is None:
+            failed = (i, list(stack))
+        lowest = max(floor, failed[0] - BACKTRACK_WINDOW)
+        if i > lowest and backtracks < max_backtracks:
+            backtracks += 1
+            i -= 1
+            continue
+
+        index, snapshot = failed
+        for _, _, p in stack[lowest:]:
+            model.release(p.stream_id, p.subject_id, p.teacher_id, p.day, p.slot)
+        for _, _, p in snapshot[lowest:]:
+            model.occupy(p.stream_id, p.subject_id, p.teacher_id, p.day, p.slot)
+        stack = snapshot + [([], 0, None)]
+        unplaced.append(demands[index])
+        floor = i = index + 1
+        failed = None
+
+    placements = [entry[2] for entry in stack if entry[2] is not None]
+    return placements, unplaced, backtracks
+
+
+def solve_term(school, term, timetables, overwrite=False, max_backtracks=MAX_BACKTRACKS):
+    """Plan the weekly pattern for every timetable in `timetables` in one pass. No writes."""
+    started = time.monotonic()
+    time_slots = get_school_time_slots(school)
+    if not time_slots:
+        raise ValueError("No time slots defined")
+
+    plan = TimetablePlan(
+        school=school, term=term, timetables=list(timetables),
+        time_slots=time_slots, overwrite=overwrite,
+    )
+    slot_index = {ts.id: i for i, ts in enumerate(time_slots)}
+    model = OccupancyModel(len(time_slots))
+    existing_weekly = _load_existing(model, school, term, plan.timetables, slot_index, overwrite)
+    demands = _build_demands(plan, existing_weekly)
+
+    placements, unplaced, plan.backtracks = _search(model, demands, len(time_slots), max_backtracks)
+    plan.placements = placements
+
+    streams = {tt.stream_id: str(tt.stream) for tt in plan.timetables}
+    missing = defaultdict(int)
+    for d in unplaced:
+        missing[(d.stream_id, d.subject_id)] += 1
+    for (stream_id, subject_id), count in missing.items():
+        plan.conflicts.append({
+            "type": "WEEKLY_TARGET_NOT_MET",
+            "subject": plan.subject_names[subject_id],
+            "stream": streams[stream_id],
+            "missing": count,
+        })
+
+    plan.elapsed = time.monotonic() - started
+    return plan
+
+
+# ---------------- WRITE ---------------- #
+def _enroll_students(plan, patterns):
+    """Enroll every student of each stream into that stream's new lesson patterns."""
+    by_stream = students_by_stream(plan.school, {tt.stream_id for tt in plan.timetables})
+    return bulk_enroll_patterns(plan.school, stream_enrollment_pairs(patterns, by_stream))
+
+
+@transaction.atomic
+def apply_plan(plan):
+    """Write a solved plan: optional delete, one bulk insert of weekly patterns, enrollments."""
+    tt_by_stream = {tt.stream_id: tt for tt in plan.timetables}
+    tt_ids = [tt.id for tt in plan.timetables]
+    if plan.overwrite:
+        LessonPattern.objects.filter(timetable_id__in=tt_ids).delete()
+        Lesson.objects.filter(timetable_id__in=tt_ids).delete()
+
+    patterns = []
+    for p in plan.placements:
+        tt = tt_by_stream[p.stream_id]
+        patterns.append(LessonPattern(
+            school=plan.school,
+            timetable_id=tt.id,
+            term=plan.term,
+            subject_id=p.subject_id,
+            stream_id=p.stream_id,
+            teacher_id=p.teacher_id,
+            day_of_week=WEEKDAYS[p.day],
+            time_slot_id=plan.time_slots[p.slot].id,
+            room=f"{tt.grade.name} {tt.stream.name}",
+        ))
+    LessonPattern.objects.bulk_create(patterns, batch_size=BULK_BATCH_SIZE)
+
+    if patterns and patterns[0].pk is None and not connection.features.can_return_rows_from_bulk_insert:
+        # Backends such as MySQL do not hand primary keys back from bulk_create.
+        keys = {(p.timetable_id, p.subject_id, p.day_of_week, p.time_slot_id) for p in patterns}
+        patterns = [
+            p for p in LessonPattern.objects.filter(timetable_id__in=tt_ids)
+            if (p.timetable_id, p.subject_id, p.day_of_week, p.time_slot_id) in keys
+        ]
+
+    enrollments_created = _enroll_students(plan, patterns)
+    return {
+        "patterns": patterns,
+        "enrollments_created": enrollments_created,
+        "conflicts": plan.conflicts,
+    }
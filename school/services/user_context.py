@@ -0,0 +1,159 @@
+"""
+Per-request user context: role, school and profiles.
+
+Every view and serializer used to work out the user's role and school with
+its own helper, each following `user.staffprofile`, `user.parent`,
+`user.student` or `user.school_admin_profile` and then `.school` — two to
+four queries, repeated by every helper call in the same request.
+
+`user_context(user)` resolves all of it once:
+
+1. the four profiles, with their schools, come from a single select_related
+   query over the reverse one-to-ones (or from a short-lived per-user cache
+   entry), and are put into the user's related-object caches, so plain
+   `user.staffprofile.school` and friends no longer query either;
+2. the role and school are derived from them in Python and the result is
+   memoised on the user object for the rest of the request.
+
+    ctx = user_context(request.user)
+    ctx.role, ctx.school, ctx.staff_profile
+
+SchoolContextMiddleware and the API's JWT authentication attach the same
+context to the request as `request.school_context`.
+
+Freshness: the guarantee is USER_CONTEXT_CACHE_TIMEOUT. A profile or school
+change is seen by every process within that many seconds. Saving or
+deleting a StaffProfile, Parent, Student or administered School row of the
+user also deletes the entry (see school.signals). That only helps the
+process that made the change, because the settings configure no shared
+cache and the default LocMemCache is per process. QuerySet.update() sends
+no signal at all. Other workers can keep serving the old profiles, such as
+a teacher's previous school, until the entry expires. The role is read
+from the User row on each request and is never stale. The entry also
+carries the user's date_joined, so a reused primary key never reads another
+user's entry.
+"""
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+USER_CONTEXT_CACHE_TIMEOUT = 60  # the staleness bound; see the module docstring
+
+# reverse one-to-one accessor on User → select_related paths that load it
+PROFILE_RELATIONS = {
+    'staffprofile': ('staffprofile__school',),
+    'parent': ('parent__school',),
+    'student': ('student__school', 'student__grade_level', 'student__stream'),
+    'school_admin_profile': ('school_admin_profile',),
+}
+
+STAFF_ROLES = ('teacher', 'principal', 'deputy', 'policy_maker', 'staff')
+
+UserContext = namedtuple('UserContext', 'role school staff_profile parent student admin_school')
+
+ANONYMOUS = UserContext('user', None, None, None, None, None)
+
+
+def _cache_key(user_id):
+    return f"user-context:{user_id}"
+
+
+def invalidate(user_id):
+    """Forget the cached profiles of `user_id` (in this process, unless the cache is shared)."""
+    if user_id:
+        cache.delete(_cache_key(user_id))
+
+
+def user_role(user):
+    # Admin roles take priority so a principal who is also a teacher
+    # is correctly identified as principal, not teacher.
+    if user.is_principal:
+        return 'principal'
+    elif user.is_deputy_principal:
+        return 'deputy'
+    elif user.is_policy_maker:
+        return 'policy_maker'
+    elif user.is_admin:
+        return 'admin'
+    elif user.is_teacher:
+        return 'teacher'
+    elif user.is_parent:
+        return 'parent'
+    elif user.is_student:
+        return 'student'
+    elif user.school_staff:
+        return 'staff'
+    return 'user'
+
+
+def _unwrap(user):
+    if isinstance(user, SimpleLazyObject):
+        user.is_authenticated  # noqa: B018 - forces the wrapped user to load
+        return user._wrapped
+    return user
+
+
+def load_profiles(user):
+    """
+    Fill `user`'s reverse one-to-one caches (staffprofile, parent, student,
+    school_admin_profile) from the per-user cache or one query. Returns
+    {accessor: profile or None}.
+    """
+    User = type(user)
+    stamp = user.date_joined.isoformat() if user.date_joined else ''
+    entry = cache.get(_cache_key(user.pk))
+    if entry is None or entry[0] != stamp:
+        paths = [path for paths in PROFILE_RELATIONS.values() for path in paths]
+        loaded = get_user_model().objects.select_related(*paths).filter(pk=user.pk).first()
+        profiles = {name: getattr(loaded, name, None) if loaded else None for name in PROFILE_RELATIONS}
+        cache.set(_cache_key(user.pk), (stamp, profiles), USER_CONTEXT_CACHE_TIMEOUT)
+    else:
+        profiles = entry[1]
+
+    for name, profile in profiles.items():
+        getattr(User, name).related.set_cached_value(user, profile)
+        if profile is not None and name != 'school_admin_profile':
+            type(profile).user.field.set_cached_value(profile, user)
+    return profiles
+
+
+def school_for_role(user, role):
+    """The school `user` works in as `role`, from the already loaded profiles."""
+    staff_profile = getattr(user, 'staffprofile', None)
+    if role in STAFF_ROLES:
+        return staff_profile.school if staff_profile else None
+    if role == 'admin':
+        if staff_profile:
+            return staff_profile.school
+        return getattr(user, 'school_admin_profile', None)
+    if role in ('parent', 'student'):
+        profile = getattr(user, role, None)
+        return profile.school if profile else None
+    return None
+
+
+def user_context(user):
+    """The UserContext of `user`, resolved once per user object."""
+    user = _unwrap(user)
+    if user is None or not user.is_authenticated:
+        return ANONYMOUS
+    context = getattr(user, '_school_context', None)
+    if context is None:
+        profiles = load_profiles(user)
+        role = user_role(user)
+        context = user._school_context = UserContext(
+            role=role,
+            school=school_for_role(user, role),
+            staff_profile=profiles['staffprofile'],
+            parent=profiles['parent'],
+            student=profiles['student'],
+            admin_school=profiles['school_admin_profile'],
+        )
+    return context
+
+
+def lazy_user_context(user):
+    """A lazy `user_context(user)`, resolved on first attribute access."""
+    return SimpleLazyObject(lambda: user_context(user))
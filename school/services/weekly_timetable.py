@@ -0,0 +1,109 @@
+"""
+Weekly timetable grid for the timetable API.
+
+A stream's or teacher's week for a term is read with three queries — the
+term's active LessonPatterns in that scope, the pattern-less Lesson rows
+written before patterns existed, and the school's time slots — and
+grouped in memory into a day × slot grid:
+
+    grid = week_grid(school, term, stream=stream)     # or teacher=staff
+    grid['days']['monday']   # [(slot label, subject name, code, stream name), ...]
+    grid['slots']            # every school slot label, by start time
+
+Slot labels are "HH-MM-HH-MM", as the mobile app expects. Grids are cached
+per (stream or teacher, term) under a stamp of the rows they are built
+from: the latest updated_at and the row count of the patterns, pattern-less
+lessons and time slots in scope. Any edit, insert or delete moves the
+stamp, so every process sees a change on its next read, whatever the cache
+backend, and bulk writers need no hook.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from ..models import Lesson, LessonPattern, TimeSlot
+
+WEEK_CACHE_TIMEOUT = 60 * 60
+WEEK_DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday')
+
+
+def _rows(school, term, scope):
+    """The (patterns, legacy lessons, time slots) querysets a grid is built from."""
+    return (
+        LessonPattern.objects.filter(school=school, term=term, is_active=True, **scope),
+        Lesson.objects.filter(timetable__school=school, timetable__term=term, pattern__isnull=True, **scope),
+        TimeSlot.objects.filter(school=school),
+    )
+
+
+def _stamp(querysets):
+    parts = []
+    for qs in querysets:
+        stamp = qs.aggregate(latest=Max('updated_at'), rows=Count('id'))
+        parts.append(f"{stamp['latest'].isoformat() if stamp['latest'] else '-'}/{stamp['rows']}")
+    return ':'.join(parts)
+
+
+def slot_label(time_slot):
+    if time_slot is None:
+        return ''
+    return f"{time_slot.start_time.strftime('%H-%M')}-{time_slot.end_time.strftime('%H-%M')}"
+
+
+def _entry(lesson):
+    subject, stream = lesson.subject, lesson.stream
+    return (
+        slot_label(lesson.time_slot),
+        subject.name if subject else '',
+        subject.code if subject else '',
+        stream.name if stream else '',
+    )
+
+
+def _compute(rows):
+    patterns, lessons, time_slots = rows
+    days = {day: [] for day in WEEK_DAYS}
+    related = ('subject', 'stream', 'time_slot')
+    for pattern in patterns.select_related(*related):
+        if pattern.day_of_week in days:
+            days[pattern.day_of_week].append(_entry(pattern))
+
+    # Timetables from before weekly patterns are dated Lesson rows, one per
+    # date; each distinct weekly session is listed once.
+    seen = set()
+    for lesson in lessons.filter(is_canceled=False).select_related(*related).order_by('pk'):
+        key = (lesson.day_of_week, lesson.time_slot_id, lesson.subject_id, lesson.stream_id)
+        if lesson.day_of_week in days and key not in seen:
+            seen.add(key)
+            days[lesson.day_of_week].append(_entry(lesson))
+
+    slots = [slot_label(ts) for ts in time_slots.order_by('start_time')]
+    return {'days': days, 'slots': slots}
+
+
+def week_grid(school, term, stream=None, teacher=None):
+    """The cached week of `stream` or `teacher` in `term`; see the module docstring."""
+    scope = {'stream': stream} if stream is not None else {'teacher': teacher}
+    owner = f"stream:{stream.pk}" if stream is not None else f"teacher:{teacher.pk}"
+    rows = _rows(school, term, scope)
+    key = f"timetable-week:{school.pk}:{owner}:{term.pk}:{_stamp(rows)}"
+    grid = cache.get(key)
+    if grid is None:
+        grid = _compute(rows)
+        cache.set(key, grid, WEEK_CACHE_TIMEOUT)
+    return grid
+
+
+def week_schedule(grid, slot):
+    """
+    {'Monday': [...], ...}: every lesson of `grid` as `slot(label, subject
+    name, subject code, stream name)`, plus an empty slot for each school
+    slot the day has no lesson in, ordered by slot label.
+    """
+    schedule = {}
+    for day in WEEK_DAYS:
+        entries = grid['days'][day]
+        taken = {entry[0] for entry in entries}
+        rows = [slot(*entry) for entry in entries]
+        rows += [slot(label, '', '', '') for label in grid['slots'] if label not in taken]
+        schedule[day.capitalize()] = sorted(rows, key=lambda row: row['timeSlot'])
+    return schedule
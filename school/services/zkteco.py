@@ -0,0 +1,297 @@
+"""
+ZKTeco biometric ingestion.
+
+Terminals are AttendanceDevice rows. `manage.py run_zkteco` keeps one
+connection per active device and calls DeviceSync.sync() every few seconds:
+
+    sync = DeviceSync(device, SmartIDCache())
+    created = sync.sync()
+
+A sync first reads the device's record counter and only downloads the log
+when it has changed. Every record at or after the device's high-water mark
+(`last_synced_at`) is then ingested in one batch, so scans between polls are
+never lost. Scan ids are derived from (device, user, timestamp), which makes
+re-reading the same records harmless. Card numbers are resolved through an
+in-process SmartIDCache. ScanLog and GradeAttendance rows are bulk inserted,
+and gate SMS go to the background job queue (kind 'scan_sms') rather than
+being sent on the polling thread. Only recent scans are texted: a device's
+first sync stores its whole log silently, and backlogs older than
+NOTIFY_WINDOW are never announced.
+
+Schools on flaky links run the poller against a local spool instead (see
+services.scan_spool); the spooled records reach ingest() through the bulk
+scan API.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import close_old_connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from ..models import AttendanceDevice, GradeAttendance, ScanLog, SmartID, Student
+from .jobs import enqueue
+from .sms import send_batch
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 5
+CACHE_TTL_SECONDS = 300
+DUPLICATE_WINDOW = timedelta(seconds=10)  # repeat scans of one card inside this window are dropped
+SCAN_BATCH_SIZE = 500
+NOTIFY_WINDOW = timedelta(minutes=30)  # older scans are stored but not texted
+
+Card = namedtuple('Card', 'smart_id school_id profile_id is_student student_id stream_id')
+ScanRecord = namedtuple('ScanRecord', 'user_id timestamp')  # the fields ingest() reads from a pyzk record
+
+
+class SmartIDCache:
+    """
+    user_f18_id → Card. Unknown ids are loaded in one query per batch and
+    the whole cache is dropped every `ttl` seconds so new and reissued cards
+    are picked up. Safe to share between device threads.
+    """
+
+    def __init__(self, ttl=CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.cards, self.missing = {}, set()
+        self.loaded_at = time.monotonic()
+
+    def resolve(self, f18_ids):
+        """{user_f18_id: Card} for the ids in `f18_ids` that belong to a SmartID."""
+        f18_ids = {str(f18) for f18 in f18_ids}
+        with self.lock:
+            if time.monotonic() - self.loaded_at > self.ttl:
+                self._clear()
+            unknown = f18_ids - self.cards.keys() - self.missing
+            if unknown:
+                self._load(unknown)
+            return {f18: self.cards[f18] for f18 in f18_ids if f18 in self.cards}
+
+    def _load(self, f18_ids):
+        rows = list(
+            SmartID.objects.filter(user_f18_id__in=f18_ids)
+            .values_list('pk', 'user_f18_id', 'school_id', 'profile_id', 'profile__is_student')
+        )
+        students = {
+            (user_id, school_id): (pk, stream_id)
+            for pk, user_id, school_id, stream_id in Student.objects.filter(
+                user_id__in=[row[3] for row in rows if row[4]],
+            ).values_list('pk', 'user_id', 'school_id', 'stream_id')
+        }
+        for pk, f18, school_id, profile_id, is_student in rows:
+            student_id, stream_id = students.get((profile_id, school_id), (None, None))
+            self.cards[f18] = Card(pk, school_id, profile_id, bool(is_student), student_id, stream_id)
+        self.missing |= f18_ids - self.cards.keys()
+
+
+def _aware(timestamp):
+    """ZKTeco clocks are naive local time."""
+    if timezone.is_naive(timestamp):
+        return timezone.make_aware(timestamp)
+    return timestamp
+
+
+def _scan_id(device, f18, scanned_at):
+    # UTC, so a record polled directly (local time) and one replayed from the spool get one id.
+    return f"{device.device_id}:{f18}:{scanned_at.astimezone(dt_timezone.utc):%Y%m%d%H%M%S}"
+
+
+def _last_scans(smart_ids, since):
+    return dict(
+        ScanLog.objects.filter(smart_id_id__in=smart_ids, scanned_at__gte=since)
+        .values('smart_id_id').annotate(last=Max('scanned_at')).values_list('smart_id_id', 'last')
+    )
+
+
+def ingest(device, records, cache, record_count=None, replay=False):
+    """
+    Store the `records` (objects with `user_id` and `timestamp`, e.g. pyzk
+    Attendance) of `device` that are at or after its high-water mark and
+    advance the mark. Returns the ScanLogs created.
+
+    With `replay` every record is considered, not just those after the mark:
+    spooled uploads can arrive after newer scans of the same device, and the
+    derived scan ids already make them idempotent.
+
+    A device's first direct sync (no mark yet) stores its history without
+    texting anyone; that log can go back months.
+    """
+    mark = device.last_synced_at
+    first_contact = mark is None and not replay
+    batch = sorted((_aware(r.timestamp), str(r.user_id)) for r in records)
+    if mark is not None and not replay:
+        batch = [(at, f18) for at, f18 in batch if at >= mark]
+    device.last_seen_at = timezone.now()
+    if record_count is not None:
+        device.last_record_count = record_count
+    if not batch:
+        device.save(update_fields=['last_seen_at', 'last_record_count', 'last_error'])
+        return []
+
+    cards = cache.resolve(f18 for _, f18 in batch)
+    latest = _last_scans({c.smart_id for c in cards.values()}, batch[0][0] - DUPLICATE_WINDOW)
+    taken = set(ScanLog.objects.filter(
+        scan_id__in=[_scan_id(device, f18, at) for at, f18 in batch],
+    ).values_list('scan_id', flat=True))
+
+    logs, owners = [], {}
+    for scanned_at, f18 in batch:
+        card = cards.get(f18)
+        if card is None:
+            logger.warning("[ZK %s] no SmartID for scanned id %s", device.device_id, f18)
+            continue
+        scan_id = _scan_id(device, f18, scanned_at)
+        last = latest.get(card.smart_id)
+        if scan_id in taken or (last is not None and abs(scanned_at - last) < DUPLICATE_WINDOW):
+            continue
+        latest[card.smart_id] = scanned_at
+        logs.append(ScanLog(
+            smart_id_id=card.smart_id, scan_id=scan_id, scanned_at=scanned_at,
+            device_id=device.device_id, location=device.location,
+        ))
+        owners[scan_id] = card
+
+    with transaction.atomic():
+        # ignore_conflicts: another process may ingest the same record concurrently.
+        ScanLog.objects.bulk_create(logs, batch_size=SCAN_BATCH_SIZE, ignore_conflicts=True)
+        if logs:
+            created = list(ScanLog.objects.filter(scan_id__in=list(owners)))
+            _after_scans(device, created, owners, notify=not first_contact)
+        else:
+            created = []
+        device.last_synced_at = max(batch[-1][0], mark) if mark else batch[-1][0]
+        device.last_error = ''
+        device.save(update_fields=['last_synced_at', 'last_seen_at', 'last_record_count', 'last_error'])
+    logger.info("[ZK %s] %d record(s) read, %d scan(s) stored", device.device_id, len(batch), len(created))
+    return created
+
+
+def _after_scans(device, scan_logs, owners, notify=True):
+    """
+    Students scanned on a grade device are marked present; every other scan
+    is texted, unless `notify` is off or it is older than NOTIFY_WINDOW.
+    """
+    grade = device.kind == AttendanceDevice.KIND_GRADE
+    present = [log for log in scan_logs if grade and owners[log.scan_id].is_student]
+    GradeAttendance.objects.bulk_create(
+        [
+            GradeAttendance(
+                student_id=owners[log.scan_id].student_id,
+                stream_id=owners[log.scan_id].stream_id,
+                status='P', scan_log=log, recorded_at=log.scanned_at,
+            )
+            for log in present if owners[log.scan_id].student_id
+        ],
+        batch_size=SCAN_BATCH_SIZE,
+    )
+    if not notify:
+        return
+    recent = timezone.now() - NOTIFY_WINDOW
+    texted = [
+        log.pk for log in scan_logs
+        if log.scanned_at >= recent and not (grade and owners[log.scan_id].is_student)
+    ]
+    if texted:
+        enqueue('scan_sms', school=device.school, scan_ids=texted)
+
+
+def notify_scans(scan_ids):
+    """Job handler: text each scan to the student's parents, or to the staff member scanned."""
+    logs = list(
+        ScanLog.objects.filter(pk__in=scan_ids)
+        .select_related('smart_id__profile').order_by('scanned_at')
+    )
+    students = {
+        (s.user_id, s.school_id): s
+        for s in Student.objects.filter(
+            user_id__in=[log.smart_id.profile_id for log in logs if log.smart_id.profile.is_student],
+        ).prefetch_related('parents')
+    }
+    outbox = []
+    for log in logs:
+        profile = log.smart_id.profile
+        message = (
+            f"New Scan: {profile.first_name} {profile.last_name} at {log.location} "
+            f"({timezone.localtime(log.scanned_at):%Y-%m-%d %H:%M:%S})"
+        )
+        if profile.is_student:
+            student = students.get((profile.pk, log.smart_id.school_id))
+            phones = [p.phone for p in student.parents.all() if p.phone] if student else []
+        else:
+            phones = [profile.phone_number] if profile.phone_number else []
+        outbox.extend(((log.pk, phone), phone, message) for phone in phones)
+    for (scan_pk, phone), (ok, error) in send_batch(outbox).items():
+        if not ok:
+            logger.warning("[ZK] SMS for scan %s to %s failed: %s", scan_pk, phone, error)
+
+
+def zk_connect(device):
+    """Open a pyzk connection to `device`."""
+    from zk import ZK
+    return ZK(device.host, port=device.port, timeout=5).connect()
+
+
+class DeviceSync:
+    """
+    Persistent connection to one device plus its sync loop. With a `spool`
+    (services.scan_spool.ScanSpool) records are appended to it instead of
+    being ingested, and the database is never touched.
+    """
+
+    def __init__(self, device, cache, connect=zk_connect, spool=None):
+        self.device, self.cache, self.connect, self.spool = device, cache, connect, spool
+        self.conn = None
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.disconnect()
+            except Exception:
+                pass
+            self.conn = None
+
+    def sync(self):
+        """
+        Take whatever the device recorded since the last sync. Returns the new
+        ScanLogs, or with a spool the number of records spooled.
+        """
+        if self.conn is None:
+            self.conn = self.connect(self.device)
+        self.conn.read_sizes()
+        count = self.conn.records
+        if self.spool is not None:
+            mark, last_count = self.spool.state(self.device.device_id)
+            if mark and count == last_count:
+                return 0
+            records = [ScanRecord(r.user_id, _aware(r.timestamp)) for r in self.conn.get_attendance() or []]
+            return self.spool.append(self.device.device_id, records, record_count=count)
+        if self.device.last_synced_at and count == self.device.last_record_count:
+            return []
+        return ingest(self.device, self.conn.get_attendance() or [], self.cache, record_count=count)
+
+    def run(self, should_stop, poll=POLL_SECONDS):
+        while not should_stop():
+            try:
+                if self.spool is None:
+                    close_old_connections()
+                    self.device.refresh_from_db()
+                    if not self.device.is_active:
+                        break
+                self.sync()
+            except Exception as exc:
+                logger.exception("[ZK %s] sync failed", self.device.device_id)
+                self.close()  # reconnect on the next round
+                if self.spool is None:
+                    AttendanceDevice.objects.filter(pk=self.device.pk).update(
+                        last_error=f"{type(exc).__name__}: {exc}"[:500],
+                    )
+            time.sleep(poll)
+        self.close()
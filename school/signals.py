@@ -1,49 +1,88 @@
 """
 Audit trail signals. Fires on save/delete for sensitive models.
 Actor is null for existing views (no request in signal context); new views log explicitly.
+Entries are buffered and bulk-written on commit (see services.audit), and
+descriptions only use related objects the instance already has loaded.
+Attendance saves/deletes also queue a refresh of that day's dashboard rollup;
+that looks up the enrollment's school when the enrollment isn't loaded.
+Profile and school changes drop the cached user context of the affected user
+(a school save reads its previous admin first).
+Cached weekly timetables need no signal: their keys carry a database stamp
+of the timetable rows (see services.weekly_timetable).
 """
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 
 
-def _log(model_name, object_id, action, description, school=None):
-    from .models import AuditLog
-    try:
-        AuditLog.objects.create(
-            model_name=model_name,
-            object_id=object_id,
-            action=action,
-            description=description,
-            school=school,
+def _log(model_name, object_id, action, description, school_id=None, enrollment_id=None):
+    from .services import audit
+    audit.log(
+        model_name, object_id, action, description,
+        school_id=school_id, enrollment_id=enrollment_id,
+    )
+
+
+def _cached(instance, field):
+    """The related object behind `field` if it is already loaded, else None."""
+    descriptor = getattr(type(instance), field)
+    return descriptor.field.get_cached_value(instance, None)
+
+
+def _student_label(instance):
+    student = _cached(instance, 'student')
+    if student is not None and _cached(student, 'user') is not None:
+        return str(student)
+    return f"student #{instance.student_id}"
+
+
+def _log_attendance(instance, action, description):
+    enrollment = _cached(instance, 'enrollment')
+    if enrollment is not None:
+        _log(
+            'Attendance', instance.pk, action,
+            description.replace('{student}', str(enrollment.student_id)),
+            school_id=enrollment.school_id,
         )
-    except Exception:
-        pass  # never break the request for audit logging
+    else:
+        _log('Attendance', instance.pk, action, description, enrollment_id=instance.enrollment_id)
 
 
-def _attendance_school(instance):
-    try:
-        return instance.enrollment.school
-    except Exception:
-        return None
+def _attendance_school_id(instance):
+    enrollment = _cached(instance, 'enrollment')
+    if enrollment is not None:
+        return enrollment.school_id
+    from .models import Enrollment
+    return Enrollment.objects.filter(pk=instance.enrollment_id).values_list('school_id', flat=True).first()
 
 
 @receiver(post_save, sender='school.Attendance')
 def audit_attendance_save(sender, instance, created, **kwargs):
-    _log(
-        'Attendance', instance.pk,
-        'create' if created else 'update',
-        f"Status={instance.status} student={instance.enrollment.student_id if instance.enrollment_id else '?'}",
-        school=_attendance_school(instance),
+    _log_attendance(
+        instance, 'create' if created else 'update',
+        f"Status={instance.status} student={{student}}",
     )
 
 
 @receiver(post_delete, sender='school.Attendance')
 def audit_attendance_delete(sender, instance, **kwargs):
-    _log(
-        'Attendance', instance.pk, 'delete',
-        f"Deleted attendance status={instance.status}",
-        school=_attendance_school(instance),
-    )
+    _log_attendance(instance, 'delete', f"Deleted attendance status={instance.status}")
+
+
+def _refresh_attendance_rollup(instance):
+    from .services.attendance_rollup import mark_dirty
+    school_id = _attendance_school_id(instance)
+    if school_id is not None:
+        mark_dirty(school_id, instance.date)
+
+
+@receiver(post_save, sender='school.Attendance')
+def rollup_attendance_save(sender, instance, **kwargs):
+    _refresh_attendance_rollup(instance)
+
+
+@receiver(post_delete, sender='school.Attendance')
+def rollup_attendance_delete(sender, instance, **kwargs):
+    _refresh_attendance_rollup(instance)
 
 
 @receiver(post_save, sender='school.DisciplineRecord')
@@ -51,14 +90,17 @@ def audit_discipline_save(sender, instance, created, **kwargs):
     _log(
         'DisciplineRecord', instance.pk,
         'create' if created else 'update',
-        f"{instance.get_incident_type_display()} / {instance.get_severity_display()} - {instance.student}",
-        school=instance.school,
+        f"{instance.get_incident_type_display()} / {instance.get_severity_display()} - {_student_label(instance)}",
+        school_id=instance.school_id,
     )
 
 
 @receiver(post_delete, sender='school.DisciplineRecord')
 def audit_discipline_delete(sender, instance, **kwargs):
-    _log('DisciplineRecord', instance.pk, 'delete', f"Deleted for {instance.student}", school=instance.school)
+    _log(
+        'DisciplineRecord', instance.pk, 'delete',
+        f"Deleted for {_student_label(instance)}", school_id=instance.school_id,
+    )
 
 
 @receiver(post_save, sender='school.Payment')
@@ -67,10 +109,45 @@ def audit_payment_save(sender, instance, created, **kwargs):
         'Payment', instance.pk,
         'create' if created else 'update',
         f"{instance.get_payment_type_display()} {instance.amount} status={instance.status}",
-        school=instance.school,
+        school_id=instance.school_id,
     )
 
 
 @receiver(post_delete, sender='school.Payment')
 def audit_payment_delete(sender, instance, **kwargs):
-    _log('Payment', instance.pk, 'delete', f"Deleted payment {instance.amount}", school=instance.school)
+    _log('Payment', instance.pk, 'delete', f"Deleted payment {instance.amount}", school_id=instance.school_id)
+
+
+# ── Cached user context (services.user_context) ──────────────────────────────
+# Best effort: with the per-process default cache these only reach the
+# process that saved the row. Other workers rely on the entry's
+# USER_CONTEXT_CACHE_TIMEOUT.
+
+def _forget_user_context(user_id):
+    from .services.user_context import invalidate
+    invalidate(user_id)
+
+
+@receiver(post_save, sender='school.StaffProfile')
+@receiver(post_delete, sender='school.StaffProfile')
+@receiver(post_save, sender='school.Parent')
+@receiver(post_delete, sender='school.Parent')
+@receiver(post_save, sender='school.Student')
+@receiver(post_delete, sender='school.Student')
+def profile_changed(sender, instance, **kwargs):
+    _forget_user_context(instance.user_id)
+
+
+@receiver(pre_save, sender='school.School')
+def school_admin_changing(sender, instance, **kwargs):
+    if instance.pk:
+        from .models import School
+        previous = School.objects.filter(pk=instance.pk).values_list('school_admin_id', flat=True).first()
+        if previous != instance.school_admin_id:
+            _forget_user_context(previous)
+
+
+@receiver(post_save, sender='school.School')
+@receiver(post_delete, sender='school.School')
+def school_changed(sender, instance, **kwargs):
+    _forget_user_context(instance.school_admin_id)
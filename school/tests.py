@@ -2,7 +2,7 @@
 Tests — Exam and Finance modules: all user roles covered.
 """
 from decimal import Decimal
-from io import BytesIO
+from io import BytesIO, StringIO
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.utils import timezone
@@ -404,6 +404,41 @@ class TeacherExamViewTest(TestCase):
         )
         self.assertEqual(ExamResult.objects.filter(session=session).count(), 0)
 
+    def _upload(self, session, *rows):
+        import openpyxl
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(['student_id', 'cat', 'assignment', 'assessment', 'exam'])
+        for row in rows:
+            ws.append(list(row))
+        buf = BytesIO()
+        wb.save(buf)
+        buf.seek(0)
+        buf.name = 'scores.xlsx'
+        self.client.post(
+            reverse('school:exam-result-upload', args=[session.pk]),
+            {'stream': self.fx['stream'].pk, 'subject': self.fx['subject'].pk, 'file': buf},
+        )
+        from school.models import ExamUploadJob
+        return ExamUploadJob.objects.filter(session=session).latest('created_at')
+
+    def test_bulk_upload_overwrites_existing_result(self):
+        session = make_session(**{k: self.fx[k] for k in ('school', 'grade', 'term')})
+        make_result(session, self.fx['student'], self.fx['subject'], self.fx['stream'], self.fx['school'])
+        job = self._upload(session, ('S001', 10, 5, 5, 30))
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.saved, 1)
+        result = ExamResult.objects.get(session=session, student=self.fx['student'])
+        self.assertEqual(result.cat_score, 10.0)
+        self.assertEqual(result.exam_score, 30.0)
+
+    def test_bulk_upload_out_of_range_row_is_skipped(self):
+        session = make_session(**{k: self.fx[k] for k in ('school', 'grade', 'term')})
+        job = self._upload(session, ('S001', 25, 8, 7, session.exam_out_of + 1))
+        self.assertEqual((job.total_rows, job.saved, job.skipped), (1, 0, 1))
+        self.assertIn('S001', job.error)
+        self.assertFalse(ExamResult.objects.filter(session=session).exists())
+
     def test_teacher_cannot_publish(self):
         session = make_session(**{k: self.fx[k] for k in ('school', 'grade', 'term')}, published=False)
         self.client.post(reverse('school:exam-publish', args=[session.pk]))
@@ -614,6 +649,40 @@ class RankingLogicTest(TestCase):
         self.assertEqual(len(positions), 2)
         self.assertTrue(all(isinstance(p, int) for p in positions))
 
+    def test_ties_share_position_and_next_skips(self):
+        from school.services.exam_ranking import rank_students
+        u3 = make_user('student3@school.test', is_student=True)
+        student3 = Student.objects.create(
+            user=u3, student_id='S003', school=self.fx['school'],
+            grade_level=self.fx['grade'], stream=self.fx['stream'], gender='m',
+        )
+        session = make_session(**{k: self.fx[k] for k in ('school', 'grade', 'term')})
+        for student, exam in ((self.fx['student'], 40), (self.student2, 40), (student3, 10)):
+            make_result(session, student, self.fx['subject'], self.fx['stream'], self.fx['school'], exam=exam)
+
+        students = Student.objects.filter(school=self.fx['school'], stream=self.fx['stream'])
+        ranking = rank_students(session, students)
+        self.assertEqual([r['position'] for r in ranking], [1, 1, 3])
+        self.assertEqual(ranking[0]['percentage'], 80.0)
+        self.assertEqual(ranking[0]['grade_band'], 'EE')
+
+    def test_cached_totals_follow_score_edits(self):
+        from school.services.exam_ranking import rank_students, student_positions
+        session = make_session(**{k: self.fx[k] for k in ('school', 'grade', 'term')})
+        make_result(session, self.fx['student'], self.fx['subject'], self.fx['stream'], self.fx['school'], exam=40)
+        low = make_result(session, self.student2, self.fx['subject'], self.fx['stream'], self.fx['school'], exam=10)
+        students = list(Student.objects.filter(school=self.fx['school'], stream=self.fx['stream']))
+
+        rank_students(session, students)
+        with self.assertNumQueries(1):  # cache-key lookup only
+            rank_students(session, students)
+
+        low.exam_score = 50
+        low.save()
+        self.assertEqual(rank_students(session, students)[0]['student'].pk, self.student2.pk)
+        pos = student_positions(session, self.fx['student'])
+        self.assertEqual((pos['stream_pos'], pos['stream_total'], pos['grade_pos']), (2, 2, 2))
+
 
 # ─── Subject performance tests ─────────────────────────────────────────────────
 
@@ -746,7 +815,8 @@ class FinancePrincipalViewTest(TestCase):
         fs = make_fee_structure(self.fx['school'], self.fx['grade'], self.fx['term'])
         data = {'fee_structures': [fs.pk], 'due_date': '', 'overwrite_existing': False}
         r = self.client.post(reverse('school:bulk-generate-invoices', args=[self.fx['term'].pk]), data)
-        self.assertRedirects(r, reverse('school:finance-dashboard'))
+        self.assertEqual(r.status_code, 302)
+        jobs.run_next('test-worker')
         self.assertEqual(FeeInvoice.objects.filter(school=self.fx['school']).count(), 1)
 
     def test_bulk_generate_skips_existing_by_default(self):
@@ -754,6 +824,7 @@ class FinancePrincipalViewTest(TestCase):
         make_invoice(self.fx['school'], self.fx['student'], self.fx['term'], description='School Fees')
         data = {'fee_structures': [fs.pk], 'due_date': '', 'overwrite_existing': False}
         self.client.post(reverse('school:bulk-generate-invoices', args=[self.fx['term'].pk]), data)
+        jobs.run_next('test-worker')
         self.assertEqual(FeeInvoice.objects.filter(school=self.fx['school']).count(), 1)
 
     def test_student_fee_statement_accessible(self):
@@ -1028,3 +1099,1794 @@ class FeeStructureModelTest(TestCase):
     def test_is_active_default_true(self):
         fs = make_fee_structure(self.fx['school'], self.fx['grade'], self.fx['term'])
         self.assertTrue(fs.is_active)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# TIMETABLE SOLVER TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from school.models import Timetable, TimeSlot, Lesson, LessonPattern, Enrollment  # noqa: E402
+from school.services.timetable_solver import solve_term, apply_plan, _has_run  # noqa: E402
+from school.services.timetable_generator import generate_for_stream  # noqa: E402
+
+
+def make_time_slots(school, count=6):
+    return [
+        TimeSlot.objects.create(
+            school=school,
+            start_time=datetime.time(8 + i, 0),
+            end_time=datetime.time(8 + i, 40),
+        )
+        for i in range(count)
+    ]
+
+
+def make_timetable(school, stream, term):
+    return Timetable.objects.create(
+        school=school, grade=stream.grade, stream=stream, term=term,
+        year=term.start_date.year, start_date=term.start_date, end_date=term.end_date,
+    )
+
+
+class TimetableSolverTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        school, grade = self.fx['school'], self.fx['grade']
+        make_time_slots(school)
+        self.fx['staff'].subjects.add(self.fx['subject'])
+        english = Subject.objects.create(
+            name='English', code='ENG', school=school,
+            start_date=datetime.date(2025, 1, 1), sessions_per_week=3,
+        )
+        english.grade.add(grade)
+        eng_user = make_user('eng@school.test', is_teacher=True)
+        eng_staff = StaffProfile.objects.create(user=eng_user, staff_id='T002', school=school, position='teacher')
+        eng_staff.subjects.add(english)
+        self.stream_b = Streams.objects.create(name='B', grade=grade, school=school)
+        self.timetables = [
+            make_timetable(school, self.fx['stream'], self.fx['term']),
+            make_timetable(school, self.stream_b, self.fx['term']),
+        ]
+
+    def _solve(self, **kwargs):
+        return solve_term(self.fx['school'], self.fx['term'], self.timetables, **kwargs)
+
+    def test_run_detection(self):
+        self.assertTrue(_has_run(0b0111, 3))
+        self.assertFalse(_has_run(0b1011, 3))
+
+    def test_all_weekly_sessions_placed(self):
+        plan = self._solve()
+        self.assertEqual(plan.conflicts, [])
+        # 2 Maths + 3 English per stream, two streams
+        self.assertEqual(len(plan.placements), 10)
+
+    def test_no_teacher_or_stream_double_booking(self):
+        plan = self._solve()
+        teacher_slots = [(p.teacher_id, p.day, p.slot) for p in plan.placements]
+        stream_slots = [(p.stream_id, p.day, p.slot) for p in plan.placements]
+        self.assertEqual(len(teacher_slots), len(set(teacher_slots)))
+        self.assertEqual(len(stream_slots), len(set(stream_slots)))
+
+    def test_solving_does_not_write(self):
+        self._solve()
+        self.assertEqual(LessonPattern.objects.count(), 0)
+
+    def test_apply_writes_weekly_patterns_and_pattern_enrollments(self):
+        plan = self._solve()
+        result = apply_plan(plan)
+        self.assertEqual(LessonPattern.objects.count(), len(plan.placements))
+        self.assertEqual(len(result['patterns']), len(plan.placements))
+        # No dated rows until attendance is marked.
+        self.assertEqual(Lesson.objects.count(), 0)
+        stream_a_patterns = LessonPattern.objects.filter(stream=self.fx['stream']).count()
+        self.assertEqual(
+            Enrollment.objects.filter(student=self.fx['student'], pattern__isnull=False).count(),
+            stream_a_patterns,
+        )
+
+    def test_missing_teacher_reported(self):
+        self.fx['staff'].subjects.clear()
+        plan = self._solve()
+        types = {(c['type'], c['subject']) for c in plan.conflicts}
+        self.assertIn(('NO_TEACHER', 'Mathematics'), types)
+
+    def test_existing_patterns_count_toward_targets(self):
+        apply_plan(self._solve())
+        before = LessonPattern.objects.count()
+        plan = self._solve()
+        self.assertEqual(plan.placements, [])
+        apply_plan(plan)
+        self.assertEqual(LessonPattern.objects.count(), before)
+
+    def test_overwrite_regenerates(self):
+        apply_plan(self._solve())
+        before = LessonPattern.objects.count()
+        result = generate_for_stream(self.timetables[0], overwrite=True)
+        self.assertEqual(result['conflicts'], [])
+        self.assertEqual(LessonPattern.objects.count(), before)
+
+    def test_dry_run_command_writes_nothing(self):
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('generate_timetables', school=self.fx['school'].code,
+                     term=self.fx['term'].id, dry_run=True, stdout=out)
+        self.assertIn('Dry run', out.getvalue())
+        self.assertEqual(LessonPattern.objects.count(), 0)
+
+
+class EnrollmentPipelineTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        make_time_slots(self.fx['school'])
+        self.fx['staff'].subjects.add(self.fx['subject'])
+        self.timetable = make_timetable(self.fx['school'], self.fx['stream'], self.fx['term'])
+        apply_plan(solve_term(self.fx['school'], self.fx['term'], [self.timetable]))
+
+    def test_bulk_enroll_skips_existing_pairs(self):
+        from school.services.enrollments import bulk_enroll_patterns
+        pattern_ids = list(LessonPattern.objects.values_list('id', flat=True))
+        pairs = {(self.fx['student'].id, pid) for pid in pattern_ids}
+        self.assertEqual(bulk_enroll_patterns(self.fx['school'], pairs), 0)
+        self.assertEqual(Enrollment.objects.count(), len(pattern_ids))
+
+    def test_populate_uses_subject_enrollments_and_is_idempotent(self):
+        from school.models import SubjectEnrollment
+        from school.views import populate_student_lesson_enrollments
+        Enrollment.objects.all().delete()
+        SubjectEnrollment.objects.create(student=self.fx['student'], subject=self.fx['subject'])
+        created = populate_student_lesson_enrollments(self.fx['school'], term=self.fx['term'])
+        self.assertEqual(created, LessonPattern.objects.filter(subject=self.fx['subject']).count())
+        self.assertEqual(populate_student_lesson_enrollments(self.fx['school'], term=self.fx['term']), 0)
+
+
+class LessonPatternTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        slot = make_time_slots(self.fx['school'], count=1)[0]
+        timetable = make_timetable(self.fx['school'], self.fx['stream'], self.fx['term'])
+        self.pattern = LessonPattern.objects.create(
+            school=self.fx['school'], timetable=timetable, term=self.fx['term'],
+            stream=self.fx['stream'], subject=self.fx['subject'], teacher=self.fx['staff'],
+            day_of_week='monday', time_slot=slot,
+        )
+        Enrollment.objects.create(student=self.fx['student'], pattern=self.pattern, school=self.fx['school'])
+        self.monday = datetime.date(2025, 1, 6)
+
+    def test_occurrences_are_generated_without_writes(self):
+        from school.services.lesson_patterns import occurrences
+        week = occurrences(LessonPattern.objects.all(), self.monday, self.monday + datetime.timedelta(days=6))
+        self.assertEqual([l.lesson_date for l in week], [self.monday])
+        self.assertIsNone(week[0].pk)
+        term = occurrences(LessonPattern.objects.all(), self.fx['term'].start_date, self.fx['term'].end_date)
+        self.assertTrue(all(l.lesson_date.weekday() == 0 for l in term))
+        self.assertEqual(Lesson.objects.count(), 0)
+
+    def test_materialise_is_idempotent_and_replaces_the_occurrence(self):
+        from school.services.lesson_patterns import materialise, occurrences
+        lesson = materialise(self.pattern, self.monday)
+        self.assertEqual(materialise(self.pattern, self.monday, is_canceled=True).pk, lesson.pk)
+        self.assertEqual(Lesson.objects.count(), 1)
+        week = occurrences(LessonPattern.objects.all(), self.monday, self.monday)
+        self.assertEqual(week[0].pk, lesson.pk)
+        self.assertTrue(week[0].is_canceled)
+        with self.assertRaises(ValueError):
+            materialise(self.pattern, self.monday + datetime.timedelta(days=1))
+
+    def test_lesson_enrollments_come_from_the_pattern_roster(self):
+        from school.services.lesson_patterns import lesson_enrollments, materialise
+        lesson = materialise(self.pattern, self.monday)
+        enrollments = lesson_enrollments(lesson)
+        self.assertEqual([e.student_id for e in enrollments], [self.fx['student'].id])
+        lesson_enrollments(lesson)
+        self.assertEqual(Enrollment.objects.filter(lesson=lesson).count(), 1)
+
+    def test_teacher_pattern_mark_materialises_and_redirects(self):
+        self.client.login(email='teacher@school.test', password='testpass123')
+        r = self.client.get(reverse('school:teacher-pattern-attendance-mark', args=[self.pattern.id, '2025-01-06']))
+        lesson = Lesson.objects.get(pattern=self.pattern)
+        self.assertRedirects(
+            r, reverse('school:teacher-attendance-mark', args=[lesson.id]), fetch_redirect_response=False,
+        )
+
+    def test_lesson_listings_read_patterns(self):
+        from school.services.lesson_patterns import pattern_dates
+        Term.objects.filter(pk=self.fx['term'].pk).update(is_active=True)
+        weeks = len(pattern_dates(self.pattern))
+        self.client.force_login(self.fx['admin_user'])
+        r = self.client.get(reverse('school:teacher-lessons', args=[self.fx['staff'].id]))
+        self.assertEqual(r.context['lessons'].paginator.count, weeks)
+        r = self.client.get(reverse('school:lesson-list', args=[self.pattern.timetable_id]))
+        self.assertEqual(r.context['lessons'].paginator.count, weeks)
+        self.assertContains(r, reverse('school:lesson-pattern-attendance', args=[self.pattern.id, '2025-01-06']))
+        self.assertEqual(Lesson.objects.count(), 0)
+
+    def test_lesson_apis_read_patterns(self):
+        from rest_framework.test import APIClient
+        from school.services.lesson_patterns import pattern_dates
+        Term.objects.filter(pk=self.fx['term'].pk).update(is_active=True)
+        api = APIClient()
+        api.force_authenticate(self.fx['admin_user'])
+        r = api.get(reverse('lessons_manage'), {'start': '2025-01-06', 'end': '2025-01-12'}).json()
+        self.assertEqual([(row['id'], row['pattern'], row['lesson_date']) for row in r['results']],
+                         [(None, self.pattern.id, '2025-01-06')])
+        api.force_authenticate(self.fx['teacher_user'])
+        r = api.get(reverse('teacher_lessons', args=[self.fx['staff'].staff_id])).json()
+        self.assertEqual([(row['lessonId'], row['patternId']) for row in r], [(None, self.pattern.id)])
+        r = api.get(reverse('teacher_attendance_summary')).json()
+        self.assertEqual(len(r['lessons']), len(pattern_dates(self.pattern)))
+
+    def test_lesson_counts_read_patterns(self):
+        from school.services.lesson_patterns import (
+            materialise, occurrence_counts, pattern_dates, weekly_lesson_count,
+        )
+        patterns, lessons = LessonPattern.objects.all(), Lesson.objects.all()
+        Lesson.objects.create(
+            timetable=self.pattern.timetable, subject=self.fx['subject'], stream=self.fx['stream'],
+            day_of_week='tuesday', time_slot=self.pattern.time_slot, lesson_date=datetime.date(2025, 1, 7),
+        )
+        materialise(self.pattern, self.monday)
+        counts = occurrence_counts(patterns, 'subject_id', lessons=lessons)
+        self.assertEqual(counts[self.fx['subject'].id], len(pattern_dates(self.pattern)) + 1)
+        self.assertEqual(weekly_lesson_count(patterns, lessons=lessons), 2)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# ATTENDANCE EXPORT TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from school.models import Attendance  # noqa: E402
+
+
+class AttendanceExportTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        slot = make_time_slots(self.fx['school'], count=1)[0]
+        timetable = make_timetable(self.fx['school'], self.fx['stream'], self.fx['term'])
+        lesson = Lesson.objects.create(
+            timetable=timetable, subject=self.fx['subject'], stream=self.fx['stream'],
+            teacher=self.fx['staff'], day_of_week='monday', time_slot=slot,
+            lesson_date=datetime.date(2025, 1, 6),
+        )
+        enrollment = Enrollment.objects.create(student=self.fx['student'], lesson=lesson, school=self.fx['school'])
+        Attendance.objects.bulk_create([
+            Attendance(enrollment=enrollment, date=datetime.date(2025, 1, 6) + datetime.timedelta(days=i),
+                       status='P', term=self.fx['term'], marked_by=self.fx['staff'])
+            for i in range(90)
+        ])
+        self.client.force_login(self.fx['admin_user'])
+
+    def test_csv_streams_every_row(self):
+        r = self.client.get(reverse('school:attendance-export-csv'))
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.streaming)
+        lines = b''.join(r.streaming_content).decode().strip().splitlines()
+        self.assertEqual(len(lines), 91)
+        self.assertIn('Mathematics', lines[1])
+        self.assertIn('Present', lines[1])
+
+    def test_csv_date_filter(self):
+        r = self.client.get(reverse('school:attendance-export-csv'), {'end': '2025-01-06'})
+        lines = b''.join(r.streaming_content).decode().strip().splitlines()
+        self.assertEqual(len(lines), 2)
+
+    def test_pdf_paginates(self):
+        r = self.client.get(reverse('school:attendance-export-pdf'))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r['Content-Type'], 'application/pdf')
+        self.assertGreaterEqual(r.content.count(b'/Type /Page\n'), 2)
+
+    def test_stranger_denied(self):
+        self.client.force_login(self.fx['stranger_user'])
+        r = self.client.get(reverse('school:attendance-export-csv'))
+        self.assertEqual(r.status_code, 403)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# ATTENDANCE ROLLUP TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from django.core.management import call_command  # noqa: E402
+from school.models import AttendanceDailyRollup  # noqa: E402
+from school.services.attendance_rollup import rollups_for, summarize  # noqa: E402
+
+
+class AttendanceRollupTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        self.day = datetime.date(2025, 1, 6)
+        slot = make_time_slots(self.fx['school'], count=1)[0]
+        timetable = make_timetable(self.fx['school'], self.fx['stream'], self.fx['term'])
+        self.lesson = Lesson.objects.create(
+            timetable=timetable, subject=self.fx['subject'], stream=self.fx['stream'],
+            teacher=self.fx['staff'], day_of_week='monday', time_slot=slot, lesson_date=self.day,
+        )
+        self.enrollment = Enrollment.objects.create(
+            student=self.fx['student'], lesson=self.lesson, school=self.fx['school'],
+        )
+
+    def _mark(self, status, day=None):
+        return Attendance.objects.create(
+            enrollment=self.enrollment, date=day or self.day, status=status,
+            term=self.fx['term'], marked_by=self.fx['staff'],
+        )
+
+    def test_marking_refreshes_the_day_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._mark('P')
+            att = self._mark('UA')
+        row = AttendanceDailyRollup.objects.get(school=self.fx['school'], date=self.day)
+        self.assertEqual((row.total_count, row.present_count, row.unexcused_absence_count), (2, 1, 1))
+        self.assertEqual(row.grade_id, self.fx['grade'].id)
+        self.assertEqual(row.teacher_id, self.fx['staff'].id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            att.status = 'ET'
+            att.save()
+        totals = summarize(rollups_for(self.fx['school']))
+        self.assertEqual((totals['present'], totals['tardy'], totals['absent']), (1, 1, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            att.delete()
+        self.assertEqual(summarize(rollups_for(self.fx['school']))['total'], 1)
+
+    def test_rebuild_command_covers_bulk_writes(self):
+        Attendance.objects.bulk_create([
+            Attendance(enrollment=self.enrollment, date=self.day + datetime.timedelta(days=i),
+                       status='P' if i % 3 else 'EA', term=self.fx['term'])
+            for i in range(9)
+        ])
+        self.assertFalse(AttendanceDailyRollup.objects.exists())
+        call_command('rebuild_attendance_rollups', school=self.fx['school'].code, stdout=StringIO())
+        totals = summarize(rollups_for(self.fx['school']))
+        self.assertEqual((totals['total'], totals['present'], totals['absent']), (9, 6, 3))
+        per_day = summarize(rollups_for(self.fx['school']), 'date')
+        self.assertEqual(len(per_day), 9)
+
+    def test_attendance_dashboard_reads_rollups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._mark('P')
+            self._mark('P')
+            self._mark('UT')
+        self.client.force_login(self.fx['admin_user'])
+        r = self.client.get(reverse('school:attendance-dashboard'))
+        self.assertEqual(r.status_code, 200)
+        cards = {c['label']: c['count'] for c in r.context['status_cards']}
+        self.assertEqual(cards, {'Present': 2, 'Tardy': 1, 'Absent': 0})
+        self.assertEqual(r.context['status_trend'][0]['P'], 2)
+
+    def test_school_and_policy_dashboards_read_rollups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._mark('P', day=datetime.date.today())
+            self._mark('EA', day=datetime.date.today())
+        self.client.force_login(self.fx['admin_user'])
+        r = self.client.get(reverse('school:dashboard'))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.context['today_total'], r.context['today_present']), (2, 1))
+
+        policy_user = make_user('policy@test.com', is_policy_maker=True)
+        self.client.force_login(policy_user)
+        r = self.client.get(reverse('school:policy-dashboard'))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.context['national_rate'], 50.0)
+        self.assertEqual(r.context['school_rankings'][0]['school__name'], self.fx['school'].name)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# BATCHED ATTENDANCE WRITE TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from django.db import connection, transaction  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from school.models import AuditLog  # noqa: E402
+from school.services.attendance import record_attendance  # noqa: E402
+
+
+class RollCallFixture:
+    """One lesson with eleven enrolled students."""
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        self.day = datetime.date(2025, 1, 6)
+        slot = make_time_slots(self.fx['school'], count=1)[0]
+        timetable = make_timetable(self.fx['school'], self.fx['stream'], self.fx['term'])
+        self.lesson = Lesson.objects.create(
+            timetable=timetable, subject=self.fx['subject'], stream=self.fx['stream'],
+            teacher=self.fx['staff'], day_of_week='monday', time_slot=slot, lesson_date=self.day,
+        )
+        self.enrollments = [Enrollment.objects.create(
+            student=self.fx['student'], lesson=self.lesson, school=self.fx['school'],
+        )]
+        for i in range(2, 12):
+            user = make_user(f'roll{i}@school.test', is_student=True)
+            student = Student.objects.create(
+                user=user, student_id=f'S{i:03d}', school=self.fx['school'],
+                grade_level=self.fx['grade'], stream=self.fx['stream'], gender='f',
+            )
+            self.enrollments.append(Enrollment.objects.create(
+                student=student, lesson=self.lesson, school=self.fx['school'],
+            ))
+
+
+class AttendanceWriteTest(RollCallFixture, TestCase):
+
+    def _record(self, enrollments, status):
+        with CaptureQueriesContext(connection) as ctx:
+            saved = record_attendance(
+                [(e, status, None) for e in enrollments], self.day, lesson=self.lesson,
+                marked_by=self.fx['staff'], term=self.fx['term'],
+            )
+        return saved, len(ctx.captured_queries)
+
+    def test_upsert_splits_creates_and_updates(self):
+        self._record(self.enrollments[:4], 'P')
+        saved, _ = self._record(self.enrollments, 'UA')
+        self.assertEqual(len(saved), len(self.enrollments))
+        self.assertEqual(Attendance.objects.count(), len(self.enrollments))
+        self.assertEqual(Attendance.objects.filter(status='UA').count(), len(self.enrollments))
+        self.assertTrue(all(a.pk for a in saved))
+
+    def test_query_count_does_not_grow_with_class_size(self):
+        _, one = self._record(self.enrollments[:1], 'P')
+        Attendance.objects.all().delete()
+        _, many = self._record(self.enrollments, 'P')
+        self.assertEqual(one, many)
+
+    def test_one_audit_entry_per_submit(self):
+        AuditLog.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self._record(self.enrollments, 'P')
+        log = AuditLog.objects.get()
+        self.assertEqual((log.model_name, log.object_id), ('Lesson', self.lesson.id))
+        self.assertEqual(len(log.changes['created']), len(self.enrollments))
+
+    def test_teacher_mark_view_and_rollup(self):
+        self.client.login(email='teacher@school.test', password='testpass123')
+        data = {f'status_{e.id}': 'P' for e in self.enrollments}
+        data[f'status_{self.enrollments[0].id}'] = 'UA'
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post(
+                reverse('school:teacher-attendance-mark', args=[self.lesson.id]), data,
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(Attendance.objects.filter(status='P').count(), len(self.enrollments) - 1)
+        totals = summarize(rollups_for(self.fx['school']))
+        self.assertEqual((totals['total'], totals['present']), (len(self.enrollments), len(self.enrollments) - 1))
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# WRITE-BEHIND AUDIT LOG TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+class AuditBufferTest(RollCallFixture, TestCase):
+
+    def _save_each(self, enrollments):
+        for e in enrollments:
+            Attendance.objects.create(
+                enrollment_id=e.id, date=self.day, status='P', term=self.fx['term'],
+            )
+
+    def test_entries_are_written_once_on_commit(self):
+        AuditLog.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with CaptureQueriesContext(connection) as ctx:
+                self._save_each(self.enrollments)
+            self.assertFalse(any('audit' in q['sql'].lower() for q in ctx.captured_queries))
+            self.assertFalse(AuditLog.objects.exists())
+        self.assertEqual(sum(1 for cb in callbacks if type(cb).__name__ == '_AuditFlush'), 1)
+        logs = AuditLog.objects.filter(model_name='Attendance')
+        self.assertEqual(logs.count(), len(self.enrollments))
+        self.assertEqual(set(logs.values_list('school_id', flat=True)), {self.fx['school'].id})
+        self.assertIn(f"student={self.fx['student'].id}", logs.get(object_id=Attendance.objects.order_by('id')[0].id).description)
+
+    def test_rolled_back_savepoint_drops_its_entries(self):
+        AuditLog.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self._save_each(self.enrollments[:1])
+                try:
+                    with transaction.atomic():
+                        self._save_each(self.enrollments[1:3])
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+        self.assertEqual(AuditLog.objects.filter(model_name='Attendance').count(), 1)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# BATCH REPORT SLIP TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+import tempfile  # noqa: E402
+import zipfile  # noqa: E402
+from unittest import mock  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from school.models import ReportSlipJob  # noqa: E402
+from school.services import report_slips  # noqa: E402
+from school.models import BackgroundJob  # noqa: E402
+from school.services import jobs  # noqa: E402
+import multiprocessing  # noqa: E402
+from school.management.commands import run_workers  # noqa: E402
+from pypdf import PdfReader  # noqa: E402
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReportSlipBatchTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        self.session = make_session(**{k: self.fx[k] for k in ('school', 'grade', 'term')})
+        self.students = [self.fx['student']]
+        for i, exam in enumerate((30, 45, 45)):
+            user = make_user(f'slip{i}@school.test', is_student=True, first_name=f'Slip{i}')
+            student = Student.objects.create(
+                user=user, student_id=f'SL{i}', school=self.fx['school'],
+                grade_level=self.fx['grade'], stream=self.fx['stream'], gender='f',
+            )
+            self.students.append(student)
+            make_result(self.session, student, self.fx['subject'], self.fx['stream'], self.fx['school'], exam=exam)
+        make_result(self.session, self.fx['student'], self.fx['subject'], self.fx['stream'], self.fx['school'], exam=10)
+
+    def _job(self, fmt):
+        return ReportSlipJob.objects.create(
+            session=self.session, school=self.fx['school'], stream=self.fx['stream'], output_format=fmt,
+        )
+
+    def test_payloads_carry_shared_positions(self):
+        payloads = report_slips.build_payloads(self.session, Student.objects.filter(pk__in=[s.pk for s in self.students]))
+        by_id = {p['student']['student_id']: p for p in payloads}
+        self.assertEqual((by_id['SL1']['stream_pos'], by_id['SL2']['stream_pos']), (1, 1))
+        self.assertEqual(by_id['SL0']['grade_pos'], 3)
+        self.assertEqual(by_id['SL0']['grade_total'], 4)
+        self.assertEqual(by_id['SL1']['results'][0]['subject'], 'Mathematics')
+
+    def test_merged_pdf_has_one_page_per_slip(self):
+        job = report_slips.run_report_slip_job(self._job(ReportSlipJob.FORMAT_PDF).pk)
+        self.assertEqual(job.status, ReportSlipJob.STATUS_DONE, job.error)
+        self.assertEqual((job.total, job.processed), (4, 4))
+        with open(job.file_path, 'rb') as fh:
+            self.assertEqual(fh.read().count(b'/Type /Page\n'), 4)
+
+    def test_merged_pdf_renders_across_worker_processes(self):
+        with mock.patch.object(report_slips, 'SLIP_CHUNK_SIZE', 2):
+            job = report_slips.run_report_slip_job(self._job(ReportSlipJob.FORMAT_PDF).pk, workers=2)
+        self.assertEqual(job.status, ReportSlipJob.STATUS_DONE, job.error)
+        self.assertEqual(job.processed, 4)
+        self.assertEqual(len(PdfReader(job.file_path).pages), 4)
+
+    def test_zip_renders_across_worker_processes(self):
+        with mock.patch.object(report_slips, 'SLIP_CHUNK_SIZE', 2):
+            job = report_slips.run_report_slip_job(self._job(ReportSlipJob.FORMAT_ZIP).pk, workers=2)
+        self.assertEqual(job.status, ReportSlipJob.STATUS_DONE, job.error)
+        with zipfile.ZipFile(job.file_path) as archive:
+            names = archive.namelist()
+        self.assertEqual(len(names), 4)
+        self.assertIn('report_slip_SL0_2025.pdf', names)
+
+    def test_web_trigger_progress_and_download(self):
+        self.client.force_login(self.fx['admin_user'])
+        r = self.client.post(reverse('school:report-slip-batch', args=[self.session.pk]),
+                             {'stream': self.fx['stream'].pk, 'format': 'pdf'})
+        job = ReportSlipJob.objects.get()
+        self.assertRedirects(r, reverse('school:report-slip-job-progress', args=[job.pk]))
+        queued = BackgroundJob.objects.get()
+        self.assertEqual((queued.kind, queued.payload), ('report_slips', {'job_id': str(job.pk)}))
+
+        jobs.run_next('test-worker')
+        status = self.client.get(reverse('school:report-slip-job-status', args=[job.pk])).json()
+        self.assertEqual((status['status'], status['progress']), ('done', 100))
+        r = self.client.get(reverse('school:report-slip-job-download', args=[job.pk]))
+        self.assertEqual(r['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(r.streaming_content).startswith(b'%PDF'))
+
+        self.client.force_login(self.fx['stranger_user'])
+        r = self.client.get(reverse('school:report-slip-job-status', args=[job.pk]))
+        self.assertEqual(r.status_code, 404)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# BACKGROUND JOB QUEUE TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+class BackgroundJobQueueTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        self.session = make_session(**{k: self.fx[k] for k in ('school', 'grade', 'term')})
+
+    def _slip_job(self):
+        slip = ReportSlipJob.objects.create(session=self.session, school=self.fx['school'])
+        return slip, jobs.enqueue('report_slips', school=self.fx['school'], job_id=str(slip.pk))
+
+    def test_claim_orders_by_priority_and_holds_lease(self):
+        _, low = self._slip_job()
+        _, high = self._slip_job()
+        BackgroundJob.objects.filter(pk=high.pk).update(priority=BackgroundJob.PRIORITY_HIGH)
+
+        first = jobs.claim('w1')
+        self.assertEqual(first.pk, high.pk)
+        self.assertEqual((first.status, first.attempts, first.locked_by), ('running', 1, 'w1'))
+        self.assertEqual(jobs.claim('w2').pk, low.pk)
+        self.assertIsNone(jobs.claim('w3'))
+
+        # A worker that died leaves its lease to lapse; the job is then claimable again.
+        BackgroundJob.objects.filter(pk=high.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(jobs.claim('w3').pk, high.pk)
+
+    def test_failures_back_off_then_fail(self):
+        job = jobs.enqueue('report_slips', max_attempts=2, job_id='00000000-0000-0000-0000-000000000000')
+        with self.assertLogs('school.services.jobs', 'ERROR'):
+            jobs.run_next('w1')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertIn('DoesNotExist', job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIsNone(jobs.claim('w1'))
+
+        BackgroundJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('school.services.jobs', 'ERROR'):
+            jobs.run_next('w1')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('failed', 2, ''))
+
+    def test_lapsed_lease_on_last_attempt_fails(self):
+        # The worker died mid-job on every attempt: the job is not handed out again.
+        _, job = self._slip_job()
+        BackgroundJob.objects.filter(pk=job.pk).update(
+            status=BackgroundJob.STATUS_RUNNING, attempts=3, locked_by='dead',
+            locked_until=timezone.now() - datetime.timedelta(seconds=1),
+        )
+        self.assertIsNone(jobs.claim('w1'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ('failed', ''))
+        self.assertIn('Lease expired', job.last_error)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_drain_runs_queued_work(self):
+        slip, queued = self._slip_job()
+        call_command('run_workers', '--drain', stdout=StringIO())
+        queued.refresh_from_db()
+        slip.refresh_from_db()
+        self.assertEqual(queued.status, 'done', queued.last_error)
+        self.assertEqual(slip.status, ReportSlipJob.STATUS_DONE)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp(), REPORT_SLIP_WORKERS=2)
+    def test_worker_process_can_run_a_pooled_slip_job(self):
+        # More slips than one chunk, so the job opens its own render pool; that
+        # only works if run_workers' processes are allowed children.
+        for i in range(report_slips.SLIP_CHUNK_SIZE + 1):
+            Student.objects.create(
+                user=make_user(f'pool{i}@school.test', is_student=True), student_id=f'PL{i}',
+                school=self.fx['school'], grade_level=self.fx['grade'], stream=self.fx['stream'], gender='m',
+            )
+        slip, queued = self._slip_job()
+        proc = run_workers.worker(multiprocessing.get_context('spawn'), 0, None, 1)
+        with mock.patch.dict(multiprocessing.current_process()._config, daemon=proc.daemon):
+            jobs.run_next('w1')
+        queued.refresh_from_db()
+        slip.refresh_from_db()
+        self.assertEqual(queued.status, 'done', queued.last_error)
+        self.assertEqual((slip.status, slip.processed), (ReportSlipJob.STATUS_DONE, report_slips.SLIP_CHUNK_SIZE + 2))
+        self.assertEqual(len(PdfReader(slip.file_path).pages), report_slips.SLIP_CHUNK_SIZE + 2)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# SMS DISPATCH TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from school.models import Notification  # noqa: E402
+from school.services import sms  # noqa: E402
+
+
+def _gateway_response(status=200, code=200):
+    response = mock.Mock(status_code=status)
+    response.json.return_value = {'responses': [{'response-code': code, 'response-description': 'Invalid mobile'}]}
+    return response
+
+
+@override_settings(SMS_API_KEY='k', SMS_PARTNERID='p', SMS_SHORTCODE='s', SMS_RATE_PER_SECOND=0)
+class SmsDispatchTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        self.gateway = sms.SmsGateway()
+        patcher = mock.patch.object(sms, '_gateway', self.gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_transient_failures_retry_and_rejections_do_not(self):
+        replies = {'0700000001': [_gateway_response(503), _gateway_response()],
+                   '0700000002': [_gateway_response(code=1004)]}
+
+        def post(url, json, timeout):
+            return replies[json['mobile'].replace('254', '0', 1)].pop(0)
+
+        with mock.patch.object(self.gateway.session, 'post', side_effect=post) as posted, \
+                mock.patch.object(sms, 'BACKOFF_SECONDS', 0):
+            results = sms.send_batch([('a', '0700000001', 'hi'), ('b', '0700000002', 'hi')])
+        self.assertEqual(results, {'a': (True, ''), 'b': (False, 'Invalid mobile')})
+        self.assertEqual(posted.call_count, 3)
+
+    def test_send_notifications_persists_outcome_and_does_not_resend(self):
+        notif = Notification.objects.create(
+            recipient=self.fx['parent_user'], school=self.fx['school'], title='Fees', message='Balance due',
+        )
+        with mock.patch.object(self.gateway.session, 'post', return_value=_gateway_response()) as posted:
+            call_command('send_notifications', stdout=StringIO())
+            call_command('send_notifications', stdout=StringIO())
+        self.assertEqual(posted.call_count, 1)
+        notif.refresh_from_db()
+        self.assertEqual((notif.sms_sent, notif.sms_error, notif.email_sent), (True, '', True))
+        self.assertEqual((notif.locked_by, notif.locked_until), ('', None))
+
+    def test_send_notifications_skips_rows_leased_by_another_run(self):
+        notif = Notification.objects.create(
+            recipient=self.fx['parent_user'], school=self.fx['school'], title='Fees', message='Balance due',
+        )
+        Notification.objects.filter(pk=notif.pk).update(
+            locked_by='other-run', locked_until=timezone.now() + datetime.timedelta(minutes=5),
+        )
+        with mock.patch.object(self.gateway.session, 'post', return_value=_gateway_response()) as posted:
+            call_command('send_notifications', stdout=StringIO())
+        self.assertEqual(posted.call_count, 0)
+
+        # The other run died: once its lease lapses the row is delivered.
+        Notification.objects.filter(pk=notif.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        with mock.patch.object(self.gateway.session, 'post', return_value=_gateway_response()) as posted:
+            call_command('send_notifications', stdout=StringIO())
+        self.assertEqual(posted.call_count, 1)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# BULK NOTIFY CAMPAIGN TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from school.models import NotificationCampaign  # noqa: E402
+
+
+@override_settings(SMS_API_KEY='k', SMS_PARTNERID='p', SMS_SHORTCODE='s', SMS_RATE_PER_SECOND=0)
+class BulkNotifyCampaignTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        self.client.force_login(self.fx['admin_user'])
+        self.gateway = sms.SmsGateway()
+        patcher = mock.patch.object(sms, '_gateway', self.gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, **channels):
+        data = {'title': 'Fees', 'message': 'Balance due', 'audience': 'all'}
+        data.update({f'channel_{c}': 'on' for c, on in channels.items() if on})
+        return self.client.post(reverse('school:bulk-notify'), data)
+
+    def test_post_queues_delivery_and_returns_immediately(self):
+        with mock.patch.object(self.gateway.session, 'post') as posted:
+            r = self._post(inapp=True, sms=True, email=True)
+        campaign = NotificationCampaign.objects.get()
+        self.assertRedirects(r, reverse('school:bulk-notify-campaign', args=[campaign.pk]))
+        posted.assert_not_called()
+        self.assertEqual(campaign.notifications.count(), campaign.total)
+        self.assertEqual(campaign.deliveries.count(), campaign.total)
+        self.assertEqual(campaign.status, NotificationCampaign.STATUS_SENDING)
+        self.assertEqual(BackgroundJob.objects.filter(kind='campaign_delivery').count(), campaign.batches)
+
+        with mock.patch.object(self.gateway.session, 'post', return_value=_gateway_response()):
+            jobs.work(drain=True)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, NotificationCampaign.STATUS_DONE)
+        self.assertEqual(campaign.sms_sent + campaign.sms_failed, campaign.total)
+        self.assertEqual(campaign.email_sent, campaign.total)
+
+        status = self.client.get(reverse('school:bulk-notify-campaign-status', args=[campaign.pk])).json()
+        self.assertEqual((status['status'], status['progress']), ('done', 100))
+        self.assertEqual(self.client.get(reverse('school:bulk-notify-campaign', args=[campaign.pk])).status_code, 200)
+
+    def test_inapp_only_campaign_finishes_without_jobs(self):
+        self._post(inapp=True)
+        campaign = NotificationCampaign.objects.get()
+        self.assertEqual(campaign.status, NotificationCampaign.STATUS_DONE)
+        self.assertFalse(BackgroundJob.objects.exists())
+        self.assertFalse(campaign.notifications.filter(is_read=True).exists())
+
+    def test_sms_only_campaign_stays_out_of_inboxes(self):
+        self._post(sms=True)
+        campaign = NotificationCampaign.objects.get()
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(campaign.deliveries.count(), campaign.total)
+
+    def test_batch_that_fails_for_good_still_finishes_the_campaign(self):
+        self._post(email=True, sms=True)
+        campaign = NotificationCampaign.objects.get()
+        BackgroundJob.objects.filter(kind='campaign_delivery').update(max_attempts=1)
+        with mock.patch.object(self.gateway.session, 'post', return_value=_gateway_response()), \
+                mock.patch('school.services.campaigns.get_connection', side_effect=RuntimeError('smtp down')), \
+                self.assertLogs('school.services.jobs', 'ERROR'):
+            jobs.work(drain=True)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, NotificationCampaign.STATUS_DONE)
+        self.assertEqual((campaign.batches_failed, campaign.batches_done), (campaign.batches, campaign.batches))
+        # The SMS went out before email failed; their outcomes are kept, so a retry would not re-send them.
+        texted = campaign.deliveries.exclude(phone='')
+        self.assertFalse(texted.filter(sms_sent__isnull=True).exists())
+        self.assertEqual(campaign.sms_sent + campaign.sms_failed, texted.count())
+
+    def test_other_school_cannot_view_campaign(self):
+        self._post(inapp=True)
+        campaign = NotificationCampaign.objects.get()
+        self.client.force_login(self.fx['stranger_user'])
+        r = self.client.get(reverse('school:bulk-notify-campaign', args=[campaign.pk]))
+        self.assertEqual(r.status_code, 404)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# ZKTECO INGESTION TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from collections import namedtuple  # noqa: E402
+from school.models import AttendanceDevice, GradeAttendance, ScanLog, SmartID  # noqa: E402
+from school.services import zkteco  # noqa: E402
+
+ZKRecord = namedtuple('ZKRecord', 'user_id timestamp')
+
+
+class FakeZKConnection:
+    """Stands in for a pyzk connection: an append-only attendance log."""
+
+    def __init__(self):
+        self.log, self.downloads, self.records = [], 0, 0
+
+    def scan(self, user_id, at):
+        self.log.append(ZKRecord(user_id, at))
+
+    def read_sizes(self):
+        self.records = len(self.log)
+
+    def get_attendance(self):
+        self.downloads += 1
+        return list(self.log)
+
+    def disconnect(self):
+        pass
+
+
+class ZKTecoIngestTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        SmartID.objects.create(profile=self.fx['student_user'], card_id='C1', user_f18_id='101', school=self.fx['school'])
+        User.objects.filter(pk=self.fx['teacher_user'].pk).update(phone_number='0722222222')
+        SmartID.objects.create(profile=self.fx['teacher_user'], card_id='C2', user_f18_id='102', school=self.fx['school'])
+        self.conn = FakeZKConnection()
+        self.t0 = datetime.datetime(2025, 2, 3, 7, 30)
+
+    def _sync(self, kind=AttendanceDevice.KIND_GATE):
+        device, _ = AttendanceDevice.objects.get_or_create(
+            device_id=kind, defaults=dict(school=self.fx['school'], host='10.0.0.1', location='Main Gate', kind=kind),
+        )
+        return zkteco.DeviceSync(device, zkteco.SmartIDCache(), connect=lambda d: self.conn)
+
+    def test_every_scan_between_polls_is_stored_once(self):
+        sync = self._sync()
+        for i, f18 in enumerate(['101', '102', '999']):
+            self.conn.scan(f18, self.t0 + datetime.timedelta(minutes=i))
+        with self.assertLogs('school.services.zkteco', 'WARNING'):
+            self.assertEqual(len(sync.sync()), 2)
+
+        # Nothing new on the device: the log is not downloaded again.
+        self.assertEqual(sync.sync(), [])
+        self.assertEqual(self.conn.downloads, 1)
+
+        self.conn.scan('101', self.t0 + datetime.timedelta(minutes=5))
+        self.conn.scan('101', self.t0 + datetime.timedelta(minutes=5, seconds=4))  # bounce
+        created = sync.sync()
+        self.assertEqual(len(created), 1)
+        self.assertEqual(ScanLog.objects.count(), 3)
+        self.assertEqual(sync.device.last_synced_at, timezone.make_aware(self.t0 + datetime.timedelta(minutes=5, seconds=4)))
+        self.assertEqual(
+            timezone.localtime(created[0].scanned_at).replace(tzinfo=None), self.t0 + datetime.timedelta(minutes=5),
+        )
+
+        # Re-reading the whole log after a lost mark creates no duplicates.
+        AttendanceDevice.objects.filter(pk=sync.device.pk).update(last_synced_at=None, last_record_count=0)
+        sync.device.refresh_from_db()
+        with self.assertLogs('school.services.zkteco', 'WARNING'):
+            self.assertEqual(sync.sync(), [])
+        self.assertEqual(ScanLog.objects.count(), 3)
+
+    def test_grade_device_marks_students_present(self):
+        sync = self._sync(AttendanceDevice.KIND_GRADE)
+        self.conn.scan('101', self.t0)
+        sync.sync()
+        attendance = GradeAttendance.objects.get()
+        self.assertEqual((attendance.student, attendance.stream, attendance.status), (self.fx['student'], self.fx['stream'], 'P'))
+        self.assertEqual(attendance.scan_log.device_id, AttendanceDevice.KIND_GRADE)
+        self.assertEqual(attendance.recorded_at, attendance.scan_log.scanned_at)
+        self.assertFalse(BackgroundJob.objects.filter(kind='scan_sms').exists())
+
+    def test_gate_scans_are_texted_from_the_job_queue(self):
+        sync = self._sync()
+        # The device's history, read on first contact, is stored but nobody is texted.
+        self.conn.scan('101', self.t0)
+        self.assertEqual(len(sync.sync()), 1)
+        self.assertFalse(BackgroundJob.objects.filter(kind='scan_sms').exists())
+
+        now = timezone.localtime().replace(tzinfo=None, microsecond=0)
+        self.conn.scan('101', now - datetime.timedelta(minutes=2))
+        self.conn.scan('102', now - datetime.timedelta(minutes=1))
+        with mock.patch.object(zkteco, 'send_batch', return_value={}) as send:
+            sync.sync()
+            send.assert_not_called()
+            job = BackgroundJob.objects.get(kind='scan_sms')
+            self.assertEqual(len(job.payload['scan_ids']), 2)
+            jobs.work(drain=True)
+        outbox = send.call_args.args[0]
+        self.assertEqual([phone for _, phone, _ in outbox], ['0711111111', '0722222222'])
+        self.assertIn(f"at Main Gate ({now - datetime.timedelta(minutes=2):%Y-%m-%d %H:%M:%S})", outbox[0][2])
+
+    def test_old_scans_are_not_texted(self):
+        sync = self._sync()
+        self.conn.scan('101', self.t0)
+        sync.sync()
+        self.conn.scan('102', self.t0 + datetime.timedelta(minutes=1))
+        self.assertEqual(len(sync.sync()), 1)
+        self.assertFalse(BackgroundJob.objects.filter(kind='scan_sms').exists())
+
+    def test_polled_and_replayed_records_share_a_scan_id(self):
+        device = self._sync().device
+        local = zkteco.ScanRecord('101', self.t0)
+        utc = zkteco.ScanRecord('101', timezone.make_aware(self.t0).astimezone(datetime.timezone.utc))
+        self.assertEqual(len(zkteco.ingest(device, [local], zkteco.SmartIDCache())), 1)
+        self.assertEqual(zkteco.ingest(device, [utc], zkteco.SmartIDCache(), replay=True), [])
+        self.assertEqual(ScanLog.objects.get().scan_id, 'gate:101:20250203043000')
+
+    def test_card_cache_loads_unknown_ids_in_one_query(self):
+        cache = zkteco.SmartIDCache()
+        with self.assertNumQueries(2):
+            cards = cache.resolve(['101', '102', '999'])
+        self.assertEqual(cards['101'].student_id, self.fx['student'].pk)
+        with self.assertNumQueries(0):
+            cache.resolve(['101', '999'])
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# OFFLINE SCAN SPOOL TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+import os  # noqa: E402
+from json import dumps as json_dumps  # noqa: E402
+import requests  # noqa: E402
+from school.services.scan_spool import ScanSpool, Uploader  # noqa: E402
+
+
+class _ClientSession:
+    """requests.Session look-alike that posts through the Django test client."""
+
+    def __init__(self, client, online=True):
+        self.client, self.online = client, online
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        if not self.online:
+            raise requests.ConnectionError('link down')
+        r = self.client.post(url, data=json_dumps(json), content_type='application/json',
+                             HTTP_X_DEVICE_KEY=(headers or {}).get('X-Device-Key', ''))
+        response = requests.Response()
+        response.status_code, response._content = r.status_code, r.content
+        return response
+
+
+class ScanSpoolTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        SmartID.objects.create(profile=self.fx['student_user'], card_id='C1', user_f18_id='101', school=self.fx['school'])
+        self.device = AttendanceDevice.objects.create(
+            school=self.fx['school'], device_id='gate1', host='10.0.0.1', location='Main Gate', kind='grade',
+        )
+        tmp = tempfile.mkdtemp()
+        self.spool = ScanSpool(os.path.join(tmp, 'scans.db'))
+        self.addCleanup(self.spool.close)
+        self.spool.save_devices([self.device])
+        self.conn = FakeZKConnection()
+        self.sync = zkteco.DeviceSync(self.device, None, connect=lambda d: self.conn, spool=self.spool)
+        self.url = reverse('scan_batch')
+        self.t0 = datetime.datetime(2025, 2, 3, 7, 30)
+
+    def test_scans_survive_an_outage_and_replay_idempotently(self):
+        for i in range(3):
+            self.conn.scan('101', self.t0 + datetime.timedelta(minutes=i))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.sync.sync(), 3)
+            self.assertEqual(self.sync.sync(), 0)
+
+        offline = Uploader(self.spool, self.url, session=_ClientSession(self.client, online=False))
+        with self.assertLogs('school.services.scan_spool', 'WARNING'), self.assertRaises(requests.ConnectionError):
+            offline.upload()
+        self.assertEqual(len(self.spool.pending('gate1')), 3)
+        self.assertFalse(ScanLog.objects.exists())
+
+        self.conn.scan('101', self.t0 + datetime.timedelta(minutes=3))
+        self.assertEqual(self.sync.sync(), 1)
+        online = Uploader(self.spool, self.url, batch_size=2, session=_ClientSession(self.client))
+        self.assertEqual(online.upload(), 4)
+        self.assertEqual(self.spool.pending('gate1'), [])
+        self.assertEqual(ScanLog.objects.filter(device_id='gate1').count(), 4)
+        self.assertEqual(
+            sorted(GradeAttendance.objects.values_list('recorded_at', flat=True)),
+            [timezone.make_aware(self.t0 + datetime.timedelta(minutes=i)) for i in range(4)],
+        )
+
+        # A batch resent after a lost acknowledgement stores nothing twice.
+        self.spool.db.execute('UPDATE records SET uploaded = 0')
+        self.assertEqual(online.upload(), 4)
+        self.assertEqual(ScanLog.objects.count(), 4)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_synced_at, timezone.make_aware(self.t0 + datetime.timedelta(minutes=3)))
+
+    def test_bulk_endpoint_rejects_bad_keys_and_records(self):
+        body = {'device_id': 'gate1', 'records': [{'user_id': '101', 'timestamp': '2025-02-03T07:30:00'}]}
+        r = self.client.post(self.url, body, content_type='application/json', HTTP_X_DEVICE_KEY='wrong')
+        self.assertEqual(r.status_code, 403)
+        body['records'][0]['timestamp'] = 'yesterday'
+        r = self.client.post(self.url, body, content_type='application/json', HTTP_X_DEVICE_KEY=self.device.api_key)
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(ScanLog.objects.exists())
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# STUDENT EXCEL IMPORT TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+import pandas as pd  # noqa: E402
+from school.models import Pathway, SubjectEnrollment  # noqa: E402
+from school.services.student_import import import_students  # noqa: E402
+
+
+class StudentImportTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        Pathway.objects.create(name='S.T.E.M', grade=self.fx['grade'], school=self.fx['school'])
+
+    def _row(self, admin_no, **overrides):
+        row = {
+            'admin_no': admin_no, 'first_name': 'Amina', 'last_name': f'N{admin_no}', 'gender': 'f',
+            'grade': 'grade 7', 'stream': 'a', 'pathway': 'stem', 'date_of_birth': '2012-05-01',
+            'subjects': 'math, xyz', 'parent_phone': '', 'parent_email': '',
+            'parent_first_name': '', 'parent_last_name': '',
+        }
+        row.update(overrides)
+        return row
+
+    def _import(self, rows):
+        results = {"created": 0, "errors": [], "warnings": []}
+        with CaptureQueriesContext(connection) as ctx:
+            import_students(pd.DataFrame(rows).fillna(''), self.fx['school'], results)
+        return results, len(ctx.captured_queries)
+
+    def test_rows_are_imported_with_per_row_errors(self):
+        results, _ = self._import([
+            self._row('1001', parent_phone='0790000001', parent_first_name='Mama'),
+            self._row('1002', parent_phone='0790000001'),          # sibling, same parent
+            self._row('1003', grade='Grade 9'),                    # unknown grade
+            self._row('S001'),                                     # fixture student, different account
+            self._row('1004', parent_phone='0711111111', parent_email='x@y.z'),  # parent already on file
+            self._row('1005', date_of_birth='not a date'),
+            self._row(''),                                         # blank row
+        ])
+        self.assertEqual(results['created'], 3)
+        self.assertEqual(
+            [(e['row'], e['error']) for e in results['errors']],
+            [
+                (4, "Grade 'Grade 9' not found for this school"),
+                (5, "Admission number 'S001' already belongs to another student"),
+                (7, 'Invalid date_of_birth'),
+            ],
+        )
+        self.assertEqual(len(results['warnings']), 4)
+
+        amina = Student.objects.select_related('pathway', 'user').get(student_id='1001')
+        self.assertEqual((amina.stream, amina.pathway.name, amina.user.email), (self.fx['stream'], 'S.T.E.M', '1001@student.school.local'))
+        self.assertEqual(amina.date_of_birth, datetime.date(2012, 5, 1))
+        self.assertTrue(amina.user.is_student)
+        self.assertFalse(amina.user.has_usable_password())
+        parent = Parent.objects.get(phone='0790000001')
+        self.assertEqual(set(parent.children.values_list('student_id', flat=True)), {'1001', '1002'})
+        self.assertIn('1004', self.fx['parent'].children.values_list('student_id', flat=True))
+        self.assertEqual(SubjectEnrollment.objects.filter(subject=self.fx['subject']).count(), 3)
+
+        # Re-importing is an update: nothing is duplicated.
+        results, _ = self._import([self._row('1001', parent_phone='0790000001', pathway='', gender='m')])
+        self.assertEqual((results['created'], results['errors']), (1, []))
+        amina.refresh_from_db()
+        self.assertEqual((amina.pathway, amina.gender), (None, 'M'))
+        self.assertEqual(SubjectEnrollment.objects.filter(student__student_id='1001').count(), 1)
+
+    def test_conflicting_accounts_are_rejected_before_writing(self):
+        make_user('taken@school.test')
+        taken_phone = User.objects.get(email='taken@school.test').phone_number
+        results, _ = self._import([
+            self._row(taken_phone),
+            self._row('2001', parent_phone=taken_phone),
+        ])
+        self.assertEqual(results['created'], 0)
+        self.assertEqual([e['row'] for e in results['errors']], [2, 3])
+        self.assertFalse(Student.objects.filter(student_id__in=[taken_phone, '2001']).exists())
+        self.assertFalse(User.objects.filter(email='2001@student.school.local').exists())
+
+    def test_new_accounts_are_not_hashed(self):
+        with mock.patch('django.contrib.auth.hashers.get_hasher') as get_hasher:
+            results, _ = self._import([self._row(f'5{i:03d}', parent_phone=f'0782000{i:03d}') for i in range(5)])
+        self.assertEqual(results['created'], 5)
+        get_hasher.assert_not_called()
+        users = User.objects.filter(email__endswith='.school.local', phone_number__startswith='5')
+        self.assertEqual(users.count(), 5)
+        self.assertFalse(any(u.has_usable_password() for u in users))
+
+    def test_query_count_does_not_grow_with_the_sheet(self):
+        _, small = self._import([self._row(f'3{i:03d}', parent_phone=f'0780000{i:03d}') for i in range(3)])
+        _, large = self._import([self._row(f'4{i:03d}', parent_phone=f'0781000{i:03d}') for i in range(20)])
+        self.assertEqual(small, large)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# BULK INVOICE GENERATION TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from school.models import FeeType, InvoiceGenerationJob  # noqa: E402
+from school.services.fee_invoices import generate_invoices  # noqa: E402
+
+
+class InvoiceGenerationTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        school, grade = self.fx['school'], self.fx['grade']
+        self.stream_b = Streams.objects.create(name='B', grade=grade, school=school)
+        for i in range(4):
+            Student.objects.create(
+                user=make_user(f'inv{i}@school.test', is_student=True), student_id=f'INV{i}', school=school,
+                grade_level=grade, stream=self.stream_b if i == 3 else self.fx['stream'], gender='f',
+            )
+        self.tuition = self._structure('Tuition', 'Tuition Fees', 5000)
+        self.lunch = self._structure('Lunch', 'Lunch', 1500, stream=self.stream_b)
+
+    def _structure(self, fee_type, description, amount, stream=None):
+        return FeeStructure.objects.create(
+            school=self.fx['school'], grade=self.fx['grade'], term=self.fx['term'], stream=stream,
+            fee_type=FeeType.objects.create(school=self.fx['school'], name=fee_type),
+            description=description, amount=Decimal(amount),
+        )
+
+    def _generate(self, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            counts = generate_invoices(self.fx['school'], self.fx['term'], [self.tuition, self.lunch], **kwargs)
+        return counts, len(ctx.captured_queries)
+
+    def test_invoices_are_planned_and_written_in_bulk(self):
+        paid = make_invoice(self.fx['school'], self.fx['student'], self.fx['term'], amount=4000, paid=4000,
+                            description='Tuition Fees')
+        counts, queries = self._generate(due_date=datetime.date(2025, 2, 1))
+        self.assertEqual(counts, {'total': 6, 'created': 5, 'updated': 0, 'skipped': 1})
+        self.assertLessEqual(queries, 6)
+        invoices = FeeInvoice.objects.filter(school=self.fx['school']).exclude(pk=paid.pk)
+        self.assertEqual(invoices.count(), 5)
+        self.assertEqual(invoices.filter(description='Lunch').get().student.student_id, 'INV3')
+        self.assertEqual({i.status for i in invoices}, {'pending'})
+        self.assertEqual({i.due_date for i in invoices}, {datetime.date(2025, 2, 1)})
+        receipts = set(FeeInvoice.objects.values_list('receipt_number', flat=True))
+        self.assertEqual(len(receipts), 6)
+        self.assertTrue(all(r.startswith('RCP-') for r in receipts))
+
+        # Re-generating updates in place and keeps what was already paid.
+        self.tuition.amount = Decimal('6000')
+        self.tuition.save()
+        counts, _ = self._generate(overwrite=True)
+        self.assertEqual(counts, {'total': 6, 'created': 0, 'updated': 6, 'skipped': 0})
+        paid.refresh_from_db()
+        self.assertEqual((paid.amount_required, paid.amount_paid, paid.status), (Decimal('6000'), Decimal('4000'), 'partial'))
+        self.assertEqual(FeeInvoice.objects.count(), 6)
+
+    def test_query_count_does_not_grow_with_students(self):
+        _, small = self._generate()
+        FeeInvoice.objects.all().delete()
+        for i in range(20):
+            Student.objects.create(
+                user=make_user(f'more{i}@school.test', is_student=True), student_id=f'MORE{i}',
+                school=self.fx['school'], grade_level=self.fx['grade'], stream=self.fx['stream'], gender='m',
+            )
+        counts, large = self._generate()
+        self.assertEqual(counts['created'], 26)
+        self.assertEqual(small, large)
+
+    def test_web_trigger_runs_as_a_job(self):
+        self.client.force_login(self.fx['admin_user'])
+        r = self.client.post(
+            reverse('school:bulk-generate-invoices', args=[self.fx['term'].pk]),
+            {'fee_structures': [self.tuition.pk, self.lunch.pk], 'due_date': ''},
+        )
+        job = InvoiceGenerationJob.objects.get()
+        self.assertRedirects(r, reverse('school:invoice-job-progress', args=[job.pk]))
+        self.assertFalse(FeeInvoice.objects.exists())
+        self.assertEqual(BackgroundJob.objects.get().kind, 'fee_invoices')
+
+        jobs.run_next('test-worker')
+        status = self.client.get(reverse('school:invoice-job-status', args=[job.pk])).json()
+        self.assertEqual(
+            (status['status'], status['progress'], status['created'], status['skipped']), ('done', 100, 6, 0),
+        )
+        self.assertEqual(FeeInvoice.objects.count(), 6)
+
+        self.client.force_login(self.fx['stranger_user'])
+        r = self.client.get(reverse('school:invoice-job-status', args=[job.pk]))
+        self.assertNotEqual(r.status_code, 200)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# PAYMENT RECONCILIATION TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from school.models import Payment, PaymentStatement  # noqa: E402
+from school.services.reconciliation import plan_statement, post_statement, read_statement  # noqa: E402
+
+MPESA_EXPORT = (
+    'Paybill Statement,,,,,\n'
+    'Period: 01/01/2025 - 31/01/2025,,,,,\n'
+    'Receipt No.,Completion Time,Details,Paid In,A/C No.,Other Party Info\n'
+    'QAB1,15/01/2025 10:22:33,Fees,"4,000.00",s001,254700000001 - MAMA\n'
+    'QAB2,15/01/2025 11:00:00,Fees,500,,254711111111 - PARENT\n'
+    'QAB1,15/01/2025 10:22:33,Fees,4000,S001,254700000001 - MAMA\n'
+    'QAB3,16/01/2025 09:00:00,Fees,300,NOPE,\n'
+    'QAB4,16/01/2025 09:30:00,Fees,abc,S001,\n'
+    'OLD1,16/01/2025 09:45:00,Fees,100,S001,\n'
+)
+
+
+class PaymentReconciliationTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        school, student, term = self.fx['school'], self.fx['student'], self.fx['term']
+        self.older = make_invoice(school, student, term, amount=3000, description='Tuition')
+        self.newer = make_invoice(school, student, term, amount=2000, description='Lunch')
+        Payment.objects.create(student=student, school=school, amount=Decimal('100'), payment_type='fees',
+                               status='paid', transaction_id='OLD1')
+
+    def _statement(self, content=MPESA_EXPORT, name='mpesa.csv'):
+        return PaymentStatement.objects.create(
+            school=self.fx['school'], term=self.fx['term'], uploaded_by=self.fx['admin_user'],
+            filename=name, default_method='mpesa', rows=read_statement(BytesIO(content.encode()), name),
+        )
+
+    def test_statement_rows_are_read_past_the_title_lines(self):
+        rows = read_statement(BytesIO(MPESA_EXPORT.encode()), 'mpesa.csv')
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(
+            (rows[0]['row'], rows[0]['reference'], rows[0]['student_ref'], rows[0]['amount']),
+            (4, 'QAB1', 's001', '4000.00'),
+        )
+        self.assertTrue(rows[0]['paid_at'].startswith('2025-01-15T10:22:33'))
+        self.assertEqual(rows[4]['error'], 'Amount is missing or not a positive number')
+
+    def test_plan_matches_allocates_and_flags_duplicates(self):
+        plan = plan_statement(self._statement())
+        self.assertEqual(plan['counts'], {'ok': 2, 'duplicate': 2, 'unmatched': 1, 'invalid': 1})
+        by_ref = {row['reference']: row for row in reversed(plan['rows'])}  # first row per reference
+        self.assertEqual(
+            [(inv.pk, share) for inv, share in by_ref['QAB1']['allocations']],
+            [(self.older.pk, Decimal('3000')), (self.newer.pk, Decimal('1000'))],
+        )
+        self.assertEqual(by_ref['QAB2']['student'][1], 'S001')  # matched through the parent's phone
+        self.assertEqual(by_ref['QAB2']['credit'], Decimal('0'))
+        self.assertEqual(
+            [row['status'] for row in plan['rows'] if row['reference'] in ('QAB1', 'OLD1')],
+            ['ok', 'duplicate', 'duplicate'],
+        )
+        self.assertFalse(Payment.objects.filter(transaction_id='QAB1').exists())
+
+    def test_post_writes_in_bulk_once(self):
+        statement = self._statement()
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            summary = post_statement(statement, self.fx['admin_user'])
+        self.assertLessEqual(len(ctx.captured_queries), 15)
+        self.assertEqual((summary['ok'], summary['total']), (2, '4500.00'))
+        self.older.refresh_from_db()
+        self.newer.refresh_from_db()
+        self.assertEqual((self.older.status, self.older.payment_method), ('paid', 'mpesa'))
+        self.assertEqual((self.newer.amount_paid, self.newer.status), (Decimal('1500'), 'partial'))
+        self.assertEqual(
+            set(Payment.objects.filter(transaction_id__startswith='QAB').values_list('transaction_id', flat=True)),
+            {'QAB1', 'QAB2'},
+        )
+        self.assertEqual(AuditLog.objects.filter(model_name='Payment', actor=self.fx['admin_user']).count(), 2)
+        with self.assertRaises(ValueError):
+            post_statement(statement)
+
+        # Overpayments become a paid credit invoice.
+        statement = self._statement('student_id,amount,reference\nS001,900,QAB9\n', 'extra.csv')
+        post_statement(statement)
+        credit = FeeInvoice.objects.get(description='Fee Payment (Uploaded)')
+        self.assertEqual((credit.amount_paid, credit.status), (Decimal('400'), 'paid'))
+        self.assertTrue(credit.receipt_number.startswith('RCP-'))
+
+    def test_upload_preview_and_confirm(self):
+        self.client.force_login(self.fx['admin_user'])
+        upload = SimpleUploadedFile('mpesa.csv', MPESA_EXPORT.encode(), content_type='text/csv')
+        r = self.client.post(reverse('school:fee-payment-upload'), {
+            'term': self.fx['term'].pk, 'file': upload, 'payment_method': 'mpesa',
+        })
+        statement = PaymentStatement.objects.get()
+        self.assertRedirects(r, reverse('school:fee-payment-reconcile', args=[statement.pk]))
+        r = self.client.get(reverse('school:fee-payment-reconcile', args=[statement.pk]))
+        self.assertEqual(r.context['plan']['counts']['ok'], 2)
+        self.assertFalse(Payment.objects.filter(transaction_id='QAB1').exists())
+
+        r = self.client.post(reverse('school:fee-payment-reconcile', args=[statement.pk]), {'action': 'confirm'})
+        self.assertRedirects(r, reverse('school:finance-dashboard'), fetch_redirect_response=False)
+        statement.refresh_from_db()
+        self.assertEqual(statement.status, PaymentStatement.STATUS_POSTED)
+        self.assertTrue(Payment.objects.filter(transaction_id='QAB1').exists())
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# FEE COLLECTION REPORT TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from rest_framework.test import APIClient  # noqa: E402
+from school.services.finance_reports import collection_report  # noqa: E402
+
+
+class CollectionReportTest(TestCase):
+
+    def setUp(self):
+        self.fx = build_school_fixture()
+        school, term = self.fx['school'], self.fx['term']
+        self.stream_b = Streams.objects.create(name='B', grade=self.fx['grade'], school=school)
+        self.grade8 = Grade.objects.create(name='Grade 8', school=school, code='G8')
+        Streams.objects.create(name='East', grade=self.grade8, school=school)
+        other = Student.objects.create(
+            user=make_user('coll@school.test', is_student=True), student_id='C001', school=school,
+            grade_level=self.fx['grade'], stream=self.stream_b, gender='f',
+        )
+        make_invoice(school, self.fx['student'], term, amount=5000, paid=3000)
+        make_invoice(school, self.fx['student'], term, amount=1000, paid=1000, description='Lunch')
+        make_invoice(school, other, term, amount=4000, paid=0)
+
+    def _report(self):
+        with CaptureQueriesContext(connection) as ctx:
+            report = collection_report(self.fx['school'], self.fx['term'])
+        return report, len(ctx.captured_queries)
+
+    def test_grouped_totals_roll_up(self):
+        report, _ = self._report()
+        self.assertEqual([g['grade'].name for g in report['grades']], ['Grade 7', 'Grade 8'])
+        grade7 = report['grades'][0]
+        self.assertEqual(
+            [(s['stream'].name, s['students'], s['expected'], s['collected']) for s in grade7['streams']],
+            [('A', 1, Decimal('6000'), Decimal('4000')), ('B', 1, Decimal('4000'), Decimal('0'))],
+        )
+        self.assertEqual((grade7['students'], grade7['balance'], grade7['rate']), (2, Decimal('6000'), 40.0))
+        self.assertEqual(report['grades'][1]['streams'][0]['expected'], Decimal('0'))
+        self.assertEqual((report['expected'], report['collected'], report['rate']), (Decimal('10000'), Decimal('4000'), 40.0))
+
+    def test_snapshot_is_cached_until_an_invoice_changes(self):
+        _, cold = self._report()
+        _, warm = self._report()
+        self.assertLess(warm, cold)
+        for i in range(5):
+            Streams.objects.create(name=f'X{i}', grade=self.grade8, school=self.fx['school'])
+        _, more_streams = self._report()
+        self.assertEqual(more_streams, warm)
+
+        invoice = FeeInvoice.objects.get(student__student_id='C001')
+        invoice.amount_paid = Decimal('4000')
+        invoice.save()
+        report, _ = self._report()
+        self.assertEqual(report['collected'], Decimal('8000'))
+
+    def test_web_csv_and_api_agree(self):
+        self.client.force_login(self.fx['admin_user'])
+        r = self.client.get(reverse('school:finance-collection-report'), {'term': self.fx['term'].pk})
+        self.assertEqual((r.context['school_expected'], r.context['school_rate']), (Decimal('10000'), 40.0))
+        r = self.client.get(reverse('school:finance-collection-report-csv'), {'term': self.fx['term'].pk})
+        lines = r.content.decode().splitlines()
+        rows = [line.split(',') for line in lines]
+        self.assertIn(['Grade 7', 'B', '1', 4000.0, 0.0, 4000.0, 0.0], [r[:3] + [float(v) for v in r[3:]] for r in rows[1:3]])
+        self.assertEqual(rows[-1][0], 'SCHOOL TOTAL')
+        self.assertEqual([float(v) for v in rows[-1][3:]], [10000.0, 4000.0, 6000.0, 40.0])
+
+        api = APIClient()
+        api.force_authenticate(self.fx['admin_user'])
+        data = api.get(reverse('fee_collection_report'), {'term_id': self.fx['term'].pk}).json()
+        self.assertEqual((data['total_invoiced'], data['total_collected'], data['collection_rate']), (10000.0, 4000.0, 40.0))
+        self.assertEqual(data['by_grade'][0], {
+            'grade': 'Grade 7', 'total_students': 2, 'total_invoiced': 10000.0, 'total_collected': 4000.0,
+        })
+        self.assertEqual(sum(s['count'] for s in data['by_status']), 3)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# PER-REQUEST USER CONTEXT TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from django.core.cache import cache  # noqa: E402
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+from api import views as api_views  # noqa: E402
+from school.services.user_context import user_context  # noqa: E402
+from school.views import get_user_school  # noqa: E402
+
+
+class UserContextTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.fx = build_school_fixture()
+
+    def _fresh(self, key):
+        return User.objects.get(pk=self.fx[key].pk)
+
+    def test_profiles_load_in_one_query_per_request(self):
+        user = self._fresh('admin_user')
+        with CaptureQueriesContext(connection) as ctx:
+            context = user_context(user)
+            self.assertEqual(get_user_school(user), self.fx['school'])
+            self.assertEqual(api_views.get_user_school(user), self.fx['school'])
+            self.assertEqual(api_views.get_user_role(user), 'principal')
+            self.assertEqual(user.staffprofile.school.name, 'Test High School')
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual((context.role, context.admin_school), ('principal', self.fx['school']))
+
+        parent = self._fresh('parent_user')
+        self.assertEqual(api_views.get_user_school(parent), self.fx['school'])
+        self.assertIsNone(get_user_school(parent))  # web views stay staff-only
+
+    def test_cached_between_requests_until_the_profile_changes(self):
+        user_context(self._fresh('teacher_user'))
+        user = self._fresh('teacher_user')
+        with self.assertNumQueries(0):
+            self.assertEqual(user_context(user).school, self.fx['school'])
+
+        other = School.objects.create(
+            name='Other School', code='OTH001', school_admin=make_user('oth@school.test', is_admin=True),
+            county=self.fx['school'].county,
+        )
+        staff = self.fx['teacher_user'].staffprofile
+        staff.school = other
+        staff.save()
+        self.assertEqual(user_context(self._fresh('teacher_user')).school, other)
+
+    def test_attached_to_web_and_api_requests(self):
+        self.client.force_login(self.fx['teacher_user'])
+        response = self.client.get(reverse('school:dashboard'))
+        self.assertEqual(response.wsgi_request.school_context.role, 'teacher')
+
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.fx['student_user']).access_token}")
+        response = api.get(reverse('fee_collection_report'))
+        context = response.wsgi_request.school_context
+        self.assertEqual((context.role, context.school, context.student), ('student', self.fx['school'], self.fx['student']))
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# WEEKLY TIMETABLE API TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from api.serializers import StudentTimetableSerializer  # noqa: E402
+from school.services.lesson_patterns import materialise  # noqa: E402
+
+
+class WeeklyTimetableTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.fx = build_school_fixture()
+        school, term = self.fx['school'], self.fx['term']
+        Term.objects.filter(pk=term.pk).update(is_active=True)
+        self.slots = make_time_slots(school, count=3)
+        self.timetable = make_timetable(school, self.fx['stream'], term)
+        for day, slot in (('monday', 0), ('monday', 2), ('wednesday', 1)):
+            LessonPattern.objects.create(
+                school=school, timetable=self.timetable, term=term, stream=self.fx['stream'],
+                subject=self.fx['subject'], teacher=self.fx['staff'], day_of_week=day, time_slot=self.slots[slot],
+            )
+        # A dated occurrence of a pattern is not a second weekly lesson.
+        materialise(LessonPattern.objects.first(), datetime.date(2025, 1, 6))
+
+    def test_teacher_week_grid(self):
+        api = APIClient()
+        api.force_authenticate(self.fx['teacher_user'])
+        schedule = api.get(reverse('teacher_timetable', args=['T001'])).json()['schedule']
+        self.assertEqual(list(schedule), ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'])
+        self.assertEqual(schedule['Monday'], [
+            {'timeSlot': '08-00-08-40', 'subject': 'Mathematics', 'subjectCode': 'MATH', 'class': 'A'},
+            {'timeSlot': '09-00-09-40', 'subject': '', 'subjectCode': '', 'class': ''},
+            {'timeSlot': '10-00-10-40', 'subject': 'Mathematics', 'subjectCode': 'MATH', 'class': 'A'},
+        ])
+        self.assertEqual([row['subject'] for row in schedule['Tuesday']], ['', '', ''])
+
+    def test_cached_until_the_timetable_changes(self):
+        student = Student.objects.select_related('school', 'stream', 'grade_level', 'user').get(pk=self.fx['student'].pk)
+        StudentTimetableSerializer(student).data
+        with self.assertNumQueries(4):  # the active term and the three stamp aggregates
+            schedule = StudentTimetableSerializer(student).data['schedule']
+        self.assertEqual(schedule['Wednesday'][1]['subjectName'], 'Mathematics')
+
+        # bulk_create sends no signals; the stamp still moves.
+        LessonPattern.objects.bulk_create([LessonPattern(
+            school=self.fx['school'], timetable=self.timetable, term=self.fx['term'], stream=self.fx['stream'],
+            subject=self.fx['subject'], teacher=self.fx['staff'], day_of_week='friday', time_slot=self.slots[0],
+        )])
+        schedule = StudentTimetableSerializer(student).data['schedule']
+        self.assertEqual(schedule['Friday'][0]['subjectName'], 'Mathematics')
+
+        LessonPattern.objects.filter(day_of_week='wednesday').get().delete()
+        schedule = StudentTimetableSerializer(student).data['schedule']
+        self.assertEqual([row['subject'] for row in schedule['Wednesday']], ['', '', ''])
+
+        TimeSlot.objects.create(school=self.fx['school'], start_time=datetime.time(14, 0), end_time=datetime.time(14, 40))
+        schedule = StudentTimetableSerializer(student).data['schedule']
+        self.assertEqual(len(schedule['Friday']), 4)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# STUDENT STATS API TESTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+from school.models import Assignment, Submission, DisciplineRecord  # noqa: E402
+
+
+class StudentStatsTest(TestCase):
+
+    def setUp(self):
+        fx = self.fx = build_school_fixture()
+        school, term, student = fx['school'], fx['term'], fx['student']
+        english = Subject.objects.create(name='English', code='ENG', school=school, start_date=term.start_date)
+        fx['staff'].subjects.add(fx['subject'])
+        User.objects.filter(pk=fx['teacher_user'].pk).update(first_name='Jane', last_name='Otieno')
+        User.objects.filter(pk=fx['student_user'].pk).update(first_name='Amani', last_name='Kamau')
+        for subject in (fx['subject'], english):
+            SubjectEnrollment.objects.create(student=student, subject=subject)
+
+        lesson = Lesson.objects.create(
+            timetable=make_timetable(school, fx['stream'], term), subject=fx['subject'], stream=fx['stream'],
+            teacher=fx['staff'], day_of_week='monday', lesson_date=datetime.date(2025, 1, 6),
+        )
+        enrollment = Enrollment.objects.create(student=student, lesson=lesson, school=school)
+        for day, code in ((6, 'P'), (13, 'UA'), (20, 'P')):
+            Attendance.objects.create(
+                enrollment=enrollment, date=datetime.date(2025, 1, day), status=code, term=term, marked_by=fx['staff'],
+            )
+
+        due = timezone.make_aware(datetime.datetime(2025, 2, 1))
+        marked, missed, unmarked = (
+            Assignment.objects.create(subject=subject, school=school, title=title, description='-', due_date=due)
+            for subject, title in ((fx['subject'], 'A1'), (fx['subject'], 'A2'), (english, 'E1'))
+        )
+        Submission.objects.create(enrollment=enrollment, assignment=marked, school=school, score=85)
+        Submission.objects.create(enrollment=enrollment, assignment=unmarked, school=school)
+
+        for severity, day in (('minor', 7), ('major', 14)):
+            DisciplineRecord.objects.create(
+                student=student, teacher=fx['staff'], school=school, description='-', severity=severity,
+                date=datetime.date(2025, 1, day), reported_by=fx['admin_user'],
+            )
+
+        classmate = Student.objects.create(
+            user=make_user('mate@school.test', is_student=True), student_id='S002', school=school,
+            grade_level=fx['grade'], stream=fx['stream'], gender='f',
+        )
+        session = make_session(school, fx['grade'], term, published=True)
+        make_result(session, student, fx['subject'], fx['stream'], school, exam=45)
+        make_result(session, classmate, fx['subject'], fx['stream'], school, exam=20)
+
+    def test_stats_blocks(self):
+        api = APIClient()
+        api.force_authenticate(self.fx['parent_user'])
+        with CaptureQueriesContext(connection) as ctx:
+            data = api.get(reverse('student_stats', args=['S001'])).json()
+        self.assertLess(len(ctx.captured_queries), 20)
+
+        self.assertEqual(data['attendance'], {
+            'totalDays': 3, 'presentDays': 2, 'absentDays': 1, 'attendanceRate': 66.7,
+            'recentAbsences': 0, 'lastAbsenceDate': '2025-01-13',
+        })
+        self.assertEqual(data['assignments'], {
+            'total': 3, 'completed': 1, 'pending': 1, 'overdue': 1, 'completionRate': 33.3, 'averageScore': 85.0,
+        })
+        self.assertEqual(
+            (data['discipline']['totalRecords'], data['discipline']['lowSeverity'], data['discipline']['highSeverity']),
+            (2, 1, 1),
+        )
+        self.assertEqual(data['grades']['subjects'], [
+            {'subject': 'English', 'grade': 0.0, 'gradeLetter': 'Pending', 'teacher': 'TBD', 'status': 'pending'},
+            {'subject': 'Mathematics', 'grade': 85.0, 'gradeLetter': 'B+', 'teacher': 'Jane Otieno', 'status': 'graded'},
+        ])
+        self.assertEqual(data['grades']['average'], 85.0)
+        self.assertEqual(data['performance'], {
+            'trend': 'needs improvement', 'rankInClass': 1, 'totalStudentsInClass': 2, 'percentile': 100,
+        })
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PARENT SUMMARY
+# ═══════════════════════════════════════════════════════════════════════════════
+
+from school.models import Payment  # noqa: E402
+from school.services.parent_summary import build_summary, parent_summary  # noqa: E402
+
+
+class ParentSummaryTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        fx = self.fx = build_school_fixture()
+        school, term = fx['school'], fx['term']
+        self.children = [fx['student']]
+        for n in (2, 3):
+            child = Student.objects.create(
+                user=make_user(f'child{n}@school.test', is_student=True), student_id=f'S00{n}', school=school,
+                grade_level=fx['grade'], stream=fx['stream'], gender='f',
+            )
+            fx['parent'].children.add(child)
+            self.children.append(child)
+
+        lesson = Lesson.objects.create(
+            timetable=make_timetable(school, fx['stream'], term), subject=fx['subject'], stream=fx['stream'],
+            teacher=fx['staff'], day_of_week='monday', lesson_date=datetime.date(2025, 1, 6),
+        )
+        for child, codes in zip(self.children, (('P', 'P', 'UA'), ('P',), ())):
+            enrollment = Enrollment.objects.create(student=child, lesson=lesson, school=school)
+            for day, code in enumerate(codes, start=6):
+                Attendance.objects.create(
+                    enrollment=enrollment, date=datetime.date(2025, 1, day), status=code, term=term,
+                    marked_by=fx['staff'],
+                )
+        make_invoice(school, fx['student'], term, amount=5000, paid=2000)
+        make_invoice(school, self.children[1], term, amount=3000, paid=3000)
+        for n in range(7):
+            Payment.objects.create(
+                school=school, student=fx['student'], amount=Decimal('100'), payment_type='cash',
+                status='completed', transaction_id=f'TX{n}', paid_at=timezone.now() - datetime.timedelta(days=n),
+            )
+        DisciplineRecord.objects.create(
+            student=self.children[1], teacher=fx['staff'], school=school, description='-', severity='minor',
+            date=datetime.date(2025, 1, 7), reported_by=fx['admin_user'],
+        )
+
+    def _students(self, count):
+        return Student.objects.filter(pk__in=[c.pk for c in self.children[:count]]).select_related(
+            'user', 'grade_level', 'stream', 'school',
+        ).order_by('pk')
+
+    def test_per_child_figures(self):
+        summary = build_summary(self._students(3))
+        first, second, third = summary['children']
+        self.assertEqual((first['total_att'], first['present_att'], first['absent_att'], first['att_rate']), (3, 2, 1, 66))
+        self.assertEqual((second['att_rate'], third['total_att']), (100, 0))
+        self.assertEqual(first['fee_balance'], Decimal('3000'))
+        self.assertEqual(summary['total_balance'], Decimal('3000'))
+        self.assertEqual((first['status_label'], second['status_label']), ('Fee balance', 'Active'))
+        self.assertEqual(second['discipline_count'], 1)
+        self.assertEqual([p.transaction_id for p in first['recent_payments']], ['TX0', 'TX1', 'TX2', 'TX3', 'TX4'])
+        self.assertEqual(first['active_term'], Term.objects.filter(school=self.fx['school'], is_active=True).first())
+
+    def test_query_count_does_not_grow_with_children(self):
+        with CaptureQueriesContext(connection) as one:
+            build_summary(self._students(1))
+        with CaptureQueriesContext(connection) as three:
+            build_summary(self._students(3))
+        self.assertEqual(len(one.captured_queries), len(three.captured_queries))
+
+    def test_cached_per_parent(self):
+        parent = self.fx['parent']
+        parent_summary(parent)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(parent_summary(parent)['children']), 3)
+
+    def test_dashboard_and_api(self):
+        client = Client()
+        client.force_login(self.fx['parent_user'])
+        for name in ('school:parent-dashboard', 'userauths:parent-dashboard'):
+            response = client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['child_data']), 3)
+
+        api = APIClient()
+        api.force_authenticate(self.fx['parent_user'])
+        children = api.get(reverse('parent_children')).json()
+        self.assertEqual([c['childId'] for c in children], ['S001', 'S002', 'S003'])
+        stats = api.get(reverse('parent_stats')).json()
+        self.assertEqual(len(stats['children']), 3)
+        self.assertEqual(stats['children'][0]['attendance']['totalDays'], 3)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# API PAGINATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+from api.pagination import parse_since  # noqa: E402
+from school.services.attendance import record_attendance  # noqa: E402
+
+
+class ApiPaginationTest(TestCase):
+
+    def setUp(self):
+        fx = self.fx = build_school_fixture()
+        school, term = fx['school'], fx['term']
+        lesson = Lesson.objects.create(
+            timetable=make_timetable(school, fx['stream'], term), subject=fx['subject'], stream=fx['stream'],
+            teacher=fx['staff'], day_of_week='monday', lesson_date=datetime.date(2025, 1, 6),
+        )
+        self.enrollment = Enrollment.objects.create(student=fx['student'], lesson=lesson, school=school)
+        Attendance.objects.bulk_create([
+            Attendance(enrollment=self.enrollment, date=datetime.date(2025, 1, 1) + datetime.timedelta(days=n),
+                       status='P', term=term, marked_by=fx['staff'])
+            for n in range(25)
+        ])
+        self.api = APIClient()
+        self.api.force_authenticate(fx['admin_user'])
+
+    def test_cursor_pages(self):
+        url = reverse('attendance_records')
+        with CaptureQueriesContext(connection) as ctx:
+            first = self.api.get(url).json()
+        self.assertFalse(any('COUNT(' in q['sql'] or 'OFFSET' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(len(first['results']), 20)
+        self.assertIsNone(first['previous'])
+        second = self.api.get(first['next']).json()
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next'])
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(ids, sorted(Attendance.objects.values_list('id', flat=True), reverse=True))
+
+        small = self.api.get(url, {'page_size': 10}).json()
+        self.assertEqual(len(small['results']), 10)
+
+    def test_sparse_fields(self):
+        url = reverse('attendance_records')
+        rows = self.api.get(url, {'fields': 'id,status'}).json()['results']
+        self.assertEqual(set(rows[0]), {'id', 'status'})
+        response = self.api.get(url, {'fields': 'id,nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nope', response.json()['error'])
+
+    def test_since_returns_changes_oldest_first(self):
+        old = timezone.now() - datetime.timedelta(days=2)
+        Attendance.objects.update(updated_at=old)
+        changed = Attendance.objects.order_by('pk')[3]
+        record_attendance([(self.enrollment, 'UA', None)], changed.date, marked_by=self.fx['staff'])
+        Student.objects.filter(pk=self.fx['student'].pk).update(updated_at=old)
+
+        since = (old + datetime.timedelta(hours=1)).isoformat()
+        rows = self.api.get(reverse('attendance_records'), {'since': since}).json()['results']
+        self.assertEqual([(row['id'], row['status']) for row in rows], [(changed.pk, 'UA')])
+        students = self.api.get(reverse('school_students'), {'since': since}).json()['results']
+        self.assertEqual(students, [])
+
+        self.assertEqual(self.api.get(reverse('attendance_records'), {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.api.get(reverse('assignments'), {'since': since}).status_code, 400)
+
+    def test_since_includes_backdated_rows_written_later(self):
+        # A replayed scan backlog lands after the client's last sync but carries its old scan time.
+        url = reverse('stream_attendance', args=[self.fx['stream'].pk])
+        since = timezone.now() - datetime.timedelta(seconds=1)
+        replayed = GradeAttendance.objects.create(
+            student=self.fx['student'], stream=self.fx['stream'], status='P',
+            recorded_at=timezone.now() - datetime.timedelta(days=2),
+        )
+        self.api.force_authenticate(self.fx['teacher_user'])  # the stream view has no principal role
+        response = self.api.get(url, {'since': since.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']], [replayed.pk])
+
+    def test_parse_since(self):
+        self.assertEqual(parse_since('2025-01-06'), timezone.make_aware(datetime.datetime(2025, 1, 6)))
+        self.assertIsNotNone(parse_since('2025-01-06T10:00:00+03:00'))
+        self.assertIsNone(parse_since('2025-13-40'))
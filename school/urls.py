@@ -103,6 +103,7 @@ urlpatterns = [
     path('timetables/<int:pk>/edit/', views.timetable_edit, name='timetable-edit'),
     path('timetables/<int:pk>/delete/', views.timetable_delete, name='timetable-delete'),
     path('attendance/<int:lesson_id>/', views.lesson_attendance, name='lesson-attendance'),
+    path('attendance/pattern/<int:pattern_id>/<str:lesson_date>/', views.lesson_pattern_attendance, name='lesson-pattern-attendance'),
     path("lessons/<int:lesson_id>/edit/", views.lesson_edit, name="lesson-edit"),
     
     # Lessons Management
@@ -156,6 +157,7 @@ urlpatterns = [
     path('teacher/attendance/', views.teacher_attendance, name='teacher-attendance'),
     path('teacher/attendance/summary/', views.teacher_attendance_summary, name='teacher-attendance-summary'),
     path('teacher/attendance/<int:lesson_id>/mark/', views.teacher_attendance_mark, name='teacher-attendance-mark'),
+    path('teacher/attendance/pattern/<int:pattern_id>/<str:lesson_date>/mark/', views.teacher_pattern_attendance_mark, name='teacher-pattern-attendance-mark'),
     path('teacher/attendance/<int:attendance_id>/edit/', views.teacher_attendance_edit, name='teacher-attendance-edit'),
     path('teacher/attendance/<int:attendance_id>/delete/', views.teacher_attendance_delete, name='teacher-attendance-delete'),
     path('teacher/attendance/<int:stream_id>/class/', views.teacher_class_attendance_report, name='teacher-class-attendance-report'),
@@ -238,6 +240,10 @@ urlpatterns = [
     path('exams/<int:session_pk>/entry/<int:stream_pk>/<int:subject_pk>/', views.exam_result_entry, name='exam-result-entry'),
     path('exams/<int:session_pk>/slip/<int:student_pk>/', views.report_slip_html, name='report-slip-html'),
     path('exams/<int:session_pk>/slip/<int:student_pk>/pdf/', views.report_slip_pdf, name='report-slip-pdf'),
+    path('exams/<int:session_pk>/slips/batch/', views.report_slip_batch, name='report-slip-batch'),
+    path('exams/slips/job/<uuid:job_pk>/', views.report_slip_job_progress, name='report-slip-job-progress'),
+    path('exams/slips/job/<uuid:job_pk>/status/', views.report_slip_job_status, name='report-slip-job-status'),
+    path('exams/slips/job/<uuid:job_pk>/download/', views.report_slip_job_download, name='report-slip-job-download'),
     path('student/exam-results/', views.student_exam_results, name='student-exam-results'),
     path("teacher/attendance/<int:lesson_id>/smart/", views.teacher_attendance_smart, name="teacher-attendance-smart"),
     path("teacher/discipline/create/ajax/", views.teacher_discipline_create_ajax, name="teacher-discipline-create-ajax"),
@@ -283,6 +289,8 @@ urlpatterns = [
 
     # Bulk notifications
     path('notifications/bulk/', views.bulk_notify, name='bulk-notify'),
+    path('notifications/bulk/<int:pk>/', views.bulk_notify_campaign, name='bulk-notify-campaign'),
+    path('notifications/bulk/<int:pk>/status/', views.bulk_notify_campaign_status, name='bulk-notify-campaign-status'),
 
     # Student notifications (in-app)
     path('student/notifications/', views.student_notifications, name='student-notifications'),
@@ -310,9 +318,12 @@ urlpatterns = [
     path('fee-structures/<int:pk>/edit/', views.fee_structure_edit, name='fee-structure-edit'),
     path('fee-structures/<int:pk>/delete/', views.fee_structure_delete, name='fee-structure-delete'),
     path('fee-structures/generate/<int:term_id>/', views.bulk_generate_invoices, name='bulk-generate-invoices'),
+    path('fee-structures/generate/job/<uuid:job_pk>/', views.invoice_job_progress, name='invoice-job-progress'),
+    path('fee-structures/generate/job/<uuid:job_pk>/status/', views.invoice_job_status, name='invoice-job-status'),
 
     # Payment upload & reports
     path('finance/payment-upload/', views.fee_payment_upload, name='fee-payment-upload'),
+    path('finance/payment-upload/<uuid:pk>/', views.fee_payment_reconcile, name='fee-payment-reconcile'),
     path('finance/statement/<int:student_pk>/', views.student_fee_statement, name='student-fee-statement'),
     path('finance/statement/<int:student_pk>/pdf/', views.student_fee_statement_pdf, name='student-fee-statement-pdf'),
     path('finance/payment-statement/', views.finance_payment_statement, name='finance-payment-statement'),
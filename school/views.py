@@ -29,9 +29,26 @@ from django.db.models.functions import Lower
 import string
 from django.utils.dateparse import parse_date
 import datetime
-import threading
 from datetime import timedelta,date
-from .services.timetable_generator import generate_for_stream
+from .services.timetable_generator import generate_for_school
+from .services.enrollments import bulk_enroll, bulk_enroll_patterns, subject_enrollment_pairs
+from .services.lesson_patterns import (
+    lesson_enrollments, materialise, occurrences, unmarked_occurrences, weekly_lesson_count,
+)
+from .services.attendance import record_attendance
+from .services.student_import import import_students
+from .services.attendance_rollup import rollups_for, status_counts, summarize
+from .services.exam_ranking import rank_students, student_positions
+from .services.report_slips import render_student_slip
+from .services.finance_reports import collection_report
+from .services.parent_summary import parent_summary
+from .services.user_context import user_context
+from .services.jobs import enqueue
+from .services.sms import gateway as sms_gateway
+from .services.campaigns import start_campaign
+from .services.exports import (
+    EXPORT_CHUNK_SIZE, LazyStory, paged_tables, streaming_csv_response,
+)
 from collections import defaultdict
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.decorators import login_required, user_passes_test
@@ -70,13 +87,13 @@ from django.utils.timezone import localdate
 import uuid
 from userauths.models import User
 from .models import (
-    Grade, School, Parent, StaffProfile, Student, Subject, Enrollment, Timetable, Lesson, PolicymakerProfile, AttendanceAlert,
+    Grade, School, Parent, StaffProfile, Student, Subject, Enrollment, Timetable, Lesson, LessonPattern, PolicymakerProfile, AttendanceAlert,
     Session, Attendance, DisciplineRecord, SummaryReport, Notification, SmartID, ScanLog, TeacherStreamAssignment,
     ClassTeacherAssignment,
     Payment, Assignment, Submission, Role, Invoice, SchoolSubscription, SubscriptionPlan, UploadedFile, County, Constituency, Ward,
     ContactMessage, MpesaStkPushRequestResponse, MpesaPayment,GradeAttendance, Streams,Term, TimeSlot, AcademicYear,
     SubjectEnrollment,AcademicYear,SubCounty,Pathway,Upload,SubjectCatalog,
-    Announcement, FeeInvoice,
+    Announcement, FeeInvoice, NotificationCampaign,
     ExamSession, ExamResult, cbc_grade_band, kcse_grade,
     FeeStructure, FeeType, FEE_TYPE_CHOICES,
 )
@@ -158,39 +175,8 @@ def safe_parse_time(value):
 def _send_sms_via_eujim(to_phone_number: str, message: str, retries=3, delay=5) -> bool:
     if not to_phone_number:
         return False
-
-    phone = str(to_phone_number)
-    if phone.startswith("0"):
-        phone = "254" + phone[1:]
-    elif phone.startswith("+254"):
-        phone = phone[1:]
-    elif not phone.startswith("254"):
-        phone = "254" + phone
-
-    payload = {
-        "apikey": settings.SMS_API_KEY,
-        "partnerID": settings.SMS_PARTNERID,
-        "shortcode": settings.SMS_SHORTCODE,
-        "message": message,
-        "mobile": phone,
-    }
-
-    for attempt in range(1, retries + 1):
-        try:
-            response = requests.post(
-                'https://quicksms.advantasms.com/api/services/sendsms/',
-                json=payload,
-                timeout=15
-            )
-            if response.status_code == 200:
-                data = response.json()
-                r = data.get("responses", [{}])[0]
-                return r.get("response-code") == 200
-        except requests.exceptions.RequestException:
-            pass
-        if attempt < retries:
-            time.sleep(delay)  # wait before retrying
-    return False
+    ok, _ = sms_gateway().send(to_phone_number, message, attempts=retries, backoff=delay)
+    return ok
 
 
 
@@ -281,20 +267,25 @@ def notify_last_lesson(student, date):
                 [parent.user.email],
                 fail_silently=True
             )
-@login_required
-def export_attendance_csv(request):
-    school = get_user_school(request.user)
-    if not school:
-        return HttpResponse("Access denied.", status=403)
-    qs = Attendance.objects.filter(
-        enrollment__school=school
-    ).select_related(
-        'enrollment__student__user',
-        'enrollment__student__grade_level',
-        'enrollment__student__stream',
-        'enrollment__subject',
-        'term', 'academic_year',
-    ).order_by('date')
+ATTENDANCE_EXPORT_COLUMNS = (
+    'enrollment__student__user__first_name',
+    'enrollment__student__user__last_name',
+    'enrollment__student__grade_level__name',
+    'enrollment__student__stream__name',
+    'enrollment__lesson__subject__name',
+    'date',
+    'status',
+    'term__name',
+    'academic_year__name',
+)
+
+
+def _attendance_export_rows(request, school):
+    """
+    Filtered attendance rows as flat tuples (ATTENDANCE_EXPORT_COLUMNS),
+    read through a server-side cursor in chunks.
+    """
+    qs = Attendance.objects.filter(enrollment__school=school)
 
     grade_id = request.GET.get('grade')
     term_id  = request.GET.get('term')
@@ -309,99 +300,86 @@ def export_attendance_csv(request):
     if end:
         qs = qs.filter(date__lte=end)
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="attendance_report.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Student', 'Grade', 'Stream', 'Subject', 'Date', 'Status', 'Term', 'Year'])
+    return qs.order_by('date', 'id').values_list(*ATTENDANCE_EXPORT_COLUMNS).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    )
+
+
+@login_required
+def export_attendance_csv(request):
+    school = get_user_school(request.user)
+    if not school:
+        return HttpResponse("Access denied.", status=403)
+
     STATUS_LABELS = {'P': 'Present', 'ET': 'Excused Tardy', 'UT': 'Unexcused Tardy',
                      'EA': 'Excused Absent', 'UA': 'Unexcused Absent', 'IB': 'In Building',
                      '18': 'Suspended', '20': 'Expelled'}
-    for a in qs:
-        try:
-            writer.writerow([
-                a.enrollment.student.user.get_full_name(),
-                a.enrollment.student.grade_level.name,
-                getattr(a.enrollment.student.stream, 'name', ''),
-                a.enrollment.subject.name,
-                a.date,
-                STATUS_LABELS.get(a.status, a.status),
-                a.term.name if a.term else '',
-                a.academic_year.name if a.academic_year else '',
-            ])
-        except Exception:
-            continue
-    return response
+    rows = (
+        [
+            f"{first or ''} {last or ''}".strip(),
+            grade or '',
+            stream or '',
+            subject or '',
+            day,
+            STATUS_LABELS.get(status, status),
+            term or '',
+            year or '',
+        ]
+        for first, last, grade, stream, subject, day, status, term, year
+        in _attendance_export_rows(request, school)
+    )
+    return streaming_csv_response(
+        'attendance_report.csv',
+        ['Student', 'Grade', 'Stream', 'Subject', 'Date', 'Status', 'Term', 'Year'],
+        rows,
+    )
 
 @login_required
 def export_attendance_pdf(request):
     school = get_user_school(request.user)
     if not school:
         return HttpResponse("Access denied.", status=403)
-    qs = Attendance.objects.filter(
-        enrollment__school=school
-    ).select_related(
-        'enrollment__student__user',
-        'enrollment__student__grade_level',
-        'enrollment__student__stream',
-        'enrollment__subject',
-        'term', 'academic_year',
-    ).order_by('date')
-
-    # Optional filters
-    grade_id = request.GET.get('grade')
-    term_id  = request.GET.get('term')
-    start    = request.GET.get('start')
-    end      = request.GET.get('end')
-    if grade_id:
-        qs = qs.filter(enrollment__student__grade_level_id=grade_id)
-    if term_id:
-        qs = qs.filter(term_id=term_id)
-    if start:
-        qs = qs.filter(date__gte=start)
-    if end:
-        qs = qs.filter(date__lte=end)
 
     response = HttpResponse(content_type='application/pdf')
     response['Content-Disposition'] = 'attachment; filename="attendance_report.pdf"'
     doc = SimpleDocTemplate(response, pagesize=letter, topMargin=36, bottomMargin=36, leftMargin=36, rightMargin=36)
     styles = getSampleStyleSheet()
-    story = []
     from reportlab.platypus import Spacer
-    story.append(Paragraph(f"<b>{school.name}</b>", styles['Title']))
-    story.append(Paragraph("Attendance Report", styles['Heading2']))
-    story.append(Paragraph(f"Generated: {timezone.now().strftime('%d %B %Y %H:%M')}", styles['Normal']))
-    story.append(Spacer(1, 12))
 
     header = ['Student', 'Grade', 'Stream', 'Subject', 'Date', 'Status', 'Term']
-    rows = [header]
     STATUS_LABELS = {'P': 'Present', 'ET': 'Exc. Tardy', 'UT': 'Unexc. Tardy',
                      'EA': 'Exc. Absent', 'UA': 'Unexc. Absent', 'IB': 'In Building',
                      '18': 'Suspended', '20': 'Expelled'}
-    for a in qs:
-        try:
-            rows.append([
-                a.enrollment.student.user.get_full_name(),
-                a.enrollment.student.grade_level.name,
-                getattr(a.enrollment.student.stream, 'name', '—'),
-                a.enrollment.subject.name,
-                str(a.date),
-                STATUS_LABELS.get(a.status, a.status),
-                a.term.name if a.term else '—',
-            ])
-        except Exception:
-            continue
-
-    t = Table(rows, colWidths=[110, 55, 55, 80, 60, 65, 55])
-    t.setStyle(TableStyle([
+    rows = (
+        [
+            f"{first or ''} {last or ''}".strip(),
+            grade or '—',
+            stream or '—',
+            subject or '—',
+            str(day),
+            STATUS_LABELS.get(status, status),
+            term or '—',
+        ]
+        for first, last, grade, stream, subject, day, status, term, _year
+        in _attendance_export_rows(request, school)
+    )
+    table_style = TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1a1a2e')),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
         ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
         ('FONTSIZE', (0, 0), (-1, -1), 7),
         ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
         ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#dee2e6')),
-    ]))
-    story.append(t)
-    doc.build(story)
+    ])
+
+    def story():
+        yield Paragraph(f"<b>{school.name}</b>", styles['Title'])
+        yield Paragraph("Attendance Report", styles['Heading2'])
+        yield Paragraph(f"Generated: {timezone.now().strftime('%d %B %Y %H:%M')}", styles['Normal'])
+        yield Spacer(1, 12)
+        yield from paged_tables(header, rows, [110, 55, 55, 80, 60, 65, 55], table_style)
+
+    doc.build(LazyStory(story()))
     return response
 
 
@@ -440,19 +418,13 @@ def _safe_next_redirect(request, default_url_name):
 
 
 def get_user_school(user):
+    ctx = user_context(user)  # profiles loaded once per request
     # Admins/principals: try school_admin_profile (School.school_admin FK) first
-    if user.is_admin or user.is_principal:
-        school = getattr(user, "school_admin_profile", None)
-        if school:
-            return school
+    if (user.is_admin or user.is_principal) and ctx.admin_school:
+        return ctx.admin_school
 
     # Any staff with a StaffProfile (teachers, deputies, finance, HOD, etc.)
-    try:
-        return user.staffprofile.school
-    except Exception:
-        pass
-
-    return None
+    return ctx.staff_profile.school if ctx.staff_profile else None
 
 
 def _can_access_finance(user):
@@ -519,18 +491,19 @@ def dashboard(request):
     total_streams  = Streams.objects.filter(school=school).count()
 
     # ── Today's attendance rate ────────────────────────────────────────────────
-    today_att = Attendance.objects.filter(enrollment__school=school, date=today)
-    today_total   = today_att.count()
-    today_present = today_att.filter(status='P').count()
+    today_att = summarize(rollups_for(school, date=today))
+    today_total   = today_att['total']
+    today_present = today_att['present']
     today_rate    = round(today_present / today_total * 100) if today_total else 0
 
     # ── Term attendance rate ───────────────────────────────────────────────────
-    term_att     = Attendance.objects.filter(enrollment__school=school).filter(term_filter)
-    term_total   = term_att.count()
-    term_present = term_att.filter(status='P').count()
+    term_rollups = rollups_for(school).filter(term_filter)
+    term_att     = summarize(term_rollups)
+    term_total   = term_att['total']
+    term_present = term_att['present']
     term_rate    = round(term_present / term_total * 100) if term_total else 0
-    term_absent  = term_att.filter(status__in=['UA', 'EA']).count()
-    term_tardy   = term_att.filter(status__in=['UT', 'ET']).count()
+    term_absent  = term_att['absent']
+    term_tardy   = term_att['tardy']
 
     # ── Fee collection (term) ─────────────────────────────────────────────────
     from django.db.models import Sum
@@ -552,26 +525,21 @@ def dashboard(request):
     open_complaints = Complaint.objects.filter(school=school, status__in=['open','in_review']).count()
 
     # ── Today's lessons ────────────────────────────────────────────────────────
-    todays_lessons = Lesson.objects.filter(
-        timetable__school=school,
-        lesson_date=today,
-    ).select_related(
-        'subject', 'teacher__user', 'stream__grade', 'time_slot'
-    ).order_by('time_slot__start_time')[:8]
+    todays_lessons = occurrences(
+        LessonPattern.objects.filter(school=school),
+        today, today,
+        lessons=Lesson.objects.filter(timetable__school=school),
+    )[:8]
 
     # ── Weekly attendance chart data ───────────────────────────────────────────
     week_counts = {s: [] for s in ['P', 'ET', 'UT', 'EA', 'UA']}
+    week_by_day = {
+        d['date']: status_counts(d)
+        for d in summarize(rollups_for(school, date__range=(week_start, week_end)), 'date')
+    }
     for status in week_counts:
-        day_dict = {
-            d['date']: d['count']
-            for d in Attendance.objects.filter(
-                status=status,
-                date__range=(week_start, week_end),
-                enrollment__school=school
-            ).values('date').annotate(count=Count('id'))
-        }
         for day in week_days:
-            week_counts[status].append(day_dict.get(day, 0))
+            week_counts[status].append(week_by_day.get(day, {}).get(status, 0))
 
     chart_labels  = [d.strftime('%a %-d') for d in week_days]
     chart_present = week_counts['P']
@@ -581,9 +549,9 @@ def dashboard(request):
     # ── Attendance donut (today) ───────────────────────────────────────────────
     donut_data = [
         today_present,
-        today_att.filter(status__in=['UA','EA']).count(),
-        today_att.filter(status__in=['UT','ET']).count(),
-        today_att.filter(status__in=['18','20','IB']).count(),
+        today_att['absent'],
+        today_att['tardy'],
+        today_att['suspension'] + today_att['expulsion'] + today_att['behavior'],
     ]
 
     # ── Teachers with missed lessons this week ─────────────────────────────────
@@ -631,13 +599,8 @@ def dashboard(request):
 
     # ── Grade attendance breakdown (term) ─────────────────────────────────────
     grade_att = (
-        Attendance.objects.filter(enrollment__school=school)
-        .filter(term_filter)
-        .values(grade_name=F('enrollment__lesson__stream__grade__name'))
-        .annotate(
-            total=Count('id'),
-            present=Count('id', filter=Q(status='P')),
-        )
+        summarize(term_rollups.annotate(grade_name=F('grade__name')), 'grade_name')
+        .filter(total__gt=0)
         .annotate(rate=ExpressionWrapper(
             F('present') * 100.0 / F('total'), output_field=FloatField()
         ))
@@ -1342,9 +1305,8 @@ def generate_timetable_view(request):
                     return redirect(request.META.get('HTTP_REFERER', '/'))
                 streams_qs = streams_qs.filter(id=stream.id)
 
-            created_total = 0
-            errors = []
-            for st in streams_qs:
+            timetables = []
+            for st in streams_qs.select_related('grade'):
                 tt, created = Timetable.objects.get_or_create(
                     school=school,
                     grade=st.grade,
@@ -1353,14 +1315,22 @@ def generate_timetable_view(request):
                     year=term.start_date.year,
                     defaults={'start_date': term.start_date, 'end_date': term.end_date}
                 )
-                try:
-                    lessons_created = generate_for_stream(tt, overwrite=overwrite)
-                    created_total += len(lessons_created)
-                except Exception as e:
-                    errors.append(str(e))
+                timetables.append(tt)
+
+            created_total = 0
+            errors = []
+            try:
+                plan, result = generate_for_school(school, term, timetables, overwrite=overwrite)
+                created_total = len(result['patterns'])
+                errors = [
+                    f"{c['type']}: {c.get('subject', '')} ({c.get('stream', '')})"
+                    for c in plan.conflicts
+                ]
+            except Exception as e:
+                errors.append(str(e))
 
             if created_total:
-                messages.success(request, f"Timetable generated — {created_total} lessons created.")
+                messages.success(request, f"Timetable generated — {created_total} weekly lessons created.")
             if errors:
                 messages.warning(request, "Some errors: " + "; ".join(errors))
 
@@ -1408,15 +1378,10 @@ def view_timetable_week(request):
     time_slots = TimeSlot.objects.filter(school=school).order_by('start_time')
 
     # ── Lessons ──────────────────────────────────────────────────────────────
-    lessons_qs = Lesson.objects.filter(
-        timetable__school=school,
-        timetable__term__is_active=True,
-        lesson_date__range=(week_start, week_end),
-    ).select_related(
-        'subject',
-        'teacher__user',
-        'stream',
-        'timetable',
+    lessons_qs = occurrences(
+        LessonPattern.objects.filter(school=school, timetable__term__is_active=True),
+        week_start, week_end,
+        lessons=Lesson.objects.filter(timetable__school=school, timetable__term__is_active=True),
     )
 
     # ── Streams ──────────────────────────────────────────────────────────────
@@ -1485,10 +1450,14 @@ def teacher_timetable_view(request):
     monday = focus_date - timedelta(days=focus_date.weekday())
     week_days = [monday + timedelta(days=i) for i in range(7)]
 
-    lessons_qs = Lesson.objects.filter(teacher=teacher, date__range=(week_days[0], week_days[-1])).order_by('lesson_date')
+    lessons = occurrences(
+        LessonPattern.objects.filter(teacher=teacher),
+        week_days[0], week_days[-1],
+        lessons=Lesson.objects.filter(teacher=teacher),
+    )
 
     # Group by date
-    lessons_by_date = {d: lessons_qs.filter(lesson_date=d) for d in week_days}
+    lessons_by_date = {d: [l for l in lessons if l.lesson_date == d] for d in week_days}
 
     context = {
         'week_days': week_days,
@@ -2528,113 +2497,21 @@ def exam_result_entry(request, session_pk, stream_pk, subject_pk):
     })
 
 
-@login_required
 def _run_exam_upload_job(job_id):
-    """Background thread: process an ExamUploadJob."""
-    import openpyxl
-    import threading
-    from django.db import connection as _conn
-    # Each thread needs its own DB connection
-    _conn.close()
-
-    from .models import ExamUploadJob, ExamResult, Student
-    try:
-        job = ExamUploadJob.objects.get(pk=job_id)
-        job.status = ExamUploadJob.STATUS_PROCESSING
-        job.save(update_fields=['status'])
-
-        wb = openpyxl.load_workbook(job.file_path, data_only=True)
-        ws = wb.active
-        headers = [str(c.value).strip().lower() if c.value else '' for c in ws[1]]
-
-        def col(name):
-            return headers.index(name) if name in headers else None
-
-        idx_id   = col('student_id')
-        idx_cat  = col('cat')
-        idx_asgn = col('assignment')
-        idx_asmt = col('assessment')
-        idx_exam = col('exam')
-
-        if idx_id is None:
-            job.status = ExamUploadJob.STATUS_FAILED
-            job.error  = 'Column "student_id" not found in file.'
-            job.finished_at = timezone.now()
-            job.save(update_fields=['status', 'error', 'finished_at'])
-            return
-
-        rows = list(ws.iter_rows(min_row=2, values_only=True))
-        data_rows = [r for r in rows if r[idx_id]]
-        job.total_rows = len(data_rows)
-        job.save(update_fields=['total_rows'])
-
-        try:
-            staff = job.uploaded_by.staffprofile
-        except Exception:
-            staff = None
-
-        saved = skipped = 0
-        for i, row in enumerate(data_rows):
-            sid = str(row[idx_id]).strip()
-            try:
-                student = Student.objects.get(student_id=sid, school=job.school)
-            except Student.DoesNotExist:
-                skipped += 1
-            else:
-                def _v(idx, _row=row):
-                    if idx is None or _row[idx] is None:
-                        return None
-                    try:
-                        return float(_row[idx])
-                    except (ValueError, TypeError):
-                        return None
-
-                result, _ = ExamResult.objects.get_or_create(
-                    session=job.session, student=student, subject=job.subject,
-                    defaults={'stream': job.stream, 'school': job.school, 'entered_by': staff},
-                )
-                result.cat_score        = _v(idx_cat)
-                result.assignment_score = _v(idx_asgn)
-                result.assessment_score = _v(idx_asmt)
-                result.exam_score       = _v(idx_exam)
-                result.stream    = job.stream
-                result.school    = job.school
-                if staff:
-                    result.entered_by = staff
-                result.save()
-                saved += 1
-
-            job.processed = i + 1
-            job.saved     = saved
-            job.skipped   = skipped
-            job.save(update_fields=['processed', 'saved', 'skipped'])
-
-        job.status      = ExamUploadJob.STATUS_DONE
-        job.finished_at = timezone.now()
-        job.save(update_fields=['status', 'finished_at'])
-
-    except Exception as exc:
-        try:
-            job = ExamUploadJob.objects.get(pk=job_id)
-            job.status      = ExamUploadJob.STATUS_FAILED
-            job.error       = str(exc)
-            job.finished_at = timezone.now()
-            job.save(update_fields=['status', 'error', 'finished_at'])
-        except Exception:
-            pass
-    finally:
-        try:
-            import os
-            if os.path.exists(job.file_path):
-                os.remove(job.file_path)
-        except Exception:
-            pass
-        _conn.close()
+    """Background job: process an ExamUploadJob."""
+    import os
+    from .models import ExamUploadJob
+    from .services.exam_import import run_import
+    job = ExamUploadJob.objects.select_related('session', 'uploaded_by').get(pk=job_id)
+    run_import(job)
+    if os.path.exists(job.file_path):
+        os.remove(job.file_path)
 
 
+@login_required
 def exam_result_upload(request, session_pk):
-    """Bulk upload scores from Excel — processed in a background thread."""
-    import threading, os, tempfile
+    """Bulk upload scores from Excel — large sheets are processed by a background worker."""
+    import os, tempfile
     user = request.user
     school = get_user_school(user)
     session = get_object_or_404(ExamSession, pk=session_pk, school=school)
@@ -2659,6 +2536,7 @@ def exam_result_upload(request, session_pk):
         tmp.close()
 
         from .models import ExamUploadJob
+        from .services.exam_import import INLINE_IMPORT_ROWS, read_score_sheet, run_import
         job = ExamUploadJob.objects.create(
             session     = session,
             school      = school,
@@ -2668,8 +2546,16 @@ def exam_result_upload(request, session_pk):
             file_path   = tmp.name,
         )
 
-        t = threading.Thread(target=_run_exam_upload_job, args=(str(job.pk),), daemon=True)
-        t.start()
+        # Class-sized sheets finish faster than a thread can start; only big ones go to the background.
+        try:
+            df = read_score_sheet(tmp.name)
+        except Exception:
+            df = None
+        if df is not None and len(df) <= INLINE_IMPORT_ROWS:
+            run_import(job, df=df)
+            os.remove(tmp.name)
+        else:
+            enqueue('exam_upload', school=school, job_id=str(job.pk))
 
         return redirect('school:exam-upload-progress', job_pk=job.pk)
 
@@ -2709,29 +2595,8 @@ def exam_upload_status(request, job_pk):
 
 
 def _compute_student_totals(session, students, stream=None):
-    """Return list of dicts {student, total, subjects_count} sorted by total desc."""
-    qs = ExamResult.objects.filter(session=session, student__in=students)
-    if stream:
-        qs = qs.filter(stream=stream)
-    from collections import defaultdict
-    totals = defaultdict(float)
-    counts = defaultdict(int)
-    for r in qs:
-        t = r.total
-        if t is not None:
-            totals[r.student_id] += t
-            counts[r.student_id] += 1
-    result = []
-    for student in students:
-        result.append({
-            'student': student,
-            'total': round(totals[student.pk], 2) if student.pk in totals else None,
-            'subjects_count': counts[student.pk],
-        })
-    result.sort(key=lambda x: (x['total'] is None, -(x['total'] or 0)))
-    for i, row in enumerate(result):
-        row['position'] = i + 1 if row['total'] is not None else '–'
-    return result
+    """Return list of dicts {student, total, subjects_count, position, ...} sorted by total desc."""
+    return rank_students(session, students, stream=stream)
 
 
 @login_required
@@ -2848,17 +2713,10 @@ def report_slip_html(request, session_pk, student_pk):
 
     results = ExamResult.objects.filter(session=session, student=student).select_related('subject').order_by('subject__name')
 
-    # Stream ranking
-    stream_students = Student.objects.filter(school=school, stream=student.stream, is_active=True).select_related('user')
-    stream_ranking = _compute_student_totals(session, stream_students, stream=student.stream)
-    stream_pos = next((r['position'] for r in stream_ranking if r['student'].pk == student_pk), '–')
-    stream_total_students = len([r for r in stream_ranking if r['total'] is not None])
-
-    # Grade ranking
-    grade_students = Student.objects.filter(school=school, grade_level=session.grade, is_active=True).select_related('user')
-    grade_ranking = _compute_student_totals(session, grade_students)
-    grade_pos = next((r['position'] for r in grade_ranking if r['student'].pk == student_pk), '–')
-    grade_total_students = len([r for r in grade_ranking if r['total'] is not None])
+    # Stream and grade positions
+    positions = student_positions(session, student)
+    stream_pos, stream_total_students = positions['stream_pos'], positions['stream_total']
+    grade_pos, grade_total_students = positions['grade_pos'], positions['grade_total']
 
     overall_total = sum(r.total for r in results if r.total is not None)
     overall_pct = round((overall_total / (session.total_marks * len(results))) * 100, 1) if results and session.total_marks else None
@@ -2875,14 +2733,6 @@ def report_slip_html(request, session_pk, student_pk):
 @login_required
 def report_slip_pdf(request, session_pk, student_pk):
     """Download PDF report slip."""
-    from io import BytesIO
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.lib.units import cm
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, HRFlowable
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-
     user = request.user
     student = get_object_or_404(Student, pk=student_pk)
     school = student.school
@@ -2906,152 +2756,80 @@ def report_slip_pdf(request, session_pk, student_pk):
     session = get_object_or_404(ExamSession, pk=session_pk, school=school)
     results = ExamResult.objects.filter(session=session, student=student).select_related('subject').order_by('subject__name')
 
-    stream_students = Student.objects.filter(school=school, stream=student.stream, is_active=True).select_related('user')
-    stream_ranking = _compute_student_totals(session, stream_students, stream=student.stream)
-    stream_pos = next((r['position'] for r in stream_ranking if r['student'].pk == student_pk), '–')
-    stream_total = len([r for r in stream_ranking if r['total'] is not None])
-
-    grade_students = Student.objects.filter(school=school, grade_level=session.grade, is_active=True).select_related('user')
-    grade_ranking = _compute_student_totals(session, grade_students)
-    grade_pos = next((r['position'] for r in grade_ranking if r['student'].pk == student_pk), '–')
-    grade_total = len([r for r in grade_ranking if r['total'] is not None])
-
-    overall_total = sum(r.total for r in results if r.total is not None)
-    overall_pct = round((overall_total / (session.total_marks * len(results))) * 100, 1) if results and session.total_marks else None
-    overall_band = cbc_grade_band(overall_pct) if overall_pct is not None else '–'
+    pdf = render_student_slip(session, student, results, student_positions(session, student))
+    filename = f"report_slip_{student.student_id}_{session.year}.pdf"
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=1.5*cm, rightMargin=1.5*cm, topMargin=1.5*cm, bottomMargin=1.5*cm)
-    styles = getSampleStyleSheet()
 
-    green = colors.HexColor('#0b7a2a')
-    red = colors.HexColor('#bb0a21')
-    dark = colors.HexColor('#111111')
-    light_green = colors.HexColor('#e8f5e9')
+@login_required
+def report_slip_batch(request, session_pk):
+    """Queue every slip of a session (whole grade, or one stream) as a merged PDF or ZIP."""
+    from .models import ReportSlipJob
+    user = request.user
+    if not (user.is_admin or user.is_principal or user.is_deputy_principal or getattr(user, 'is_teacher', False)):
+        messages.error(request, "Access denied.")
+        return redirect('school:dashboard')
+    school = get_user_school(user)
+    session = get_object_or_404(ExamSession, pk=session_pk, school=school)
+    if request.method != 'POST':
+        return redirect('school:exam-session-detail', pk=session_pk)
 
-    h1 = ParagraphStyle('H1', fontSize=16, fontName='Helvetica-Bold', textColor=green, alignment=TA_CENTER, spaceAfter=2)
-    h2 = ParagraphStyle('H2', fontSize=11, fontName='Helvetica-Bold', textColor=dark, alignment=TA_CENTER, spaceAfter=2)
-    sub = ParagraphStyle('Sub', fontSize=9, fontName='Helvetica', textColor=colors.grey, alignment=TA_CENTER, spaceAfter=6)
-    normal = ParagraphStyle('N', fontSize=9, fontName='Helvetica')
-    bold9 = ParagraphStyle('B9', fontSize=9, fontName='Helvetica-Bold')
-    center9 = ParagraphStyle('C9', fontSize=9, fontName='Helvetica', alignment=TA_CENTER)
-    right9 = ParagraphStyle('R9', fontSize=9, fontName='Helvetica', alignment=TA_RIGHT)
+    stream = None
+    if request.POST.get('stream'):
+        stream = get_object_or_404(Streams, pk=request.POST['stream'], school=school, grade=session.grade)
+    output_format = request.POST.get('format', ReportSlipJob.FORMAT_PDF)
+    if output_format not in dict(ReportSlipJob.FORMAT_CHOICES):
+        output_format = ReportSlipJob.FORMAT_PDF
 
-    elements = []
+    job = ReportSlipJob.objects.create(
+        session=session, school=school, stream=stream,
+        output_format=output_format, requested_by=user,
+    )
+    enqueue('report_slips', school=school, job_id=str(job.pk))
+    return redirect('school:report-slip-job-progress', job_pk=job.pk)
 
-    # Header
-    elements.append(Paragraph(school.name.upper(), h1))
-    elements.append(Paragraph(f"Code: {school.code}  |  {school.address}", sub))
-    elements.append(Paragraph(f"Tel: {school.contact_phone}  |  Email: {school.contact_email}", sub))
-    elements.append(HRFlowable(width='100%', thickness=2, color=green, spaceAfter=6))
-    elements.append(Paragraph(f"STUDENT REPORT SLIP – {session.name.upper()}", h2))
-    elements.append(HRFlowable(width='100%', thickness=1, color=red, spaceAfter=8))
 
-    # Student info
-    info_data = [
-        ['Name:', student.user.get_full_name(), 'Admission No:', student.student_id],
-        ['Grade:', session.grade.name, 'Stream:', student.stream.name if student.stream else '–'],
-        ['Term:', session.term.name if session.term else '–', 'Year:', str(session.year)],
-    ]
-    info_table = Table(info_data, colWidths=[2.5*cm, 6*cm, 3*cm, 6*cm])
-    info_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-    ]))
-    elements.append(info_table)
-    elements.append(Spacer(1, 8))
+@login_required
+def report_slip_job_progress(request, job_pk):
+    """Page that polls a report-slip batch job."""
+    from .models import ReportSlipJob
+    school = get_user_school(request.user)
+    job = get_object_or_404(ReportSlipJob, pk=job_pk, school=school)
+    base_template = 'school/teacher/base.html' if request.user.is_teacher else 'school/base.html'
+    return render(request, 'school/exams/slip_batch_progress.html', {'job': job, 'base_template': base_template})
 
-    # Scores table
-    hdr = ['Subject', f'CAT\n/{session.cat_out_of:.0f}', f'Asgn\n/{session.assignment_out_of:.0f}',
-           f'Asmt\n/{session.assessment_out_of:.0f}', f'Exam\n/{session.exam_out_of:.0f}',
-           f'Total\n/{session.total_marks:.0f}', '%', 'Grade']
-    table_data = [hdr]
-    for r in results:
-        band = r.grade_band
-        band_colors = {'EE': '#1b5e20', 'ME': '#2e7d32', 'AE': '#f57f17', 'BE': '#b71c1c'}
-        table_data.append([
-            r.subject.name,
-            f'{r.cat_score:.1f}' if r.cat_score is not None else '–',
-            f'{r.assignment_score:.1f}' if r.assignment_score is not None else '–',
-            f'{r.assessment_score:.1f}' if r.assessment_score is not None else '–',
-            f'{r.exam_score:.1f}' if r.exam_score is not None else '–',
-            f'{r.total:.1f}' if r.total is not None else '–',
-            f'{r.percentage:.1f}%' if r.percentage is not None else '–',
-            band,
-        ])
 
-    col_widths = [4.5*cm, 1.6*cm, 1.6*cm, 1.6*cm, 1.6*cm, 2*cm, 1.8*cm, 1.8*cm]
-    score_table = Table(table_data, colWidths=col_widths, repeatRows=1)
-    style = TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), green),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, light_green]),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('TOPPADDING', (0, 0), (-1, -1), 4),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-    ])
-    score_table.setStyle(style)
-    elements.append(score_table)
-    elements.append(Spacer(1, 10))
-
-    # Summary
-    summary_data = [
-        ['Overall Total:', f'{overall_total:.1f} / {session.total_marks * len(results):.0f}',
-         'Overall %:', f'{overall_pct:.1f}%' if overall_pct else '–',
-         'Grade Band:', overall_band],
-        ['Stream Position:', f'{stream_pos} / {stream_total}',
-         'Grade Position:', f'{grade_pos} / {grade_total}', '', ''],
-    ]
-    sum_table = Table(summary_data, colWidths=[3.5*cm, 4*cm, 3*cm, 3*cm, 2.5*cm, 2.5*cm])
-    sum_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (4, 0), (4, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BACKGROUND', (0, 0), (-1, -1), light_green),
-        ('BOX', (0, 0), (-1, -1), 1, green),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-        ('TOPPADDING', (0, 0), (-1, -1), 5),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-    ]))
-    elements.append(sum_table)
-    elements.append(Spacer(1, 16))
-
-    # CBC grade key
-    key_data = [['CBC Grade Key:  EE = Exceeding Expectations (75–100%)  |  ME = Meeting Expectations (50–74%)  |  AE = Approaching Expectations (25–49%)  |  BE = Below Expectations (0–24%)']]
-    key_table = Table(key_data, colWidths=[18.5*cm])
-    key_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Oblique'),
-        ('FONTSIZE', (0, 0), (-1, -1), 7),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.grey),
-    ]))
-    elements.append(key_table)
-    elements.append(Spacer(1, 20))
+@login_required
+def report_slip_job_status(request, job_pk):
+    """JSON endpoint polled by the batch progress page."""
+    from .models import ReportSlipJob
+    from django.http import JsonResponse
+    school = get_user_school(request.user)
+    job = get_object_or_404(ReportSlipJob, pk=job_pk, school=school)
+    return JsonResponse({
+        'status':    job.status,
+        'total':     job.total,
+        'processed': job.processed,
+        'progress':  job.progress_pct,
+        'error':     job.error,
+    })
 
-    # Signature line
-    sig_data = [['Class Teacher: ___________________________', 'Principal: ___________________________', f'Date: {date.today().strftime("%d/%m/%Y")}']]
-    sig_table = Table(sig_data, colWidths=[7*cm, 7*cm, 4.5*cm])
-    sig_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
-    ]))
-    elements.append(sig_table)
 
-    doc.build(elements)
-    buffer.seek(0)
-    filename = f"report_slip_{student.student_id}_{session.year}.pdf"
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+@login_required
+def report_slip_job_download(request, job_pk):
+    """Download the merged PDF or ZIP produced by a finished batch job."""
+    import os
+    from .models import ReportSlipJob
+    from django.http import FileResponse, Http404
+    school = get_user_school(request.user)
+    job = get_object_or_404(ReportSlipJob, pk=job_pk, school=school, status=ReportSlipJob.STATUS_DONE)
+    if not job.file_path or not os.path.exists(job.file_path):
+        raise Http404("Report slips file is no longer available.")
+    scope = job.stream.name if job.stream else job.session.grade.name
+    filename = f"report_slips_{scope}_{job.session.name}.{job.output_format}".replace(' ', '_')
+    return FileResponse(open(job.file_path, 'rb'), as_attachment=True, filename=filename)
 
 
 def school_subscriptions(request):
@@ -3466,11 +3244,10 @@ def school_timetable(request):
     end_of_week = start_of_week + timedelta(days=4)
 
     # ---------------- LESSONS ----------------
-    lessons = Lesson.objects.filter(
-        timetable__school=school,
-        lesson_date__range=[start_of_week, end_of_week]
-    ).select_related(
-        'subject', 'teacher__user', 'stream', 'time_slot', 'timetable__grade'
+    lessons = occurrences(
+        LessonPattern.objects.filter(school=school),
+        start_of_week, end_of_week,
+        lessons=Lesson.objects.filter(timetable__school=school),
     )
 
     # ---------------- GROUP ----------------
@@ -3566,6 +3343,18 @@ def lesson_edit(request, lesson_id):
 
     return render(request, "school/partials/lesson_form.html", context)
 
+@login_required
+def lesson_pattern_attendance(request, pattern_id, lesson_date):
+    """Materialise one date of a weekly lesson, then open its attendance sheet."""
+    pattern = get_object_or_404(LessonPattern, id=pattern_id, school=get_user_school(request.user))
+    try:
+        lesson = materialise(pattern, date.fromisoformat(lesson_date))
+    except ValueError:
+        messages.error(request, "That lesson does not run on the selected date.")
+        return redirect('school:lesson-list', timetable_id=pattern.timetable_id)
+    return redirect('school:lesson-attendance', lesson_id=lesson.id)
+
+
 @login_required
 def lesson_attendance(request, lesson_id):
     lesson = get_object_or_404(Lesson, id=lesson_id)
@@ -3578,49 +3367,44 @@ def lesson_attendance(request, lesson_id):
 
     # ---------------- POST REQUEST ----------------
     if request.method == "POST":
-        with transaction.atomic():
-            for e in enrollments:
-                status = request.POST.get(f"status_{e.id}")   # <-- use enrollment ID
-                remarks = request.POST.get(f"remarks_{e.id}")
+        marks = []
+        students_changed = []
+        for e in enrollments:
+            status = request.POST.get(f"status_{e.id}")   # <-- use enrollment ID
+            remarks = request.POST.get(f"remarks_{e.id}")
+
+            if not status:
+                continue  # skip empty
+
+            # Only principals/deputies can suspend (18) or expel (20)
+            if status in ('18', '20') and not (
+                request.user.is_principal or request.user.is_deputy_principal or request.user.is_admin
+            ):
+                continue
 
-                if not status:
-                    continue  # skip empty
+            marks.append((e, status, remarks))
 
-                # Only principals/deputies can suspend (18) or expel (20)
-                if status in ('18', '20') and not (
-                    request.user.is_principal or request.user.is_deputy_principal or request.user.is_admin
-                ):
-                    continue
-
-                # Update or create attendance
-                att, created = Attendance.objects.update_or_create(
-                    enrollment=e,
-                    date=lesson.lesson_date,
-                    defaults={
-                        "status": status,
-                        "remarks": remarks,
-                        "marked_by": getattr(request.user, "staffprofile", None)
-                    }
-                )
+            # Update student suspension/expulsion flags
+            student = e.student
+            if status == '18':  # Suspension
+                flags = (True, False, True)
+            elif status == '20':  # Expulsion
+                flags = (False, True, False)
+            elif student.suspended or student.expelled:
+                flags = (False, False, True)
+            else:
+                continue
+            if (student.suspended, student.expelled, student.is_active) != flags:
+                student.suspended, student.expelled, student.is_active = flags
+                student.updated_at = timezone.now()
+                students_changed.append(student)
 
-                # Update student suspension/expulsion flags
-                student = e.student
-                if status == '18':  # Suspension
-                    student.suspended = True
-                    student.expelled = False
-                    student.is_active = True
-                    student.save(update_fields=['suspended', 'expelled', 'is_active'])
-                elif status == '20':  # Expulsion
-                    student.expelled = True
-                    student.suspended = False
-                    student.is_active = False
-                    student.save(update_fields=['expelled', 'suspended', 'is_active'])
-                else:
-                    if student.suspended or student.expelled:
-                        student.suspended = False
-                        student.expelled = False
-                        student.is_active = True
-                        student.save(update_fields=['suspended', 'expelled', 'is_active'])
+        with transaction.atomic():
+            record_attendance(
+                marks, lesson.lesson_date, lesson=lesson,
+                marked_by=getattr(request.user, "staffprofile", None), actor=request.user,
+            )
+            Student.objects.bulk_update(students_changed, ['suspended', 'expelled', 'is_active', 'updated_at'])
 
         # Reload fresh attendance for modal display
         updated_attendance = Attendance.objects.filter(
@@ -3860,6 +3644,22 @@ def timetable_delete(request, pk):
     return redirect('school:school-timetable')
 
 
+def _lesson_window(school):
+    """(start, end) of the school's active term, else of the current week."""
+    term = Term.objects.filter(school=school, is_active=True).first()
+    if term:
+        return term.start_date, term.end_date
+    today = timezone.localdate()
+    monday = today - timedelta(days=today.weekday())
+    return monday, monday + timedelta(days=6)
+
+
+def _search_lessons(lessons, query, fields):
+    """Occurrences where any of `fields(lesson)` contains `query` (case-insensitive)."""
+    query = query.lower()
+    return [l for l in lessons if any(query in value.lower() for value in fields(l))]
+
+
 # List lessons via @login_required
 @login_required
 def teacher_lessons(request, staff_id):
@@ -3873,18 +3673,21 @@ def teacher_lessons(request, staff_id):
         return redirect('userauths:teacher-dashboard')
     
     teacher = get_object_or_404(StaffProfile, pk=staff_id, school=school)
-    lessons = Lesson.objects.filter(teacher=teacher).select_related(
-        'subject', 'timetable__grade', 'time_slot', 'stream'
-    ).order_by('day_of_week', 'lesson_date', 'time_slot__start_time')
+    start, end = _lesson_window(school)
+    lessons = occurrences(
+        LessonPattern.objects.filter(teacher=teacher),
+        start, end,
+        lessons=Lesson.objects.filter(teacher=teacher),
+    )
 
     query = request.GET.get('q', '')
     if query:
-        lessons = lessons.filter(
-            Q(subject__name__icontains=query) |
-            Q(timetable__grade__name__icontains=query) |
-            Q(stream__name__icontains=query) |
-            Q(day_of_week__icontains=query)
-        )
+        lessons = _search_lessons(lessons, query, lambda l: (
+            l.subject.name if l.subject else '',
+            l.timetable.grade.name if l.timetable and l.timetable.grade else '',
+            l.stream.name if l.stream else '',
+            l.day_of_week or '',
+        ))
     
     paginator = Paginator(lessons, 10)
     page_number = request.GET.get('page')
@@ -3997,19 +3800,20 @@ def lesson_list(request, timetable_id):
         return redirect('school:dashboard')
     
     timetable = get_object_or_404(Timetable, id=timetable_id, school=school)
-    lessons = timetable.lessons.select_related(
-        'subject', 'teacher__user', 'time_slot', 'stream'
-    ).order_by('day_of_week', 'lesson_date', 'time_slot__start_time')
+    lessons = occurrences(
+        timetable.patterns.all(), timetable.start_date, timetable.end_date,
+        lessons=timetable.lessons.all(),
+    )
 
     query = request.GET.get('q', '')
     if query:
-        lessons = lessons.filter(
-            Q(subject__name__icontains=query) |
-            Q(teacher__user__first_name__icontains=query) |
-            Q(teacher__user__last_name__icontains=query) |
-            Q(stream__name__icontains=query) |
-            Q(room__icontains=query)
-        )
+        lessons = _search_lessons(lessons, query, lambda l: (
+            l.subject.name if l.subject else '',
+            l.teacher.user.first_name if l.teacher else '',
+            l.teacher.user.last_name if l.teacher else '',
+            l.stream.name if l.stream else '',
+            l.room or '',
+        ))
     
     paginator = Paginator(lessons, 10)
     page_number = request.GET.get('page')
@@ -4228,7 +4032,8 @@ def auto_mark_attendance_from_scan(student, stream, scan_log=None):
             student=student,
             stream=stream,
             status='P',
-            scan_log=scan_log
+            scan_log=scan_log,
+            recorded_at=scan_log.scanned_at,
         )
 
 
@@ -4358,16 +4163,31 @@ def attendance_dashboard(request):
     elif date_to:
         qs = qs.filter(date__lte=date_to)
 
-    # ───── STATUS CARDS ─────
-    stats = qs.aggregate(
-        P=Count('id', filter=Q(status='P')),
-        ET=Count('id', filter=Q(status='ET')),
-        UT=Count('id', filter=Q(status='UT')),
-        EA=Count('id', filter=Q(status='EA')),
-        UA=Count('id', filter=Q(status='UA')),
-    )
+    # ───── ROLLUPS ─────
+    # Cards and trends read the daily rollups; a per-student search has no
+    # rollup dimension, so it falls back to counting the filtered rows.
+    use_rollups = not filters['student'].strip()
+    rollups = rollups_for(school)
+    for key in ('academic_year', 'term', 'grade', 'stream', 'subject'):
+        if filters[key].isdigit():
+            rollups = rollups.filter(**{f'{key}_id': filters[key]})
+    if date_from:
+        rollups = rollups.filter(date__gte=date_from)
+    if date_to:
+        rollups = rollups.filter(date__lte=date_to)
 
-    stats = {k: v or 0 for k, v in stats.items()}
+    # ───── STATUS CARDS ─────
+    if use_rollups:
+        stats = status_counts(summarize(rollups))
+    else:
+        stats = qs.aggregate(
+            P=Count('id', filter=Q(status='P')),
+            ET=Count('id', filter=Q(status='ET')),
+            UT=Count('id', filter=Q(status='UT')),
+            EA=Count('id', filter=Q(status='EA')),
+            UA=Count('id', filter=Q(status='UA')),
+        )
+        stats = {k: v or 0 for k, v in stats.items()}
 
     status_cards = [
         {'label': 'Present', 'color': 'success', 'count': stats['P']},
@@ -4376,41 +4196,52 @@ def attendance_dashboard(request):
     ]
 
     # ───── FULL STATUS TREND ─────
-    status_trend = qs.values('date').annotate(
-        P=Count('id', filter=Q(status='P')),
-        ET=Count('id', filter=Q(status='ET')),
-        UT=Count('id', filter=Q(status='UT')),
-        EA=Count('id', filter=Q(status='EA')),
-        UA=Count('id', filter=Q(status='UA')),
-        IB=Count('id', filter=Q(status='IB')),
-        S18=Count('id', filter=Q(status='18')),
-        S20=Count('id', filter=Q(status='20')),
-    ).order_by('date')
+    if use_rollups:
+        status_trend = []
+        for row in summarize(rollups, 'date').order_by('date'):
+            counts = status_counts(row)
+            counts['S18'], counts['S20'] = counts.pop('18'), counts.pop('20')
+            status_trend.append({'date': row['date'], **counts})
+    else:
+        status_trend = qs.values('date').annotate(
+            P=Count('id', filter=Q(status='P')),
+            ET=Count('id', filter=Q(status='ET')),
+            UT=Count('id', filter=Q(status='UT')),
+            EA=Count('id', filter=Q(status='EA')),
+            UA=Count('id', filter=Q(status='UA')),
+            IB=Count('id', filter=Q(status='IB')),
+            S18=Count('id', filter=Q(status='18')),
+            S20=Count('id', filter=Q(status='20')),
+        ).order_by('date')
 
     # ───── MISSING ATTENDANCE ─────
-    lesson_qs = Lesson.objects.filter(
-        timetable__school=school,
-        lesson_date__lt=localdate()
-    )
-
-    attendance_exists = Attendance.objects.filter(
-        enrollment__lesson=OuterRef('pk')
+    # Weekly patterns only have dated rows once marked, so past occurrences
+    # are generated and checked against the lessons that have attendance.
+    missing_lessons = unmarked_occurrences(
+        LessonPattern.objects.filter(school=school),
+        date.min, localdate() - timedelta(days=1),
+        lessons=Lesson.objects.filter(timetable__school=school),
     )
 
-    missing_lessons = lesson_qs.annotate(
-        has_attendance=Exists(attendance_exists)
-    ).filter(has_attendance=False)
-
-    missing_lessons_count = missing_lessons.count()
+    missing_lessons_count = len(missing_lessons)
 
     # ───── TEACHER MISSED LESSONS ─────
-    teacher_missed_trends = missing_lessons.values(
-        'teacher__user__first_name',
-        'teacher__user__last_name',
-        'teacher__pk',
-    ).annotate(
-        missed=Count('id')
-    ).order_by('-missed')[:10]
+    missed_by_teacher = defaultdict(list)
+    for lesson in missing_lessons:
+        missed_by_teacher[lesson.teacher_id].append(lesson)
+
+    teacher_missed_trends = sorted(
+        (
+            {
+                'teacher__user__first_name': lessons[0].teacher.user.first_name if tid else None,
+                'teacher__user__last_name': lessons[0].teacher.user.last_name if tid else None,
+                'teacher__pk': tid,
+                'missed': len(lessons),
+            }
+            for tid, lessons in missed_by_teacher.items()
+        ),
+        key=lambda t: -t['missed'],
+    )[:10]
 
     # Per-teacher missed lesson details (for hover tooltip)
     import json as _json
@@ -4418,25 +4249,14 @@ def attendance_dashboard(request):
     for t in teacher_missed_trends:
         tid = t.get('teacher__pk')
         if tid:
-            details = list(
-                missing_lessons.filter(teacher_id=tid).select_related(
-                    'subject', 'stream', 'timetable__grade', 'time_slot'
-                ).values(
-                    'lesson_date',
-                    'time_slot__start_time',
-                    'time_slot__end_time',
-                    'subject__name',
-                    'stream__name',
-                    'timetable__grade__name',
-                )[:15]
-            )
+            details = missed_by_teacher[tid][:15]
             teacher_name = f"{t['teacher__user__first_name']} {t['teacher__user__last_name']}"
             teacher_missed_details[teacher_name] = [
                 {
-                    'date': str(d['lesson_date']),
-                    'time': f"{d['time_slot__start_time']} - {d['time_slot__end_time']}" if d['time_slot__start_time'] else '—',
-                    'subject': d['subject__name'] or '—',
-                    'class': f"{d['timetable__grade__name']} {d['stream__name']}",
+                    'date': str(d.lesson_date),
+                    'time': f"{d.time_slot.start_time} - {d.time_slot.end_time}" if d.time_slot_id else '—',
+                    'subject': d.subject.name if d.subject_id else '—',
+                    'class': f"{d.timetable.grade.name if d.timetable_id else None} {d.stream.name if d.stream_id else None}",
                 }
                 for d in details
             ]
@@ -4488,14 +4308,19 @@ def attendance_dashboard(request):
 
     # ───── DEFAULT TREND ─────
     trend_qs = qs
+    trend_rollups = rollups
     if not (date_from or date_to):
         today = localdate()
         trend_qs = qs.filter(date__gte=today - timedelta(days=30))
+        trend_rollups = rollups.filter(date__gte=today - timedelta(days=30))
 
-    daily_trend = trend_qs.values('date').annotate(
-        present=Count('id', filter=Q(status='P')),
-        absent=Count('id', filter=Q(status__in=['EA', 'UA'])),
-    ).order_by('date')
+    if use_rollups:
+        daily_trend = summarize(trend_rollups, 'date').order_by('date')
+    else:
+        daily_trend = trend_qs.values('date').annotate(
+            present=Count('id', filter=Q(status='P')),
+            absent=Count('id', filter=Q(status__in=['EA', 'UA'])),
+        ).order_by('date')
 
     # ───── PAGINATION ─────
     paginator = Paginator(qs.order_by('-date', '-id'), 25)
@@ -4535,31 +4360,6 @@ def get_streams_by_grade(request):
         streams = [{'id': s.id, 'name': s.name} for s in streams_qs]
     return JsonResponse({'streams': streams})
 
-# === EXPORT CSV ===
-def export_attendance_csv(request):
-    qs = Attendance.objects.all()
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="attendance_report.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow([
-        'Student', 'Grade', 'Stream', 'Subject', 'Date', 'Status'
-    ])
-
-    for a in qs:
-        writer.writerow([
-            a.enrollment.student.user.get_full_name(),
-            a.enrollment.student.grade_level.name,
-            a.enrollment.student.stream.name,
-            a.enrollment.subject.name,
-            a.date,
-            a.status
-        ])
-
-    return response
-
-
 @login_required
 def attendance_mark(request, lesson_id):
     # --- Fetch lesson safely ---
@@ -4845,10 +4645,13 @@ def teacher_attendance(request):
     streams  = Streams.objects.filter(school=school).order_by('name')
     grades   = Grade.objects.filter(school=school).order_by('name')
     # Only subjects this teacher has taught in the period
-    subjects = Subject.objects.filter(
-        lessons__teacher=teacher,
-        lessons__lesson_date__range=[start, end]
-    ).distinct().order_by('name')
+    subjects = sorted(
+        {l.subject for l in occurrences(
+            LessonPattern.objects.filter(teacher=teacher), start, end,
+            lessons=Lesson.objects.filter(teacher=teacher),
+        ) if l.subject and not l.is_canceled},
+        key=lambda subject: subject.name,
+    )
 
     context = {
         'attendances': attendances_page,
@@ -4925,10 +4728,7 @@ def teacher_attendance_mark(request, lesson_id):
     teacher = request.user.staffprofile
     can_override = teacher.position in ['principal', 'deputy_principal']
 
-    enrollments = Enrollment.objects.filter(
-        lesson=lesson,
-        status='active'
-    ).select_related('student', 'student__user')
+    enrollments = lesson_enrollments(lesson).select_related('student', 'student__user')
 
     # Prefetch today's attendance
     today_attendance_qs = Attendance.objects.filter(
@@ -4974,36 +4774,29 @@ def teacher_attendance_mark(request, lesson_id):
 
     # POST - save attendance
     if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        with transaction.atomic():
-            updated_attendances = []
-
-            for e in enrollments:
-                # Force expelled/suspended status
-                if e.id in forced_status_map:
-                    status = forced_status_map[e.id]
-                else:
-                    status = request.POST.get(f'status_{e.id}')
-                    # Prevent teacher from setting 18/20
-                    if not can_override and status in ['18', '20']:
-                        previous = today_attendance_map.get(e.id)
-                        status = previous.status if previous else 'P'
-
-                    # Validate
-                    valid_codes = [s['code'] for s in status_choices]
-                    if status not in valid_codes:
-                        status = 'P'
-
-                att, _ = Attendance.objects.update_or_create(
-                    enrollment=e,
-                    date=lesson.lesson_date,
-                    defaults={
-                        'status': status,
-                        'term': lesson.timetable.term,
-                        'academic_year': lesson.timetable.term.year,
-                        'marked_by': teacher
-                    }
-                )
-                updated_attendances.append(att)
+        valid_codes = {s['code'] for s in status_choices}
+        marks = []
+        for e in enrollments:
+            # Force expelled/suspended status
+            if e.id in forced_status_map:
+                status = forced_status_map[e.id]
+            else:
+                status = request.POST.get(f'status_{e.id}')
+                # Prevent teacher from setting 18/20
+                if not can_override and status in ['18', '20']:
+                    previous = today_attendance_map.get(e.id)
+                    status = previous.status if previous else 'P'
+
+                # Validate
+                if status not in valid_codes:
+                    status = 'P'
+            marks.append((e, status, None))
+
+        term = lesson.timetable.term
+        updated_attendances = record_attendance(
+            marks, lesson.lesson_date, lesson=lesson, marked_by=teacher,
+            term=term, academic_year=term.year, actor=request.user,
+        )
 
         # Notifications for first/last slot
         is_first = is_first_slot(lesson)
@@ -5061,6 +4854,18 @@ def teacher_attendance_mark(request, lesson_id):
         'trend_map': dict(trend_map),
     })
 
+@login_required
+def teacher_pattern_attendance_mark(request, pattern_id, lesson_date):
+    """Materialise one date of a weekly lesson, then open its attendance sheet."""
+    pattern = get_object_or_404(LessonPattern, id=pattern_id, teacher=request.user.staffprofile)
+    try:
+        lesson = materialise(pattern, date.fromisoformat(lesson_date))
+    except ValueError:
+        messages.error(request, "That lesson does not run on the selected date.")
+        return redirect('userauths:teacher-dashboard')
+    return redirect('school:teacher-attendance-mark', lesson_id=lesson.id)
+
+
 @login_required
 def teacher_attendance_smart(request, lesson_id):
     """
@@ -5074,10 +4879,7 @@ def teacher_attendance_smart(request, lesson_id):
     """
     lesson = get_object_or_404(Lesson, id=lesson_id, teacher=request.user.staffprofile)
 
-    enrollments = Enrollment.objects.filter(
-        lesson=lesson,
-        status='active'
-    ).select_related('student', 'student__user')
+    enrollments = lesson_enrollments(lesson).select_related('student', 'student__user')
 
     smart_statuses = {}
 
@@ -6567,94 +6369,60 @@ def policymaker_dashboard(request):
     if classification:
         schools = schools.filter(school_classification=classification)
 
-    # ───────── ATTENDANCE BASE QUERY ─────────
-    attendance = (
-        Attendance.objects
-        .filter(enrollment__school__in=schools)
-        .select_related(
-            "enrollment__lesson__teacher__user",
-            "enrollment__lesson__subject",
-            "enrollment__lesson__stream__grade",
-            "enrollment__school__county",
-        )
-    )
+    # ───────── ATTENDANCE BASE QUERY (daily rollups) ─────────
+    attendance = rollups_for(schools)
     if grade_id:
-        attendance = attendance.filter(enrollment__lesson__stream__grade_id=grade_id)
+        attendance = attendance.filter(grade_id=grade_id)
     if subject_id:
-        attendance = attendance.filter(enrollment__lesson__subject_id=subject_id)
+        attendance = attendance.filter(subject_id=subject_id)
     if term_id:
         attendance = attendance.filter(term_id=term_id)
 
-    _att_expr = ExpressionWrapper(F("present") * 100.0 / F("total"), output_field=FloatField())
+    def _ranked(*group_by, rate="performance"):
+        return (
+            summarize(attendance, *group_by)
+            .filter(total__gt=0)
+            .annotate(**{rate: ExpressionWrapper(F("present") * 100.0 / F("total"), output_field=FloatField())})
+            .order_by(f"-{rate}")
+        )
 
     # ───────── SCHOOL RANKING ─────────
-    _school_rank_qs = (
-        attendance.values("enrollment__school__id", "enrollment__school__name",
-                          "enrollment__school__school_classification",
-                          "enrollment__school__county__name")
-        .annotate(total=Count("id"), present=Count("id", filter=Q(status="P")))
-        .annotate(present_rate=ExpressionWrapper(F("present") * 100.0 / F("total"), output_field=FloatField()))
-        .order_by("-present_rate")
-    )
+    _school_rank_qs = _ranked("school__id", "school__name", "school__school_classification",
+                              "school__county__name", rate="present_rate")
     school_rankings = _school_rank_qs if active_view == "schools" else _school_rank_qs[:20]
 
     # ───────── COUNTY RANKING ─────────
-    county_rankings = (
-        attendance.values("enrollment__school__county__name")
-        .annotate(total=Count("id"), present=Count("id", filter=Q(status="P")))
-        .annotate(performance=ExpressionWrapper(F("present") * 100.0 / F("total"), output_field=FloatField()))
-        .order_by("-performance")
-    )
+    county_rankings = _ranked("school__county__name")
 
     # ───────── TEACHER PERFORMANCE ─────────
-    _teacher_rank_qs = (
-        attendance.values(
-            "enrollment__lesson__teacher__user__first_name",
-            "enrollment__lesson__teacher__user__last_name",
-            "enrollment__school__name",
-            "enrollment__school__county__name",
-        )
-        .annotate(total=Count("id"), present=Count("id", filter=Q(status="P")))
-        .annotate(performance=ExpressionWrapper(F("present") * 100.0 / F("total"), output_field=FloatField()))
-        .order_by("-performance")
+    _teacher_rank_qs = _ranked(
+        "teacher__user__first_name", "teacher__user__last_name",
+        "school__name", "school__county__name",
     )
     teacher_rankings = _teacher_rank_qs if active_view == "teachers" else _teacher_rank_qs[:15]
 
     # ───────── GRADE PERFORMANCE ─────────
-    grade_rankings = (
-        attendance.values("enrollment__lesson__stream__grade__name")
-        .annotate(total=Count("id"), present=Count("id", filter=Q(status="P")))
-        .annotate(performance=ExpressionWrapper(F("present") * 100.0 / F("total"), output_field=FloatField()))
-        .order_by("-performance")
-    )
+    grade_rankings = _ranked("grade__name")
 
     # ───────── SUBJECT PERFORMANCE ─────────
-    subject_rankings = (
-        attendance.values("enrollment__lesson__subject__name")
-        .annotate(total=Count("id"), present=Count("id", filter=Q(status="P")))
-        .annotate(performance=ExpressionWrapper(F("present") * 100.0 / F("total"), output_field=FloatField()))
-        .order_by("-performance")
-    )
+    subject_rankings = _ranked("subject__name")
 
     # ───────── NATIONAL / FILTERED RATE ─────────
-    totals = attendance.aggregate(
-        total=Count("id"),
-        present=Count("id", filter=Q(status="P")),
-        absent_unexcused=Count("id", filter=Q(status="UA")),
-        tardy=Count("id", filter=Q(status__in=["ET","UT"])),
-    )
+    _sums = summarize(attendance)
+    totals = {
+        "total": _sums["total"],
+        "present": _sums["present"],
+        "absent_unexcused": _sums["unexcused_absence"],
+        "tardy": _sums["tardy"],
+    }
     total_records = totals["total"] or 1
-    national_rate = round((totals["present"] or 0) * 100.0 / total_records, 1)
+    national_rate = round(totals["present"] * 100.0 / total_records, 1)
 
     # ───────── TREND (monthly last 6 months) ─────────
     six_months_ago = timezone.localdate() - timedelta(days=182)
-    trend_qs = (
-        attendance.filter(date__gte=six_months_ago)
-        .annotate(month=TruncMonth("date"))
-        .values("month")
-        .annotate(total=Count("id"), present=Count("id", filter=Q(status="P")))
-        .order_by("month")
-    )
+    trend_qs = summarize(
+        attendance.filter(date__gte=six_months_ago).annotate(month=TruncMonth("date")), "month"
+    ).order_by("month")
     trend_labels = [r["month"].strftime("%b %Y") for r in trend_qs if r["month"]]
     trend_rates  = [
         round(r["present"] * 100.0 / r["total"], 1) if r["total"] else 0
@@ -6704,7 +6472,10 @@ def policymaker_dashboard(request):
     total_schools   = schools.count()
     total_students  = Student.objects.filter(school__in=schools).count()
     total_teachers  = StaffProfile.objects.filter(school__in=schools, position="teacher").count()
-    total_lessons   = Lesson.objects.filter(timetable__school__in=schools).count()
+    total_lessons   = weekly_lesson_count(
+        LessonPattern.objects.filter(school__in=schools),
+        lessons=Lesson.objects.filter(timetable__school__in=schools),
+    )
     total_discipline = DisciplineRecord.objects.filter(school__in=schools).count()
 
     # sub-counties for filter (scoped to county if selected)
@@ -6759,11 +6530,7 @@ def policymaker_dashboard(request):
 #FIle Upload
 
 
-import random
-import string
-
-def generate_password(length=8):
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+from django.contrib.auth.hashers import make_password
 
 
 def safe_email(value, fallback):
@@ -6810,7 +6577,9 @@ def generate_time_slots(school, staff_user):
 
 def populate_student_lesson_enrollments(school, grade=None, stream=None, term=None):
     """
-    Create Enrollment records for all lessons in a term based on student's subject enrollments.
+    Enroll students in the term's lesson patterns based on their subject
+    enrollments. Pattern-less dated lessons (one-offs, timetables imported
+    before patterns existed) are enrolled per lesson as before.
     """
     import logging
     logger = logging.getLogger(__name__)
@@ -6821,10 +6590,23 @@ def populate_student_lesson_enrollments(school, grade=None, stream=None, term=No
         students = students.filter(grade_level=grade)
     if stream:
         students = students.filter(stream=stream)
+    students = list(students.values_list('id', 'stream_id'))
 
-    # ── Lessons within term
+    # ── Weekly patterns of the term
+    patterns_qs = LessonPattern.objects.filter(school=school, is_active=True)
+    if stream:
+        patterns_qs = patterns_qs.filter(stream=stream)
+    if term:
+        patterns_qs = patterns_qs.filter(term=term)
+    patterns = list(patterns_qs.only('id', 'stream_id', 'subject_id'))
+
+    pattern_pairs = subject_enrollment_pairs(patterns, students)
+    created = bulk_enroll_patterns(school, pattern_pairs, patterns=patterns_qs)
+
+    # ── Pattern-less lessons within term
     lessons_qs = Lesson.objects.filter(
         timetable__school=school,
+        pattern__isnull=True,
         is_canceled=False
     )
     if stream:
@@ -6834,48 +6616,16 @@ def populate_student_lesson_enrollments(school, grade=None, stream=None, term=No
             lesson_date__gte=term.start_date,
             lesson_date__lte=term.end_date
         )
+    lessons = list(lessons_qs.only('id', 'stream_id', 'subject_id'))
 
-    # Map lessons by subject
-    lessons_map = defaultdict(list)
-    for lesson in lessons_qs.select_related('subject', 'stream'):
-        lessons_map[lesson.subject_id].append(lesson)
+    pairs = subject_enrollment_pairs(lessons, students)
+    created += bulk_enroll(school, pairs, lessons=lessons_qs)
 
-    # Prefetch student's subject enrollments
-    students = students.prefetch_related('subject_enrollments__subject')
-
-    enrollments_to_create = []
-
-    for student in students:
-        try:
-            subject_ids = list(student.subject_enrollments.values_list('subject_id', flat=True))
-            if not subject_ids:
-                logger.warning(f"Student {student.student_id} has no subject enrollments")
-                continue
-
-            # For each subject, get all lessons for this term & stream
-            for sid in subject_ids:
-                lessons = lessons_map.get(sid, [])
-                for lesson in lessons:
-                    enrollments_to_create.append(
-                        Enrollment(
-                            student=student,
-                            lesson=lesson,
-                            school=school,
-                            status='active'
-                        )
-                    )
-
-        except Exception as e:
-            logger.exception(f"Failed to process enrollments for student {student.student_id}")
-
-    if enrollments_to_create:
-        Enrollment.objects.bulk_create(enrollments_to_create, ignore_conflicts=True)
-
-    # Debug print
-    total_students = students.count()
-    total_lessons = lessons_qs.count()
-    total_enrollments = len(enrollments_to_create)
-    logger.info(f"[SUMMARY] Students={total_students} Lessons={total_lessons} Enrollments={total_enrollments}")
+    logger.info(
+        f"[SUMMARY] Students={len(students)} Patterns={len(patterns)} Lessons={len(lessons)} "
+        f"Pairs={len(pattern_pairs) + len(pairs)} Enrollments={created}"
+    )
+    return created
 
 
 
@@ -7039,128 +6789,7 @@ def _run_excel_processing(df, category, school, user, results):
                 results["fatal"] = "No active term found"
                 return
 
-            for idx, row in df.iterrows():
-                try:
-                    with transaction.atomic():
-                        admin_no = str(row.get("admin_no", "")).strip()
-                        if not admin_no:
-                            continue  # blank row — skip silently
-
-                        student_email = f"{admin_no}@student.school.local"
-                        student_password = generate_password()
-                        first_name = str(row.get("first_name", "")).strip()
-                        last_name = str(row.get("last_name", "")).strip()
-                        gender = str(row.get("gender", "")).strip().upper()
-
-                        user_obj, user_created = User.objects.get_or_create(
-                            email=student_email,
-                            defaults={
-                                "phone_number": admin_no,
-                                "first_name": first_name,
-                                "last_name": last_name,
-                                "is_student": True,
-                            }
-                        )
-                        if user_created:
-                            user_obj.set_password(student_password)
-                            user_obj.save()
-
-                        grade_name = str(row.get("grade", "")).strip()
-                        stream_name = str(row.get("stream", "")).strip()
-                        grade = Grade.objects.filter(name__iexact=grade_name, school=school).first()
-                        stream = Streams.objects.filter(name__iexact=stream_name, school=school).first()
-
-                        if not grade:
-                            raise ValueError(f"Grade '{grade_name}' not found for this school")
-                        if not stream:
-                            raise ValueError(f"Stream '{stream_name}' not found in {grade_name}")
-
-                        pathway_obj = None
-                        pathway_raw = str(row.get("pathway", "")).strip()
-                        if pathway_raw and grade:
-                            normalized_csv = pathway_raw.lower().replace(".", "").replace("&", "and").replace(" ", "")
-                            for p in Pathway.objects.filter(school=school, grade=grade):
-                                normalized_db = p.name.strip().lower().replace(".", "").replace("&", "and").replace(" ", "")
-                                if normalized_db == normalized_csv:
-                                    pathway_obj = p
-                                    break
-
-                        student, created = Student.objects.update_or_create(
-                            user=user_obj,
-                            student_id=admin_no,
-                            school=school,
-                            defaults={
-                                "date_of_birth": row.get("date_of_birth"),
-                                "gender": gender,
-                                "enrollment_date": timezone.now().date(),
-                                "grade_level": grade,
-                                "stream": stream,
-                                "pathway": pathway_obj,
-                            }
-                        )
-
-                        subject_codes = [
-                            c.strip().upper()
-                            for c in str(row.get("subjects", "")).split(",")
-                            if c.strip()
-                        ]
-                        for code in subject_codes:
-                            # Only enroll in subjects the school has already activated from catalog
-                            subject = Subject.objects.filter(
-                                school=school, is_active=True
-                            ).filter(
-                                Q(code__iexact=code) | Q(name__iexact=code)
-                            ).first()
-                            if not subject:
-                                results["warnings"].append({
-                                    "row": idx + 2,
-                                    "message": (
-                                        f"Subject '{code}' not found in school's activated subjects. "
-                                        f"Go to Subjects → 'From Catalog' to activate it first."
-                                    ),
-                                })
-                                continue
-                            SubjectEnrollment.objects.get_or_create(student=student, subject=subject)
-
-                        parent_phone = str(row.get("parent_phone", "")).strip()
-                        if parent_phone:
-                            parent_email = str(row.get("parent_email", "")).strip() or f"{parent_phone}@parent.school.local"
-                            parent_first_name = str(row.get("parent_first_name", "")).strip()
-                            parent_last_name = str(row.get("parent_last_name", "")).strip()
-                            parent_password = generate_password()
-
-                            parent_user, parent_user_created = User.objects.get_or_create(
-                                email=parent_email,
-                                defaults={
-                                    "phone_number": parent_phone,
-                                    "first_name": parent_first_name,
-                                    "last_name": parent_last_name,
-                                    "is_parent": True,
-                                }
-                            )
-                            if parent_user_created:
-                                parent_user.set_password(parent_password)
-                                parent_user.save()
-
-                            parent_obj, _ = Parent.objects.get_or_create(
-                                phone=parent_phone,
-                                defaults={
-                                    "user": parent_user,
-                                    "parent_id": parent_phone,
-                                    "school": school,
-                                }
-                            )
-                            if not parent_obj.user:
-                                parent_obj.user = parent_user
-                                parent_obj.save()
-
-                            student.parents.add(parent_obj)
-
-                        results["created"] += 1
-
-                except Exception as e:
-                    logger.exception(f"Student row {idx + 2} failed")
-                    results["errors"].append({"row": idx + 2, "error": str(e)})
+            import_students(df, school, results)
 
         # ====================== TEACHERS ======================
         elif category == "teachers":
@@ -7176,8 +6805,9 @@ def _run_excel_processing(df, category, school, user, results):
                         continue  # blank row — skip silently
                     phone = normalize_phone(row["phone"])
                     email = safe_email(row["email"], f"{phone}@gmail.com")
-                    password = generate_password()
 
+                    # No password is hashed here: the teacher activates the
+                    # account through the forgot-password OTP flow.
                     user_obj, created = User.objects.get_or_create(
                         email=email,
                         defaults={
@@ -7185,11 +6815,9 @@ def _run_excel_processing(df, category, school, user, results):
                             "first_name": str(row["first_name"]).strip(),
                             "last_name": str(row["last_name"]).strip(),
                             "is_teacher": True,
+                            "password": make_password(None),
                         }
                     )
-                    if created:
-                        user_obj.set_password(password)
-                        user_obj.save()
 
                     staff_id = f"TCHR{str(user_obj.id).zfill(5)}"
                     staff_profile, _ = StaffProfile.objects.get_or_create(
@@ -7313,17 +6941,17 @@ def _run_excel_processing(df, category, school, user, results):
                         phone = normalize_phone(row[phone_col])
                         admin_no = str(row["admin_no"]).strip()
                         email = f"{phone}@parent.school.local"
-                        password = generate_password()
 
                         user_obj = User.objects.filter(phone_number=phone).first()
                         if not user_obj:
+                            # password=None: unusable until activated via forgot-password.
                             user_obj = User.objects.create_user(
                                 email=email,
                                 phone_number=phone,
                                 first_name=str(row["first_name"]).strip(),
                                 last_name=str(row["last_name"]).strip(),
                                 is_parent=True,
-                                password=password,
+                                password=None,
                             )
 
                         parent, _ = Parent.objects.get_or_create(
@@ -7392,7 +7020,7 @@ def _run_excel_processing(df, category, school, user, results):
                 if slot.start_time and slot.end_time
             }
 
-            lessons_to_create = []
+            patterns_to_create = []
             seen_patterns = set()
             weekday_counts = defaultdict(int)
 
@@ -7441,36 +7069,30 @@ def _run_excel_processing(df, category, school, user, results):
                         })
                         continue
 
-                    pattern_key = (wd, time_slot.id, subject.id, teacher.id if teacher else None, room)
+                    pattern_key = (wd, time_slot.id, subject.id)
                     if pattern_key in seen_patterns:
                         continue
                     seen_patterns.add(pattern_key)
 
-                    current_date = term.start_date
-                    while current_date <= term.end_date:
-                        if current_date.strftime("%A").lower() == wd:
-                            break
-                        current_date += timedelta(days=1)
-
-                    while current_date <= term.end_date:
-                        lessons_to_create.append(
-                            Lesson(
-                                timetable=timetable, subject=subject, stream=stream,
-                                teacher=teacher, day_of_week=wd,
-                                time_slot=time_slot, room=room, lesson_date=current_date,
-                            )
+                    # One weekly row; dated lessons are materialised when attendance is marked.
+                    patterns_to_create.append(
+                        LessonPattern(
+                            school=school, timetable=timetable, term=term,
+                            subject=subject, stream=stream, teacher=teacher,
+                            day_of_week=wd, time_slot=time_slot, room=room,
                         )
-                        weekday_counts[wd] += 1
-                        current_date += timedelta(days=7)
+                    )
+                    weekday_counts[wd] += 1
 
                 except Exception as e:
                     logger.exception(f"[ROW {row_num}] Failed")
                     results["errors"].append({"row": row_num, "error": str(e)})
 
+            LessonPattern.objects.filter(timetable=timetable).delete()
             Lesson.objects.filter(timetable=timetable).delete()
-            if lessons_to_create:
-                Lesson.objects.bulk_create(lessons_to_create, ignore_conflicts=True)
-                results["created"] = len(lessons_to_create)
+            if patterns_to_create:
+                LessonPattern.objects.bulk_create(patterns_to_create, ignore_conflicts=True)
+                results["created"] = len(patterns_to_create)
 
             transaction.on_commit(
                 lambda: populate_student_lesson_enrollments(school, grade, stream, term)
@@ -7478,7 +7100,7 @@ def _run_excel_processing(df, category, school, user, results):
 
             results["summary"] = {
                 "grade": grade_name, "stream": stream_name, "term": term_name,
-                "year": excel_year_value, "lessons_generated": len(lessons_to_create),
+                "year": excel_year_value, "lessons_generated": len(patterns_to_create),
                 "weekdays": dict(weekday_counts),
             }
         else:
@@ -7486,10 +7108,7 @@ def _run_excel_processing(df, category, school, user, results):
 
 
 def _process_upload_in_background(upload_id, user_id, school_id, category):
-    """Thread target: process saved Excel file, update Upload record, email uploader."""
-    from django.db import connection as _conn, close_old_connections
-    close_old_connections()
-
+    """Background job: process saved Excel file, update Upload record, email uploader."""
     try:
         upload = Upload.objects.get(pk=upload_id)
         upload.status = 'processing'
@@ -7524,9 +7143,7 @@ def _process_upload_in_background(upload_id, user_id, school_id, category):
         _send_upload_email(user, upload, category)
 
     except Exception as e:
-        logger.exception(f"[BG UPLOAD #{upload_id}] Thread-level failure: {e}")
-    finally:
-        _conn.close()
+        logger.exception(f"[BG UPLOAD #{upload_id}] Job-level failure: {e}")
 
 
 def _send_upload_email(user, upload, category):
@@ -7613,7 +7230,7 @@ def _send_upload_email(user, upload, category):
 def universal_excel_upload(request):
     """
     Accepts the file, saves it to the Upload model, and immediately returns
-    {"status": "queued"}. Heavy processing runs in a background thread and
+    {"status": "queued"}. Heavy processing runs on a background worker and
     sends an email to the uploader on completion.
     """
     excel_file = request.FILES.get("file")
@@ -7657,13 +7274,11 @@ def universal_excel_upload(request):
         logger.error(f"Failed to save uploaded file: {e}")
         return JsonResponse({"error": f"Failed to save file: {e}"}, status=500)
 
-    # Kick off background thread
-    t = threading.Thread(
-        target=_process_upload_in_background,
-        args=(upload_record.id, user.id, school.id, category),
-        daemon=True,
+    # Hand off to the background workers
+    enqueue(
+        'excel_upload', school=school,
+        upload_id=upload_record.id, user_id=user.id, school_id=school.id, category=category,
     )
-    t.start()
 
     return JsonResponse({
         "status": "queued",
@@ -7959,86 +7574,17 @@ def parent_dashboard(request):
         messages.error(request, "Parent profile not found.")
         return redirect('userauths:sign-in')
 
-    children = parent.children.select_related('user', 'grade_level', 'stream', 'school').all()
+    summary = parent_summary(parent)
     unread_count = request.user.notifications.filter(is_read=False).count()
     open_complaints = Complaint.objects.filter(parent=parent, status='open').count()
 
-    today = timezone.now().date()
-    next_week = today + timedelta(days=7)
-    total_balance = Decimal('0.00')
-    child_data = []
-
-    for child in children:
-        # Attendance stats
-        att_qs = Attendance.objects.filter(enrollment__student=child)
-        total_att = att_qs.count()
-        present_att = att_qs.filter(status='P').count()
-        att_rate = int((present_att / total_att * 100) if total_att > 0 else 0)
-
-        # Fee balance
-        fee_balance = FeeInvoice.objects.filter(
-            student=child
-        ).exclude(status='paid').aggregate(
-            bal=Sum(F('amount_required') - F('amount_paid'))
-        )['bal'] or Decimal('0.00')
-        total_balance += fee_balance
-
-        # Discipline records
-        discipline_count = DisciplineRecord.objects.filter(student=child, resolved=False).count()
-
-        # Upcoming lessons (next 7 days)
-        upcoming_lessons = Lesson.objects.filter(
-            stream=child.stream,
-            lesson_date__gte=today,
-            lesson_date__lte=next_week,
-        ).select_related('subject', 'teacher__user', 'time_slot').order_by('lesson_date', 'time_slot__start_time')[:8] if child.stream else []
-
-        # Announcements for child's school/grade (active only)
-        _now = timezone.now()
-        announcements = Announcement.objects.filter(
-            school=child.school,
-            audience__in=['all', 'parents'],
-        ).filter(
-            Q(grade=child.grade_level) | Q(grade__isnull=True)
-        ).filter(
-            Q(expires_at__isnull=True) | Q(expires_at__gt=_now)
-        ).order_by('-is_pinned', '-created_at')[:4]
-
-        # Active term
-        active_term = Term.objects.filter(school=child.school, is_active=True).first()
-
-        # Student status
-        if child.expelled:
-            status_color, status_label = 'danger', 'Expelled'
-        elif child.suspended:
-            status_color, status_label = 'warning', 'Suspended'
-        elif child.is_active:
-            status_color, status_label = 'success', 'Active'
-        else:
-            status_color, status_label = 'secondary', 'Inactive'
-
-        child_data.append({
-            'student': child,
-            'school': child.school,
-            'att_rate': att_rate,
-            'present_att': present_att,
-            'total_att': total_att,
-            'fee_balance': fee_balance,
-            'discipline_count': discipline_count,
-            'upcoming_lessons': upcoming_lessons,
-            'announcements': announcements,
-            'active_term': active_term,
-            'status_color': status_color,
-            'status_label': status_label,
-        })
-
     return render(request, 'school/parent/dashboard.html', {
         'parent': parent,
-        'child_data': child_data,
-        'total_balance': total_balance,
+        'child_data': summary['children'],
+        'total_balance': summary['total_balance'],
         'unread_count': unread_count,
         'open_complaints': open_complaints,
-        'today': today,
+        'today': timezone.now().date(),
     })
 
 
@@ -8210,9 +7756,7 @@ def parent_exam_results(request):
                 session=session, student=child
             ).select_related('subject').order_by('subject__name')
 
-            stream_students = Student.objects.filter(school=child.school, stream=child.stream, is_active=True).select_related('user')
-            stream_ranking = _compute_student_totals(session, stream_students, stream=child.stream)
-            stream_pos = next((r['position'] for r in stream_ranking if r['student'].pk == child.pk), '–')
+            stream_pos = student_positions(session, child)['stream_pos']
 
             overall_total = sum(r.total for r in results if r.total is not None)
             overall_pct = round((overall_total / (session.total_marks * len(results))) * 100, 1) if results and session.total_marks else None
@@ -8601,7 +8145,6 @@ def bulk_notify(request):
         return redirect('school:dashboard')
 
     form = BulkNotificationForm(school=school)
-    result = None
 
     if request.method == 'POST':
         form = BulkNotificationForm(request.POST, school=school)
@@ -8614,68 +8157,71 @@ def bulk_notify(request):
             stream   = cd.get('stream')
             do_inapp = cd['channel_inapp']
             do_email = cd['channel_email']
-            do_sms   = cd['channel_sms']
+            sms_skipped = cd['channel_sms'] and not _sms_configured()
+            do_sms   = cd['channel_sms'] and not sms_skipped
 
             recipients = _resolve_recipients(audience, school, grade, stream)
-
-            inapp_sent = email_sent = sms_sent = 0
-            email_failed = sms_failed = 0
-
-            for recipient_user, phone in recipients:
-                if do_inapp:
-                    Notification.objects.create(
-                        recipient=recipient_user,
-                        title=title,
-                        message=message,
-                        school=school,
-                    )
-                    inapp_sent += 1
-
-                if do_email and recipient_user.email:
-                    ok = send_email(recipient_user.email, title, message)
-                    if ok:
-                        email_sent += 1
-                    else:
-                        email_failed += 1
-
-                if do_sms and phone:
-                    sms_text = f"{title}\n{message}"[:320]
-                    ok = _send_sms_via_eujim(phone, sms_text)
-                    if ok:
-                        sms_sent += 1
-                    else:
-                        sms_failed += 1
+            campaign = start_campaign(
+                school, user, title, message, audience, recipients,
+                inapp=do_inapp, email=do_email, sms=do_sms,
+            )
 
             AuditLog.objects.create(
-                school=school, model_name='BulkNotification', object_id=0,
+                school=school, model_name='NotificationCampaign', object_id=campaign.pk,
                 action='create', actor=user,
                 description=(
-                    f"Bulk notify '{title}' → audience={audience}, "
-                    f"inapp={inapp_sent}, email={email_sent}, sms={sms_sent}"
+                    f"Bulk notify '{title}' → audience={audience}, recipients={campaign.total}, "
+                    f"inapp={do_inapp}, email={do_email}, sms={do_sms}"
                 ),
             )
-
-            result = {
-                'total':        len(recipients),
-                'inapp_sent':   inapp_sent,
-                'email_sent':   email_sent,
-                'email_failed': email_failed,
-                'sms_sent':     sms_sent,
-                'sms_failed':   sms_failed,
-                'title':        title,
-                'audience':     dict(BulkNotificationForm.AUDIENCE_CHOICES).get(audience, audience),
-            }
-            if do_sms and not _sms_configured():
+            if sms_skipped:
                 messages.warning(request, "SMS credentials are not configured — SMS was skipped. Set SMS_API_KEY, SMS_PARTNERID, SMS_SHORTCODE in settings.")
+            return redirect('school:bulk-notify-campaign', pk=campaign.pk)
 
     return render(request, 'school/bulk_notify.html', {
         'form': form,
         'school': school,
-        'result': result,
+        'campaigns': NotificationCampaign.objects.filter(school=school)[:10],
         'sms_configured': _sms_configured(),
     })
 
 
+def _campaign_for(request, pk):
+    """A campaign the user may see: their own school's, or any school's for Kiswate admins."""
+    user = request.user
+    campaigns = NotificationCampaign.objects.select_related('school')
+    if not (getattr(user, 'is_kiswate_user', False) or getattr(user, 'is_kiswate_admin', False) or user.is_superuser):
+        campaigns = campaigns.filter(school=get_user_school(user))
+    return get_object_or_404(campaigns, pk=pk)
+
+
+@login_required
+def bulk_notify_campaign(request, pk):
+    """Progress and delivery report for one bulk notification."""
+    campaign = _campaign_for(request, pk)
+    failures = campaign.deliveries.filter(
+        Q(sms_sent=False) | Q(email_sent=False)
+    ).select_related('recipient').order_by('pk')[:50]
+    return render(request, 'school/bulk_notify_campaign.html', {
+        'campaign': campaign, 'school': campaign.school, 'failures': failures,
+    })
+
+
+@login_required
+def bulk_notify_campaign_status(request, pk):
+    """JSON endpoint polled by the campaign page."""
+    campaign = _campaign_for(request, pk)
+    return JsonResponse({
+        'status':       campaign.status,
+        'total':        campaign.total,
+        'progress':     campaign.progress_pct,
+        'email_sent':   campaign.email_sent,
+        'email_failed': campaign.email_failed,
+        'sms_sent':     campaign.sms_sent,
+        'sms_failed':   campaign.sms_failed,
+    })
+
+
 @login_required
 def student_notifications(request):
     """Student: view in-app notifications."""
@@ -9070,10 +8616,8 @@ def student_exam_results(request):
     sessions_data = []
     for session in sessions:
         results = ExamResult.objects.filter(session=session, student=student).select_related('subject').order_by('subject__name')
-        stream_students = Student.objects.filter(school=student.school, stream=student.stream, is_active=True).select_related('user')
-        stream_ranking = _compute_student_totals(session, stream_students, stream=student.stream)
-        stream_pos = next((r['position'] for r in stream_ranking if r['student'].pk == student.pk), '–')
-        stream_total = len([r for r in stream_ranking if r['total'] is not None])
+        positions = student_positions(session, student)
+        stream_pos, stream_total = positions['stream_pos'], positions['stream_total']
 
         overall_total = sum(r.total for r in results if r.total is not None)
         overall_pct = round((overall_total / (session.total_marks * len(results))) * 100, 1) if results and session.total_marks else None
@@ -9268,7 +8812,7 @@ def fee_structure_delete(request, pk):
 
 @login_required
 def bulk_generate_invoices(request, term_id):
-    """Generate FeeInvoice records for all students matching each selected FeeStructure."""
+    """Queue FeeInvoice generation for all students matching each selected FeeStructure."""
     user = request.user
     school = get_user_school(user)
     if not school or not _can_access_finance(user):
@@ -9279,41 +8823,15 @@ def bulk_generate_invoices(request, term_id):
     form = BulkInvoiceGenerateForm(school, term, request.POST or None)
 
     if request.method == 'POST' and form.is_valid():
-        fee_structures = form.cleaned_data['fee_structures']
-        due_date = form.cleaned_data.get('due_date')
-        overwrite = form.cleaned_data.get('overwrite_existing', False)
-        created = skipped = 0
-
-        for fs in fee_structures:
-            # Get students matching this fee structure's grade (and stream if specified)
-            student_qs = Student.objects.filter(school=school, grade_level=fs.grade, is_active=True)
-            if fs.stream:
-                student_qs = student_qs.filter(stream=fs.stream)
-
-            for student in student_qs:
-                exists = FeeInvoice.objects.filter(
-                    school=school, student=student, term=term, description=fs.description
-                ).exists()
-                if exists and not overwrite:
-                    skipped += 1
-                    continue
-                if exists and overwrite:
-                    FeeInvoice.objects.filter(
-                        school=school, student=student, term=term, description=fs.description
-                    ).delete()
-
-                FeeInvoice.objects.create(
-                    school=school, student=student, term=term,
-                    academic_year=fs.academic_year,
-                    description=fs.description,
-                    amount_required=fs.amount,
-                    due_date=due_date,
-                    created_by=user,
-                )
-                created += 1
-
-        messages.success(request, f'{created} invoice(s) generated, {skipped} skipped (already existed).')
-        return redirect('school:finance-dashboard')
+        from .models import InvoiceGenerationJob
+        job = InvoiceGenerationJob.objects.create(
+            school=school, term=term, requested_by=user,
+            due_date=form.cleaned_data.get('due_date'),
+            overwrite=form.cleaned_data.get('overwrite_existing', False),
+        )
+        job.fee_structures.set(form.cleaned_data['fee_structures'])
+        enqueue('fee_invoices', school=school, job_id=str(job.pk))
+        return redirect('school:invoice-job-progress', job_pk=job.pk)
 
     structures = FeeStructure.objects.filter(school=school, term=term, is_active=True).select_related('grade', 'stream')
     return render(request, 'school/finance/bulk_generate.html', {
@@ -9321,10 +8839,44 @@ def bulk_generate_invoices(request, term_id):
     })
 
 
+@login_required
+def invoice_job_progress(request, job_pk):
+    """Page that polls a bulk invoice generation job."""
+    from .models import InvoiceGenerationJob
+    school = get_user_school(request.user)
+    if not school or not _can_access_finance(request.user):
+        messages.error(request, "Access denied.")
+        return redirect('school:finance-dashboard')
+    job = get_object_or_404(InvoiceGenerationJob.objects.select_related('term'), pk=job_pk, school=school)
+    return render(request, 'school/finance/invoice_job_progress.html', {'job': job, 'school': school})
+
+
+@login_required
+def invoice_job_status(request, job_pk):
+    """JSON endpoint polled by the invoice generation progress page."""
+    from .models import InvoiceGenerationJob
+    from django.http import JsonResponse
+    school = get_user_school(request.user)
+    if not school or not _can_access_finance(request.user):
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    job = get_object_or_404(InvoiceGenerationJob, pk=job_pk, school=school)
+    return JsonResponse({
+        'status':    job.status,
+        'total':     job.total,
+        'processed': job.processed,
+        'progress':  job.progress_pct,
+        'created':   job.created,
+        'updated':   job.updated,
+        'skipped':   job.skipped,
+        'error':     job.error,
+    })
+
+
 @login_required
 def fee_payment_upload(request):
-    """Upload Excel file to record payments in bulk."""
-    import openpyxl
+    """Upload a payments sheet or bank / M-Pesa statement; its rows are previewed before posting."""
+    from .models import PaymentStatement
+    from .services.reconciliation import read_statement
     user = request.user
     school = get_user_school(user)
     if not school or not _can_access_finance(user):
@@ -9333,80 +8885,59 @@ def fee_payment_upload(request):
 
     form = FeePaymentUploadForm(school, request.POST or None, request.FILES or None)
     if request.method == 'POST' and form.is_valid():
-        term = form.cleaned_data['term']
         f = form.cleaned_data['file']
-
-        wb = openpyxl.load_workbook(f, data_only=True)
-        ws = wb.active
-        headers = [str(c.value).strip().lower() if c.value else '' for c in ws[1]]
-
-        def col(name):
-            return headers.index(name) if name in headers else None
-
-        idx_sid = col('student_id')
-        idx_amt = col('amount')
-        idx_method = col('payment_method')
-        idx_notes = col('notes')
-
-        if idx_sid is None or idx_amt is None:
-            messages.error(request, 'Columns "student_id" and "amount" are required.')
+        try:
+            rows = read_statement(f, f.name)
+        except Exception as exc:
+            messages.error(request, f'Could not read {f.name}: {exc}')
+            return redirect('school:fee-payment-upload')
+        if not rows:
+            messages.warning(request, 'The file has no payment rows.')
             return redirect('school:fee-payment-upload')
 
-        saved = skipped = 0
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            sid = str(row[idx_sid]).strip() if row[idx_sid] else ''
-            if not sid:
-                continue
-            try:
-                student = Student.objects.get(student_id=sid, school=school)
-            except Student.DoesNotExist:
-                skipped += 1
-                continue
+        statement = PaymentStatement.objects.create(
+            school=school, term=form.cleaned_data['term'], uploaded_by=user, filename=f.name[:255],
+            default_method=form.cleaned_data.get('payment_method') or 'cash', rows=rows,
+        )
+        return redirect('school:fee-payment-reconcile', pk=statement.pk)
 
-            try:
-                amount = Decimal(str(row[idx_amt]))
-            except Exception:
-                skipped += 1
-                continue
+    return render(request, 'school/finance/payment_upload.html', {'form': form, 'school': school})
 
-            method = str(row[idx_method]).strip().lower() if idx_method is not None and row[idx_method] else 'cash'
-            notes = str(row[idx_notes]).strip() if idx_notes is not None and row[idx_notes] else ''
-
-            # Find the latest unpaid/partial invoice for this student in this term
-            invoice = FeeInvoice.objects.filter(
-                school=school, student=student, term=term,
-                status__in=['pending', 'partial']
-            ).order_by('created_at').first()
-
-            if invoice:
-                invoice.amount_paid = min(invoice.amount_required, invoice.amount_paid + amount)
-                invoice.payment_method = method if method in ['cash', 'mpesa', 'cheque', 'bank'] else 'cash'
-                if notes:
-                    invoice.notes = (invoice.notes + '\n' + notes).strip()
-                invoice.save()
-            else:
-                # Create a generic payment record even without an invoice
-                FeeInvoice.objects.create(
-                    school=school, student=student, term=term,
-                    description='Fee Payment (Uploaded)',
-                    amount_required=amount, amount_paid=amount,
-                    payment_method=method if method in ['cash', 'mpesa', 'cheque', 'bank'] else 'cash',
-                    notes=notes, created_by=user,
-                )
 
-            # Audit payment record
-            Payment.objects.create(
-                student=student, school=school,
-                amount=amount, payment_type='fees', status='paid',
-                transaction_id=f"UPL-{uuid.uuid4().hex[:10].upper()}",
-                description=f"Bulk upload – {term.name}",
-            )
-            saved += 1
+@login_required
+def fee_payment_reconcile(request, pk):
+    """Preview how a statement's rows match students and invoices; POST confirms or discards it."""
+    from .models import PaymentStatement
+    from .services.reconciliation import plan_statement, post_statement
+    user = request.user
+    school = get_user_school(user)
+    if not school or not _can_access_finance(user):
+        messages.error(request, "Access denied.")
+        return redirect('school:finance-dashboard')
 
-        messages.success(request, f'Upload complete: {saved} payments recorded, {skipped} rows skipped.')
+    statement = get_object_or_404(PaymentStatement.objects.select_related('term'), pk=pk, school=school)
+    if request.method == 'POST' and statement.status == PaymentStatement.STATUS_DRAFT:
+        if request.POST.get('action') == 'discard':
+            statement.status = PaymentStatement.STATUS_DISCARDED
+            statement.save(update_fields=['status'])
+            messages.info(request, f'{statement.filename} discarded; nothing was recorded.')
+            return redirect('school:fee-payment-upload')
+        try:
+            summary = post_statement(statement, user)
+        except ValueError as exc:
+            messages.error(request, str(exc))
+            return redirect('school:fee-payment-reconcile', pk=statement.pk)
+        messages.success(
+            request,
+            f"Upload complete: {summary['ok']} payments recorded (KES {summary['total']}), "
+            f"{summary['duplicate']} duplicate(s), {summary['unmatched'] + summary['invalid']} rows skipped.",
+        )
         return redirect('school:finance-dashboard')
 
-    return render(request, 'school/finance/payment_upload.html', {'form': form, 'school': school})
+    plan = plan_statement(statement) if statement.status == PaymentStatement.STATUS_DRAFT else None
+    return render(request, 'school/finance/payment_reconcile.html', {
+        'statement': statement, 'plan': plan, 'school': school,
+    })
 
 
 @login_required
@@ -9613,38 +9144,13 @@ def finance_collection_report(request):
         except Term.DoesNotExist:
             pass
 
+    school_expected = school_collected = school_balance = Decimal('0')
+    school_rate = 0
     if term:
-        grades = Grade.objects.filter(school=school, is_active=True).prefetch_related('streams')
-        for grade in grades:
-            streams = Streams.objects.filter(grade=grade, school=school)
-            grade_data = {'grade': grade, 'streams': []}
-            for stream in streams:
-                invoices = FeeInvoice.objects.filter(
-                    school=school, term=term,
-                    student__stream=stream,
-                )
-                expected = invoices.aggregate(t=Sum('amount_required'))['t'] or Decimal('0')
-                collected = invoices.aggregate(t=Sum('amount_paid'))['t'] or Decimal('0')
-                balance = expected - collected
-                rate = round((collected / expected * 100), 1) if expected else 0
-                grade_data['streams'].append({
-                    'stream': stream,
-                    'expected': expected, 'collected': collected,
-                    'balance': balance, 'rate': rate,
-                    'students': invoices.values('student').distinct().count(),
-                })
-            # Grade totals
-            grade_invoices = FeeInvoice.objects.filter(school=school, term=term, student__grade_level=grade)
-            grade_data['expected'] = grade_invoices.aggregate(t=Sum('amount_required'))['t'] or Decimal('0')
-            grade_data['collected'] = grade_invoices.aggregate(t=Sum('amount_paid'))['t'] or Decimal('0')
-            grade_data['balance'] = grade_data['expected'] - grade_data['collected']
-            grade_data['rate'] = round((grade_data['collected'] / grade_data['expected'] * 100), 1) if grade_data['expected'] else 0
-            report.append(grade_data)
-
-    school_expected = sum(g['expected'] for g in report)
-    school_collected = sum(g['collected'] for g in report)
-    school_balance = school_expected - school_collected
-    school_rate = round((school_collected / school_expected * 100), 1) if school_expected else 0
+        summary = collection_report(school, term)
+        report = summary['grades']
+        school_expected, school_collected = summary['expected'], summary['collected']
+        school_balance, school_rate = summary['balance'], summary['rate']
 
     return render(request, 'school/finance/collection_report.html', {
         'school': school, 'terms': terms, 'term': term, 'report': report,
@@ -9775,7 +9281,7 @@ def grade_promote_view(request):
                 qs = qs.filter(stream_id=from_stream_id)
 
         count = qs.count()
-        qs.update(grade_level=to_grade, stream=to_stream)
+        qs.update(grade_level=to_grade, stream=to_stream, updated_at=timezone.now())
         messages.success(request, f"{count} student(s) promoted to {to_grade.name}{' / ' + to_stream.name if to_stream else ''}.")
         return redirect('school:grade-promote')
 
@@ -10115,10 +9621,19 @@ def class_teacher_subject_summary(request):
     period_start = date.fromisoformat(start_str) if start_str else timezone.localdate().replace(day=1)
     period_end = date.fromisoformat(end_str) if end_str else timezone.localdate()
 
-    lessons = Lesson.objects.filter(
-        stream=stream,
-        lesson_date__range=[period_start, period_end],
-    ).select_related('subject', 'teacher__user', 'time_slot')
+    lessons = occurrences(
+        LessonPattern.objects.filter(stream=stream), period_start, period_end,
+        lessons=Lesson.objects.filter(stream=stream),
+    )
+    marked = {
+        row['enrollment__lesson__subject_id']: row
+        for row in Attendance.objects.filter(
+            enrollment__lesson__stream=stream,
+            enrollment__lesson__lesson_date__range=[period_start, period_end],
+        ).values('enrollment__lesson__subject_id').annotate(
+            total=Count('id'), present=Count('id', filter=Q(status='P')),
+        )
+    }
 
     from collections import defaultdict
     subject_data = defaultdict(lambda: {'total': 0, 'present': 0, 'lessons': 0, 'subject': None, 'teacher': None})
@@ -10127,11 +9642,10 @@ def class_teacher_subject_summary(request):
         subject_data[key]['subject'] = lesson.subject
         subject_data[key]['teacher'] = lesson.teacher
         subject_data[key]['lessons'] += 1
-        att_qs = Attendance.objects.filter(enrollment__lesson=lesson)
-        total = att_qs.count()
-        present = att_qs.filter(status='P').count()
-        subject_data[key]['total'] += total
-        subject_data[key]['present'] += present
+    for key, row in marked.items():
+        if key in subject_data:
+            subject_data[key]['total'] = row['total']
+            subject_data[key]['present'] = row['present']
 
     rows = []
     for data in subject_data.values():
@@ -10219,28 +9733,15 @@ def finance_collection_report_csv(request):
     writer.writerow(['Grade', 'Stream', 'Students w/ Invoices',
                      'Expected (KES)', 'Collected (KES)', 'Balance (KES)', 'Rate (%)'])
 
-    grades = Grade.objects.filter(school=school, is_active=True).order_by('name')
-    school_exp = school_col = Decimal('0')
-    for grade in grades:
-        streams = Streams.objects.filter(grade=grade, school=school).order_by('name')
-        g_exp = g_col = Decimal('0')
-        for stream in streams:
-            invoices = FeeInvoice.objects.filter(school=school, term=term, student__stream=stream)
-            exp = invoices.aggregate(t=Sum('amount_required'))['t'] or Decimal('0')
-            col = invoices.aggregate(t=Sum('amount_paid'))['t'] or Decimal('0')
-            bal = exp - col
-            rate = round(float(col / exp * 100), 1) if exp else 0
-            students = invoices.values('student').distinct().count()
-            writer.writerow([grade.name, stream.name, students, exp, col, bal, rate])
-            g_exp += exp; g_col += col
-        g_bal = g_exp - g_col
-        g_rate = round(float(g_col / g_exp * 100), 1) if g_exp else 0
-        writer.writerow([f'{grade.name} — SUBTOTAL', '', '', g_exp, g_col, g_bal, g_rate])
-        school_exp += g_exp; school_col += g_col
-
-    s_bal = school_exp - school_col
-    s_rate = round(float(school_col / school_exp * 100), 1) if school_exp else 0
-    writer.writerow(['SCHOOL TOTAL', '', '', school_exp, school_col, s_bal, s_rate])
+    summary = collection_report(school, term)
+    for grade in summary['grades']:
+        for row in grade['streams']:
+            writer.writerow([grade['grade'].name, row['stream'].name, row['students'],
+                             row['expected'], row['collected'], row['balance'], row['rate']])
+        writer.writerow([f"{grade['grade'].name} — SUBTOTAL", '', '',
+                         grade['expected'], grade['collected'], grade['balance'], grade['rate']])
+    writer.writerow(['SCHOOL TOTAL', '', '', summary['expected'], summary['collected'],
+                     summary['balance'], summary['rate']])
     return response
 
 
@@ -46,3 +46,19 @@ class ContentSecurityPolicyMiddleware:
             f"form-action 'self'",
             f"object-src 'none'",
         ])
+
+
+class SchoolContextMiddleware:
+    """
+    Attaches `request.school_context`: the user's role, school and profiles
+    (see school.services.user_context), resolved lazily on first use and at
+    most once per request. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from school.services.user_context import lazy_user_context
+        request.school_context = lazy_user_context(request.user)
+        return self.get_response(request)
@@ -67,6 +67,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'src.middleware.ContentSecurityPolicyMiddleware',
+    'src.middleware.SchoolContextMiddleware',
 ]
 
 ROOT_URLCONF = 'src.urls'
@@ -244,7 +245,7 @@ from datetime import timedelta
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.SchoolContextJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',  # Require auth for most endpoints
@@ -252,7 +253,7 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
 }
 
@@ -276,6 +277,9 @@ SMS_API_KEY = ''
 SMS_PARTNERID = ''
 SMS_SHORTCODE = ''
 SMS_API_URL = ''
+# Parallel gateway requests and overall send rate for batch dispatch (school.services.sms).
+SMS_CONCURRENCY = 8
+SMS_RATE_PER_SECOND = 10
 
 # ─── M-PESA DARAJA ───────────────────────────────────────────────────────────
 import os as _os
@@ -286,6 +290,14 @@ MPESA_PASSKEY         = _os.environ.get('MPESA_PASSKEY', '')
 MPESA_CALLBACK_URL    = _os.environ.get('MPESA_CALLBACK_URL', '')       # public HTTPS URL
 MPESA_ENV             = _os.environ.get('MPESA_ENV', 'sandbox')         # 'sandbox' or 'production'
 
+# ─── BACKGROUND JOBS ─────────────────────────────────────────────────────────
+# Worker processes started by `manage.py run_workers`.
+BACKGROUND_JOB_WORKERS = int(_os.environ.get('BACKGROUND_JOB_WORKERS', '2'))
+# Run queued jobs in-process after commit instead (development without workers).
+BACKGROUND_JOBS_EAGER = _os.environ.get('BACKGROUND_JOBS_EAGER', '') == '1'
+# Render processes per report-slip batch; each queue worker may run one batch.
+REPORT_SLIP_WORKERS = int(_os.environ.get('REPORT_SLIP_WORKERS', '2'))
+
 # ─── EMAIL ───────────────────────────────────────────────────────────────────
 # Development: prints email to console.
 # Production: uncomment SMTP lines below and fill in credentials.
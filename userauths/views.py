@@ -5,10 +5,12 @@ from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import PasswordChangeForm
 from school.models import (
-    Timetable,TeacherStreamAssignment,Streams, Term, Lesson, Session, Enrollment, Subject,
+    Timetable,TeacherStreamAssignment,Streams, Term, Lesson, LessonPattern, Session, Enrollment, Subject,
     StaffProfile, Student, Parent,Attendance,DisciplineRecord,TimeSlot,Assignment, Notification,ContactMessage,
     Payment, FeeInvoice, Announcement, Complaint
 )
+from school.services.lesson_patterns import occurrences
+from school.services.parent_summary import parent_summary
 from django.utils import timezone
 from collections import defaultdict
 from userauths.models import User
@@ -208,6 +210,7 @@ def LoginView(request):
         user = authenticate(request, email=email, password=password)
 
         if user is None:
+            # Same message for every failure, so the form can't be used to probe which emails exist.
             messages.warning(request, "Invalid email or password")
             return redirect("userauths:sign-in")
 
@@ -263,91 +266,14 @@ def parent_dashboard(request):
             "unread_count": 0, "open_complaints": 0,
         })
 
-    today = now().date()
-
-    # All children linked to this parent via Student.parents M2M
-    children = Student.objects.filter(parents=parent).select_related(
-        'user', 'grade_level', 'stream', 'school'
-    )
-
+    summary = parent_summary(parent)
     unread_count = request.user.notifications.filter(is_read=False).count()
     open_complaints = Complaint.objects.filter(parent=parent, status='open').count()
 
-    child_data = []
-    total_balance = 0
-
-    for student in children:
-        school = student.school
-        active_term = Term.objects.filter(school=school, is_active=True).first()
-
-        # Attendance stats (all time for the school, not limited to active term)
-        att_qs = Attendance.objects.filter(enrollment__student=student, enrollment__school=school)
-        total_att = att_qs.count()
-        present_att = att_qs.filter(status='P').count()
-        att_rate = round((present_att / total_att * 100) if total_att else 0, 1)
-
-        # Discipline
-        discipline_count = DisciplineRecord.objects.filter(student=student, school=school).count()
-
-        # Fee balance from FeeInvoice
-        fee_invoices = FeeInvoice.objects.filter(student=student, school=school)
-        student_balance = sum(inv.balance for inv in fee_invoices)
-        total_balance += student_balance
-
-        # Recent payments
-        recent_payments = Payment.objects.filter(student=student, school=school).order_by('-paid_at', '-id')[:5]
-
-        # Upcoming lessons
-        upcoming_lessons = Lesson.objects.filter(
-            l_enrollments__student=student,
-            lesson_date__range=[today, today + timedelta(days=6)],
-            is_canceled=False
-        ).select_related("subject", "teacher__user", "time_slot").order_by(
-            "lesson_date", "time_slot__start_time"
-        )[:8]
-
-        # Status
-        if student.expelled:
-            status_label = 'expelled'
-            status_color = 'danger'
-        elif student.suspended:
-            status_label = 'suspended'
-            status_color = 'warning'
-        elif student_balance > 0:
-            status_label = 'fee balance'
-            status_color = 'warning'
-        elif student.is_active:
-            status_label = 'active'
-            status_color = 'success'
-        else:
-            status_label = 'inactive'
-            status_color = 'secondary'
-
-        # Announcements for this school
-        announcements = Announcement.objects.filter(
-            school=school, audience__in=['all', 'parents']
-        ).order_by('-is_pinned', '-created_at')[:3]
-
-        child_data.append({
-            "student": student,
-            "school": school,
-            "active_term": active_term,
-            "total_att": total_att,
-            "present_att": present_att,
-            "att_rate": att_rate,
-            "discipline_count": discipline_count,
-            "fee_balance": student_balance,
-            "recent_payments": recent_payments,
-            "upcoming_lessons": upcoming_lessons,
-            "status_label": status_label,
-            "status_color": status_color,
-            "announcements": announcements,
-        })
-
     context = {
-        "child_data": child_data,
-        "today": today,
-        "total_balance": total_balance,
+        "child_data": summary["children"],
+        "today": now().date(),
+        "total_balance": summary["total_balance"],
         "unread_count": unread_count,
         "open_complaints": open_complaints,
         "parent": parent,
@@ -599,12 +525,10 @@ def teacher_dashboard(request):
     # ----------------------------
     # Lessons
     # ----------------------------
-    assigned_lessons = Lesson.objects.filter(
-        teacher=teacher_profile,
-        lesson_date__range=(week_start, week_end),
-        timetable__school=school
-    ).select_related('timetable__grade', 'subject', 'time_slot', 'stream').order_by(
-        'lesson_date', 'time_slot__start_time'
+    assigned_lessons = occurrences(
+        LessonPattern.objects.filter(teacher=teacher_profile, school=school),
+        week_start, week_end,
+        lessons=Lesson.objects.filter(teacher=teacher_profile, timetable__school=school),
     )
 
     # ----------------------------
@@ -644,8 +568,8 @@ def teacher_dashboard(request):
         school=school
     ).count()
 
-    today_lessons_count = assigned_lessons.filter(lesson_date=today).count()
-    week_lessons_count = assigned_lessons.count()
+    today_lessons_count = sum(1 for lesson in assigned_lessons if lesson.lesson_date == today)
+    week_lessons_count = len(assigned_lessons)
 
     stats = [
         {'title': "Today's Lessons", 'value': today_lessons_count, 'icon': 'fa-chalkboard-teacher', 'color': 'success'},